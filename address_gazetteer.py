@@ -0,0 +1,116 @@
+import os
+import json
+import threading
+import logging
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'static', 'data', 'api_province_with_amphure_tambon.json')
+
+LEVELS = ('province', 'district', 'subdistrict', 'zipcode')
+
+
+class AddressGazetteer:
+    """ข้อมูลที่อยู่ไทย (จังหวัด → อำเภอ → ตำบล → รหัสไปรษณีย์) ที่อ่านจากไฟล์ JSON ครั้งเดียวต่อ process"""
+
+    def __init__(self, data):
+        # {province: {district: {subdistrict: [zip, ...]}}}
+        self.tree = {}
+        for province_data in data:
+            province = province_data.get('name_th')
+            if not province:
+                continue
+            districts = self.tree.setdefault(province, {})
+            for amphure in province_data.get('amphure', []):
+                district = amphure.get('name_th')
+                if not district:
+                    continue
+                subdistricts = districts.setdefault(district, {})
+                for tambon in amphure.get('tambon', []):
+                    subdistrict = tambon.get('name_th')
+                    if not subdistrict:
+                        continue
+                    zipcodes = subdistricts.setdefault(subdistrict, set())
+                    if tambon.get('zip_code'):
+                        zipcodes.add(str(tambon['zip_code']))
+
+        # รายชื่อที่เรียงไว้แล้วสำหรับแต่ละระดับ
+        self.province_names = sorted(self.tree)
+        self.district_names = {}
+        self.subdistrict_names = {}
+        self.zipcodes = {}
+        # รายการ (คีย์สำหรับค้นหา, ข้อมูล) เรียงตามคีย์ สำหรับ prefix autocomplete ด้วย bisect
+        self._prefix_entries = {level: [] for level in LEVELS}
+
+        for province, districts in self.tree.items():
+            self.district_names[province] = sorted(districts)
+            self._prefix_entries['province'].append((province.lower(), {'province': province}))
+            for district, subdistricts in districts.items():
+                self.subdistrict_names[(province, district)] = sorted(subdistricts)
+                self._prefix_entries['district'].append(
+                    (district.lower(), {'province': province, 'district': district}))
+                for subdistrict, zipcodes in subdistricts.items():
+                    zipcodes = sorted(zipcodes)
+                    subdistricts[subdistrict] = zipcodes
+                    self.zipcodes[(province, district, subdistrict)] = zipcodes
+                    record = {'province': province, 'district': district, 'subdistrict': subdistrict}
+                    self._prefix_entries['subdistrict'].append(
+                        (subdistrict.lower(), dict(record, zipcodes=zipcodes)))
+                    for zipcode in zipcodes:
+                        self._prefix_entries['zipcode'].append((zipcode, dict(record, zipcode=zipcode)))
+
+        for entries in self._prefix_entries.values():
+            entries.sort(key=lambda entry: entry[0])
+        self._prefix_keys = {level: [key for key, _ in entries]
+                             for level, entries in self._prefix_entries.items()}
+
+    def get_districts(self, province):
+        return self.district_names.get(province, [])
+
+    def get_subdistricts(self, province, district):
+        return self.subdistrict_names.get((province, district), [])
+
+    def get_zipcodes(self, province, district, subdistrict):
+        return self.zipcodes.get((province, district, subdistrict), [])
+
+    def autocomplete(self, prefix, level='subdistrict', province=None, district=None, limit=20):
+        """ค้นหาชื่อที่ขึ้นต้นด้วย prefix ในระดับที่กำหนด (กรองตามจังหวัด/อำเภอได้)"""
+        if level not in self._prefix_entries:
+            return []
+        prefix = (prefix or '').strip().lower()
+        if not prefix:
+            return []
+        keys = self._prefix_keys[level]
+        entries = self._prefix_entries[level]
+        results = []
+        for i in range(bisect_left(keys, prefix), len(keys)):
+            if not keys[i].startswith(prefix):
+                break
+            record = entries[i][1]
+            if province and record.get('province') != province:
+                continue
+            if district and record.get('district') != district:
+                continue
+            results.append(record)
+            if len(results) >= limit:
+                break
+        return results
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """คืนค่า gazetteer ของ process นี้ (อ่านไฟล์ครั้งแรกที่ถูกเรียก)"""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                with open(DATA_FILE, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                _gazetteer = AddressGazetteer(data)
+                logger.info(f"Address gazetteer loaded: {len(_gazetteer.province_names)} provinces")
+    return _gazetteer
@@ -3,8 +3,11 @@ from flask_wtf.csrf import CSRFProtect
 from flask_cors import CORS  # type: ignore
 from werkzeug.exceptions import RequestEntityTooLarge
 from config import Config
-from database import get_db, close_db_connection, ensure_page_views_table
+from database import get_db, close_db_connection, ensure_page_views_table, ensure_reporting_indexes
 from utils import allowed_file, get_device_type
+from booking_slots import ensure_booking_slots_table
+from tire_model_images import ensure_model_image_column
+from booking_search import ensure_booking_search_table
 from decorators import login_required, customer_login_required, owner_login_required
 from routes.auth import auth
 from routes.api import api
@@ -12,6 +15,17 @@ from routes.admin import admin
 from routes.staff import staff
 from routes.owner import owner
 from routes.customer import customer
+from routes.reports import reports
+from routes.monitoring import monitoring
+import page_view_recorder
+import report_jobs
+import sql_profiler
+import upload_store
+import image_derivatives
+from upload_store import save_upload, delete_upload
+import metrics
+import template_cache
+from page_view_recorder import record_page_view
 import os
 import time
 import logging
@@ -38,6 +52,10 @@ database.DB_CONFIG.update({
     'password': os.environ.get('DB_PASSWORD', 'mxAiijYOvjVtdUrdtVCVyMygyvxOFOhO'),
     'database': os.environ.get('DB_NAME', 'railway')
 })
+database.pool_manager.configure(
+    pool_size=app.config.get('DB_POOL_SIZE'),
+    pool_timeout=app.config.get('DB_POOL_TIMEOUT')
+)
 
 # ตั้งค่า CSRF protection
 csrf = CSRFProtect(app)
@@ -48,6 +66,21 @@ CORS(app, origins=app.config.get('CORS_ORIGINS', ['*']))
 # ตั้งค่า database teardown
 app.teardown_request(close_db_connection)
 
+# ตั้งค่าการบันทึกการเข้าชมแบบบัฟเฟอร์
+page_view_recorder.init_app(app)
+
+# ตั้งค่าคิวสร้างรายงาน PDF เบื้องหลัง
+report_jobs.init_app(app)
+
+# วัดจำนวน/เวลา SQL ต่อ request และตรวจจับ N+1
+sql_profiler.init_app(app)
+
+# นับ request และเวลาตอบสนองต่อ endpoint สำหรับ /metrics
+metrics.init_app(app)
+
+# bytecode cache ของ template ที่ทุก worker ใช้ร่วมกัน และแท็ก {% cache %} สำหรับ fragment
+template_cache.init_app(app)
+
 # ตั้งค่า logging สำหรับ production
 if not app.config.get('DEBUG', False):
     logging.basicConfig(level=logging.INFO)
@@ -80,6 +113,10 @@ for folder in upload_folders:
             fallback_dir = os.path.join(os.path.expanduser('~'), 'uploads')
             os.makedirs(fallback_dir, exist_ok=True)
 
+# สร้างดัชนีไฟล์อัปโหลดสำหรับ /uploads/<filename> และคิวสร้างรูปย่อ/WebP
+image_derivatives.init_app(app)
+upload_store.init_app(app)
+
 # ลงทะเบียน blueprints
 app.register_blueprint(auth)
 app.register_blueprint(api)
@@ -87,11 +124,20 @@ app.register_blueprint(admin)
 app.register_blueprint(staff)
 app.register_blueprint(owner)
 app.register_blueprint(customer)
+app.register_blueprint(reports)
+app.register_blueprint(monitoring)
 
 # สร้างตารางที่จำเป็น
 with app.app_context():
     # ensure_roles_table() - ไม่จำเป็นแล้วเพราะใช้ role_name ในตาราง users แทน
     ensure_page_views_table()
+    ensure_reporting_indexes()
+    ensure_booking_slots_table()
+    ensure_model_image_column()
+    ensure_booking_search_table()
+
+# ปิด connection ที่เปิดใน master (gunicorn --preload) ก่อน fork เพื่อไม่ให้ worker แชร์ socket กัน
+database.pool_manager.dispose()
 
 # ===== CSRF EXEMPTIONS =====
 # Exempt API routes from CSRF protection
@@ -131,22 +177,7 @@ except KeyError:
 def log_page_view(page_id: str):
     """บันทึกการเข้าชมหน้าเว็บ"""
     try:
-        # สร้างตาราง page_views ถ้ายังไม่มี
-        ensure_page_views_table()
-        
-        cursor = get_db().cursor()
-        
-        # อัปเดตการเข้าชม
-        cursor.execute("""
-            INSERT INTO page_views (page_id, views)
-            VALUES (%s, 1)
-            ON DUPLICATE KEY UPDATE 
-                views = views + 1,
-                last_viewed_at = NOW()
-        """, (page_id,))
-        
-        get_db().commit()
-        
+        record_page_view(page_id)
     except Exception as e:
         print(f"Error logging page view: {e}")
 
@@ -168,41 +199,14 @@ def index():
 # Route สำหรับแสดงรูปภาพจาก upload folder
 @app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    """แสดงรูปภาพจาก upload folder - รองรับทั้ง Local และ Railway"""
-    try:
-        # ตรวจสอบว่าเป็นไฟล์รูปภาพหรือไม่
-        if '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']:
-            # ลองหาไฟล์ในโฟลเดอร์ต่างๆ
-            upload_folders = [
-                app.config['PROFILE_UPLOAD_FOLDER'],
-                app.config['TIRE_UPLOAD_FOLDER'],
-                app.config['PROMOTION_UPLOAD_FOLDER'],
-                app.config['SLIDER_UPLOAD_FOLDER'],
-                app.config['LOGO_UPLOAD_FOLDER'],
-                # เพิ่ม static/uploads สำหรับไฟล์เก่า
-                os.path.join(app.static_folder, 'uploads'),
-                os.path.join(app.static_folder, 'uploads', 'promotions'),
-                os.path.join(app.static_folder, 'uploads', 'tires'),
-                os.path.join(app.static_folder, 'uploads', 'profiles'),
-                os.path.join(app.static_folder, 'uploads', 'logos')
-            ]
-            
-            for folder in upload_folders:
-                file_path = os.path.join(folder, filename)
-                if os.path.exists(file_path):
-                    from flask import send_file
-                    return send_file(file_path, mimetype='image/jpeg')
-            
-            # ถ้าไม่เจอไฟล์ ให้แสดงรูป default
-            from flask import abort
-            print(f"File not found: {filename}")
-            abort(404)
-        else:
-            abort(404)
-    except Exception as e:
-        print(f"Error serving file {filename}: {e}")
-        abort(404)
+    """แสดงรูปภาพจาก upload folder - รองรับทั้ง Local และ Railway (ค้นจากดัชนีไฟล์ใน upload_store)
 
+    ?w=<ความกว้าง> ส่งรูปย่อขนาดมาตรฐานที่ใกล้ที่สุด (WebP ถ้าเบราว์เซอร์รองรับ)
+    """
+    width = request.args.get('w', type=int)
+    # ต้องระบุ image/webp ตรงๆ (*/* หรือ image/* ของ Safari รุ่นเก่าไม่ได้แปลว่าแสดง WebP ได้)
+    webp = any(value == 'image/webp' and quality > 0 for value, quality in request.accept_mimetypes)
+    return upload_store.store.send(filename, width=width if width and width > 0 else None, webp=webp)
 
 
 @app.route('/staff/profile', methods=['GET', 'POST'])
@@ -231,8 +235,7 @@ def staff_profile():
                         filename = f"{user_id}_{timestamp}_{secure_filename(file.filename)}"
                         
                         # บันทึกไฟล์
-                        file_path = os.path.join(app.config['PROFILE_UPLOAD_FOLDER'], filename)
-                        file.save(file_path)
+                        save_upload(file, app.config['PROFILE_UPLOAD_FOLDER'], filename)
                         avatar_filename = filename
                         
                         # ลบไฟล์เก่าถ้ามี
@@ -240,9 +243,7 @@ def staff_profile():
                         cursor.execute('SELECT avatar_filename FROM users WHERE user_id = %s', (user_id,))
                         user_data = cursor.fetchone()
                         if user_data and user_data.get('avatar_filename'):
-                            old_file_path = os.path.join(app.config['PROFILE_UPLOAD_FOLDER'], user_data['avatar_filename'])
-                            if os.path.exists(old_file_path):
-                                os.remove(old_file_path)
+                            delete_upload(app.config['PROFILE_UPLOAD_FOLDER'], user_data['avatar_filename'])
                     else:
                         flash('นามสกุลไฟล์ไม่ถูกต้อง กรุณาใช้ไฟล์ JPG, PNG เท่านั้น', 'error')
                         return redirect(url_for('staff_profile'))
@@ -358,6 +359,9 @@ def handle_file_too_large(e):
     flash('ไฟล์ที่อัปโหลดมีขนาดใหญ่เกินไป กรุณาเลือกไฟล์ที่มีขนาดไม่เกิน 5MB', 'error')
     return redirect(request.url)
 
+# คอมไพล์ template ของหน้าลูกค้าล่วงหน้า (หลังลงทะเบียน filter แล้ว) ให้ worker ที่ fork ใหม่ไม่ต้องคอมไพล์ซ้ำ
+template_cache.preload_templates(app)
+
 if __name__ == "__main__":
    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
 
@@ -0,0 +1,143 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# จำนวน id สูงสุดต่อ query แบบ IN (...) เพื่อไม่ให้ query ยาวเกินไป
+CHUNK_SIZE = 500
+
+TIRE_POSITIONS = ('front_left', 'front_right', 'rear_left', 'rear_right')
+
+
+def _chunks(ids, size=CHUNK_SIZE):
+    ids = list(dict.fromkeys(i for i in ids if i is not None))
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def load_booking_tires(cursor, booking_ids):
+    """ข้อมูลยางของการจองหลายรายการ: {booking_id: [{position, brand, model, size, dot}, ...]}"""
+    tires = {booking_id: [] for booking_id in booking_ids}
+    order = {position: i for i, position in enumerate(TIRE_POSITIONS)}
+    for chunk in _chunks(booking_ids):
+        cursor.execute(f'''
+            SELECT booking_id, position, brand, model, size, dot
+            FROM service_tires
+            WHERE booking_id IN ({_placeholders(chunk)})
+            ORDER BY booking_id, id
+        ''', tuple(chunk))
+        for row in cursor.fetchall():
+            booking_id = row.pop('booking_id')
+            tires.setdefault(booking_id, []).append(row)
+    for rows in tires.values():
+        rows.sort(key=lambda row: order.get(row['position'], len(order)))
+    return tires
+
+
+def load_booking_services(cursor, booking_ids):
+    """รายการบริการของการจองหลายรายการ: {booking_id: [item, ...]}
+
+    item มี item_id, service_id, quantity, service_name, category และ option_list
+    (รายการ {option_id, option_name, note} ของบริการย่อย) เรียงตาม item_id
+    """
+    services = {booking_id: [] for booking_id in booking_ids}
+    items_by_id = {}
+    for chunk in _chunks(booking_ids):
+        cursor.execute(f'''
+            SELECT bi.item_id, bi.booking_id, bi.service_id, bi.quantity,
+                   s.service_name, s.category
+            FROM booking_items bi
+            JOIN services s ON bi.service_id = s.service_id
+            WHERE bi.booking_id IN ({_placeholders(chunk)})
+            ORDER BY bi.booking_id, bi.item_id
+        ''', tuple(chunk))
+        for row in cursor.fetchall():
+            row['option_list'] = []
+            services.setdefault(row['booking_id'], []).append(row)
+            items_by_id[row['item_id']] = row
+
+    for chunk in _chunks(items_by_id):
+        cursor.execute(f'''
+            SELECT bio.item_id, bio.option_id, so.option_name, so.note
+            FROM booking_item_options bio
+            LEFT JOIN service_options so ON bio.option_id = so.option_id
+            WHERE bio.item_id IN ({_placeholders(chunk)})
+            ORDER BY bio.item_id, bio.option_id
+        ''', tuple(chunk))
+        for row in cursor.fetchall():
+            item = items_by_id.get(row.pop('item_id'))
+            if item is not None:
+                item['option_list'].append(row)
+    return services
+
+
+def load_booking_details(cursor, booking_ids, tires=True, services=True):
+    """ดึงยาง/บริการ/บริการย่อยของการจองทั้งชุดด้วย query แบบ IN (...) ทีละก้อน
+
+    คืนค่า {booking_id: {'tires': [...], 'services': [...]}}
+    """
+    booking_ids = list(dict.fromkeys(booking_ids))
+    tire_map = load_booking_tires(cursor, booking_ids) if tires else {}
+    service_map = load_booking_services(cursor, booking_ids) if services else {}
+    return {
+        booking_id: {
+            'tires': tire_map.get(booking_id, []),
+            'services': service_map.get(booking_id, []),
+        }
+        for booking_id in booking_ids
+    }
+
+
+def tire_info(tires):
+    """จัดกลุ่มยางตามตำแหน่ง {front_left: {...} | None, ...} (รูปแบบที่รายงาน PDF ใช้)"""
+    info = {position: None for position in TIRE_POSITIONS}
+    for tire in tires:
+        info[tire['position']] = {
+            'brand': tire['brand'],
+            'model': tire['model'],
+            'size': tire['size'],
+            'dot': tire['dot'],
+        }
+    return info
+
+
+def service_summary(item):
+    """แปลง item เป็นรูปแบบเดิมของหน้าพนักงาน (options เป็นข้อความคั่นด้วย ', ' หรือ None)"""
+    names = [option['option_name'] for option in item['option_list'] if option['option_name'] is not None]
+    return {
+        'item_id': item['item_id'],
+        'service_id': item['service_id'],
+        'quantity': item['quantity'],
+        'service_name': item['service_name'],
+        'category': item['category'],
+        'options': ', '.join(names) if names else None,
+    }
+
+
+def service_texts(items):
+    """ข้อความบริการแบบเดียวกับ GROUP_CONCAT เดิมของรายงาน: (service_names, service_details)
+
+    service_names: ชื่อบริการไม่ซ้ำ เรียงตามชื่อ
+    service_details: "บริการ (บริการย่อย)" ไม่ซ้ำ เรียงตามชื่อบริการและบริการย่อย
+    """
+    names = set()
+    details = set()
+    for item in items:
+        name = item['service_name']
+        if name is None:
+            continue
+        names.add(name)
+        option_names = [option['option_name'] for option in item['option_list']]
+        if not option_names:
+            details.add((name, ''))
+        for option_name in option_names:
+            details.add((name, option_name or ''))
+    service_names = ', '.join(sorted(names)) or None
+    service_details = ', '.join(
+        f"{name} ({option_name})" if option_name else name
+        for name, option_name in sorted(details)
+    ) or None
+    return service_names, service_details
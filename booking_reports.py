@@ -0,0 +1,73 @@
+import logging
+
+from database import get_cursor
+from booking_details import load_booking_details, service_texts, tire_info
+from booking_service import BOOKINGS_VERSION
+from customer_search import CUSTOMERS_VERSION
+
+logger = logging.getLogger(__name__)
+
+# version stamp ของข้อมูลที่รายงานการจองใช้ (key ของไฟล์รายงานในแคชของคิวรายงาน)
+BOOKING_REPORT_VERSIONS = (BOOKINGS_VERSION, CUSTOMERS_VERSION)
+
+
+def load_booking_report(params, order_by='b.booking_date DESC'):
+    """ดึงข้อมูลรายงานการจอง PDF ตามช่วงวันที่ใน params (ใช้ร่วมกันทั้งแอดมินและเจ้าของกิจการ)
+
+    order_by เป็นลำดับของแถวในรายงาน คืนค่า dict ที่แปลงเป็น JSON ได้สำหรับ renderer ใน report_pdfs
+    """
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+
+    cursor = get_cursor()
+
+    # ดึงข้อมูลการจองตามช่วงวันที่ (บริการและยางดึงแยกเป็นชุดด้านล่าง)
+    query = '''
+        SELECT b.booking_id, b.booking_date, b.service_date, b.service_time, b.status, b.note,
+               c.first_name, c.last_name, c.phone,
+               v.brand_name, v.model_name, v.license_plate, v.license_province
+        FROM bookings b
+        JOIN customers c ON b.customer_id = c.customer_id
+        JOIN vehicles v ON b.vehicle_id = v.vehicle_id
+    '''
+    query_params = []
+
+    if start_date and end_date:
+        # เงื่อนไขแบบช่วงเพื่อให้ใช้ index ของ booking_date ได้ (เทียบเท่า DATE(...) BETWEEN)
+        query += ' WHERE b.booking_date >= %s AND b.booking_date < DATE_ADD(%s, INTERVAL 1 DAY)'
+        query_params.extend([start_date, end_date])
+
+    query += f' ORDER BY {order_by}'
+    cursor.execute(query, query_params)
+    bookings = cursor.fetchall()
+
+    # ดึงบริการ บริการย่อย และยางของทุกการจองด้วย query แบบ IN (...) แทนการ query ทีละการจอง
+    details = load_booking_details(cursor, [booking['booking_id'] for booking in bookings])
+    cursor.close()
+
+    # แปลงข้อมูลให้เป็น JSON serializable
+    bookings_data = []
+    for booking in bookings:
+        booking_id = booking['booking_id']
+        detail = details[booking_id]
+        service_names, service_details = service_texts(detail['services'])
+        bookings_data.append({
+            'booking_id': booking_id,
+            'booking_date': booking['booking_date'].strftime('%Y-%m-%d') if booking['booking_date'] else None,
+            'service_date': booking['service_date'].strftime('%Y-%m-%d') if booking['service_date'] else None,
+            'service_time': str(booking['service_time']) if booking['service_time'] else None,
+            'status': booking['status'],
+            'first_name': booking['first_name'],
+            'last_name': booking['last_name'],
+            'phone': booking['phone'],
+            'brand_name': booking['brand_name'],
+            'model_name': booking['model_name'],
+            'license_plate': booking['license_plate'],
+            'license_province': booking['license_province'],
+            'service_names': service_names,
+            'service_details': service_details,
+            'note': booking['note'],
+            'tire_info': tire_info(detail['tires'])
+        })
+
+    return {'start_date': start_date, 'end_date': end_date, 'bookings': bookings_data}
@@ -0,0 +1,141 @@
+import re
+import logging
+import unicodedata
+
+from database import get_cursor, get_db
+
+logger = logging.getLogger(__name__)
+
+# ความยาวสูงสุดของ search key (คำค้นที่ยาวกว่านี้ถูกตัดเหลือส่วนต้น)
+KEY_LENGTH = 64
+INSERT_BATCH_SIZE = 1000
+
+# อักขระที่ไม่มีผลต่อการค้นหา: ช่องว่าง เครื่องหมายในทะเบียนรถ และอักขระความกว้างศูนย์ที่มักติดมากับข้อความภาษาไทย
+_IGNORED = re.compile('[\\s\\-_.,/()\u200b\u200c\u200d\ufeff]+')
+
+
+def normalize_search_text(text):
+    """แปลงข้อความเป็นรูปแบบเดียวกันสำหรับค้นหา
+
+    NFKC รวมรูปแบบที่พิมพ์ต่างกันแต่อ่านเหมือนกัน (เช่น สระอำ กับ นิคหิต+สระอา, ตัวเลขเต็มความกว้าง)
+    แล้วตัดช่องว่างและเครื่องหมายออก ภาษาไทยไม่มีการเว้นวรรคระหว่างคำจึงไม่ต้องตัดคำ
+    """
+    if not text:
+        return ''
+    return _IGNORED.sub('', unicodedata.normalize('NFKC', str(text))).lower()
+
+
+def search_keys(*values):
+    """search key ของข้อความ: ทุก suffix (ตัดเหลือ KEY_LENGTH ตัวอักษร)
+
+    การค้น LIKE 'คำค้น%' บน suffix ให้ผลเดียวกับ LIKE '%คำค้น%' บนข้อความเต็ม แต่ใช้ index ได้
+    """
+    keys = set()
+    for value in values:
+        text = normalize_search_text(value)
+        for start in range(len(text)):
+            keys.add(text[start:start + KEY_LENGTH])
+    return keys
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def index_bookings(cursor, booking_ids=None, customer_ids=None, vehicle_ids=None):
+    """สร้าง search key ของการจองใหม่ (ผู้เรียกต้อง commit เอง)
+
+    เลือกการจองตาม booking_ids, customer_ids (เมื่อชื่อลูกค้าเปลี่ยน) หรือ vehicle_ids (เมื่อทะเบียนรถเปลี่ยน)
+    ไม่ส่งอะไรเลย = สร้างใหม่ทั้งหมด
+    key ของแต่ละการจองคือ ชื่อ+นามสกุลลูกค้า (ต่อกัน จึงค้นด้วยชื่อเต็มได้) และทะเบียนรถ
+    """
+    conditions = []
+    params = []
+    for column, ids in (('b.booking_id', booking_ids), ('b.customer_id', customer_ids),
+                        ('b.vehicle_id', vehicle_ids)):
+        if ids is None:
+            continue
+        ids = sorted({int(value) for value in ids if value not in (None, '')})
+        if ids:
+            conditions.append(f'{column} IN ({_placeholders(ids)})')
+            params.extend(ids)
+    selected = booking_ids is not None or customer_ids is not None or vehicle_ids is not None
+    if selected and not conditions:
+        return
+    where = f"WHERE {' OR '.join(conditions)}" if conditions else ''
+    cursor.execute(f'''
+        SELECT b.booking_id, c.first_name, c.last_name, v.license_plate
+        FROM bookings b
+        JOIN customers c ON b.customer_id = c.customer_id
+        JOIN vehicles v ON b.vehicle_id = v.vehicle_id
+        {where}
+    ''', params)
+    rows = cursor.fetchall()
+
+    if selected:
+        ids = [row['booking_id'] for row in rows]
+        if ids:
+            cursor.execute(f'DELETE FROM booking_search_keys WHERE booking_id IN ({_placeholders(ids)})', ids)
+    else:
+        cursor.execute('DELETE FROM booking_search_keys')
+
+    entries = []
+    for row in rows:
+        name = f"{row['first_name'] or ''}{row['last_name'] or ''}"
+        entries.extend((key, row['booking_id']) for key in search_keys(name, row['license_plate']))
+    for start in range(0, len(entries), INSERT_BATCH_SIZE):
+        cursor.executemany('INSERT IGNORE INTO booking_search_keys (search_key, booking_id) VALUES (%s, %s)',
+                           entries[start:start + INSERT_BATCH_SIZE])
+
+
+def booking_search_condition(term, booking_column='b.booking_id'):
+    """เงื่อนไข SQL สำหรับกรองการจองด้วยคำค้น (ชื่อ/นามสกุลลูกค้า หรือทะเบียนรถ)
+
+    คืนค่า (sql, params) ถ้าคำค้นไม่มีตัวอักษรที่ค้นได้ (เช่น '-' หรือช่องว่าง) จะได้เงื่อนไขที่ไม่ตรงกับแถวใดเลย
+    เหมือน customer_search แทนการไม่กรองแล้วได้การจองทั้งหมด
+    เป็นการค้น prefix บน primary key ของ booking_search_keys แล้ว join กลับด้วย booking_id
+    """
+    key = normalize_search_text(term)[:KEY_LENGTH]
+    if not key:
+        return '1 = 0', []
+    return (f"{booking_column} IN (SELECT k.booking_id FROM booking_search_keys k WHERE k.search_key LIKE %s)",
+            [_escape_like(key) + '%'])
+
+
+def ensure_booking_search_table():
+    """สร้างตาราง booking_search_keys ถ้ายังไม่มี และสร้าง key ของการจองเดิมเมื่อสร้างครั้งแรก"""
+    try:
+        cursor = get_cursor()
+        if not cursor:
+            logger.error("Cannot create cursor for booking_search_keys table")
+            return False
+        cursor.execute('''
+            SELECT COUNT(*) AS table_count
+            FROM information_schema.tables
+            WHERE table_schema = DATABASE() AND table_name = 'booking_search_keys'
+        ''')
+        exists = cursor.fetchone()['table_count'] > 0
+        if not exists:
+            # utf8mb4_bin: เทียบทีละ code point (collation แบบ _ci ข้ามวรรณยุกต์ไทยบางตัว) ข้อความ normalize แล้ว
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS booking_search_keys (
+                    search_key VARCHAR({KEY_LENGTH}) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+                    booking_id INT NOT NULL,
+                    PRIMARY KEY (search_key, booking_id),
+                    KEY idx_booking_search_keys_booking (booking_id),
+                    CONSTRAINT fk_booking_search_keys_bookings FOREIGN KEY (booking_id)
+                        REFERENCES bookings (booking_id) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            ''')
+            index_bookings(cursor)
+            get_db().commit()
+            logger.info("ตาราง booking_search_keys พร้อมใช้งาน (สร้าง key ของการจองเดิมแล้ว)")
+        cursor.close()
+        return True
+    except Exception as e:
+        logger.error(f"Error creating booking_search_keys table: {e}")
+        return False
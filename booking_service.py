@@ -0,0 +1,280 @@
+import logging
+
+from booking_details import TIRE_POSITIONS
+from booking_slots import lock_booking_slot, move_booking_slot, slots_changed
+from booking_search import index_bookings
+from cache_versions import bump_version
+from tire_catalog import get_tire_catalog
+from vehicle_taxonomy import get_vehicle_taxonomy
+
+logger = logging.getLogger(__name__)
+
+# version stamp ของตาราง bookings (bump หลัง commit ทุกครั้งที่เพิ่ม/แก้ไข/ลบการจอง)
+BOOKINGS_VERSION = 'bookings'
+
+
+def _to_int(value):
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def _name_from(names, value):
+    """แปลง id จากฟอร์มเป็นชื่อจาก dictionary ในหน่วยความจำ ('' ถ้าไม่มี id หรือไม่พบ)"""
+    key = _to_int(value)
+    if key is None:
+        return ''
+    return names.get(key) or ''
+
+
+def car_brand_name(car_brand_id):
+    """ชื่อยี่ห้อรถจาก car_brand_id (อ่านจาก vehicle taxonomy ที่แคชไว้)"""
+    return _name_from(get_vehicle_taxonomy().brand_names, car_brand_id)
+
+
+def tire_names(brand_id, model_id):
+    """(ชื่อยี่ห้อยาง, ชื่อรุ่นยาง) จาก id (อ่านจาก tire catalog ที่แคชไว้)"""
+    catalog = get_tire_catalog()
+    return _name_from(catalog.brand_names, brand_id), _name_from(catalog.model_names, model_id)
+
+
+def services_from_form(form):
+    """บริการที่เลือกในฟอร์ม [(service_id, [option_id, ...]), ...] (ตัด id ซ้ำ/ไม่ถูกต้องออก)"""
+    services = []
+    seen = set()
+    for value in form.getlist('service_id'):
+        service_id = _to_int(value)
+        if service_id is None or service_id in seen:
+            continue
+        seen.add(service_id)
+        option_ids = []
+        for option_value in form.getlist(f'service_option_{value}'):
+            option_id = _to_int(option_value)
+            if option_id is not None and option_id not in option_ids:
+                option_ids.append(option_id)
+        services.append((service_id, option_ids))
+    return services
+
+
+def tires_from_form(form):
+    """ข้อมูลยาง 4 ตำแหน่งจากฟอร์ม [(position, brand, model, size, dot), ...]
+
+    ยางหน้า (front_left/front_right) ใช้ยี่ห้อ รุ่น และขนาดของ tire_front_*
+    ยางหลังใช้ของ tire_rear_* ส่วน DOT แยกตามตำแหน่ง
+    """
+    front = tire_names(form.get('tire_front_brand_id', '').strip(), form.get('tire_front_model_id', '').strip())
+    rear = tire_names(form.get('tire_rear_brand_id', '').strip(), form.get('tire_rear_model_id', '').strip())
+    front_size = form.get('tire_front_size', '').strip()
+    rear_size = form.get('tire_rear_size', '').strip()
+    tires = []
+    for position in TIRE_POSITIONS:
+        brand, model = front if position.startswith('front') else rear
+        size = front_size if position.startswith('front') else rear_size
+        tires.append((position, brand, model, size, form.get(f'dot_{position}', '').strip()))
+    return tires
+
+
+def insert_booking_items(cursor, booking_id, services):
+    """บันทึกบริการและบริการย่อยของการจองด้วย 2 statement
+
+    - booking_items: INSERT หลายแถวด้วย executemany (connector รวมเป็น VALUES เดียว)
+    - booking_item_options: INSERT ... SELECT จับคู่ item_id จาก service_id ในการจองเดียวกัน
+      จึงไม่ต้องพึ่ง LAST_INSERT_ID() หรือ query item_id กลับมา (service_id ต้องไม่ซ้ำในการจอง)
+    """
+    if not services:
+        return
+    cursor.executemany('''
+        INSERT INTO booking_items (booking_id, service_id, quantity)
+        VALUES (%s, %s, %s)
+    ''', [(booking_id, service_id, 1) for service_id, _ in services])
+
+    pairs = [(service_id, option_id) for service_id, option_ids in services for option_id in option_ids]
+    if not pairs:
+        return
+    selected = ' UNION ALL '.join(['SELECT %s AS service_id, %s AS option_id'] * len(pairs))
+    params = [value for pair in pairs for value in pair]
+    params.append(booking_id)
+    cursor.execute(f'''
+        INSERT INTO booking_item_options (item_id, option_id)
+        SELECT bi.item_id, selected.option_id
+        FROM ({selected}) AS selected
+        JOIN booking_items bi ON bi.service_id = selected.service_id
+        WHERE bi.booking_id = %s
+    ''', tuple(params))
+
+
+def insert_service_tires(cursor, booking_id, tires):
+    """บันทึกข้อมูลยางทุกตำแหน่งด้วย INSERT หลายแถวครั้งเดียว"""
+    if not tires:
+        return
+    cursor.executemany('''
+        INSERT INTO service_tires (booking_id, position, brand, model, size, dot)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    ''', [(booking_id,) + tuple(tire) for tire in tires])
+
+
+def replace_booking_items(cursor, booking_id, services):
+    """แทนที่บริการของการจองด้วยรายการใหม่ โดยแก้เฉพาะแถวที่เปลี่ยน
+
+    - บริการที่ถูกเอาออก: ลบ item และบริการย่อยของ item นั้นด้วย primary key
+    - บริการใหม่: INSERT แบบหลายแถว (insert_booking_items)
+    - บริการเดิม: เพิ่ม/ลบเฉพาะบริการย่อยที่ต่างไป
+    """
+    cursor.execute('''
+        SELECT item_id, service_id
+        FROM booking_items
+        WHERE booking_id = %s
+        ORDER BY item_id
+    ''', (booking_id,))
+    existing_items = {}
+    stale_item_ids = []
+    for row in cursor.fetchall():
+        if row['service_id'] in existing_items:
+            # การจองเก่าอาจมีบริการซ้ำ เก็บ item แรกไว้ที่เหลือลบทิ้ง
+            stale_item_ids.append(row['item_id'])
+        else:
+            existing_items[row['service_id']] = row['item_id']
+
+    existing_options = {item_id: {} for item_id in existing_items.values()}
+    if existing_items:
+        item_ids = list(existing_items.values())
+        cursor.execute(f'''
+            SELECT id, item_id, option_id
+            FROM booking_item_options
+            WHERE item_id IN ({_placeholders(item_ids)})
+            ORDER BY id
+        ''', tuple(item_ids))
+        for row in cursor.fetchall():
+            existing_options[row['item_id']].setdefault(row['option_id'], []).append(row['id'])
+
+    wanted = dict(services)
+    stale_item_ids.extend(item_id for service_id, item_id in existing_items.items() if service_id not in wanted)
+    new_services = [(service_id, option_ids) for service_id, option_ids in services if service_id not in existing_items]
+
+    stale_option_ids = []
+    new_options = []
+    for service_id, item_id in existing_items.items():
+        if service_id not in wanted:
+            continue
+        current = existing_options[item_id]
+        for option_id, row_ids in current.items():
+            # บริการย่อยที่ไม่ได้เลือกแล้ว หรือแถวซ้ำของบริการย่อยเดียวกัน
+            stale_option_ids.extend(row_ids if option_id not in wanted[service_id] else row_ids[1:])
+        new_options.extend((item_id, option_id) for option_id in wanted[service_id] if option_id not in current)
+
+    if stale_item_ids:
+        cursor.execute(f'DELETE FROM booking_item_options WHERE item_id IN ({_placeholders(stale_item_ids)})',
+                       tuple(stale_item_ids))
+        cursor.execute(f'DELETE FROM booking_items WHERE item_id IN ({_placeholders(stale_item_ids)})',
+                       tuple(stale_item_ids))
+    if stale_option_ids:
+        cursor.execute(f'DELETE FROM booking_item_options WHERE id IN ({_placeholders(stale_option_ids)})',
+                       tuple(stale_option_ids))
+    if new_options:
+        cursor.executemany('''
+            INSERT INTO booking_item_options (item_id, option_id)
+            VALUES (%s, %s)
+        ''', new_options)
+    insert_booking_items(cursor, booking_id, new_services)
+
+
+def replace_service_tires(cursor, booking_id, tires):
+    """แทนที่ข้อมูลยางของการจอง โดย UPDATE เฉพาะตำแหน่งที่ข้อมูลเปลี่ยน
+
+    แถวเก่าที่ไม่มีตำแหน่ง (ข้อมูลก่อนมีคอลัมน์ position) ถูกใช้เป็นตำแหน่งที่ว่างตามลำดับ id
+    แถวที่เกินมาถูกลบ และตำแหน่งที่ยังไม่มีแถวจะ INSERT แบบหลายแถว
+    """
+    cursor.execute('''
+        SELECT id, position, brand, model, size, dot
+        FROM service_tires
+        WHERE booking_id = %s
+        ORDER BY id
+    ''', (booking_id,))
+    by_position = {}
+    unplaced = []
+    stale_ids = []
+    for row in cursor.fetchall():
+        if row['position'] in TIRE_POSITIONS and row['position'] not in by_position:
+            by_position[row['position']] = row
+        elif row['position'] in TIRE_POSITIONS:
+            stale_ids.append(row['id'])
+        else:
+            unplaced.append(row)
+
+    updates = []
+    inserts = []
+    for position, brand, model, size, dot in tires:
+        row = by_position.pop(position, None)
+        if row is None and unplaced:
+            row = unplaced.pop(0)
+        if row is None:
+            inserts.append((position, brand, model, size, dot))
+        elif (row['position'], row['brand'], row['model'], row['size'], row['dot']) != (position, brand, model, size, dot):
+            updates.append((position, brand, model, size, dot, row['id']))
+    stale_ids.extend(row['id'] for row in by_position.values())
+    stale_ids.extend(row['id'] for row in unplaced)
+
+    if stale_ids:
+        cursor.execute(f'DELETE FROM service_tires WHERE id IN ({_placeholders(stale_ids)})', tuple(stale_ids))
+    if updates:
+        cursor.executemany('''
+            UPDATE service_tires SET position = %s, brand = %s, model = %s, size = %s, dot = %s
+            WHERE id = %s
+        ''', updates)
+    insert_service_tires(cursor, booking_id, inserts)
+
+
+def create_booking(cursor, customer_id, vehicle_id, booking_date, service_date, service_time,
+                   status, note, services=(), tires=(), enforce_capacity=False):
+    """สร้างการจองพร้อมบริการ บริการย่อย และข้อมูลยาง (ผู้เรียกต้อง commit เองแล้วเรียก bookings_changed())
+
+    enforce_capacity=True (ลูกค้าจองเอง) จะโยน SlotFullError เมื่อรอบเวลาเต็ม
+    คืนค่า booking_id
+    """
+    move_booking_slot(cursor, None, {'service_date': service_date, 'service_time': service_time, 'status': status},
+                      enforce=enforce_capacity)
+    cursor.execute('''
+        INSERT INTO bookings (customer_id, vehicle_id, booking_date, service_date, service_time, status, note)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ''', (customer_id, vehicle_id, booking_date, service_date, service_time, status, note))
+    booking_id = cursor.lastrowid
+    insert_booking_items(cursor, booking_id, services)
+    insert_service_tires(cursor, booking_id, tires)
+    index_bookings(cursor, booking_ids=[booking_id])
+    return booking_id
+
+
+def update_booking(cursor, booking_id, service_date, service_time, status, note, services=None, tires=None):
+    """แก้ไขวัน เวลา สถานะ หมายเหตุ และ (ถ้าส่งมา) บริการและยางของการจอง (ผู้เรียกต้อง commit เองแล้วเรียก bookings_changed())
+
+    ล็อกแถวการจองก่อน แล้วย้ายคิวตามวันเวลา/สถานะใหม่ (แอดมินและพนักงานจองเกินจำนวนคิวได้)
+    คืนค่า False ถ้าไม่พบการจอง
+    """
+    before = lock_booking_slot(cursor, booking_id)
+    if not before:
+        return False
+    cursor.execute('''
+        UPDATE bookings
+        SET service_date = %s, service_time = %s, status = %s, note = %s
+        WHERE booking_id = %s
+    ''', (service_date, service_time, status, note, booking_id))
+    move_booking_slot(cursor, before, {'service_date': service_date, 'service_time': service_time, 'status': status})
+    if services is not None:
+        replace_booking_items(cursor, booking_id, services)
+    if tires is not None:
+        replace_service_tires(cursor, booking_id, tires)
+    return True
+
+
+def bookings_changed():
+    """แจ้งทุก worker ว่าข้อมูลการจองเปลี่ยน (เรียกหลัง commit)
+
+    คำนวณจุดเริ่มของหน้ารายการจองใหม่ และสร้างแคชความพร้อมของคิวใหม่ (การจองที่เปลี่ยนอาจย้าย/คืนคิว)
+    """
+    bump_version(BOOKINGS_VERSION)
+    slots_changed()
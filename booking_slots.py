@@ -0,0 +1,335 @@
+import os
+import json
+import time
+import tempfile
+import calendar
+import logging
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+
+from database import get_cursor, get_db
+from cache_versions import get_version, bump_version
+from utils import encode_json_payload
+
+logger = logging.getLogger(__name__)
+
+CANCELLED = 'ยกเลิก'
+
+# ค่าเริ่มต้นของรอบเวลาและจำนวนคิวต่อรอบ (override ได้ผ่าน app.config)
+DEFAULT_SLOT_TIMES = ('09:00', '10:00', '11:00', '13:00', '14:00', '15:00')
+DEFAULT_SLOT_CAPACITY = 3
+
+# ชื่อ version stamp ของตัวนับคิว (bump หลัง commit ทุกครั้งที่ตัวนับเปลี่ยน ผ่าน slots_changed)
+SLOTS_VERSION = 'booking_slots'
+# แคชความพร้อมรายเดือนเป็นไฟล์ที่ทุก gunicorn worker ใช้ร่วมกัน
+AVAILABILITY_CACHE_DIR = os.environ.get(
+    'BOOKING_AVAILABILITY_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'tireweb_availability'))
+DEFAULT_AVAILABILITY_CACHE_TTL = 30
+
+
+class SlotFullError(Exception):
+    """รอบเวลาที่เลือกเต็มแล้ว หรือไม่มีรอบนี้ให้บริการในวันนั้น"""
+
+    def __init__(self, service_date, service_time, message):
+        super().__init__(message)
+        self.service_date = service_date
+        self.service_time = service_time
+
+
+def slot_key(value):
+    """แปลงเวลา (timedelta จาก MySQL, time หรือ string) เป็น 'HH:MM'"""
+    if value is None:
+        return None
+    if hasattr(value, 'total_seconds'):
+        total_seconds = int(value.total_seconds())
+        return f"{total_seconds // 3600:02d}:{(total_seconds % 3600) // 60:02d}"
+    if hasattr(value, 'strftime'):
+        return value.strftime('%H:%M')
+    parts = str(value).strip().split(':')
+    if len(parts) >= 2 and parts[0].isdigit() and parts[1].isdigit():
+        return f"{int(parts[0]):02d}:{int(parts[1]):02d}"
+    return None
+
+
+def parse_service_date(value):
+    """แปลง 'YYYY-MM-DD' (หรือ date/datetime) เป็น date คืนค่า None ถ้ารูปแบบไม่ถูกต้อง"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value).strip(), '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def slot_times():
+    """รอบเวลามาตรฐาน (BOOKING_SLOT_TIMES) แบบ 'HH:MM' เรียงตามเวลา สำหรับตัวเลือกก่อนเลือกวันที่"""
+    times = current_app.config.get('BOOKING_SLOT_TIMES', DEFAULT_SLOT_TIMES)
+    return sorted({slot_key(time_str) for time_str in times} - {None})
+
+
+def slot_schedule(service_date):
+    """รอบเวลาของวันนั้น {'HH:MM': จำนวนคิวสูงสุด} เรียงตามเวลา
+
+    BOOKING_SLOT_SCHEDULE กำหนดรอบเวลาแยกตามวันในสัปดาห์ (0 = จันทร์ ... 6 = อาทิตย์)
+    วันที่ไม่ได้กำหนดใช้ BOOKING_SLOT_TIMES x BOOKING_SLOT_CAPACITY และ {} หมายถึงปิดทำการ
+    """
+    config = current_app.config
+    schedule = config.get('BOOKING_SLOT_SCHEDULE') or {}
+    weekday = service_date.weekday()
+    slots = schedule.get(weekday, schedule.get(str(weekday)))
+    if slots is None:
+        capacity = int(config.get('BOOKING_SLOT_CAPACITY', DEFAULT_SLOT_CAPACITY))
+        slots = {time_str: capacity for time_str in config.get('BOOKING_SLOT_TIMES', DEFAULT_SLOT_TIMES)}
+    return {slot_key(time_str): int(capacity) for time_str, capacity in sorted(slots.items())}
+
+
+def _slot_of(state):
+    """(date, 'HH:MM') ที่การจองนี้ใช้คิวอยู่ หรือ None ถ้าไม่นับคิว (ยกเลิก/ไม่มีวันเวลา)"""
+    if not state or state.get('status') in (None, CANCELLED):
+        return None
+    service_date = parse_service_date(state.get('service_date'))
+    service_time = slot_key(state.get('service_time'))
+    if service_date is None or service_time is None:
+        return None
+    return service_date, service_time
+
+
+def lock_booking_slot(cursor, booking_id):
+    """อ่านวัน เวลา และสถานะของการจองพร้อมล็อกแถว (SELECT ... FOR UPDATE)
+
+    ใช้ก่อนแก้ไข/ลบการจอง เพื่อให้การเปลี่ยนสถานะพร้อมกันหลายครั้งปรับตัวนับได้ถูกต้อง
+    """
+    cursor.execute('''
+        SELECT booking_id, service_date, service_time, status
+        FROM bookings
+        WHERE booking_id = %s
+        FOR UPDATE
+    ''', (booking_id,))
+    return cursor.fetchone()
+
+
+def lock_customer_booking_slots(cursor, customer_id):
+    """เหมือน lock_booking_slot แต่สำหรับการจองทั้งหมดของลูกค้า"""
+    cursor.execute('''
+        SELECT booking_id, service_date, service_time, status
+        FROM bookings
+        WHERE customer_id = %s
+        FOR UPDATE
+    ''', (customer_id,))
+    return cursor.fetchall()
+
+
+def reserve_slot(cursor, service_date, service_time, enforce=True):
+    """จองคิว 1 คิวในรอบเวลา ภายใน transaction ของผู้เรียก
+
+    enforce=True (การจองของลูกค้า) ตรวจจำนวนคิวสูงสุดและโยน SlotFullError ถ้าเต็ม;
+    แถวตัวนับถูกล็อกจนกว่าจะ commit/rollback การจองพร้อมกันในรอบเดียวกันจึงต่อคิวกัน
+    enforce=False (แอดมิน/พนักงาน) นับคิวเพิ่มโดยไม่ตรวจจำนวนสูงสุด
+    """
+    slot_date = parse_service_date(service_date)
+    slot_time = slot_key(service_time)
+    if slot_date is None or slot_time is None:
+        raise ValueError(f"Invalid booking slot: {service_date} {service_time}")
+
+    if not enforce:
+        cursor.execute('''
+            INSERT INTO booking_slots (slot_date, slot_time, booked) VALUES (%s, %s, 1)
+            ON DUPLICATE KEY UPDATE booked = booked + 1
+        ''', (slot_date, slot_time))
+        return
+
+    capacity = slot_schedule(slot_date).get(slot_time, 0)
+    if capacity <= 0:
+        raise SlotFullError(slot_date, slot_time, f'ไม่มีรอบเวลา {slot_time} น. ให้บริการในวันที่เลือก')
+    # ON DUPLICATE KEY ล็อกแถวแบบ exclusive ตั้งแต่แรก (ไม่ต้อง upgrade lock จึงไม่เกิด deadlock)
+    cursor.execute('''
+        INSERT INTO booking_slots (slot_date, slot_time, booked) VALUES (%s, %s, 0)
+        ON DUPLICATE KEY UPDATE booked = booked
+    ''', (slot_date, slot_time))
+    cursor.execute('''
+        UPDATE booking_slots SET booked = booked + 1
+        WHERE slot_date = %s AND slot_time = %s AND booked < %s
+    ''', (slot_date, slot_time, capacity))
+    if cursor.rowcount != 1:
+        raise SlotFullError(slot_date, slot_time, f'รอบเวลา {slot_time} น. เต็มแล้ว กรุณาเลือกเวลาอื่น')
+
+
+def release_slot(cursor, service_date, service_time):
+    """คืนคิว 1 คิวในรอบเวลา (เมื่อยกเลิกหรือลบการจอง)"""
+    slot_date = parse_service_date(service_date)
+    slot_time = slot_key(service_time)
+    if slot_date is None or slot_time is None:
+        return
+    cursor.execute('''
+        UPDATE booking_slots SET booked = GREATEST(booked - 1, 0)
+        WHERE slot_date = %s AND slot_time = %s
+    ''', (slot_date, slot_time))
+
+
+def move_booking_slot(cursor, before, after, enforce=False):
+    """ปรับตัวนับคิวตามการเปลี่ยนแปลงของการจอง
+
+    before/after เป็น dict ที่มี service_date, service_time และ status (None = ไม่มีการจองนั้น)
+    ครอบคลุมการเพิ่ม (before=None) การลบ (after=None) การเปลี่ยนสถานะ และการย้ายวันเวลา
+    ผู้เรียกต้องเรียก slots_changed() หลัง commit
+    """
+    before_slot = _slot_of(before)
+    after_slot = _slot_of(after)
+    if before_slot == after_slot:
+        return
+    if after_slot:
+        reserve_slot(cursor, *after_slot, enforce=enforce)
+    if before_slot:
+        release_slot(cursor, *before_slot)
+
+
+def slots_changed():
+    """แจ้งทุก worker ว่าตัวนับคิวเปลี่ยน (เรียกหลัง commit เพื่อไม่ให้แคชรายเดือนถูกสร้างจากข้อมูลก่อน commit)"""
+    bump_version(SLOTS_VERSION)
+
+
+def _day_availability(service_date, booked):
+    availability = {}
+    for time_slot, capacity in slot_schedule(service_date).items():
+        current_count = booked.get(time_slot, 0)
+        availability[time_slot] = {
+            'available': current_count < capacity,
+            'current_bookings': current_count,
+            'max_bookings': capacity,
+            'remaining': max(0, capacity - current_count)
+        }
+    return availability
+
+
+def slot_availability(cursor, service_date):
+    """ความพร้อมของแต่ละรอบเวลาในวันนั้น อ่านจากตัวนับ booking_slots (ไม่ต้องนับจาก bookings)"""
+    cursor.execute('''
+        SELECT slot_time, booked
+        FROM booking_slots
+        WHERE slot_date = %s
+    ''', (service_date,))
+    booked = {slot_key(row['slot_time']): row['booked'] for row in cursor.fetchall()}
+    return _day_availability(service_date, booked)
+
+
+def parse_month(value):
+    """แปลง 'YYYY-MM' เป็น (year, month) คืนค่า None ถ้ารูปแบบไม่ถูกต้อง"""
+    try:
+        parsed = datetime.strptime(str(value).strip(), '%Y-%m')
+    except (TypeError, ValueError):
+        return None
+    return parsed.year, parsed.month
+
+
+def month_availability(cursor, year, month):
+    """ความพร้อมของทุกวันในเดือน {'YYYY-MM-DD': {รอบเวลา: {...}}} ด้วย query ช่วงวันที่ครั้งเดียว
+
+    วันที่ปิดทำการ (ไม่มีรอบเวลาในตาราง) ได้ค่า {}
+    """
+    first_day = date(year, month, 1)
+    days_in_month = calendar.monthrange(year, month)[1]
+    cursor.execute('''
+        SELECT slot_date, slot_time, booked
+        FROM booking_slots
+        WHERE slot_date >= %s AND slot_date < %s
+    ''', (first_day, first_day + timedelta(days=days_in_month)))
+    booked = {}
+    for row in cursor.fetchall():
+        booked.setdefault(row['slot_date'], {})[slot_key(row['slot_time'])] = row['booked']
+
+    days = {}
+    for offset in range(days_in_month):
+        service_date = first_day + timedelta(days=offset)
+        days[service_date.isoformat()] = _day_availability(service_date, booked.get(service_date, {}))
+    return days
+
+
+def _availability_cache_path(year, month):
+    return os.path.join(AVAILABILITY_CACHE_DIR, f"{year:04d}-{month:02d}.json")
+
+
+def month_availability_payload(year, month):
+    """(body JSON, ETag) ของความพร้อมรายเดือน ผ่านแคชไฟล์ที่ใช้ร่วมกันทุก worker
+
+    แคชหมดอายุเมื่อเกิน BOOKING_AVAILABILITY_CACHE_TTL วินาที หรือเมื่อตัวนับคิวเปลี่ยน (version stamp)
+    """
+    ttl = float(current_app.config.get('BOOKING_AVAILABILITY_CACHE_TTL', DEFAULT_AVAILABILITY_CACHE_TTL))
+    version = str(get_version(SLOTS_VERSION))
+    path = _availability_cache_path(year, month)
+    try:
+        if time.time() - os.path.getmtime(path) < ttl:
+            with open(path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('version') == version:
+                return cached['body'], cached['etag']
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+    cursor = get_cursor()
+    days = month_availability(cursor, year, month)
+    cursor.close()
+    payload = encode_json_payload({'success': True, 'month': f"{year:04d}-{month:02d}", 'days': days})
+    try:
+        os.makedirs(AVAILABILITY_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': version, 'body': payload[0], 'etag': payload[1]}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"Error writing availability cache {path}: {e}")
+    return payload
+
+
+def rebuild_booking_slots(cursor, start_date=None, end_date=None):
+    """คำนวณตัวนับใหม่จากตาราง bookings (ทั้งหมด หรือเฉพาะช่วงวันที่)"""
+    where = ''
+    params = ()
+    if start_date and end_date:
+        where = 'AND service_date BETWEEN %s AND %s'
+        params = (start_date, end_date)
+        cursor.execute('DELETE FROM booking_slots WHERE slot_date BETWEEN %s AND %s', params)
+    else:
+        cursor.execute('DELETE FROM booking_slots')
+    cursor.execute(f'''
+        INSERT INTO booking_slots (slot_date, slot_time, booked)
+        SELECT service_date, MAKETIME(HOUR(service_time), MINUTE(service_time), 0) AS slot_time, COUNT(*)
+        FROM bookings
+        WHERE status != 'ยกเลิก' AND service_date IS NOT NULL AND service_time IS NOT NULL {where}
+        GROUP BY service_date, slot_time
+    ''', params)
+
+
+def ensure_booking_slots_table():
+    """สร้างตาราง booking_slots ถ้ายังไม่มี และเติมตัวนับจากการจองเดิมเมื่อสร้างครั้งแรก"""
+    try:
+        cursor = get_cursor()
+        if not cursor:
+            logger.error("Cannot create cursor for booking_slots table")
+            return False
+        cursor.execute('''
+            SELECT COUNT(*) AS table_count
+            FROM information_schema.tables
+            WHERE table_schema = DATABASE() AND table_name = 'booking_slots'
+        ''')
+        exists = cursor.fetchone()['table_count'] > 0
+        if not exists:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS booking_slots (
+                    slot_date DATE NOT NULL,
+                    slot_time TIME NOT NULL,
+                    booked INT NOT NULL DEFAULT 0,
+                    PRIMARY KEY (slot_date, slot_time)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            ''')
+            rebuild_booking_slots(cursor)
+            get_db().commit()
+            slots_changed()
+            logger.info("ตาราง booking_slots พร้อมใช้งาน (เติมตัวนับจากการจองเดิมแล้ว)")
+        cursor.close()
+        return True
+    except Exception as e:
+        logger.error(f"Error creating booking_slots table: {e}")
+        return False
@@ -0,0 +1,42 @@
+import os
+import tempfile
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# โฟลเดอร์เก็บ version stamp ที่ทุก gunicorn worker บนเครื่องเดียวกันมองเห็น
+VERSION_DIR = os.environ.get('CACHE_VERSION_DIR', os.path.join(tempfile.gettempdir(), 'tireweb_versions'))
+
+
+def _stamp_path(name):
+    return os.path.join(VERSION_DIR, f"{name}.version")
+
+
+def get_version(name):
+    """อ่าน version stamp ของข้อมูลชุด name (ใช้ stat ครั้งเดียว ไม่แตะฐานข้อมูล)
+
+    คืนค่า 0 ถ้ายังไม่เคยมีการ bump
+    """
+    try:
+        stat = os.stat(_stamp_path(name))
+        return (stat.st_mtime_ns, stat.st_ino)
+    except FileNotFoundError:
+        return 0
+    except Exception as e:
+        logger.warning(f"Error reading version stamp {name}: {e}")
+        return 0
+
+
+def bump_version(name):
+    """เปลี่ยน version stamp ของข้อมูลชุด name เพื่อให้ cache ในทุก worker ถูกสร้างใหม่"""
+    try:
+        os.makedirs(VERSION_DIR, exist_ok=True)
+        path = _stamp_path(name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(str(time.time_ns()))
+        # os.replace ทำให้ได้ inode ใหม่เสมอ แม้ mtime จะซ้ำกันในเครื่องที่ความละเอียดเวลาต่ำ
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.error(f"Error bumping version stamp {name}: {e}")
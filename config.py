@@ -1,4 +1,5 @@
 import os
+import json
 import tempfile
 from datetime import timedelta
 
@@ -14,6 +15,9 @@ class Config:
     DB_USER = os.environ.get('DB_USER', 'root')
     DB_PASSWORD = os.environ.get('DB_PASSWORD', 'mxAiijYOvjVtdUrdtVCVyMygyvxOFOhO')
     DB_NAME = os.environ.get('DB_NAME', 'railway')
+    # Connection pool ต่อ gunicorn worker
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))
     
     # Production settings
     DEBUG = os.environ.get('DEBUG', 'false').lower() == 'true'
@@ -41,6 +45,12 @@ class Config:
 
     # Allowed file extensions
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+    # อายุ cache ฝั่งเบราว์เซอร์ของรูปที่เสิร์ฟผ่าน /uploads (วินาที) ไฟล์ที่เปลี่ยนจะถูกตรวจด้วย ETag/Last-Modified
+    UPLOAD_CACHE_MAX_AGE = int(os.environ.get('UPLOAD_CACHE_MAX_AGE', 7 * 24 * 60 * 60))
+    # รูปย่อของไฟล์อัปโหลด (/uploads/<filename>?w=) - ความกว้างมาตรฐาน และจำนวน process ที่ใช้ย่อรูป
+    IMAGE_DERIVATIVES_ENABLED = os.environ.get('IMAGE_DERIVATIVES_ENABLED', 'true').lower() == 'true'
+    IMAGE_DERIVATIVE_WIDTHS = [int(width) for width in os.environ.get('IMAGE_DERIVATIVE_WIDTHS', '160,320,640,1024').split(',')]
+    IMAGE_DERIVATIVE_WORKERS = int(os.environ.get('IMAGE_DERIVATIVE_WORKERS', 1))
     MAX_CONTENT_LENGTH = 5 * 1024 * 1024  # 5MB
     
     # Railway specific settings
@@ -84,4 +94,46 @@ class Config:
     
     # Pagination settings
     DEFAULT_PER_PAGE = 10
-    MAX_PER_PAGE = 100
\ No newline at end of file
+    MAX_PER_PAGE = 100
+    # เก็บจำนวนรายการและจุดเริ่มของแต่ละหน้า (keyset pagination) ไว้กี่วินาที
+    PAGINATION_CACHE_TTL = float(os.environ.get('PAGINATION_CACHE_TTL', 30))
+
+    # Template cache - bytecode ที่คอมไพล์แล้วใช้ร่วมกันทุก worker และ fragment {% cache %} ต่อ worker
+    TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR',
+                                                 os.path.join(tempfile.gettempdir(), 'tireweb_jinja_bytecode'))
+    TEMPLATE_FRAGMENT_CACHE_TTL = float(os.environ.get('TEMPLATE_FRAGMENT_CACHE_TTL', 300))
+    TEMPLATE_FRAGMENT_CACHE_SIZE = int(os.environ.get('TEMPLATE_FRAGMENT_CACHE_SIZE', 256))
+
+    # Page view recorder - flush ทุก N วินาที หรือเมื่อครบ M เหตุการณ์
+    # และเก็บ log ที่ค้างได้ไม่เกินจำนวนที่กำหนด (ทิ้งแถวเก่าสุดเมื่อฐานข้อมูลล่มนาน)
+    PAGE_VIEW_FLUSH_INTERVAL = float(os.environ.get('PAGE_VIEW_FLUSH_INTERVAL', 5))
+    PAGE_VIEW_FLUSH_MAX_EVENTS = int(os.environ.get('PAGE_VIEW_FLUSH_MAX_EVENTS', 200))
+    PAGE_VIEW_MAX_BUFFERED_LOGS = int(os.environ.get('PAGE_VIEW_MAX_BUFFERED_LOGS', 10000))
+
+    # คิวสร้างรายงาน PDF - จำนวน process ที่ render, เวลารอใน request ก่อนพาไปหน้าสถานะงาน,
+    # และอายุของไฟล์รายงานที่แคชไว้ (วินาที)
+    REPORT_DIR = os.environ.get('REPORT_DIR', os.path.join(tempfile.gettempdir(), 'tireweb_reports'))
+    REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 2))
+    REPORT_SYNC_WAIT = float(os.environ.get('REPORT_SYNC_WAIT', 5))
+    REPORT_CACHE_MAX_AGE = int(os.environ.get('REPORT_CACHE_MAX_AGE', 24 * 60 * 60))
+
+    # รอบเวลาจองคิว - ค่าเริ่มต้นใช้ทุกวัน และกำหนดแยกตามวันในสัปดาห์ได้ผ่าน BOOKING_SLOT_SCHEDULE
+    # เช่น {"5": {"09:00": 2, "10:00": 2}, "6": {}} (0 = จันทร์ ... 6 = อาทิตย์, {} = ปิดทำการ)
+    BOOKING_SLOT_TIMES = os.environ.get('BOOKING_SLOT_TIMES', '09:00,10:00,11:00,13:00,14:00,15:00').split(',')
+    BOOKING_SLOT_CAPACITY = int(os.environ.get('BOOKING_SLOT_CAPACITY', 3))
+    BOOKING_SLOT_SCHEDULE = json.loads(os.environ.get('BOOKING_SLOT_SCHEDULE', '{}'))
+    # อายุแคชความพร้อมรายเดือน (วินาที) ที่ทุก worker ใช้ร่วมกัน
+    BOOKING_AVAILABILITY_CACHE_TTL = float(os.environ.get('BOOKING_AVAILABILITY_CACHE_TTL', 30))
+
+    # วัด SQL ต่อ request - header X-SQL-Profile (ค่าเริ่มต้นเปิดเฉพาะตอน DEBUG),
+    # จำนวน statement รูปแบบเดียวกันที่ถือว่าเป็น N+1 และจำนวน request ย้อนหลังต่อ endpoint
+    SQL_PROFILE_ENABLED = os.environ.get('SQL_PROFILE_ENABLED', 'true').lower() == 'true'
+    SQL_PROFILE_HEADER = os.environ.get('SQL_PROFILE_HEADER', os.environ.get('DEBUG', 'false')).lower() == 'true'
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 5))
+    SQL_PROFILE_WINDOW = int(os.environ.get('SQL_PROFILE_WINDOW', 200))
+
+    # สถิติแบบ Prometheus (/metrics) - โฟลเดอร์ที่ทุก worker เขียนสถิติร่วมกัน, ความถี่ในการเขียน (วินาที)
+    # และ token สำหรับ scraper (ถ้าไม่ตั้ง เปิดให้เฉพาะแอดมินหรือ request จากเครื่องเดียวกัน)
+    METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'tireweb_metrics'))
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
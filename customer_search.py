@@ -0,0 +1,252 @@
+import os
+import bisect
+import threading
+import time
+import logging
+import unicodedata
+
+from database import get_cursor
+from cache_versions import VERSION_DIR, bump_version
+from booking_search import normalize_search_text
+
+logger = logging.getLogger(__name__)
+
+# ฟิลด์ที่หน้า admin/customers ค้นหาได้
+SEARCH_FIELDS = ('first_name', 'last_name', 'email', 'phone')
+GRAM_SIZE = 3
+# สร้าง index ใหม่ทั้งหมดอย่างน้อยทุกกี่วินาที เผื่อมีการแก้ฐานข้อมูลโดยตรงนอกแอป
+INDEX_MAX_AGE = 600
+
+# บันทึก customer_id ที่เปลี่ยน (ต่อท้ายทีละบรรทัด) ให้ทุก gunicorn worker อัปเดต index เฉพาะลูกค้าเหล่านั้น
+JOURNAL_PATH = os.path.join(VERSION_DIR, 'customer_search.journal')
+# เมื่อไฟล์ใหญ่เกินนี้จะเริ่มไฟล์ใหม่ (inode ใหม่) และทุก worker สร้าง index ใหม่ทั้งหมดหนึ่งครั้ง
+JOURNAL_MAX_BYTES = 256 * 1024
+# version stamp ของตาราง customers (ใช้กับ cache จุดเริ่มของหน้ารายการลูกค้าและรายการจอง)
+CUSTOMERS_VERSION = 'customers'
+
+# คะแนนการจัดอันดับ
+SCORE_EXACT = 100
+SCORE_PHONE_SUFFIX = 95
+SCORE_PREFIX = 90
+SCORE_CONTAINS = 70
+
+
+def normalize_phone(value):
+    """เบอร์โทรเหลือเฉพาะตัวเลข (รวมเลขไทย ๐-๙) และแปลง +66xxxxxxxxx เป็น 0xxxxxxxxx"""
+    digits = ''.join(str(unicodedata.digit(ch)) for ch in str(value or '') if ch.isdigit())
+    if digits.startswith('66') and len(digits) == 11:
+        digits = '0' + digits[2:]
+    return digits
+
+
+def _normalize(field, value):
+    return normalize_phone(value) if field == 'phone' else normalize_search_text(value)
+
+
+def _grams(text):
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+class CustomerSearchIndex:
+    """posting index ของ trigram ต่อฟิลด์ของลูกค้า (ไม่ต้องตัดคำ จึงใช้กับชื่อภาษาไทยได้)
+
+    - คำค้นยาว 3 ตัวอักษรขึ้นไป: intersect posting ของทุก trigram แล้วยืนยันว่ามีคำค้นอยู่จริง
+    - คำค้นสั้นกว่านั้น: ตรวจทุกค่าของฟิลด์นั้น
+    - เบอร์โทร: ค้นท้ายเบอร์ (เช่น 4 ตัวท้าย) ด้วย bisect บนเบอร์ที่กลับด้านและเรียงไว้
+    เรียงผลตามคะแนน (ตรงทั้งค่า / ท้ายเบอร์ / ขึ้นต้น / มีอยู่) แล้วลูกค้าใหม่ก่อน
+    """
+
+    def __init__(self, rows, journal_key):
+        self.journal_key = journal_key
+        self.built_at = time.monotonic()
+        self.records = {}
+        self.postings = {field: {} for field in SEARCH_FIELDS}
+        self._reversed_phones = []
+        for row in rows:
+            self._add(row)
+        self._reversed_phones.sort()
+
+    def __len__(self):
+        return len(self.records)
+
+    def _add(self, row, keep_sorted=False):
+        customer_id = row['customer_id']
+        values = {field: _normalize(field, row.get(field)) for field in SEARCH_FIELDS}
+        self.records[customer_id] = values
+        for field, value in values.items():
+            postings = self.postings[field]
+            for gram in _grams(value):
+                postings.setdefault(gram, set()).add(customer_id)
+        if values['phone']:
+            entry = (values['phone'][::-1], customer_id)
+            if keep_sorted:
+                bisect.insort(self._reversed_phones, entry)
+            else:
+                self._reversed_phones.append(entry)
+
+    def _remove(self, customer_id):
+        values = self.records.pop(customer_id, None)
+        if values is None:
+            return
+        for field, value in values.items():
+            postings = self.postings[field]
+            for gram in _grams(value):
+                ids = postings.get(gram)
+                if ids is not None:
+                    ids.discard(customer_id)
+                    if not ids:
+                        del postings[gram]
+        if values['phone']:
+            entry = (values['phone'][::-1], customer_id)
+            pos = bisect.bisect_left(self._reversed_phones, entry)
+            if pos < len(self._reversed_phones) and self._reversed_phones[pos] == entry:
+                del self._reversed_phones[pos]
+
+    def apply(self, customer_ids, rows):
+        """อัปเดตลูกค้าตาม customer_ids ด้วยแถวใหม่ (id ที่ไม่มีใน rows คือถูกลบ)"""
+        for customer_id in customer_ids:
+            self._remove(customer_id)
+        for row in rows:
+            self._add(row, keep_sorted=True)
+
+    def _phone_suffix_matches(self, digits):
+        start = digits[::-1]
+        pos = bisect.bisect_left(self._reversed_phones, (start,))
+        matches = []
+        while pos < len(self._reversed_phones) and self._reversed_phones[pos][0].startswith(start):
+            matches.append(self._reversed_phones[pos][1])
+            pos += 1
+        return matches
+
+    def _candidates(self, field, term):
+        if len(term) < GRAM_SIZE:
+            return self.records.keys()
+        postings = self.postings[field]
+        lists = sorted((postings.get(gram, ()) for gram in _grams(term)), key=len)
+        if not lists or not lists[0]:
+            return ()
+        return set(lists[0]).intersection(*lists[1:])
+
+    def search(self, term, filter_by=None):
+        """customer_id ที่ตรงกับคำค้นเรียงตามอันดับ (filter_by เป็นฟิลด์เดียว หรือ None = ทุกฟิลด์)"""
+        fields = [filter_by] if filter_by in SEARCH_FIELDS else list(SEARCH_FIELDS)
+        scores = {}
+        for field in fields:
+            term_key = _normalize(field, term)
+            if not term_key:
+                continue
+            if field == 'phone':
+                for customer_id in self._phone_suffix_matches(term_key):
+                    score = SCORE_EXACT if self.records[customer_id]['phone'] == term_key else SCORE_PHONE_SUFFIX
+                    scores[customer_id] = max(scores.get(customer_id, 0), score)
+            for customer_id in self._candidates(field, term_key):
+                value = self.records[customer_id][field]
+                if term_key not in value:
+                    continue
+                if value == term_key:
+                    score = SCORE_EXACT
+                elif value.startswith(term_key):
+                    score = SCORE_PREFIX
+                else:
+                    score = SCORE_CONTAINS
+                if score > scores.get(customer_id, 0):
+                    scores[customer_id] = score
+        return sorted(scores, key=lambda customer_id: (-scores[customer_id], -customer_id))
+
+
+def _journal_state():
+    """(inode, ขนาด) ของ journal (สร้างไฟล์เปล่าถ้ายังไม่มี) หรือ (None, 0) ถ้าเข้าถึงไม่ได้"""
+    try:
+        stat = os.stat(JOURNAL_PATH)
+    except FileNotFoundError:
+        try:
+            os.makedirs(VERSION_DIR, exist_ok=True)
+            open(JOURNAL_PATH, 'ab').close()
+            stat = os.stat(JOURNAL_PATH)
+        except OSError as e:
+            logger.warning(f"Error creating customer search journal: {e}")
+            return None, 0
+    return stat.st_ino, stat.st_size
+
+
+def _select_customers(cursor, customer_ids=None):
+    columns = 'customer_id, first_name, last_name, email, phone'
+    if customer_ids is None:
+        cursor.execute(f'SELECT {columns} FROM customers')
+    else:
+        cursor.execute(f"SELECT {columns} FROM customers WHERE customer_id IN ({', '.join(['%s'] * len(customer_ids))})",
+                       list(customer_ids))
+    return cursor.fetchall()
+
+
+def _read_journal(offset, size):
+    """customer_id ในบรรทัดที่เขียนครบแล้วระหว่าง offset ถึง size คืนค่า (ids, offset ใหม่)"""
+    with open(JOURNAL_PATH, 'rb') as f:
+        f.seek(offset)
+        data = f.read(size - offset)
+    end = data.rfind(b'\n') + 1
+    ids = set()
+    for line in data[:end].split():
+        try:
+            ids.add(int(line))
+        except ValueError:
+            continue
+    return ids, offset + end
+
+
+_index = None
+_offset = 0
+_index_lock = threading.Lock()
+
+
+def get_customer_search_index():
+    """index ค้นหาลูกค้าของ process นี้ อัปเดตเฉพาะลูกค้าที่อยู่ใน journal ใหม่ หรือสร้างใหม่เมื่อ journal เริ่มไฟล์ใหม่/เก่าเกินไป"""
+    global _index, _offset
+    inode, size = _journal_state()
+    index = _index
+    if index is not None and index.journal_key == inode and size == _offset and \
+            time.monotonic() - index.built_at < INDEX_MAX_AGE:
+        return index
+    with _index_lock:
+        inode, size = _journal_state()
+        index = _index
+        cursor = get_cursor()
+        if index is None or index.journal_key != inode or time.monotonic() - index.built_at >= INDEX_MAX_AGE:
+            # อ่านสถานะ journal ก่อนโหลดข้อมูล การเปลี่ยนแปลงระหว่างโหลดจะถูกอ่านซ้ำในรอบถัดไป
+            index = CustomerSearchIndex(_select_customers(cursor), inode)
+            _offset = size
+            logger.info(f"Customer search index built: {len(index)} customers")
+        elif size > _offset:
+            customer_ids, _offset = _read_journal(_offset, size)
+            if customer_ids:
+                index.apply(customer_ids, _select_customers(cursor, sorted(customer_ids)))
+        cursor.close()
+        _index = index
+        return index
+
+
+def customers_changed(customer_ids):
+    """แจ้งทุก worker ว่าข้อมูลลูกค้าเปลี่ยน (เรียกหลัง commit การเพิ่ม/แก้ไข/ลบลูกค้า)"""
+    lines = ''.join(f"{int(customer_id)}\n" for customer_id in customer_ids if customer_id not in (None, ''))
+    if not lines:
+        return
+    bump_version(CUSTOMERS_VERSION)
+    try:
+        os.makedirs(VERSION_DIR, exist_ok=True)
+        # O_APPEND: บรรทัดสั้นๆ จากหลาย worker ต่อท้ายได้โดยไม่ทับกัน
+        fd = os.open(JOURNAL_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, lines.encode('ascii'))
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size > JOURNAL_MAX_BYTES:
+            tmp_path = f"{JOURNAL_PATH}.{os.getpid()}.tmp"
+            open(tmp_path, 'wb').close()
+            os.replace(tmp_path, JOURNAL_PATH)
+    except Exception as e:
+        logger.error(f"Error writing customer search journal: {e}")
+
+
+def search_customers(term, filter_by=None):
+    return get_customer_search_index().search(term, filter_by)
@@ -1,9 +1,14 @@
 import mysql.connector
 from mysql.connector import pooling, Error as MySQLError
+from mysql.connector.errors import PoolError
 from flask import g, current_app
 import os
+import time
 import logging
+import threading
+import weakref
 from dotenv import load_dotenv
+from sql_profiler import profile_cursor
 
 load_dotenv()
 
@@ -27,33 +32,195 @@ DB_CONFIG = dict(
     sql_mode='TRADITIONAL'
 )
 
-try:
-    connection_pool = pooling.MySQLConnectionPool(
-        pool_name="tireweb_pool",
-        pool_size=10,
-        pool_reset_session=True,
-        **DB_CONFIG
-    )
-    logger.info("Database connection pool initialized successfully")
-except MySQLError as e:
-    logger.error(f"MySQL error initializing DB pool: {e}")
-    connection_pool = None
-except Exception as e:
-    logger.error(f"Unexpected error initializing DB pool: {e}")
-    connection_pool = None
+# ขนาด pool ต่อ worker process (override ได้ผ่าน app.config['DB_POOL_SIZE'])
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+# เวลารอสูงสุด (วินาที) เมื่อ connection ใน pool ถูกใช้หมด
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))
+
+
+class _TrackedConnection:
+    """ห่อ connection จาก pool เพื่อนับจำนวนที่ถูกยืมออกไปและคืนกลับ"""
+
+    def __init__(self, connection, manager):
+        self._connection = connection
+        self._manager = manager
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._manager._on_release()
+            # pool ไม่ reset session ทุกครั้งที่คืน จึงต้อง rollback transaction ที่ค้างเอง
+            # (in_transaction อ่านจาก status flag ในเครื่อง ไม่ต้องคุยกับเซิร์ฟเวอร์)
+            try:
+                if self._connection.in_transaction:
+                    self._connection.rollback()
+            except Exception as e:
+                logger.warning(f"Error rolling back connection before release: {e}")
+        self._connection.close()
+
+
+class ConnectionPoolManager:
+    """จัดการ MySQL connection pool แบบ lazy ต่อ process
+
+    gunicorn รันด้วย --preload จึงห้ามสร้าง pool ตอน import เพราะ socket จะถูก
+    แชร์ข้าม worker หลัง fork; pool จะถูกสร้างครั้งแรกที่มีการขอ connection
+    ใน process นั้นๆ และสร้างใหม่อัตโนมัติเมื่อ pid เปลี่ยน
+    """
+
+    def __init__(self, pool_name, pool_size, pool_timeout, config):
+        self.pool_name = pool_name
+        self.pool_size = pool_size
+        self.pool_timeout = pool_timeout
+        self.config = config
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.stats = {
+            'checked_out': 0,
+            'max_checked_out': 0,
+            'checkouts': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+            'exhausted': 0,
+            'pools_created': 0,
+            'recycled': 0,
+        }
+
+    def configure(self, pool_size=None, pool_timeout=None):
+        """ตั้งค่าขนาด pool (มีผลกับ pool ที่สร้างหลังจากนี้)"""
+        if pool_size:
+            self.pool_size = int(pool_size)
+        if pool_timeout is not None:
+            self.pool_timeout = float(pool_timeout)
+
+    def get_pool(self):
+        """คืนค่า pool ของ process ปัจจุบัน สร้างใหม่ถ้ายังไม่มี"""
+        pid = os.getpid()
+        if self._pool is not None and self._pid == pid:
+            return self._pool
+        with self._lock:
+            if self._pid != pid:
+                # process ลูกหลัง fork: ทิ้ง pool ของ process แม่โดยไม่ปิด socket ที่แชร์กันอยู่
+                self._pool = None
+                self._pid = pid
+                self._stats_lock = threading.Lock()
+                self._reset_stats()
+            if self._pool is None:
+                self._pool = pooling.MySQLConnectionPool(
+                    pool_name=f"{self.pool_name}_{pid}",
+                    pool_size=self.pool_size,
+                    # charset/collation/sql_mode ถูกตั้งครั้งเดียวตอนเปิด connection จริงจาก DB_CONFIG
+                    # การ reset session ทุกครั้งที่ยืมจะเสีย round trip เพิ่มโดยไม่จำเป็น
+                    pool_reset_session=False,
+                    **self.config
+                )
+                self.stats['pools_created'] += 1
+                logger.info(f"Database connection pool initialized (pid={pid}, size={self.pool_size})")
+            return self._pool
+
+    def get_connection(self):
+        """ยืม connection จาก pool; ถ้าเต็มจะรอจนถึง pool_timeout"""
+        pool = self.get_pool()
+        started = time.monotonic()
+        deadline = started + self.pool_timeout
+        waited = False
+        while True:
+            try:
+                connection = pool.get_connection()
+                break
+            except PoolError:
+                if not waited:
+                    # นับครั้งเดียวต่อการขอ connection ที่ต้องรอ ไม่ใช่ทุกรอบที่วนตรวจ
+                    waited = True
+                    with self._stats_lock:
+                        self.stats['exhausted'] += 1
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.05)
+        wait_ms = (time.monotonic() - started) * 1000
+        with self._stats_lock:
+            stats = self.stats
+            stats['checkouts'] += 1
+            stats['checked_out'] += 1
+            stats['max_checked_out'] = max(stats['max_checked_out'], stats['checked_out'])
+            stats['total_wait_ms'] += wait_ms
+            stats['max_wait_ms'] = max(stats['max_wait_ms'], wait_ms)
+        return _TrackedConnection(connection, self)
+
+    def _on_release(self):
+        with self._stats_lock:
+            self.stats['checked_out'] = max(0, self.stats['checked_out'] - 1)
+
+    def note_recycle(self):
+        """นับการเชื่อมต่อใหม่แทน connection ที่หลุด"""
+        with self._stats_lock:
+            self.stats['recycled'] += 1
+
+    def reset(self):
+        """ทิ้ง pool ปัจจุบันแล้วให้สร้างใหม่ในการขอครั้งถัดไป"""
+        self.dispose()
+        self.note_recycle()
+
+    def dispose(self):
+        """ปิด connection ที่ว่างอยู่ใน pool (เรียกใน master ก่อน fork worker)"""
+        with self._lock:
+            pool = self._pool
+            self._pool = None
+        if pool is None or self._pid != os.getpid():
+            return
+        # ยืม connection ที่ว่างออกมาจนหมดแล้ว disconnect ทีละตัว (ไม่คืนเข้า pool ที่ถูกทิ้งแล้ว)
+        # วนไม่เกินขนาด pool เผื่อ connection ที่ reconnect ไม่ได้ถูกคืนกลับเข้าคิว
+        for _ in range(pool.pool_size):
+            try:
+                connection = pool.get_connection()
+            except PoolError:
+                break
+            except MySQLError as e:
+                logger.warning(f"Error disposing connection pool: {e}")
+                break
+            try:
+                connection.disconnect()
+            except MySQLError as e:
+                logger.warning(f"Error closing pooled connection: {e}")
+
+    def get_stats(self):
+        """สถิติของ pool ใน process ปัจจุบัน"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['pid'] = os.getpid()
+        stats['pool_size'] = self.pool_size
+        stats['initialized'] = self._pool is not None and self._pid == os.getpid()
+        checkouts = stats['checkouts']
+        stats['avg_wait_ms'] = stats['total_wait_ms'] / checkouts if checkouts else 0.0
+        return stats
+
+
+pool_manager = ConnectionPoolManager("tireweb_pool", DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_CONFIG)
+
+
+def get_pool_stats():
+    """สถิติของ connection pool (จำนวนที่ยืมอยู่, เวลารอ, จำนวนการสร้าง/recycle)"""
+    return pool_manager.get_stats()
 
 def _get_db_connection():
     """สร้างการเชื่อมต่อฐานข้อมูล"""
-    if connection_pool is None:
+    try:
+        pool_manager.get_pool()
+    except Exception as e:
+        logger.error(f"Error initializing DB pool: {e}")
         # สร้าง connection แบบตรงถ้า pool ไม่ได้
         try:
             connection = mysql.connector.connect(**DB_CONFIG)
             # ตั้งค่า charset เพิ่มเติมสำหรับการเชื่อมต่อแบบตรง
-            cursor = connection.cursor()
-            cursor.execute("SET NAMES utf8mb4")
-            cursor.execute("SET CHARACTER SET utf8mb4")
-            cursor.execute("SET character_set_connection=utf8mb4")
-            cursor.close()
+            _configure_connection(connection)
             logger.info("Direct database connection created successfully")
             return connection
         except MySQLError as e:
@@ -64,7 +231,7 @@ def _get_db_connection():
             raise RuntimeError(f"Cannot connect to database: {e}")
     
     try:
-        connection = connection_pool.get_connection()
+        connection = pool_manager.get_connection()
         logger.debug("Got connection from pool")
         return connection
     except MySQLError as e:
@@ -85,9 +252,7 @@ def get_db():
             logger.error(f"Error getting database connection: {e}")
             # ลองรีเซ็ต pool และลองใหม่
             try:
-                global connection_pool
-                if connection_pool:
-                    connection_pool.reset_session()
+                pool_manager.reset()
                 g.db_conn = _get_db_connection()
                 _configure_connection(g.db_conn)
                 logger.info("Database connection re-established after pool reset")
@@ -100,6 +265,7 @@ def get_db():
             if hasattr(g.db_conn, 'is_connected') and not g.db_conn.is_connected():
                 try:
                     g.db_conn.reconnect(attempts=2, delay=1)
+                    pool_manager.note_recycle()
                     _configure_connection(g.db_conn)
                     logger.info("Database connection reconnected")
                 except Exception as e:
@@ -123,14 +289,33 @@ def get_db():
                 raise
     return g.db_conn
 
+# connection จริง (physical) ที่ตั้งค่า session แล้ว
+_configured_connections = weakref.WeakSet()
+
+def _physical_connection(connection):
+    """คืนค่า connection จริงที่อยู่ใต้ wrapper ของ pool"""
+    connection = getattr(connection, '_connection', connection)
+    return getattr(connection, '_cnx', connection)
+
 def _configure_connection(connection):
-    """ตั้งค่า charset สำหรับการเชื่อมต่อ"""
+    """ตั้งค่า charset สำหรับการเชื่อมต่อ ครั้งเดียวต่อ connection จริง
+
+    DB_CONFIG กำหนด charset/collation ไว้แล้ว connector จึงตั้งค่าให้ตอน connect;
+    ที่นี่แค่ตรวจสอบจากข้อมูลในเครื่อง และส่ง SET NAMES เฉพาะกรณีที่ยังไม่ใช่ utf8mb4
+    """
+    physical = _physical_connection(connection)
     try:
-        cursor = connection.cursor()
-        cursor.execute("SET NAMES utf8mb4")
-        cursor.execute("SET CHARACTER SET utf8mb4")
-        cursor.execute("SET character_set_connection=utf8mb4")
-        cursor.close()
+        if physical in _configured_connections:
+            return
+    except TypeError:
+        physical = None
+    try:
+        if getattr(connection, 'charset', None) != 'utf8mb4':
+            cursor = connection.cursor()
+            cursor.execute("SET NAMES utf8mb4 COLLATE utf8mb4_unicode_ci")
+            cursor.close()
+        if physical is not None:
+            _configured_connections.add(physical)
     except Exception as e:
         logger.warning(f"Error configuring connection charset: {e}")
 
@@ -139,7 +324,7 @@ def get_cursor(buffered=True, dictionary=True):
     try:
         db = get_db()
         if db:
-            return db.cursor(buffered=buffered, dictionary=dictionary)
+            return profile_cursor(db.cursor(buffered=buffered, dictionary=dictionary))
         return None
     except Exception as e:
         logger.error(f"Error creating cursor: {e}")
@@ -278,6 +463,35 @@ def ensure_vehicles_table():
     except Exception as e:
         print(f"Error creating vehicles table: {e}")
 
+def _ensure_index(cursor, table, index_name, columns):
+    """สร้าง index ถ้ายังไม่มี (MySQL ไม่รองรับ CREATE INDEX IF NOT EXISTS)"""
+    cursor.execute("""
+        SELECT COUNT(*) AS count
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    """, (table, index_name))
+    if cursor.fetchone()['count'] == 0:
+        cursor.execute(f"CREATE INDEX {index_name} ON {table} ({columns})")
+        logger.info(f"สร้าง index {index_name} บนตาราง {table}")
+
+def ensure_reporting_indexes():
+    """สร้าง index สำหรับ query รายงานแบบช่วงวันที่"""
+    try:
+        cursor = get_cursor()
+        if not cursor:
+            logger.error("Cannot create cursor for reporting indexes")
+            return False
+        _ensure_index(cursor, 'bookings', 'idx_bookings_booking_date', 'booking_date')
+        _ensure_index(cursor, 'users', 'idx_users_created_at', 'created_at')
+        get_db().commit()
+        return True
+    except MySQLError as e:
+        logger.error(f"MySQL error creating reporting indexes: {e}")
+        return False
+    except Exception as e:
+        logger.error(f"Unexpected error creating reporting indexes: {e}")
+        return False
+
 def ensure_all_tables():
     """สร้างตารางทั้งหมดที่จำเป็น"""
     success_count = 0
@@ -0,0 +1,35 @@
+# Gunicorn hooks (gunicorn โหลดไฟล์นี้อัตโนมัติจาก working directory)
+
+
+def post_fork(server, worker):
+    """ให้แต่ละ worker สร้าง connection pool ของตัวเองแบบ lazy หลัง fork"""
+    try:
+        from database import pool_manager
+        pool_manager.dispose()
+    except Exception as e:
+        server.log.error(f"Error resetting connection pool after fork: {e}")
+
+
+def worker_exit(server, worker):
+    """เขียนยอดเข้าชมที่ค้างในบัฟเฟอร์และปิด process pool ของคิวรายงานและสถิติ /metrics ก่อน worker ปิดตัว (รวมถึงตอนถูก recycle ด้วย --max-requests)"""
+    try:
+        from page_view_recorder import recorder
+        recorder.shutdown()
+    except Exception as e:
+        server.log.error(f"Error flushing page views on worker exit: {e}")
+    try:
+        from report_jobs import queue
+        queue.shutdown()
+    except Exception as e:
+        server.log.error(f"Error shutting down report workers: {e}")
+    try:
+        from image_derivatives import pipeline
+        pipeline.shutdown()
+    except Exception as e:
+        server.log.error(f"Error shutting down image workers: {e}")
+    try:
+        import metrics
+        metrics.shutdown()
+    except Exception as e:
+        server.log.error(f"Error writing final metrics on worker exit: {e}")
+
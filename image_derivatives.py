@@ -0,0 +1,237 @@
+import os
+import sys
+import shutil
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+# ค่าเริ่มต้น (override ได้ผ่าน app.config)
+DEFAULT_WIDTHS = (160, 320, 640, 1024)
+DEFAULT_WORKERS = 1
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+# โฟลเดอร์ย่อยที่เก็บรูปย่อของไฟล์ในโฟลเดอร์เดียวกัน: <folder>/.derived/<filename>/<width>.<ext>
+DERIVED_DIR = '.derived'
+# นามสกุลที่สร้างรูปย่อได้ (GIF อาจเป็นภาพเคลื่อนไหว จึงเสิร์ฟไฟล์เดิม)
+RESIZABLE_EXTENSIONS = {'jpg', 'jpeg', 'png'}
+FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG'}
+MIMETYPES = {'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+
+
+def _extension(path):
+    return path.rsplit('.', 1)[-1].lower() if '.' in os.path.basename(path) else ''
+
+
+def derived_dir(path):
+    return os.path.join(os.path.dirname(path), DERIVED_DIR, os.path.basename(path))
+
+
+def derivative_path(path, width, webp):
+    """path และ mimetype ของรูปย่อความกว้าง width (ไม่ตรวจว่ามีไฟล์อยู่จริง)"""
+    ext = 'webp' if webp else _extension(path)
+    return os.path.join(derived_dir(path), f"{width}.{ext}"), MIMETYPES[ext]
+
+
+def render_derivatives(path, widths):
+    """สร้างรูปย่อทุกความกว้างทั้งนามสกุลเดิมและ WebP (รันใน process pool)
+
+    ไม่ขยายรูปที่เล็กกว่าความกว้างที่ขอ แต่ยังบันทึกไฟล์ไว้ที่ขนาดเดิม
+    เพื่อให้ทุกความกว้างมีไฟล์ (และได้ WebP ที่เล็กกว่าเสมอ)
+    """
+    from PIL import Image, ImageOps
+
+    ext = _extension(path)
+    target_dir = derived_dir(path)
+    os.makedirs(target_dir, exist_ok=True)
+    with Image.open(path) as source:
+        image = ImageOps.exif_transpose(source)
+        if FORMATS[ext] == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        elif FORMATS[ext] == 'PNG' and image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA')
+        original_options = {'quality': JPEG_QUALITY, 'optimize': True} if FORMATS[ext] == 'JPEG' else {'optimize': True}
+        outputs = ((FORMATS[ext], ext, original_options),
+                   ('WEBP', 'webp', {'quality': WEBP_QUALITY, 'method': 4}))
+        written = 0
+        for width in sorted(widths):
+            resized = image
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.LANCZOS)
+            for fmt, suffix, options in outputs:
+                target = os.path.join(target_dir, f"{width}.{suffix}")
+                tmp_path = f"{target}.{os.getpid()}.tmp"
+                resized.save(tmp_path, fmt, **options)
+                os.replace(tmp_path, target)
+                written += 1
+    return written
+
+
+class DerivativePipeline:
+    """คิวสร้างรูปย่อของไฟล์อัปโหลดใน process pool
+
+    งานถูกส่งแบบ fire-and-forget หลังบันทึกไฟล์ ระหว่างที่ยังสร้างไม่เสร็จ /uploads จะเสิร์ฟไฟล์เดิม
+    """
+
+    def __init__(self):
+        self.widths = DEFAULT_WIDTHS
+        self.max_workers = DEFAULT_WORKERS
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._pid = None
+        self._pool = None
+        self._pending = set()
+
+    def configure(self, widths=None, max_workers=None, enabled=None):
+        if widths:
+            self.widths = tuple(sorted(int(width) for width in widths))
+        if max_workers:
+            self.max_workers = int(max_workers)
+        if enabled is not None:
+            self.enabled = bool(enabled)
+
+    def resizable(self, path):
+        return _extension(path) in RESIZABLE_EXTENSIONS
+
+    def _executor(self):
+        """สร้าง pool แบบ lazy ต่อ process (gunicorn --preload fork หลังโหลดแอป)"""
+        pid = os.getpid()
+        if self._pid != pid or self._pool is None:
+            with self._lock:
+                if self._pid != pid or self._pool is None:
+                    # ใช้ spawn เพื่อไม่ให้ process ลูกได้ lock/connection ที่ค้างจาก web worker
+                    self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                    self._pending = set()
+                    self._pid = pid
+        return self._pool
+
+    def enqueue(self, path):
+        """ส่งงานสร้างรูปย่อของไฟล์ (ข้ามถ้าปิดไว้ ไม่ใช่รูปที่ย่อได้ หรือมีงานของไฟล์นี้ค้างอยู่)"""
+        if not self.enabled or not self.resizable(path):
+            return None
+        path = os.path.abspath(path)
+        pool = self._executor()
+        with self._lock:
+            if path in self._pending:
+                return None
+            self._pending.add(path)
+        try:
+            future = pool.submit(render_derivatives, path, self.widths)
+        except BrokenProcessPool:
+            logger.warning("Image process pool broken, restarting")
+            with self._lock:
+                self._pool = None
+            future = self._executor().submit(render_derivatives, path, self.widths)
+        except Exception as e:
+            logger.warning(f"Error queueing image derivatives for {path}: {e}")
+            with self._lock:
+                self._pending.discard(path)
+            return None
+        future.add_done_callback(lambda done: self._finished(path, done))
+        return future
+
+    def _finished(self, path, future):
+        with self._lock:
+            self._pending.discard(path)
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            with self._lock:
+                self._pool = None
+        if error is not None:
+            logger.warning(f"Error creating image derivatives for {path}: {error}")
+
+    def discard(self, path):
+        """ลบรูปย่อทั้งหมดของไฟล์ (เมื่อไฟล์ถูกลบหรือถูกเขียนทับ)"""
+        shutil.rmtree(derived_dir(path), ignore_errors=True)
+
+    def select(self, path, width, webp):
+        """รูปย่อที่ใกล้ที่สุดสำหรับความกว้าง width: ขนาดมาตรฐานที่เล็กที่สุดที่ไม่น้อยกว่า width"""
+        if not self.enabled or not self.resizable(path):
+            return None
+        chosen = next((candidate for candidate in self.widths if candidate >= width), self.widths[-1])
+        return derivative_path(path, chosen, webp)
+
+    def shutdown(self):
+        """ปิด process pool (เรียกตอน worker ปิดตัว)"""
+        if self._pid != os.getpid() or self._pool is None:
+            return
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+
+
+pipeline = DerivativePipeline()
+
+
+def init_app(app):
+    """ตั้งค่าคิวรูปย่อจาก app.config"""
+    pipeline.configure(
+        widths=app.config.get('IMAGE_DERIVATIVE_WIDTHS'),
+        max_workers=app.config.get('IMAGE_DERIVATIVE_WORKERS'),
+        enabled=app.config.get('IMAGE_DERIVATIVES_ENABLED', True),
+    )
+
+
+def _needs_backfill(path, widths):
+    """ไฟล์ที่ยังไม่มีรูปย่อครบ หรือรูปย่อเก่ากว่าไฟล์ต้นฉบับ"""
+    source_mtime = os.path.getmtime(path)
+    for width in widths:
+        for webp in (False, True):
+            target, _ = derivative_path(path, width, webp)
+            try:
+                if os.path.getmtime(target) < source_mtime:
+                    return True
+            except FileNotFoundError:
+                return True
+    return False
+
+
+def backfill(roots, widths=DEFAULT_WIDTHS, max_workers=None, force=False):
+    """สร้างรูปย่อของไฟล์ที่มีอยู่แล้วในทุกโฟลเดอร์อัปโหลด คืนค่า (จำนวนไฟล์ที่สร้าง, จำนวนที่ผิดพลาด)"""
+    paths = []
+    seen = set()
+    for root in roots:
+        if not os.path.isdir(root):
+            continue
+        for folder, dirs, files in os.walk(root):
+            dirs[:] = [name for name in dirs if name != DERIVED_DIR]
+            for name in files:
+                path = os.path.realpath(os.path.join(folder, name))
+                if path in seen or _extension(path) not in RESIZABLE_EXTENSIONS:
+                    continue
+                seen.add(path)
+                if force or _needs_backfill(path, widths):
+                    paths.append(path)
+
+    done = failed = 0
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {pool.submit(render_derivatives, path, widths): path for path in paths}
+        for future, path in futures.items():
+            try:
+                future.result()
+                done += 1
+            except Exception as e:
+                failed += 1
+                print(f"❌ {path}: {e}")
+    return done, failed
+
+
+if __name__ == '__main__':
+    # สร้างรูปย่อให้ไฟล์ที่อัปโหลดไว้ก่อนมีระบบนี้: python image_derivatives.py [--force]
+    from flask import Flask
+    from config import Config
+    from upload_store import upload_roots
+
+    logging.basicConfig(level=logging.INFO)
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    app = Flask(__name__, static_folder=os.path.join(base_dir, 'static'))
+    app.config.from_object(Config)
+    widths = tuple(sorted(app.config.get('IMAGE_DERIVATIVE_WIDTHS') or DEFAULT_WIDTHS))
+    roots = upload_roots(app) + [os.path.join(app.config['UPLOAD_FOLDER'], 'home_slider')]
+    done, failed = backfill(roots, widths, force='--force' in sys.argv[1:])
+    print(f"✅ Created derivatives for {done} files ({failed} failed)")
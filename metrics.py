@@ -0,0 +1,365 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import tempfile
+import threading
+import logging
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# โฟลเดอร์ที่แต่ละ gunicorn worker เขียนสถิติของตัวเอง (ค่าเริ่มต้น override ได้ผ่าน app.config)
+DEFAULT_METRICS_DIR = os.path.join(tempfile.gettempdir(), 'tireweb_metrics')
+# เขียนไฟล์สถิติของ worker อย่างมากทุกกี่วินาที
+DEFAULT_FLUSH_INTERVAL = 5
+# ขอบบนของ bucket เวลาตอบสนอง (วินาที)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PREFIX = 'tireweb_'
+
+HELP = {
+    'http_requests_total': ('counter', 'จำนวน request แยกตาม blueprint, endpoint, method และ status'),
+    'http_request_duration_seconds': ('histogram', 'เวลาตอบสนองของ request (วินาที)'),
+    'db_pool_checkouts_total': ('counter', 'จำนวนครั้งที่ยืม connection จาก pool'),
+    'db_pool_exhausted_total': ('counter', 'จำนวนการขอ connection ที่ต้องรอเพราะ pool เต็ม'),
+    'db_pool_wait_seconds_total': ('counter', 'เวลารอ connection จาก pool รวม (วินาที)'),
+    'db_pool_recycled_total': ('counter', 'จำนวน connection ที่ต่อใหม่แทนตัวที่หลุด'),
+    'db_pool_size': ('gauge', 'ขนาด connection pool ต่อ worker'),
+    'db_pool_checked_out': ('gauge', 'จำนวน connection ที่ถูกยืมอยู่'),
+    'db_pool_max_checked_out': ('gauge', 'จำนวน connection ที่ถูกยืมพร้อมกันสูงสุด'),
+    'page_view_buffer_pending': ('gauge', 'จำนวนการเข้าชมที่รอเขียนลงฐานข้อมูล'),
+    'page_view_logs_dropped_total': ('counter', 'จำนวนแถว page_view_logs ที่ทิ้งเพราะบัฟเฟอร์เต็ม'),
+    'report_jobs_active': ('gauge', 'จำนวนงานรายงาน PDF ที่รอหรือกำลังทำ'),
+    'worker_up': ('gauge', 'worker ที่ยังทำงานอยู่ (1 ต่อ worker)'),
+}
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """สถิติของ process นี้ (counter และ histogram สะสม) พร้อมเขียนลงไฟล์เพื่อรวมข้ามทุก worker
+
+    แต่ละ worker เขียนไฟล์ metrics_<pid>.json ของตัวเอง หน้า /metrics อ่านทุกไฟล์มารวมกัน:
+    counter/histogram รวมทุกไฟล์ (รวม worker ที่ปิดไปแล้ว เพื่อให้ค่าไม่ลดลงเมื่อ worker ถูก recycle)
+    ส่วน gauge ใช้เฉพาะ worker ที่ยังทำงานอยู่
+    """
+
+    def __init__(self):
+        self.metrics_dir = DEFAULT_METRICS_DIR
+        self.flush_interval = DEFAULT_FLUSH_INTERVAL
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._token = uuid.uuid4().hex
+        self._counters = {}
+        self._histograms = {}
+        self._last_flush = 0.0
+        self._registered = False
+
+    def configure(self, metrics_dir=None, flush_interval=None):
+        if metrics_dir:
+            self.metrics_dir = metrics_dir
+        if flush_interval is not None:
+            self.flush_interval = float(flush_interval)
+
+    def _ensure_process(self):
+        # gunicorn --preload fork หลังโหลดแอป: เริ่มนับใหม่เมื่อ pid เปลี่ยน
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+    # ---------- บันทึกค่า ----------
+
+    def inc(self, name, labels, value=1):
+        self._ensure_process()
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        self._ensure_process()
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': [0] * len(buckets), 'bounds': list(buckets),
+                                                     'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    # ---------- เขียน/อ่านไฟล์ ----------
+
+    def _path(self, pid):
+        return os.path.join(self.metrics_dir, f"metrics_{pid}.json")
+
+    def _process_gauges(self):
+        """ค่าปัจจุบันของ process (pool, บัฟเฟอร์การเข้าชม, คิวรายงาน) อ่านตอนเขียนไฟล์"""
+        gauges = []
+        counters = []
+        try:
+            from database import get_pool_stats
+            stats = get_pool_stats()
+            gauges += [('db_pool_size', stats['pool_size']),
+                       ('db_pool_checked_out', stats['checked_out']),
+                       ('db_pool_max_checked_out', stats['max_checked_out'])]
+            counters += [('db_pool_checkouts_total', stats['checkouts']),
+                         ('db_pool_exhausted_total', stats['exhausted']),
+                         ('db_pool_wait_seconds_total', stats['total_wait_ms'] / 1000),
+                         ('db_pool_recycled_total', stats['recycled'])]
+        except Exception as e:
+            logger.debug(f"Error reading pool stats: {e}")
+        try:
+            from page_view_recorder import recorder
+            gauges.append(('page_view_buffer_pending', recorder.pending()))
+            counters.append(('page_view_logs_dropped_total', recorder.dropped_logs()))
+        except Exception as e:
+            logger.debug(f"Error reading page view buffer: {e}")
+        try:
+            from report_jobs import queue
+            gauges.append(('report_jobs_active', queue.queue_depth()))
+        except Exception as e:
+            logger.debug(f"Error reading report queue depth: {e}")
+        gauges.append(('worker_up', 1))
+        return gauges, counters
+
+    def _snapshot(self, alive=True):
+        with self._lock:
+            counters = [[name, list(map(list, labels)), value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, list(map(list, labels)), dict(data, buckets=list(data['buckets']))]
+                          for (name, labels), data in self._histograms.items()]
+        gauges, process_counters = self._process_gauges()
+        counters += [[name, [], value] for name, value in process_counters]
+        return {
+            'pid': self._pid,
+            'token': self._token,
+            'alive': alive,
+            'written_at': time.time(),
+            'counters': counters,
+            'histograms': histograms,
+            'gauges': [[name, [], value] for name, value in gauges] if alive else [],
+        }
+
+    def write(self, alive=True):
+        """เขียนสถิติของ process นี้ลงไฟล์ (แทนที่แบบ atomic)"""
+        self._ensure_process()
+        try:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            path = self._path(self._pid)
+            if not self._registered:
+                # ไฟล์ของ process เก่าที่บังเอิญได้ pid เดียวกัน: เก็บยอดสะสมไว้ก่อนเขียนทับ
+                with _DirectoryLock(self.metrics_dir):
+                    _archive_file(self.metrics_dir, path, keep_token=self._token)
+                self._registered = True
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._snapshot(alive), f)
+            os.replace(tmp_path, path)
+            self._last_flush = time.monotonic()
+        except Exception as e:
+            logger.warning(f"Error writing metrics file: {e}")
+
+    def maybe_write(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.write()
+
+    # ---------- request hooks ----------
+
+    def start_request(self):
+        g.metrics_started_at = time.perf_counter()
+
+    def finish_request(self, response):
+        started = g.pop('metrics_started_at', None)
+        if started is None:
+            return response
+        endpoint = request.endpoint or 'unknown'
+        blueprint = request.blueprint or 'app'
+        self.inc('http_requests_total', {'blueprint': blueprint, 'endpoint': endpoint,
+                                         'method': request.method, 'status': response.status_code})
+        self.observe('http_request_duration_seconds', {'blueprint': blueprint, 'endpoint': endpoint},
+                     time.perf_counter() - started)
+        self.maybe_write()
+        return response
+
+
+class _DirectoryLock:
+    """file lock ระหว่าง process สำหรับรวม/ย้ายไฟล์สถิติ"""
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, '.lock')
+
+    def __enter__(self):
+        self._file = open(self.path, 'a')
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        return False
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _merge(target, data):
+    """รวม counter/histogram ของ data เข้า target (dict key -> value)"""
+    for name, labels, value in data.get('counters', []):
+        key = (name, tuple(map(tuple, labels)))
+        target['counters'][key] = target['counters'].get(key, 0) + value
+    for name, labels, histogram in data.get('histograms', []):
+        key = (name, tuple(map(tuple, labels)))
+        current = target['histograms'].get(key)
+        if current is None or current['bounds'] != histogram['bounds']:
+            target['histograms'][key] = dict(histogram, buckets=list(histogram['buckets']))
+            continue
+        current['buckets'] = [a + b for a, b in zip(current['buckets'], histogram['buckets'])]
+        current['sum'] += histogram['sum']
+        current['count'] += histogram['count']
+
+
+def _archive_path(directory):
+    return os.path.join(directory, 'metrics_archive.json')
+
+
+def _archive_file(directory, path, keep_token=None):
+    """ย้ายยอดสะสมของไฟล์ process ที่ปิดไปแล้วเข้า metrics_archive.json (ต้องถือ _DirectoryLock)"""
+    data = _read_json(path)
+    if data is None or data.get('token') == keep_token:
+        return
+    archive = _read_json(_archive_path(directory)) or {'counters': [], 'histograms': []}
+    merged = {'counters': {}, 'histograms': {}}
+    _merge(merged, archive)
+    _merge(merged, data)
+    archive = {
+        'counters': [[name, list(map(list, labels)), value] for (name, labels), value in merged['counters'].items()],
+        'histograms': [[name, list(map(list, labels)), value] for (name, labels), value in merged['histograms'].items()],
+    }
+    tmp_path = f"{_archive_path(directory)}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(archive, f)
+    os.replace(tmp_path, _archive_path(directory))
+    os.remove(path)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def collect(directory):
+    """รวมสถิติจากทุกไฟล์ในโฟลเดอร์ คืนค่า (counters, histograms, gauges)"""
+    merged = {'counters': {}, 'histograms': {}}
+    gauges = []
+    with _DirectoryLock(directory):
+        for name in sorted(os.listdir(directory)):
+            if not (name.startswith('metrics_') and name.endswith('.json')) or name == 'metrics_archive.json':
+                continue
+            path = os.path.join(directory, name)
+            data = _read_json(path)
+            if data is None:
+                continue
+            if not data.get('alive', True) or not _pid_alive(data['pid']):
+                _archive_file(directory, path)
+                continue
+            _merge(merged, data)
+            for metric, labels, value in data.get('gauges', []):
+                gauges.append((metric, tuple(map(tuple, labels)) + (('pid', data['pid']),), value))
+        archive = _read_json(_archive_path(directory))
+        if archive:
+            _merge(merged, archive)
+    return merged['counters'], merged['histograms'], gauges
+
+
+def render_exposition(directory):
+    """สถิติทั้งหมดในรูปแบบ Prometheus text exposition format (version 0.0.4)"""
+    counters, histograms, gauges = collect(directory)
+    # series[name] = [(labels, [บรรทัด, ...]), ...] เรียงตาม label แต่คงลำดับ bucket ของ histogram ไว้
+    series = {}
+    for (name, labels), value in counters.items():
+        series.setdefault(name, []).append(
+            (labels, [f"{PREFIX}{name}{_format_labels(labels)} {_format_value(value)}"]))
+    for (name, labels), histogram in histograms.items():
+        lines = []
+        cumulative = 0
+        for bound, count in zip(histogram['bounds'], histogram['buckets']):
+            cumulative += count
+            lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+        lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+        lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {_format_value(histogram['sum'])}")
+        lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {histogram['count']}")
+        series.setdefault(name, []).append((labels, lines))
+    for name, labels, value in gauges:
+        series.setdefault(name, []).append(
+            (labels, [f"{PREFIX}{name}{_format_labels(labels)} {_format_value(value)}"]))
+
+    output = []
+    for name in sorted(series):
+        metric_type, help_text = HELP.get(name, ('untyped', name))
+        output.append(f"# HELP {PREFIX}{name} {help_text}")
+        output.append(f"# TYPE {PREFIX}{name} {metric_type}")
+        for _, lines in sorted(series[name], key=lambda item: [(k, str(v)) for k, v in item[0]]):
+            output.extend(lines)
+    return '\n'.join(output) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def init_app(app):
+    """ตั้งค่าจาก app.config และลงทะเบียน hook วัด request"""
+    registry.configure(
+        metrics_dir=app.config.get('METRICS_DIR'),
+        flush_interval=app.config.get('METRICS_FLUSH_INTERVAL'),
+    )
+    app.before_request(registry.start_request)
+    app.after_request(registry.finish_request)
+
+
+def metrics_text():
+    """เขียนสถิติล่าสุดของ worker นี้ แล้วรวมกับ worker อื่นเป็นข้อความสำหรับ scrape"""
+    registry.write()
+    return render_exposition(registry.metrics_dir)
+
+
+def shutdown():
+    """เขียนยอดสุดท้ายของ worker (เรียกตอน worker ปิดตัว) gauge ของ worker นี้จะไม่ถูกนับอีก"""
+    if registry._pid == os.getpid() and registry._registered:
+        registry.write(alive=False)
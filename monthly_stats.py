@@ -0,0 +1,88 @@
+import threading
+import logging
+from datetime import date
+
+from database import get_cursor
+
+logger = logging.getLogger(__name__)
+
+# ชุดข้อมูลรายเดือนที่รองรับ: ชื่อ → (ตาราง/JOIN, คอลัมน์วันที่)
+# คอลัมน์วันที่ถูกใช้ในเงื่อนไขแบบช่วง (>= / <) เพื่อให้ใช้ index ได้
+SERIES = {
+    'bookings': ('bookings b', 'b.booking_date'),
+    # customers ไม่มีคอลัมน์วันที่สร้าง จึงใช้วันที่สร้างบัญชีผู้ใช้ที่ผูกกับลูกค้า
+    'customers': ('customers c JOIN users u ON c.user_id = u.user_id', 'u.created_at'),
+}
+
+# เดือนที่ปิดไปแล้วไม่เปลี่ยน จึงเก็บไว้ตลอดอายุ process: {(series, 'YYYY-MM'): count}
+_closed_months = {}
+_lock = threading.Lock()
+
+
+def month_key(year, month):
+    return f"{year:04d}-{month:02d}"
+
+
+def add_months(year, month, delta):
+    index = year * 12 + (month - 1) + delta
+    return index // 12, index % 12 + 1
+
+
+def last_months(count, today=None):
+    """รายการเดือน (year, month) ย้อนหลัง count เดือน รวมเดือนปัจจุบัน เรียงจากเก่าไปใหม่"""
+    today = today or date.today()
+    return [add_months(today.year, today.month, -i) for i in range(count - 1, -1, -1)]
+
+
+def _query_counts(series, first, last):
+    """นับจำนวนต่อเดือนในช่วง [first, last] ด้วย query เดียว"""
+    table, column = SERIES[series]
+    end_year, end_month = add_months(last[0], last[1], 1)
+    cursor = get_cursor()
+    cursor.execute(f"""
+        SELECT YEAR({column}) AS y, MONTH({column}) AS m, COUNT(*) AS count
+        FROM {table}
+        WHERE {column} >= %s AND {column} < %s
+        GROUP BY YEAR({column}), MONTH({column})
+    """, (date(first[0], first[1], 1), date(end_year, end_month, 1)))
+    counts = {month_key(int(row['y']), int(row['m'])): int(row['count']) for row in cursor.fetchall()}
+    cursor.close()
+    return counts
+
+
+def monthly_counts(series, months, today=None):
+    """คืนค่า {'YYYY-MM': count} สำหรับเดือนที่ระบุ
+
+    เดือนที่ปิดแล้วอ่านจาก cache; เดือนปัจจุบัน (หรืออนาคต) คำนวณใหม่ทุกครั้ง
+    และเดือนที่ขาดทั้งหมดถูกดึงด้วย query แบบช่วงเพียงครั้งเดียว
+    """
+    if series not in SERIES:
+        raise ValueError(f"Unknown series: {series}")
+    today = today or date.today()
+    current = (today.year, today.month)
+    months = sorted(set(months))
+    result = {}
+    missing = []
+    for year, month in months:
+        key = month_key(year, month)
+        cached = _closed_months.get((series, key)) if (year, month) < current else None
+        if cached is None:
+            missing.append((year, month))
+        else:
+            result[key] = cached
+
+    if missing:
+        counts = _query_counts(series, missing[0], missing[-1])
+        with _lock:
+            for year, month in missing:
+                key = month_key(year, month)
+                result[key] = counts.get(key, 0)
+                if (year, month) < current:
+                    _closed_months[(series, key)] = result[key]
+    return result
+
+
+def clear_cache():
+    """ล้าง cache ของเดือนที่ปิดแล้ว (เช่นหลังแก้ข้อมูลย้อนหลัง)"""
+    with _lock:
+        _closed_months.clear()
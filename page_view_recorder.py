@@ -0,0 +1,276 @@
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime
+
+from mysql.connector.errors import DataError, IntegrityError, NotSupportedError, ProgrammingError
+
+from cache_versions import bump_version
+
+logger = logging.getLogger(__name__)
+
+# version stamp ของ page_view_logs (bump หลังเขียนแต่ละชุด ใช้เป็น key ของรายงานสถิติการเข้าชมในแคช)
+PAGE_VIEWS_VERSION = 'page_views'
+
+# ค่าเริ่มต้นของการ flush (override ได้ผ่าน app.config)
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_FLUSH_MAX_EVENTS = 200
+# จำนวนแถว page_view_logs สูงสุดที่ค้างในบัฟเฟอร์ได้ (กันหน่วยความจำโตไม่จำกัดเมื่อฐานข้อมูลล่มนาน)
+DEFAULT_MAX_BUFFERED_LOGS = 10000
+# ความยาวสูงสุดของ page_id (page_views.page_id เป็น VARCHAR(100) และ sql_mode TRADITIONAL ไม่ตัดให้)
+MAX_PAGE_ID_LENGTH = 100
+# error ที่เกิดจากข้อมูลในชุด ไม่ใช่จากการเชื่อมต่อ: ลองใหม่ก็ล้มเหลวเหมือนเดิม จึงไม่คืนกลับเข้าบัฟเฟอร์
+REJECTED_ROW_ERRORS = (DataError, IntegrityError, NotSupportedError, ProgrammingError)
+
+
+class PageViewRecorder:
+    """บัฟเฟอร์การเข้าชมหน้าเว็บในหน่วยความจำ แล้วเขียนลงฐานข้อมูลเป็นชุดด้วย background thread
+
+    - page_views: รวมจำนวนการเข้าชมต่อ page_id แล้วเขียนด้วย INSERT หลายแถวคำสั่งเดียว
+    - page_view_logs: เก็บแถว log (page_id, device_type, viewed_at) แล้วเขียนด้วย INSERT หลายแถวคำสั่งเดียว
+      ถ้าค้างเกิน max_buffered_logs (เช่นฐานข้อมูลล่ม) จะทิ้งแถวที่เก่าที่สุดและนับไว้ใน dropped_logs()
+      ส่วนยอดรวมใน page_views ไม่ถูกทิ้งเพราะมีอย่างมากหนึ่งรายการต่อหน้า
+    """
+
+    def __init__(self, flush_interval=DEFAULT_FLUSH_INTERVAL, flush_max_events=DEFAULT_FLUSH_MAX_EVENTS,
+                 max_buffered_logs=DEFAULT_MAX_BUFFERED_LOGS):
+        self.flush_interval = flush_interval
+        self.flush_max_events = flush_max_events
+        self.max_buffered_logs = max_buffered_logs
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._counts = {}
+        self._logs = []
+        self._pending = 0
+        self._dropped_logs = 0
+        self._warned_dropped = 0
+        self._thread = None
+        self._pid = None
+        self._stopped = False
+
+    def configure(self, flush_interval=None, flush_max_events=None, max_buffered_logs=None):
+        """ปรับค่าการ flush และขนาดบัฟเฟอร์"""
+        if flush_interval is not None:
+            self.flush_interval = float(flush_interval)
+        if flush_max_events is not None:
+            self.flush_max_events = int(flush_max_events)
+        if max_buffered_logs is not None:
+            self.max_buffered_logs = int(max_buffered_logs)
+
+    def record(self, page_id, device_type=None, viewed_at=None):
+        """บันทึกการเข้าชมลงบัฟเฟอร์ (ไม่แตะฐานข้อมูล)
+
+        ถ้าส่ง device_type มาด้วยจะเก็บแถวสำหรับ page_view_logs เพิ่ม
+        คืนค่า False (ไม่บันทึก) ถ้า page_id ไม่ใช่ข้อความยาว 1..MAX_PAGE_ID_LENGTH ตัวอักษร
+        """
+        if not isinstance(page_id, str) or not page_id or len(page_id) > MAX_PAGE_ID_LENGTH:
+            logger.debug(f"Ignoring invalid page_id: {str(page_id)[:MAX_PAGE_ID_LENGTH]!r}")
+            return False
+        viewed_at = viewed_at or datetime.now()
+        self._ensure_worker()
+        with self._lock:
+            entry = self._counts.get(page_id)
+            if entry is None:
+                self._counts[page_id] = [1, viewed_at]
+            else:
+                entry[0] += 1
+                if viewed_at > entry[1]:
+                    entry[1] = viewed_at
+            if device_type is not None:
+                self._logs.append((page_id, device_type, viewed_at))
+                self._trim_logs()
+            self._pending += 1
+            pending = self._pending
+        if pending >= self.flush_max_events:
+            self._wakeup.set()
+        return True
+
+    def pending(self):
+        """จำนวนเหตุการณ์ที่ยังไม่ได้เขียนลงฐานข้อมูล"""
+        with self._lock:
+            return self._pending
+
+    def dropped_logs(self):
+        """จำนวนแถว page_view_logs ที่ถูกทิ้งเพราะบัฟเฟอร์เต็ม (สะสมตั้งแต่ process เริ่ม)"""
+        with self._lock:
+            return self._dropped_logs
+
+    def flush(self):
+        """เขียนข้อมูลในบัฟเฟอร์ลงฐานข้อมูล คืนค่าจำนวนเหตุการณ์ที่เขียนสำเร็จ"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                counts, self._counts = self._counts, {}
+                logs, self._logs = self._logs, []
+                pending, self._pending = self._pending, 0
+
+            try:
+                self._write(counts, logs)
+            except REJECTED_ROW_ERRORS as e:
+                # ฐานข้อมูลปฏิเสธข้อมูลในชุด: เขียนทีละแถวเพื่อแยกแถวที่เสียออก ไม่ให้ทั้งชุดค้างในบัฟเฟอร์ตลอดไป
+                logger.error(f"Page view batch rejected, retrying row by row: {e}")
+                pending = self._write_rows(counts, logs)
+            except Exception as e:
+                logger.error(f"Error flushing page views: {e}")
+                # ฐานข้อมูลไม่พร้อม (เชื่อมต่อไม่ได้/หลุด): คืนข้อมูลกลับเข้าบัฟเฟอร์เพื่อไม่ให้ยอดเข้าชมหาย
+                self._restore(counts, logs, pending)
+                return 0
+            if logs:
+                bump_version(PAGE_VIEWS_VERSION)
+            return pending
+
+    def _write_rows(self, counts, logs):
+        """เขียนทีละแถว ทิ้งแถวที่ฐานข้อมูลปฏิเสธ (log ไว้) คืนค่าจำนวนการเข้าชมที่เขียนสำเร็จ
+
+        ถ้าฐานข้อมูลไม่พร้อมระหว่างทาง แถวที่เหลือจะถูกคืนกลับเข้าบัฟเฟอร์
+        """
+        rows = [({page_id: entry}, []) for page_id, entry in counts.items()] + [({}, [row]) for row in logs]
+        written = 0
+        for index, (row_counts, row_logs) in enumerate(rows):
+            try:
+                self._write(row_counts, row_logs)
+            except REJECTED_ROW_ERRORS as e:
+                logger.error(f"Dropping page view row rejected by database {row_counts or row_logs}: {e}")
+                continue
+            except Exception as e:
+                logger.error(f"Error flushing page views: {e}")
+                rest = rows[index:]
+                rest_counts = {page_id: entry for rest_count, _ in rest for page_id, entry in rest_count.items()}
+                rest_logs = [row for _, rest_log in rest for row in rest_log]
+                self._restore(rest_counts, rest_logs, sum(views for views, _ in rest_counts.values()))
+                break
+            written += sum(views for views, _ in row_counts.values())
+        return written
+
+    def _restore(self, counts, logs, pending):
+        with self._lock:
+            for page_id, (views, last_viewed_at) in counts.items():
+                entry = self._counts.get(page_id)
+                if entry is None:
+                    self._counts[page_id] = [views, last_viewed_at]
+                else:
+                    entry[0] += views
+                    if last_viewed_at > entry[1]:
+                        entry[1] = last_viewed_at
+            self._logs[:0] = logs
+            self._pending += pending
+            self._trim_logs()
+            # รวมแถวที่ทิ้งตอน record() ระหว่างที่ฐานข้อมูลล่มด้วย (เตือนหนึ่งครั้งต่อรอบ flush ที่ล้มเหลว)
+            dropped, self._warned_dropped = self._dropped_logs - self._warned_dropped, self._dropped_logs
+            total_dropped = self._dropped_logs
+        if dropped:
+            logger.warning(f"Page view buffer full: dropped {dropped} oldest page_view_logs rows "
+                           f"({total_dropped} total)")
+
+    def _trim_logs(self):
+        """ทิ้งแถว log ที่เก่าที่สุดที่เกิน max_buffered_logs (ต้องถือ self._lock) คืนค่าจำนวนที่ทิ้ง"""
+        excess = len(self._logs) - self.max_buffered_logs
+        if excess <= 0:
+            return 0
+        del self._logs[:excess]
+        self._dropped_logs += excess
+        return excess
+
+    def _write(self, counts, logs):
+        # import ภายในฟังก์ชันเพื่อไม่ให้เกิด circular import กับ database
+        from database import _get_db_connection
+
+        connection = _get_db_connection()
+        try:
+            cursor = connection.cursor()
+            if counts:
+                rows = list(counts.items())
+                placeholders = ", ".join(["(%s, %s, %s)"] * len(rows))
+                params = []
+                for page_id, (views, last_viewed_at) in rows:
+                    params.extend((page_id, views, last_viewed_at))
+                cursor.execute(f"""
+                    INSERT INTO page_views (page_id, views, last_viewed_at)
+                    VALUES {placeholders}
+                    ON DUPLICATE KEY UPDATE
+                        views = views + VALUES(views),
+                        last_viewed_at = GREATEST(COALESCE(last_viewed_at, VALUES(last_viewed_at)), VALUES(last_viewed_at))
+                """, params)
+            if logs:
+                placeholders = ", ".join(["(%s, %s, %s)"] * len(logs))
+                params = [value for row in logs for value in row]
+                cursor.execute(f"""
+                    INSERT INTO page_view_logs (page_id, device_type, viewed_at)
+                    VALUES {placeholders}
+                """, params)
+            connection.commit()
+            cursor.close()
+            logger.debug(f"Flushed {len(counts)} page_views rows and {len(logs)} page_view_logs rows")
+        except Exception:
+            try:
+                connection.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _ensure_worker(self):
+        """เริ่ม background thread แบบ lazy ต่อ process (รองรับ gunicorn --preload ที่ fork หลังโหลดแอป)"""
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == pid and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != pid:
+                # process ลูกที่ fork มา: บัฟเฟอร์ที่ติดมาเป็นของ process แม่ ไม่ต้องเขียนซ้ำ
+                self._counts = {}
+                self._logs = []
+                self._pending = 0
+                self._dropped_logs = 0
+                self._warned_dropped = 0
+                self._flush_lock = threading.Lock()
+                self._wakeup = threading.Event()
+                self._pid = pid
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name="page-view-flusher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Unexpected error in page view flusher: {e}")
+
+    def shutdown(self):
+        """หยุด background thread และเขียนข้อมูลที่ค้างอยู่ (เรียกตอน worker ปิดตัว)"""
+        if self._pid != os.getpid():
+            return
+        self._stopped = True
+        self._wakeup.set()
+        self.flush()
+
+
+recorder = PageViewRecorder()
+
+# worker ของ gunicorn ที่ถูก recycle (--max-requests) ออกด้วย sys.exit จึงยัง flush ได้ทัน
+atexit.register(recorder.shutdown)
+
+
+def init_app(app):
+    """ตั้งค่า recorder จาก app.config"""
+    recorder.configure(
+        flush_interval=app.config.get('PAGE_VIEW_FLUSH_INTERVAL'),
+        flush_max_events=app.config.get('PAGE_VIEW_FLUSH_MAX_EVENTS'),
+        max_buffered_logs=app.config.get('PAGE_VIEW_MAX_BUFFERED_LOGS'),
+    )
+
+
+def record_page_view(page_id, device_type=None):
+    """บันทึกการเข้าชมหน้าเว็บแบบไม่บล็อก request คืนค่า False ถ้า page_id ไม่ถูกต้อง"""
+    return recorder.record(page_id, device_type=device_type)
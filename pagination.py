@@ -0,0 +1,180 @@
+import json
+import time
+import base64
+import threading
+import logging
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+
+from cache_versions import get_version
+
+logger = logging.getLogger(__name__)
+
+# เก็บจำนวนรายการและจุดเริ่มของแต่ละหน้าไว้กี่วินาที (override ได้ผ่าน app.config['PAGINATION_CACHE_TTL'])
+DEFAULT_CACHE_TTL = 30
+CACHE_SIZE = 64
+
+
+def encode_cursor(values):
+    """cursor แบบ opaque จากค่า key ของแถวสุดท้าย (base64 ของ JSON)"""
+    data = json.dumps([value if isinstance(value, (int, float)) or value is None else str(value)
+                       for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    """ค่า key จาก cursor หรือ None ถ้า cursor ไม่ถูกต้อง"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+class Page:
+    """ผลลัพธ์หนึ่งหน้า: rows, จำนวนทั้งหมด (จาก cache) และ cursor ของหน้าถัดไป"""
+
+    def __init__(self, rows, page, per_page, total, next_cursor):
+        self.rows = rows
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.total_pages = (total + per_page - 1) // per_page
+        self.next_cursor = next_cursor
+
+    def as_dict(self):
+        return {
+            'page': self.page,
+            'per_page': self.per_page,
+            'total': self.total,
+            'total_pages': self.total_pages,
+            'next_cursor': self.next_cursor,
+        }
+
+
+_boundaries = OrderedDict()
+_boundaries_lock = threading.Lock()
+
+
+def _cache_ttl():
+    if has_app_context():
+        return current_app.config.get('PAGINATION_CACHE_TTL', DEFAULT_CACHE_TTL)
+    return DEFAULT_CACHE_TTL
+
+
+class KeysetQuery:
+    """แบ่งหน้าแบบ keyset (seek) แทน LIMIT/OFFSET
+
+    keys คือ [(นิพจน์ SQL, 'ASC'|'DESC'), ...] ที่เรียงแล้วไม่ซ้ำกัน (ปิดท้ายด้วย primary key เสมอ)
+    และต้องไม่เป็น NULL (ใช้ COALESCE ถ้าคอลัมน์เป็น NULL ได้)
+
+    - หน้าถัดไป: WHERE (key) < ค่า key ของแถวสุดท้าย ใช้ index ได้โดยไม่ต้องข้ามแถวก่อนหน้า
+    - ?page=N: ใช้ค่า key ของแถวสุดท้ายของทุกหน้า ซึ่งได้จาก query เดียวที่อ่านเฉพาะคอลัมน์ key
+      (ROW_NUMBER) พร้อมจำนวนทั้งหมด แล้วเก็บไว้ PAGINATION_CACHE_TTL วินาที
+      หน้าลึกๆ และการนับจำนวนจึงไม่ต้อง query ซ้ำทุกครั้งที่เปลี่ยนหน้า
+    - versions: ชื่อ version stamp ของตารางใน from_clause ที่ผู้เขียนข้อมูล bump หลัง commit
+      เมื่อ stamp เปลี่ยน จุดเริ่มของหน้าที่ cache ไว้จะถูกคำนวณใหม่ (ไม่ข้ามแถวที่เพิ่งเพิ่มหรือย้ายหน้า)
+    """
+
+    def __init__(self, select, from_clause, keys, where=(), params=(), per_page=10, versions=()):
+        self.select = select
+        self.from_clause = from_clause
+        self.keys = list(keys)
+        self.where = list(where)
+        self.params = list(params)
+        self.per_page = per_page
+        self.versions = tuple(versions)
+        self._aliases = [f"_page_key{i}" for i in range(len(self.keys))]
+
+    def _order_by(self):
+        return ', '.join(f"{expr} {direction}" for expr, direction in self.keys)
+
+    def _where_sql(self, conditions):
+        return f" WHERE {' AND '.join(f'({condition})' for condition in conditions)}" if conditions else ''
+
+    def _seek(self, values):
+        """เงื่อนไขแถวที่อยู่หลังค่า key (แยกเป็น OR ของแต่ละระดับ ใช้ index ได้ทั้ง MySQL และ MariaDB)"""
+        clauses = []
+        params = []
+        for i, (expr, direction) in enumerate(self.keys):
+            parts = [f"{self.keys[j][0]} = %s" for j in range(i)]
+            parts.append(f"{expr} {'<' if direction.upper() == 'DESC' else '>'} %s")
+            clauses.append(f"({' AND '.join(parts)})")
+            params.extend(values[:i + 1])
+        return f"({' OR '.join(clauses)})", params
+
+    def _boundaries(self, cursor):
+        """(จำนวนทั้งหมด, [ค่า key ของแถวสุดท้ายของหน้า 1, 2, ...]) จาก cache หรือ query ใหม่"""
+        cache_key = (self.from_clause, tuple(self.where), tuple(map(str, self.params)),
+                     tuple(self.keys), self.per_page)
+        versions = tuple(get_version(name) for name in self.versions)
+        now = time.monotonic()
+        with _boundaries_lock:
+            cached = _boundaries.get(cache_key)
+            if cached is not None and cached[1] == versions and now - cached[0] < _cache_ttl():
+                _boundaries.move_to_end(cache_key)
+                return cached[2], cached[3]
+
+        key_columns = ', '.join(f"{expr} AS {alias}" for (expr, _), alias in zip(self.keys, self._aliases))
+        cursor.execute(f"""
+            SELECT {', '.join(self._aliases)}, total
+            FROM (
+                SELECT {key_columns},
+                       ROW_NUMBER() OVER (ORDER BY {self._order_by()}) AS page_row,
+                       COUNT(*) OVER () AS total
+                FROM {self.from_clause}{self._where_sql(self.where)}
+            ) AS numbered
+            WHERE MOD(page_row, %s) = 0 OR page_row = total
+            ORDER BY page_row
+        """, self.params + [self.per_page])
+        rows = cursor.fetchall()
+        total = rows[-1]['total'] if rows else 0
+        # แถวสุดท้ายของผลลัพธ์ถูกดึงมาเพื่อเอาจำนวนทั้งหมด ไม่ใช่จุดจบของหน้าเต็ม ถ้าหน้าสุดท้ายไม่เต็ม
+        full_pages = total // self.per_page
+        ends = [[row[alias] for alias in self._aliases] for row in rows[:full_pages]]
+        with _boundaries_lock:
+            _boundaries[cache_key] = (now, versions, total, ends)
+            _boundaries.move_to_end(cache_key)
+            while len(_boundaries) > CACHE_SIZE:
+                _boundaries.popitem(last=False)
+        return total, ends
+
+    def fetch(self, cursor, page=1, after=None):
+        """ดึงหน้าตาม cursor (after) หรือเลขหน้า คืนค่า Page"""
+        total, ends = self._boundaries(cursor)
+        values = decode_cursor(after, len(self.keys))
+        if values is None:
+            page = max(1, int(page or 1))
+            if page > 1:
+                if page - 2 >= len(ends):
+                    return Page([], page, self.per_page, total, None)
+                values = ends[page - 2]
+
+        conditions = list(self.where)
+        params = list(self.params)
+        if values is not None:
+            seek_sql, seek_params = self._seek(values)
+            conditions.append(seek_sql)
+            params.extend(seek_params)
+        key_columns = ', '.join(f"{expr} AS {alias}" for (expr, _), alias in zip(self.keys, self._aliases))
+        cursor.execute(f"""
+            SELECT {self.select}, {key_columns}
+            FROM {self.from_clause}{self._where_sql(conditions)}
+            ORDER BY {self._order_by()}
+            LIMIT %s
+        """, params + [self.per_page + 1])
+        rows = cursor.fetchall()
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            next_cursor = encode_cursor([rows[-1][alias] for alias in self._aliases])
+        for row in rows:
+            for alias in self._aliases:
+                row.pop(alias, None)
+        return Page(rows, page, self.per_page, total, next_cursor)
@@ -0,0 +1,143 @@
+import os
+import json
+import tempfile
+import threading
+import time
+import logging
+from datetime import date, timedelta
+
+from database import get_cursor
+from cache_versions import get_version, bump_version
+
+logger = logging.getLogger(__name__)
+
+# ชื่อ version stamp ของข้อมูลโปรโมชัน (bump ทุกครั้งที่แอดมินเพิ่ม/แก้ไข/ลบโปรโมชัน)
+PROMOTIONS_VERSION = 'promotions'
+# โหลดใหม่อย่างน้อยทุกกี่วินาที เผื่อมีการแก้ฐานข้อมูลโดยตรงนอกแอป
+PROMOTIONS_MAX_AGE = 600
+# ไฟล์ที่ทุก gunicorn worker ใช้ร่วมกัน (worker แรกที่ query แล้ว worker อื่นอ่านจากไฟล์)
+PROMOTIONS_CACHE_PATH = os.path.join(
+    os.environ.get('PROMOTIONS_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'tireweb_promotions')),
+    'active_promotions.json')
+
+_DATE_FIELDS = ('start_date', 'end_date')
+
+
+class ActivePromotions:
+    """โปรโมชันที่ใช้งานได้ในวันหนึ่ง พร้อมช่วงวันที่ที่ผลลัพธ์นี้ยังถูกต้อง
+
+    valid_until คือวันถัดไปที่ชุดโปรโมชันจะเปลี่ยน (วันเริ่มของโปรโมชันถัดไป หรือวันหลังวันสิ้นสุดของโปรโมชันที่ใช้อยู่)
+    None หมายถึงไม่เปลี่ยนจนกว่าแอดมินจะแก้ไขโปรโมชัน
+    """
+
+    def __init__(self, rows, version, valid_from, valid_until):
+        self.version = version
+        self.valid_from = valid_from
+        self.valid_until = valid_until
+        self.loaded_at = time.monotonic()
+        self.rows = rows
+        self.by_start_date = sorted(rows, key=lambda row: row['start_date'], reverse=True)
+        self.by_id = sorted(rows, key=lambda row: row['promotion_id'], reverse=True)
+
+    @classmethod
+    def from_upcoming(cls, rows, version, today):
+        """คำนวณจากโปรโมชันที่ยังไม่สิ้นสุด (end_date >= today)"""
+        active = [row for row in rows if row['start_date'] <= today <= row['end_date']]
+        boundaries = [row['start_date'] for row in rows if row['start_date'] > today]
+        boundaries += [row['end_date'] + timedelta(days=1) for row in active]
+        return cls(active, version, today, min(boundaries) if boundaries else None)
+
+    def valid_on(self, today):
+        return self.valid_from <= today and (self.valid_until is None or today < self.valid_until)
+
+    def to_json(self):
+        return {
+            'version': self.version,
+            'valid_from': self.valid_from.isoformat(),
+            'valid_until': self.valid_until.isoformat() if self.valid_until else None,
+            'rows': [dict(row, **{field: row[field].isoformat() for field in _DATE_FIELDS}) for row in self.rows],
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        rows = [dict(row, **{field: date.fromisoformat(row[field]) for field in _DATE_FIELDS})
+                for row in data['rows']]
+        valid_until = date.fromisoformat(data['valid_until']) if data['valid_until'] else None
+        return cls(rows, data['version'], date.fromisoformat(data['valid_from']), valid_until)
+
+
+def _version_key():
+    return str(get_version(PROMOTIONS_VERSION))
+
+
+def _read_shared(version, today):
+    try:
+        if time.time() - os.path.getmtime(PROMOTIONS_CACHE_PATH) >= PROMOTIONS_MAX_AGE:
+            return None
+        with open(PROMOTIONS_CACHE_PATH, 'r', encoding='utf-8') as f:
+            cached = ActivePromotions.from_json(json.load(f))
+    except (FileNotFoundError, ValueError, KeyError, TypeError):
+        return None
+    if cached.version != version or not cached.valid_on(today):
+        return None
+    return cached
+
+
+def _write_shared(promotions):
+    try:
+        os.makedirs(os.path.dirname(PROMOTIONS_CACHE_PATH), exist_ok=True)
+        tmp_path = f"{PROMOTIONS_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(promotions.to_json(), f, ensure_ascii=False)
+        os.replace(tmp_path, PROMOTIONS_CACHE_PATH)
+    except Exception as e:
+        logger.warning(f"Error writing promotions cache {PROMOTIONS_CACHE_PATH}: {e}")
+
+
+def _load(version, today):
+    cursor = get_cursor()
+    cursor.execute("""
+        SELECT promotion_id, title, description, image_url,
+               start_date, end_date
+        FROM promotions
+        WHERE end_date >= %s
+    """, (today,))
+    rows = [row for row in cursor.fetchall() if row['start_date'] and row['end_date']]
+    cursor.close()
+    promotions = ActivePromotions.from_upcoming(rows, version, today)
+    _write_shared(promotions)
+    logger.info(f"Active promotions loaded: {len(promotions.rows)} (valid until {promotions.valid_until})")
+    return promotions
+
+
+_current = None
+_current_lock = threading.Lock()
+
+
+def _get_active():
+    global _current
+    version = _version_key()
+    today = date.today()
+    current = _current
+    if current is not None and current.version == version and current.valid_on(today) and \
+            time.monotonic() - current.loaded_at < PROMOTIONS_MAX_AGE:
+        return current
+    with _current_lock:
+        current = _current
+        if current is None or current.version != version or not current.valid_on(today) or \
+                time.monotonic() - current.loaded_at >= PROMOTIONS_MAX_AGE:
+            current = _read_shared(version, today) or _load(version, today)
+            _current = current
+    return current
+
+
+def active_promotions(order='start_date'):
+    """โปรโมชันที่ใช้งานได้วันนี้ (สำเนา) เรียงตาม start_date ใหม่ไปเก่า หรือ order='promotion_id'"""
+    current = _get_active()
+    rows = current.by_id if order == 'promotion_id' else current.by_start_date
+    return [dict(row) for row in rows]
+
+
+def invalidate_promotions():
+    """แจ้งทุก worker ว่าข้อมูลโปรโมชันเปลี่ยน (เรียกหลัง commit)"""
+    bump_version(PROMOTIONS_VERSION)
@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import tempfile
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from cache_versions import get_version
+
+logger = logging.getLogger(__name__)
+
+# ค่าเริ่มต้น (override ได้ผ่าน app.config)
+DEFAULT_REPORT_DIR = os.path.join(tempfile.gettempdir(), 'tireweb_reports')
+DEFAULT_REPORT_WORKERS = 2
+DEFAULT_CACHE_MAX_AGE = 24 * 60 * 60
+# งานที่ค้างสถานะ queued/running นานกว่านี้ถือว่าล้มเหลว (เช่น worker ถูก recycle ระหว่างทำงาน)
+JOB_TIMEOUT = 15 * 60
+
+# สถานะงาน
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+ERROR = 'error'
+
+
+class ReportKind:
+    """ชนิดรายงาน: loader ดึงข้อมูลจากฐานข้อมูล (รันใน web process)
+    renderer สร้าง PDF จากข้อมูล (รันใน process pool จึงต้องเป็นฟังก์ชันระดับ module)
+    versions คือชื่อ version stamp ของข้อมูลที่ loader อ่าน (ผู้เขียนข้อมูล bump หลัง commit)
+    """
+
+    def __init__(self, name, loader, renderer, filename, versions=()):
+        self.name = name
+        self.loader = loader
+        self.renderer = renderer
+        self.filename = filename
+        self.versions = tuple(versions)
+
+
+class ReportJobQueue:
+    """คิวงานสร้างรายงาน PDF เบื้องหลัง
+
+    - สถานะงานเก็บเป็นไฟล์ JSON ใน REPORT_DIR/jobs ทำให้ทุก gunicorn worker ตอบการ poll ได้
+    - ผลลัพธ์เก็บใน REPORT_DIR/cache โดยใช้ hash ของ (ชนิด, พารามิเตอร์, version stamp) เป็นชื่อไฟล์
+      รายงานที่พารามิเตอร์เหมือนเดิมและข้อมูลยังไม่เปลี่ยนจึงไม่ต้องดึงข้อมูลหรือสร้างใหม่
+    - การ render รันใน ProcessPoolExecutor เพราะ ReportLab ใช้ CPU ล้วน
+    """
+
+    def __init__(self):
+        self.report_dir = DEFAULT_REPORT_DIR
+        self.max_workers = DEFAULT_REPORT_WORKERS
+        self.cache_max_age = DEFAULT_CACHE_MAX_AGE
+        self.app = None
+        self._kinds = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._process_pool = None
+        self._thread_pool = None
+        self._events = {}
+        self._active = 0
+        self._last_cleanup = 0
+
+    def configure(self, app, report_dir=None, max_workers=None, cache_max_age=None):
+        """ตั้งค่าคิว (เรียกจาก init_app)"""
+        self.app = app
+        if report_dir:
+            self.report_dir = report_dir
+        if max_workers:
+            self.max_workers = int(max_workers)
+        if cache_max_age:
+            self.cache_max_age = int(cache_max_age)
+
+    def register(self, name, loader, renderer, filename, versions=()):
+        """ลงทะเบียนชนิดรายงาน"""
+        self._kinds[name] = ReportKind(name, loader, renderer, filename, versions)
+
+    # ---------- path helpers ----------
+
+    def _jobs_dir(self):
+        return os.path.join(self.report_dir, 'jobs')
+
+    def _cache_dir(self):
+        return os.path.join(self.report_dir, 'cache')
+
+    def _job_path(self, job_id):
+        return os.path.join(self._jobs_dir(), f"{job_id}.json")
+
+    def _write_json(self, path, data):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _update_job(self, job, **fields):
+        job.update(fields)
+        self._write_json(self._job_path(job['job_id']), job)
+
+    # ---------- executors ----------
+
+    def _executors(self):
+        """สร้าง executor แบบ lazy ต่อ process (gunicorn --preload fork หลังโหลดแอป)"""
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._process_pool = None
+                    self._thread_pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                           thread_name_prefix='report-job')
+                    self._events = {}
+                    self._active = 0
+                    self._pid = pid
+        if self._process_pool is None:
+            with self._lock:
+                if self._process_pool is None:
+                    # ใช้ spawn เพื่อไม่ให้ process ลูกได้ lock/connection ที่ค้างจาก web worker
+                    self._process_pool = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context('spawn'))
+        return self._thread_pool, self._process_pool
+
+    def _reset_process_pool(self):
+        with self._lock:
+            pool, self._process_pool = self._process_pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    # ---------- public API ----------
+
+    def submit(self, kind, params, requested_by=None):
+        """ส่งงานสร้างรายงาน คืนค่า job_id ทันที"""
+        if kind not in self._kinds:
+            raise ValueError(f"Unknown report kind: {kind}")
+        thread_pool, _ = self._executors()
+        os.makedirs(self._jobs_dir(), exist_ok=True)
+        os.makedirs(self._cache_dir(), exist_ok=True)
+        self._cleanup()
+
+        job_id = uuid.uuid4().hex
+        job = {
+            'job_id': job_id,
+            'kind': kind,
+            'params': params,
+            'requested_by': requested_by,
+            'status': QUEUED,
+            'filename': self._kinds[kind].filename(params),
+            'created_at': time.time(),
+            'finished_at': None,
+            'cached': False,
+            'error': None,
+        }
+        self._write_json(self._job_path(job_id), job)
+        with self._lock:
+            self._events[job_id] = threading.Event()
+            self._active += 1
+        thread_pool.submit(self._run, job)
+        return job_id
+
+    def get_job(self, job_id):
+        """อ่านสถานะงาน (None ถ้าไม่พบ)"""
+        if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+            return None
+        try:
+            with open(self._job_path(job_id), 'r', encoding='utf-8') as f:
+                job = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if job['status'] in (QUEUED, RUNNING) and time.time() - job['created_at'] > JOB_TIMEOUT:
+            job['status'] = ERROR
+            job['error'] = 'การสร้างรายงานใช้เวลานานเกินไป กรุณาลองใหม่อีกครั้ง'
+        return job
+
+    def wait(self, job_id, timeout):
+        """รองานที่ส่งจาก process นี้ไม่เกิน timeout วินาที แล้วคืนค่าสถานะล่าสุด"""
+        event = self._events.get(job_id)
+        if event is not None and timeout:
+            event.wait(timeout)
+        return self.get_job(job_id)
+
+    def result_path(self, job):
+        """path ของไฟล์ PDF สำหรับงานที่เสร็จแล้ว"""
+        if not job or job.get('status') != DONE or not job.get('result'):
+            return None
+        path = os.path.join(self._cache_dir(), job['result'])
+        return path if os.path.exists(path) else None
+
+    def queue_depth(self):
+        """จำนวนงานที่รอหรือกำลังทำอยู่ใน process นี้"""
+        with self._lock:
+            return self._active
+
+    # ---------- worker ----------
+
+    def _cache_key(self, report, params):
+        # อ่าน version stamp ก่อนดึงข้อมูล: ถ้าข้อมูลเปลี่ยนระหว่างดึง คำขอถัดไปจะได้ key ใหม่และสร้างใหม่
+        versions = [get_version(name) for name in report.versions]
+        payload = json.dumps([report.name, params, versions], sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _run(self, job):
+        job_id = job['job_id']
+        try:
+            report = self._kinds[job['kind']]
+            self._update_job(job, status=RUNNING)
+
+            result = f"{self._cache_key(report, job['params'])}.pdf"
+            path = os.path.join(self._cache_dir(), result)
+
+            if os.path.exists(path):
+                os.utime(path)
+                self._update_job(job, status=DONE, result=result, cached=True, finished_at=time.time())
+                return
+
+            data = self._load(report, job['params'])
+            pdf = self._render(report, data)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(pdf)
+            os.replace(tmp_path, path)
+            self._update_job(job, status=DONE, result=result, finished_at=time.time())
+            logger.info(f"Report job {job_id} ({report.name}) finished in "
+                        f"{job['finished_at'] - job['created_at']:.2f}s")
+        except Exception as e:
+            logger.error(f"Report job {job_id} failed: {e}")
+            try:
+                self._update_job(job, status=ERROR, error=str(e), finished_at=time.time())
+            except Exception as write_error:
+                logger.error(f"Error writing report job {job_id}: {write_error}")
+        finally:
+            with self._lock:
+                self._active -= 1
+                event = self._events.pop(job_id, None)
+            if event is not None:
+                event.set()
+
+    def _load(self, report, params):
+        # loader ใช้ get_cursor() ซึ่งต้องมี app context และต้องคืน connection เองเมื่อเสร็จ
+        from database import close_db_connection
+
+        with self.app.app_context():
+            try:
+                return report.loader(params)
+            finally:
+                close_db_connection(None)
+
+    def _render(self, report, data):
+        _, process_pool = self._executors()
+        try:
+            return process_pool.submit(report.renderer, data).result()
+        except BrokenProcessPool:
+            # process ลูกตาย (เช่นหน่วยความจำไม่พอ) สร้าง pool ใหม่แล้วลองอีกครั้ง
+            logger.warning("Report process pool broken, restarting")
+            self._reset_process_pool()
+            _, process_pool = self._executors()
+            return process_pool.submit(report.renderer, data).result()
+
+    def _cleanup(self):
+        """ลบไฟล์งานและรายงานที่เก่ากว่า cache_max_age (ทำอย่างมากนาทีละครั้ง)"""
+        now = time.time()
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+        for directory in (self._jobs_dir(), self._cache_dir()):
+            try:
+                for name in os.listdir(directory):
+                    path = os.path.join(directory, name)
+                    try:
+                        if now - os.path.getmtime(path) > self.cache_max_age:
+                            os.remove(path)
+                    except FileNotFoundError:
+                        pass
+            except Exception as e:
+                logger.warning(f"Error cleaning report directory {directory}: {e}")
+
+    def shutdown(self):
+        """ปิด process pool (เรียกตอน worker ปิดตัว)"""
+        if self._pid != os.getpid():
+            return
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+
+
+queue = ReportJobQueue()
+
+
+def init_app(app):
+    """ตั้งค่าคิวจาก app.config"""
+    queue.configure(
+        app,
+        report_dir=app.config.get('REPORT_DIR'),
+        max_workers=app.config.get('REPORT_WORKERS'),
+        cache_max_age=app.config.get('REPORT_CACHE_MAX_AGE'),
+    )
+
+
+def register_report(name, loader, renderer, filename, versions=()):
+    queue.register(name, loader, renderer, filename, versions=versions)
+
+
+def submit_report(kind, params, requested_by=None):
+    return queue.submit(kind, params, requested_by=requested_by)
@@ -0,0 +1,1086 @@
+import io
+import os
+from datetime import datetime
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.lib.colors import black, white, HexColor
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.lib.units import inch
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+# ฟังก์ชันในไฟล์นี้สร้าง PDF จากข้อมูลที่ดึงมาแล้วเท่านั้น (ไม่แตะ Flask หรือฐานข้อมูล)
+# จึงรันใน process pool ของ report_jobs ได้
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def render_admin_booking_report(data):
+    """สร้าง PDF รายงานการจองสำหรับผู้ดูแลระบบ คืนค่าเป็น bytes"""
+    start_date = data.get('start_date')
+    end_date = data.get('end_date')
+    bookings_data = data['bookings']
+
+    # สร้าง buffer สำหรับ PDF
+    buffer = io.BytesIO()
+
+    # ฟังก์ชันสำหรับเพิ่มเส้นขีดและเลขหน้า
+    def add_page_number(canvas, doc):
+        canvas.saveState()
+        # วาดเส้นขีดสีเขียว green-700
+        canvas.setStrokeColor(HexColor('#15803d'))  # green-700
+        canvas.setLineWidth(1.2)
+
+        # เส้นวาดเหนือ margin (เช่น y=doc.bottomMargin-10)
+        y_line = doc.bottomMargin - 10
+        canvas.line(doc.leftMargin, y_line, A4[0] - doc.rightMargin, y_line)
+
+        # วันที่และเวลาปัจจุบัน
+        canvas.setFont('Helvetica', 10)
+        current_time = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+        canvas.drawString(doc.leftMargin, y_line - 12, f"This report was created {current_time}")
+
+        #เลขหน้า
+        page_num = canvas.getPageNumber()
+        canvas.drawRightString(A4[0] - doc.rightMargin, y_line - 12, f"หน้าที่ {page_num}")
+
+        canvas.restoreState()
+
+    # ตั้ง margin ให้มีพื้นที่ว่างรอบขอบกระดาษเพื่อความอ่านง่าย
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        leftMargin=36,   # 0.5 inch
+        rightMargin=36,  # 0.5 inch
+        topMargin=36,    # 0.5 inch
+        bottomMargin=36,  # 0.5 inch
+        onFirstPage=add_page_number,
+        onLaterPages=add_page_number
+    )
+    elements = []
+
+    # ลงทะเบียนฟอนต์ภาษาไทย
+    font_path = os.path.join(BASE_DIR, 'fonts', 'Noto_Sans_Thai', 'static', 'NotoSansThai-Regular.ttf')
+    pdfmetrics.registerFont(TTFont('NotoSansThai', font_path))
+
+    # ลงทะเบียนฟอนต์ภาษาไทย Bold
+    bold_font_path = os.path.join(BASE_DIR, 'fonts', 'Noto_Sans_Thai', 'static', 'NotoSansThai-Bold.ttf')
+    if os.path.exists(bold_font_path):
+        pdfmetrics.registerFont(TTFont('NotoSansThai-Bold', bold_font_path))
+    else:
+        # ถ้าไม่มี Bold font ให้ใช้ font ปกติ
+        pdfmetrics.registerFont(TTFont('NotoSansThai-Bold', font_path))
+
+    # สร้างสไตล์
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontName='NotoSansThai',
+        fontSize=18,
+        spaceAfter=30,
+        alignment=1  # center
+    )
+
+    # สร้างสไตล์สำหรับข้อความปกติ
+    normal_style = ParagraphStyle(
+        'ThaiNormal',
+        parent=styles['Normal'],
+        fontName='NotoSansThai',
+        fontSize=10,
+        leading=13,
+        wordWrap='CJK'
+    )
+
+    # สร้างสไตล์สำหรับข้อความตัวหนา
+    bold_style = ParagraphStyle(
+        'ThaiBold',
+        parent=styles['Normal'],
+        fontName='NotoSansThai-Bold',
+        fontSize=10,
+        leading=13,
+        wordWrap='CJK'
+    )
+
+    # สร้างสไตล์สำหรับลำดับ (จัดกึ่งกลาง)
+    center_style = ParagraphStyle(
+        'ThaiCenter',
+        parent=styles['Normal'],
+        fontName='NotoSansThai',
+        fontSize=10,
+        leading=13,
+        alignment=1,  # จัดกึ่งกลาง
+        wordWrap='CJK'
+    )
+
+    # สร้างสไตล์สำหรับชื่อร้าน (กลางหน้ากระดาษ, สีเขียว, ตัวหนา)
+    shop_name_style = ParagraphStyle(
+        'ShopName',
+        parent=styles['Heading1'],
+        fontName='NotoSansThai-Bold',
+        fontSize=20,
+        textColor=HexColor('#14532d'),  # green-900
+        spaceAfter=15,
+        alignment=1,  # center
+        leading=24
+    )
+
+    # สไตล์สำหรับหัวข้อหลัก
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontName='NotoSansThai-Bold',
+        fontSize=14,  # ลดขนาดลง
+        textColor=black,  # สีดำ
+        spaceAfter=15,  # ลดระยะห่าง
+        alignment=1,  # center
+        leading=18
+    )
+
+    # สไตล์สำหรับ Selected Period (ตัวปกติ, ขนาดเล็กมาก, จัดกึ่งกลาง)
+    selected_period_style = ParagraphStyle(
+        'SelectedPeriod',
+        parent=styles['Heading1'],
+        fontName='Helvetica',  # ใช้ฟอนต์ภาษาอังกฤษ
+        fontSize=10,  # ขนาดเล็กมาก
+        textColor=black,  # สีดำ
+        spaceAfter=8,  # ลดระยะห่าง
+        alignment=1,  # center
+        leading=14
+    )
+
+    # ชื่อร้านที่กลางหน้ากระดาษ
+    shop_name = Paragraph("TYRE PLUS BURIRAM SANGJAROENKARNYANG", shop_name_style)
+    elements.append(shop_name)
+
+    # ข้อมูลช่วงวันที่ (ย้ายมาอยู่บนชื่อรายงาน)
+    if start_date and end_date:
+        # แปลงวันที่เป็นรูปแบบไทย (วว/ดด/ปปปป)
+        try:
+            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
+            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
+            thai_start_date = start_date_obj.strftime('%d/%m/%Y')
+            thai_end_date = end_date_obj.strftime('%d/%m/%Y')
+            date_text = f"Selected Period: {thai_start_date} to {thai_end_date}"
+        except:
+            date_text = f"Selected Period: {start_date} to {end_date}"
+
+        # สร้าง Paragraph สำหรับวันที่ (ตัวปกติ, ขนาดเล็กมาก, จัดกึ่งกลาง)
+        date_paragraph = Paragraph(date_text, selected_period_style)
+        elements.append(date_paragraph)
+        elements.append(Spacer(1, 2))  # ลดระยะห่าง
+
+    # หัวเรื่อง
+    title = Paragraph("รายงานการจองบริการ", title_style)
+    elements.append(title)
+    elements.append(Spacer(1, 3))  # ลดระยะห่างหลังหัวเรื่อง
+
+    # สร้างตารางข้อมูล
+    if bookings_data:
+        # สร้างสไตล์สำหรับหัวตาราง (สีขาว, จัดกึ่งกลาง)
+        header_style = ParagraphStyle(
+            'TableHeader',
+            parent=styles['Normal'],
+            fontName='NotoSansThai-Bold',
+            fontSize=11,
+            textColor=white,  # สีขาว
+            leading=14,
+            alignment=1  # จัดกึ่งกลาง
+        )
+
+        # หัวตาราง
+        table_data = [
+            [
+                Paragraph('ลำดับ', header_style),
+                Paragraph('ลูกค้า', header_style),
+                Paragraph('รถยนต์', header_style),
+                Paragraph('บริการที่จอง', header_style),
+                Paragraph('หมายเหตุ', header_style),
+                Paragraph('วันที่จอง', header_style),
+                Paragraph('สถานะ', header_style)
+            ]
+        ]
+
+        # ข้อมูลในตาราง
+        row_number = 1  # ตัวนับลำดับแยก
+        for booking in bookings_data:
+            # จัดรูปแบบชื่อลูกค้า - แยกชื่อและนามสกุล
+            first_name = booking['first_name'] or ''
+            last_name = booking['last_name'] or ''
+            full_name = f"{first_name} {last_name}".strip()
+
+            # ถ้าชื่อยาวเกิน 15 ตัวอักษร ให้แยกบรรทัด
+            if len(full_name) > 15:
+                customer_name = Paragraph(f"{first_name}<br/>{last_name}", normal_style)
+            else:
+                customer_name = Paragraph(full_name, normal_style)
+            # จัดรูปแบบข้อมูลรถยนต์ - แยกยี่ห้อ รุ่น ทะเบียนรถ และจังหวัด
+            brand_name = booking['brand_name'] or ''
+            model_name = booking['model_name'] or ''
+            license_plate = booking['license_plate'] or ''
+            license_province = booking['license_province'] or ''
+
+            vehicle_parts = []
+            if brand_name:
+                vehicle_parts.append(f"ยี่ห้อ : {brand_name}")
+            if model_name:
+                vehicle_parts.append(f"รุ่น : {model_name}")
+            if license_plate:
+                vehicle_parts.append(f"ทะเบียน : {license_plate}")
+            if license_province:
+                vehicle_parts.append(f"{license_province}")
+
+            if vehicle_parts:
+                vehicle_info = Paragraph("<br/>".join(vehicle_parts), normal_style)
+            else:
+                vehicle_info = Paragraph('-', normal_style)
+            # แปลงวันที่เป็นรูปแบบไทย (วว/ดด/ปป)
+            if booking['booking_date']:
+                try:
+                    # แปลงจาก YYYY-MM-DD เป็น DD/MM/YY
+                    date_obj = datetime.strptime(booking['booking_date'], '%Y-%m-%d')
+                    thai_date = date_obj.strftime('%d/%m/%y')
+                    booking_date = Paragraph(thai_date, center_style)
+                except:
+                    booking_date = Paragraph(booking['booking_date'] or '-', center_style)
+            else:
+                booking_date = Paragraph('-', center_style)
+            status = Paragraph(booking['status'], center_style)
+
+            # ใช้ service_details ถ้ามี (รวมบริการย่อย) ไม่งั้นใช้ service_names
+            service_text = booking.get('service_details') or booking.get('service_names') or '-'
+
+            # จัดรูปแบบการแสดงผลบริการและข้อมูลยาง
+            all_content = []
+
+            # เพิ่มบริการหลักและบริการย่อย
+            if service_text and service_text != '-':
+                # แยกบริการหลักและบริการย่อย
+                services_list = service_text.split(', ')
+                formatted_services = []
+
+                for service in services_list:
+                    if '(' in service and ')' in service:
+                        # มีบริการย่อย
+                        main_service = service.split(' (')[0]
+                        sub_service = service.split(' (')[1].rstrip(')')
+                        formatted_services.append(f"๐ {main_service}")
+                        formatted_services.append(f"  - {sub_service}")
+                    else:
+                        # ไม่มีบริการย่อย
+                        formatted_services.append(f"๐ {service}")
+
+                all_content.extend(formatted_services)
+
+            # เพิ่มข้อมูลยางจาก tire_info
+            tire_info = booking.get('tire_info', {})
+
+            # ตรวจสอบว่ามีข้อมูลยางหรือไม่
+            has_tire_data = any(tire_info.get(pos) for pos in ['front_left', 'front_right', 'rear_left', 'rear_right'])
+
+            if has_tire_data:
+                # ตรวจสอบยางด้านหน้า
+                front_tires = []
+                if tire_info.get('front_left'):
+                    front_tires.append(tire_info['front_left'])
+                if tire_info.get('front_right'):
+                    front_tires.append(tire_info['front_right'])
+
+                if front_tires:
+                    all_content.append("๐ ยางด้านหน้า")
+                    for i, tire in enumerate(front_tires, 1):
+                        if tire.get('size'):
+                            all_content.append(f"  - ขนาด: {tire['size']}")
+                        if tire.get('brand'):
+                            all_content.append(f"  - ยี่ห้อ: {tire['brand']}")
+                        if tire.get('model'):
+                            all_content.append(f"  - รุ่น: {tire['model']}")
+
+                # ตรวจสอบยางด้านหลัง
+                rear_tires = []
+                if tire_info.get('rear_left'):
+                    rear_tires.append(tire_info['rear_left'])
+                if tire_info.get('rear_right'):
+                    rear_tires.append(tire_info['rear_right'])
+
+                if rear_tires:
+                    all_content.append("๐ ยางด้านหลัง")
+                    for i, tire in enumerate(rear_tires, 1):
+                        if tire.get('size'):
+                            all_content.append(f"  - ขนาด: {tire['size']}")
+                        if tire.get('brand'):
+                            all_content.append(f"  - ยี่ห้อ: {tire['brand']}")
+                        if tire.get('model'):
+                            all_content.append(f"  - รุ่น: {tire['model']}")
+
+                # ตรวจสอบข้อมูล DOT
+                dot_data = []
+                for pos, tire in tire_info.items():
+                    if tire and tire.get('dot'):
+                        pos_name = {
+                            'front_left': 'หน้าซ้าย',
+                            'front_right': 'หน้าขวา',
+                            'rear_left': 'หลังซ้าย',
+                            'rear_right': 'หลังขวา'
+                        }.get(pos, pos)
+                        dot_data.append(f"  - {pos_name}: {tire['dot']}")
+
+                if dot_data:
+                    all_content.append("๐ DOT ของยาง")
+                    all_content.extend(dot_data)
+
+            if all_content:
+                # สร้าง Paragraph แยกสำหรับบริการหลักและบริการย่อย
+                services_list = []
+
+                for content in all_content:
+                    if content.startswith('๐ '):
+                        # บริการหลัก - ใช้ bold_style
+                        services_list.append(Paragraph(content, bold_style))
+                    else:
+                        # บริการย่อย - ใช้ normal_style
+                        services_list.append(Paragraph(content, normal_style))
+
+                services = services_list
+            else:
+                services = Paragraph('-', normal_style)
+
+            note_text = Paragraph((booking.get('note') or '-'), normal_style)
+
+            table_data.append([
+                Paragraph(str(row_number), center_style),
+                customer_name,
+                vehicle_info,
+                services,
+                note_text,
+                booking_date,
+                status
+            ])
+
+            row_number += 1  # เพิ่มลำดับ
+
+        # สร้างตาราง - ปรับความกว้างคอลัมน์ให้เหมาะสมกับขนาดกระดาษ
+        table = Table(
+            table_data,
+            colWidths=[35, 70, 100, 150, 60, 60, 70]  # เพิ่มความกว้างคอลัมน์สถานะจาก 50 เป็น 70
+        )
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), HexColor('#166534')),  # green-800
+            ('TEXTCOLOR', (0, 0), (-1, 0), white),
+            ('FONTNAME', (0, 0), (-1, 0), 'NotoSansThai-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),  # จัดกึ่งกลางหัวตารางทั้งหมด
+            ('VALIGN', (0, 0), (-1, 0), 'MIDDLE'),  # จัดกึ่งกลางแนวตั้งหัวตาราง
+
+            ('BACKGROUND', (0, 1), (-1, -1), HexColor('#fefce8')),  # yellow-50
+            ('GRID', (0, 0), (-1, -1), 1, HexColor('#166534')),  # green-800
+            ('FONTNAME', (0, 1), (-1, -1), 'NotoSansThai'),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('VALIGN', (0, 1), (-1, -1), 'TOP'),
+
+            # จัดชิดซ้ายให้คอลัมน์ข้อความยาว
+            ('ALIGN', (1, 1), (4, -1), 'LEFT'),  # ลูกค้า, รถยนต์, บริการ, หมายเหตุ
+            ('ALIGN', (0, 1), (0, -1), 'CENTER'),  # ลำดับ
+            ('ALIGN', (5, 1), (5, -1), 'CENTER'),  # วันที่จอง
+            ('ALIGN', (6, 1), (6, -1), 'CENTER'),  # สถานะ
+
+            # Padding ให้พอดีอ่านง่าย - ลด padding เพื่อประหยัดพื้นที่
+            ('LEFTPADDING', (0, 0), (-1, -1), 4),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 4),
+            ('TOPPADDING', (0, 0), (-1, -1), 3),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+        ]))
+        table.repeatRows = 1
+
+        elements.append(table)
+    else:
+        no_data = Paragraph("ไม่พบข้อมูลการจองในช่วงวันที่ที่เลือก", normal_style)
+        no_data.leftIndent = 40
+        elements.append(no_data)
+
+    elements.append(Spacer(1, 8))  # ลดระยะห่างก่อนข้อมูลเพิ่มเติม
+
+    # สร้าง PDF
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def render_owner_bookings_report(data):
+    """สร้าง PDF รายงานการจองสำหรับเจ้าของกิจการ คืนค่าเป็น bytes"""
+    start_date = data.get('start_date')
+    end_date = data.get('end_date')
+    bookings_data = data['bookings']
+
+
+    # สร้าง buffer สำหรับ PDF
+    buffer = io.BytesIO()
+
+    # ฟังก์ชันสำหรับเพิ่มเส้นขีดและเลขหน้า
+    def add_page_number(canvas, doc):
+        canvas.saveState()
+        # วาดเส้นขีดสีเขียว green-700
+        canvas.setStrokeColor(colors.HexColor('#15803d'))  # green-700
+        canvas.setLineWidth(1.2)
+
+        # เส้นวาดเหนือ margin (เช่น y=doc.bottomMargin-10)
+        y_line = doc.bottomMargin - 10
+        canvas.line(doc.leftMargin, y_line, A4[0] - doc.rightMargin, y_line)
+
+        # วันที่และเวลาปัจจุบัน - ย้ายไปมุมล่างซ้าย
+        canvas.setFont('Helvetica', 9)
+        current_time = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+        canvas.drawString(doc.leftMargin, y_line - 12, f"This report was created: {current_time}")
+
+        #เลขหน้า
+        page_num = canvas.getPageNumber()
+        canvas.drawRightString(A4[0] - doc.rightMargin, y_line - 12, f"หน้าที่ {page_num}")
+
+        canvas.restoreState()
+
+    # ตั้ง margin ให้มีพื้นที่ว่างรอบขอบกระดาษเพื่อความอ่านง่าย
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        leftMargin=36,   # 0.5 inch
+        rightMargin=36,  # 0.5 inch
+        topMargin=36,    # 0.5 inch
+        bottomMargin=36,  # 0.5 inch
+        onFirstPage=add_page_number,
+        onLaterPages=add_page_number
+    )
+    elements = []
+
+    # ลงทะเบียนฟอนต์ภาษาไทย
+    font_path = os.path.join(BASE_DIR, 'fonts', 'Noto_Sans_Thai', 'static', 'NotoSansThai-Regular.ttf')
+    pdfmetrics.registerFont(TTFont('NotoSansThai', font_path))
+
+    # ลงทะเบียนฟอนต์ตัวหนา
+    try:
+        bold_font_path = os.path.join(BASE_DIR, 'fonts', 'Noto_Sans_Thai', 'static', 'NotoSansThai-Bold.ttf')
+        pdfmetrics.registerFont(TTFont('NotoSansThai-Bold', bold_font_path))
+    except:
+        # ถ้าไม่มีฟอนต์ตัวหนา ให้ใช้ฟอนต์ปกติ
+        pdfmetrics.registerFont(TTFont('NotoSansThai-Bold', font_path))
+
+    # สร้างสไตล์
+    styles = getSampleStyleSheet()
+
+    # สร้างสไตล์สำหรับชื่อร้าน (กลางหน้ากระดาษ, สีเขียว, ตัวหนา)
+    shop_name_style = ParagraphStyle(
+        'ShopName',
+        parent=styles['Heading1'],
+        fontName='NotoSansThai-Bold',
+        fontSize=20,
+        textColor=colors.HexColor('#14532d'),  # green-900
+        spaceAfter=15,
+        alignment=1,  # center
+        leading=24
+    )
+
+    # สไตล์สำหรับหัวข้อหลัก
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontName='NotoSansThai-Bold',
+        fontSize=14,  # ลดขนาดลง
+        textColor=colors.black,  # สีดำ
+        spaceAfter=15,  # ลดระยะห่าง
+        alignment=1,  # center
+        leading=18
+    )
+
+    # สไตล์สำหรับ Selected Period (ตัวปกติ, ขนาดเล็กมาก, จัดกึ่งกลาง)
+    selected_period_style = ParagraphStyle(
+        'SelectedPeriod',
+        parent=styles['Heading1'],
+        fontName='Helvetica',  # ใช้ฟอนต์ภาษาอังกฤษ
+        fontSize=10,  # ขนาดเล็กมาก
+        textColor=colors.black,  # สีดำ
+        spaceAfter=8,  # ลดระยะห่าง
+        alignment=1,  # center
+        leading=14
+    )
+
+    # สไตล์สำหรับหัวข้อส่วน
+    heading_style = ParagraphStyle(
+        'CustomHeading',
+        parent=styles['Heading2'],
+        fontName='NotoSansThai-Bold',
+        fontSize=14,
+        textColor=colors.black,
+        spaceAfter=5
+    )
+
+    # สไตล์สำหรับข้อความปกติ
+    normal_style = ParagraphStyle(
+        'ThaiNormal',
+        parent=styles['Normal'],
+        fontName='NotoSansThai',
+        fontSize=10,
+        leading=12
+    )
+
+    # สไตล์สำหรับข้อความตัวหนา
+    bold_style = ParagraphStyle(
+        'ThaiBold',
+        parent=styles['Normal'],
+        fontName='NotoSansThai-Bold',
+        fontSize=10,
+        leading=12
+    )
+
+    # สร้างสไตล์สำหรับลำดับ (จัดกึ่งกลาง)
+    center_style = ParagraphStyle(
+        'ThaiCenter',
+        parent=styles['Normal'],
+        fontName='NotoSansThai',
+        fontSize=10,
+        alignment=1,  # center
+        leading=12
+    )
+
+    # สไตล์สำหรับหัวตาราง
+    header_style = ParagraphStyle(
+        'TableHeader',
+        parent=styles['Normal'],
+        fontName='NotoSansThai-Bold',
+        fontSize=11,
+        textColor=colors.white,
+        alignment=1,  # center
+        leading=13
+    )
+
+    # ชื่อร้านที่กลางหน้ากระดาษ
+    shop_name = Paragraph("TYRE PLUS BURIRAM SANGJAROENKARNYANG", shop_name_style)
+    elements.append(shop_name)
+
+    # ข้อมูลช่วงวันที่ (ย้ายมาอยู่บนชื่อรายงาน)
+    if start_date and end_date:
+        # แปลงวันที่เป็นรูปแบบไทย (วว/ดด/ปปปป)
+        try:
+            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
+            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
+            thai_start_date = start_date_obj.strftime('%d/%m/%Y')
+            thai_end_date = end_date_obj.strftime('%d/%m/%Y')
+            date_text = f"Selected Period: {thai_start_date} to {thai_end_date}"
+        except:
+            date_text = f"Selected Period: {start_date} to {end_date}"
+
+        # สร้าง Paragraph สำหรับวันที่ (ตัวปกติ, ขนาดเล็กมาก, จัดกึ่งกลาง)
+        date_paragraph = Paragraph(date_text, selected_period_style)
+        elements.append(date_paragraph)
+        elements.append(Spacer(1, 2))  # ลดระยะห่าง
+
+    # หัวเรื่อง
+    title = Paragraph("Booking Service Report", title_style)
+    elements.append(title)
+    elements.append(Spacer(1, 3))  # ลดระยะห่างหลังหัวเรื่อง
+
+    # สร้างตารางข้อมูล
+    if bookings_data:
+        # หัวตาราง
+        table_data = [
+            [Paragraph("ลำดับ", header_style), 
+             Paragraph("ลูกค้า", header_style), 
+             Paragraph("รถยนต์", header_style), 
+             Paragraph("บริการที่จอง", header_style), 
+             Paragraph("หมายเหตุ", header_style), 
+             Paragraph("วันที่จอง", header_style), 
+             Paragraph("สถานะ", header_style)]
+        ]
+
+        # ข้อมูลในตาราง
+        row_number = 1
+        for booking in bookings_data:
+            # จัดรูปแบบชื่อลูกค้า
+            first_name = booking['first_name'] or ''
+            last_name = booking['last_name'] or ''
+            full_name = f"{first_name} {last_name}".strip()
+
+            # ถ้าชื่อยาวเกิน 15 ตัวอักษร ให้แยกบรรทัด
+            if len(full_name) > 15:
+                customer_name = Paragraph(f"{first_name}<br/>{last_name}", normal_style)
+            else:
+                customer_name = Paragraph(full_name, normal_style)
+
+            # จัดรูปแบบข้อมูลรถยนต์ - แยกยี่ห้อและรุ่น
+            brand_name = booking['brand_name'] or ''
+            model_name = booking['model_name'] or ''
+
+            if brand_name and model_name:
+                vehicle_info = Paragraph(f"ยี่ห้อ : {brand_name}<br/>รุ่น : {model_name}", normal_style)
+            elif brand_name:
+                vehicle_info = Paragraph(f"ยี่ห้อ : {brand_name}", normal_style)
+            elif model_name:
+                vehicle_info = Paragraph(f"รุ่น : {model_name}", normal_style)
+            else:
+                vehicle_info = Paragraph('-', normal_style)
+
+            # แปลงวันที่เป็นรูปแบบไทย (วว/ดด/ปป)
+            if booking['booking_date']:
+                try:
+                    # แปลงจาก YYYY-MM-DD เป็น DD/MM/YY
+                    date_obj = datetime.strptime(booking['booking_date'], '%Y-%m-%d')
+                    thai_date = date_obj.strftime('%d/%m/%y')
+                    booking_date = Paragraph(thai_date, center_style)
+                except:
+                    booking_date = Paragraph(booking['booking_date'] or '-', center_style)
+            else:
+                booking_date = Paragraph('-', center_style)
+
+            status = Paragraph(booking['status'], center_style)
+
+            # ใช้ service_details ถ้ามี (รวมบริการย่อย) ไม่งั้นใช้ service_names
+            service_text = booking.get('service_details') or booking.get('service_names') or '-'
+
+            # จัดรูปแบบการแสดงผลบริการและข้อมูลยาง
+            all_content = []
+
+            # เพิ่มบริการหลักและบริการย่อย
+            if service_text and service_text != '-':
+                # แยกบริการหลักและบริการย่อย
+                services_list = service_text.split(', ')
+                formatted_services = []
+
+                for service in services_list:
+                    if '(' in service and ')' in service:
+                        # มีบริการย่อย
+                        main_service = service.split(' (')[0]
+                        sub_service = service.split(' (')[1].rstrip(')')
+                        all_content.append(f"๐ {main_service}")
+                        all_content.append(f"  - {sub_service}")
+                    else:
+                        # ไม่มีบริการย่อย
+                        all_content.append(f"๐ {service}")
+
+            # เพิ่มข้อมูลยาง
+            tire_info = booking.get('tire_info', {})
+            has_tire_data = any(tire_info.get(pos) for pos in ['front_left', 'front_right', 'rear_left', 'rear_right'])
+
+            if has_tire_data:
+                # ยางด้านหน้า
+                front_tires = []
+                if tire_info.get('front_left'): front_tires.append(tire_info['front_left'])
+                if tire_info.get('front_right'): front_tires.append(tire_info['front_right'])
+                if front_tires:
+                    all_content.append("๐ ยางด้านหน้า")
+                    for tire in front_tires:
+                        if tire.get('size'): all_content.append(f"  - ขนาด: {tire['size']}")
+                        if tire.get('brand'): all_content.append(f"  - ยี่ห้อ: {tire['brand']}")
+                        if tire.get('model'): all_content.append(f"  - รุ่น: {tire['model']}")
+
+                # ยางด้านหลัง
+                rear_tires = []
+                if tire_info.get('rear_left'): rear_tires.append(tire_info['rear_left'])
+                if tire_info.get('rear_right'): rear_tires.append(tire_info['rear_right'])
+                if rear_tires:
+                    all_content.append("๐ ยางด้านหลัง")
+                    for tire in rear_tires:
+                        if tire.get('size'): all_content.append(f"  - ขนาด: {tire['size']}")
+                        if tire.get('brand'): all_content.append(f"  - ยี่ห้อ: {tire['brand']}")
+                        if tire.get('model'): all_content.append(f"  - รุ่น: {tire['model']}")
+
+                # DOT ของยาง
+                dot_data = []
+                for pos, tire in tire_info.items():
+                    if tire and tire.get('dot'):
+                        pos_name = {'front_left': 'หน้าซ้าย', 'front_right': 'หน้าขวา', 'rear_left': 'หลังซ้าย', 'rear_right': 'หลังขวา'}.get(pos, pos)
+                        dot_data.append(f"  - {pos_name}: {tire['dot']}")
+                if dot_data:
+                    all_content.append("๐ DOT ของยาง")
+                    all_content.extend(dot_data)
+
+            # สร้าง Paragraph objects สำหรับบริการ
+            if all_content:
+                services_list = []
+                for content in all_content:
+                    if content.startswith('๐ '):
+                        services_list.append(Paragraph(content, bold_style))
+                    else:
+                        services_list.append(Paragraph(content, normal_style))
+                services = services_list
+            else:
+                services = Paragraph('-', normal_style)
+
+            # หมายเหตุ
+            note_text = Paragraph((booking.get('note') or '-'), normal_style)
+
+            table_data.append([
+                Paragraph(str(row_number), center_style),
+                customer_name,
+                vehicle_info,
+                services,
+                note_text,
+                booking_date,
+                status
+            ])
+
+            row_number += 1  # เพิ่มลำดับ
+
+        # สร้างตาราง - ปรับความกว้างคอลัมน์ให้เหมาะสมกับขนาดกระดาษ
+        table = Table(
+            table_data,
+            colWidths=[35, 70, 100, 150, 60, 60, 70]  # เพิ่มความกว้างคอลัมน์สถานะจาก 50 เป็น 70
+        )
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#166534')),  # green-800
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('FONTNAME', (0, 0), (-1, 0), 'NotoSansThai-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),  # จัดกึ่งกลางหัวตารางทั้งหมด
+            ('VALIGN', (0, 0), (-1, 0), 'MIDDLE'),  # จัดกึ่งกลางแนวตั้งหัวตาราง
+
+            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#fefce8')),  # yellow-50
+            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#166534')),  # green-800
+            ('FONTNAME', (0, 1), (-1, -1), 'NotoSansThai'),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('VALIGN', (0, 1), (-1, -1), 'TOP'),
+
+            # จัดชิดซ้ายให้คอลัมน์ข้อความยาว
+            ('ALIGN', (1, 1), (4, -1), 'LEFT'),  # ลูกค้า, รถยนต์, บริการ, หมายเหตุ
+            ('ALIGN', (0, 1), (0, -1), 'CENTER'),  # ลำดับ
+            ('ALIGN', (5, 1), (5, -1), 'CENTER'),  # วันที่จอง
+            ('ALIGN', (6, 1), (6, -1), 'CENTER'),  # สถานะ
+
+            # Padding ให้พอดีอ่านง่าย - ลด padding เพื่อประหยัดพื้นที่
+            ('LEFTPADDING', (0, 0), (-1, -1), 4),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 4),
+            ('TOPPADDING', (0, 0), (-1, -1), 3),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+        ]))
+        table.repeatRows = 1
+
+        elements.append(table)
+    else:
+        no_data = Paragraph("ไม่พบข้อมูลการจองในช่วงวันที่ที่เลือก", normal_style)
+        no_data.leftIndent = 40
+        elements.append(no_data)
+
+    # สร้าง PDF
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def render_page_views_report(data):
+    """สร้าง PDF รายงานสถิติการเข้าชมสำหรับเจ้าของกิจการ คืนค่าเป็น bytes"""
+    start_date = data.get('start_date')
+    end_date = data.get('end_date')
+    report_type = data.get('report_type')
+    page_views = data['page_views']
+    device_stats = data['device_stats']
+    daily_visits = data['daily_visits']
+
+    # สร้างไฟล์ PDF
+    buffer = io.BytesIO()
+
+    # ฟังก์ชันสำหรับเพิ่มเส้นขีดและเลขหน้า
+    def add_page_number(canvas, doc):
+        canvas.saveState()
+        # วาดเส้นขีดสีเขียว green-700
+        canvas.setStrokeColor(colors.HexColor('#15803d'))  # green-700
+        canvas.setLineWidth(1.2)
+
+        # เส้นวาดเหนือ margin (เช่น y=doc.bottomMargin-10)
+        y_line = doc.bottomMargin - 10
+        canvas.line(doc.leftMargin, y_line, A4[0] - doc.rightMargin, y_line)
+
+        # วันที่และเวลาปัจจุบัน - ย้ายไปมุมล่างซ้าย
+        canvas.setFont('Helvetica', 9)
+        current_time = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+        canvas.drawString(doc.leftMargin, y_line - 12, f"This report was created: {current_time}")
+
+        #เลขหน้า
+        page_num = canvas.getPageNumber()
+        canvas.drawRightString(A4[0] - doc.rightMargin, y_line - 12, f"หน้าที่ {page_num}")
+
+        canvas.restoreState()
+
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        leftMargin=36,
+        rightMargin=36,
+        topMargin=36,
+        bottomMargin=36,
+        onFirstPage=add_page_number,
+        onLaterPages=add_page_number
+    )
+    elements = []
+
+    # ลงทะเบียน font ภาษาไทย
+    font_path = os.path.join(BASE_DIR, 'fonts', 'Noto_Sans_Thai', 'NotoSansThai-VariableFont_wdth,wght.ttf')
+    pdfmetrics.registerFont(TTFont('NotoSansThai', font_path))
+
+    # ลงทะเบียน font ภาษาไทย Bold
+    bold_font_path = os.path.join(BASE_DIR, 'fonts', 'Noto_Sans_Thai', 'static', 'NotoSansThai-Bold.ttf')
+    if os.path.exists(bold_font_path):
+        pdfmetrics.registerFont(TTFont('NotoSansThai-Bold', bold_font_path))
+    else:
+        # ถ้าไม่มี Bold font ให้ใช้ font ปกติ
+        pdfmetrics.registerFont(TTFont('NotoSansThai-Bold', font_path))
+
+    # สร้าง styles ด้วย font ภาษาไทย
+    styles = getSampleStyleSheet()
+
+    # สไตล์สำหรับชื่อร้าน (กลางหน้ากระดาษ, สีเขียว, ตัวหนา)
+    shop_name_style = ParagraphStyle(
+        'ShopName',
+        parent=styles['Heading1'],
+        fontName='NotoSansThai-Bold',
+        fontSize=20,
+        textColor=colors.HexColor('#14532d'),  # green-900
+        spaceAfter=15,
+        alignment=1,  # center
+        leading=24
+    )
+
+    # สไตล์สำหรับหัวข้อหลัก
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontName='NotoSansThai-Bold',
+        fontSize=14,  # ลดขนาดลง
+        textColor=colors.black,  # สีดำ
+        spaceAfter=15,  # ลดระยะห่าง
+        alignment=1,  # center
+        leading=18
+    )
+
+    # สไตล์สำหรับ Selected Period (ตัวปกติ, ขนาดเล็กมาก, จัดกึ่งกลาง)
+    selected_period_style = ParagraphStyle(
+        'SelectedPeriod',
+        parent=styles['Heading1'],
+        fontName='Helvetica',  # ใช้ฟอนต์ภาษาอังกฤษ
+        fontSize=10,  # ขนาดเล็กมาก
+        textColor=colors.black,  # สีดำ
+        spaceAfter=8,  # ลดระยะห่าง
+        alignment=1,  # center
+        leading=14
+    )
+
+    # สไตล์สำหรับหัวข้อย่อย
+    heading_style = ParagraphStyle(
+        'CustomHeading',
+        parent=styles['Heading2'],
+        fontName='NotoSansThai-Bold',
+        fontSize=13,
+        textColor=colors.HexColor('#166534'),  # green-800
+        spaceAfter=8,
+        spaceBefore=5,  # ลดระยะห่างด้านบน
+        leading=16
+    )
+
+    # สไตล์สำหรับข้อความปกติ
+    normal_style = ParagraphStyle(
+        'CustomNormal',
+        parent=styles['Normal'],
+        fontName='NotoSansThai',
+        fontSize=11,
+        textColor=colors.HexColor('#374151'),  # gray-700
+        leading=16,
+        spaceAfter=6
+    )
+
+    # สไตล์สำหรับข้อความตัวหนา
+    bold_style = ParagraphStyle(
+        'CustomBold',
+        parent=styles['Normal'],
+        fontName='NotoSansThai-Bold',
+        fontSize=11,
+        textColor=colors.HexColor('#374151'),  # gray-700
+        leading=16,
+        spaceAfter=6
+    )
+
+    # ชื่อร้านที่กลางหน้ากระดาษ
+    shop_name = Paragraph("TYRE PLUS BURIRAM SANGJAROENKARNYANG", shop_name_style)
+    elements.append(shop_name)
+
+    # ข้อมูลช่วงวันที่ (ย้ายมาอยู่บนชื่อรายงาน)
+    if start_date and end_date:
+        # แปลงวันที่เป็นรูปแบบไทย (วว/ดด/ปปปป)
+        try:
+            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
+            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
+            thai_start_date = start_date_obj.strftime('%d/%m/%Y')
+            thai_end_date = end_date_obj.strftime('%d/%m/%Y')
+            date_text = f"Selected Period: {thai_start_date} to {thai_end_date}"
+        except:
+            date_text = f"Selected Period: {start_date} to {end_date}"
+
+        # สร้าง Paragraph สำหรับวันที่ (ตัวปกติ, ขนาดเล็กมาก, จัดกึ่งกลาง)
+        date_paragraph = Paragraph(date_text, selected_period_style)
+        elements.append(date_paragraph)
+        elements.append(Spacer(1, 2))  # ลดระยะห่าง
+
+    # หัวเรื่อง
+    if report_type == 'device':
+        title_text = "รายงานอุปกรณ์ผู้เข้าชมเว็บไซต์"
+    elif report_type == 'daily':
+        title_text = "รายงานสถิติการเข้าชมรายวัน"
+    elif report_type == 'pages':
+        title_text = "รายงานสถิติหน้าที่เข้าชมมากที่สุด"
+    else:
+        title_text = "รายงานอุปกรณ์ผู้เข้าชมเว็บไซต์"
+
+    title = Paragraph(title_text, title_style)
+    elements.append(title)
+    elements.append(Spacer(1, 3))  # ลดระยะห่างหลังหัวเรื่อง
+
+    # ส่วนอุปกรณ์ที่ใช้เข้าชม
+    if device_stats and report_type == 'device':
+
+        # สร้างตารางอุปกรณ์
+        device_table_data = [['อุปกรณ์', 'จำนวนการเข้าชม']]
+        for device in device_stats:
+            device_name = device['device_type']
+            if device_name == 'mobile':
+                device_name = 'มือถือ'
+            elif device_name == 'desktop':
+                device_name = 'เดสก์ท็อป'
+            elif device_name == 'tablet':
+                device_name = 'แท็บเล็ต'
+            elif device_name == 'unknown':
+                device_name = 'อื่นๆ'
+
+            device_table_data.append([device_name, str(device['count'])])
+
+        device_table = Table(device_table_data, colWidths=[3*inch, 3*inch])
+        device_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#166534')),  # green-800
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'NotoSansThai-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f0fdf4')),  # green-50
+            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#166534')),  # green-800
+            ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 1), (-1, -1), 'NotoSansThai'),
+            ('FONTSIZE', (0, 1), (-1, -1), 10),
+            ('LEFTPADDING', (0, 0), (-1, -1), 10),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 10),
+            ('TOPPADDING', (0, 0), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+        ]))
+
+        elements.append(device_table)
+        elements.append(Spacer(1, 5))  # ลดระยะห่างหลังตารางอุปกรณ์
+
+    # ส่วนการเข้าชมรายวัน
+    if daily_visits and report_type == 'daily':
+
+        # สร้างตารางการเข้าชมรายวัน
+        daily_table_data = [['วันที่', 'จำนวนการเข้าชม']]
+        for daily in daily_visits:
+            date_str = daily['date'].strftime('%d/%m/%Y') if daily['date'] else 'ไม่ระบุ'
+            daily_table_data.append([date_str, str(daily['count'])])
+
+        daily_table = Table(daily_table_data, colWidths=[3*inch, 3*inch])
+        daily_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#166534')),  # green-800
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'NotoSansThai-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#fefce8')),  # yellow-50
+            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#166534')),  # green-800
+            ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 1), (-1, -1), 'NotoSansThai'),
+            ('FONTSIZE', (0, 1), (-1, -1), 10),
+            ('LEFTPADDING', (0, 0), (-1, -1), 10),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 10),
+            ('TOPPADDING', (0, 0), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+        ]))
+
+        elements.append(daily_table)
+        elements.append(Spacer(1, 5))  # ลดระยะห่างหลังตารางรายวัน
+
+    # สร้างตารางข้อมูลหน้าเว็บ
+    if page_views and report_type == 'pages':
+
+        # หัวตาราง
+        table_data = [['หน้าเว็บ', 'จำนวนการเข้าชม']]
+
+        # ข้อมูลในตาราง
+        for page in page_views:
+            page_name = page['page_id']
+            # แปลงชื่อหน้าให้อ่านง่าย
+            if page_name == 'index.html':
+                page_name = 'หน้าหลัก'
+            elif page_name == 'tires.html':
+                page_name = 'หน้ายางทั้งหมด'
+            elif page_name == 'customer/recommend.html':
+                page_name = 'หน้าแนะนำยาง'
+            elif page_name == 'customer/compare.html':
+                page_name = 'หน้าเปรียบเทียบยาง'
+            elif page_name == 'customer/profile.html':
+                page_name = 'หน้าโปรไฟล์ลูกค้า'
+            elif page_name == 'customer/bookings.html':
+                page_name = 'หน้าการจอง'
+            elif page_name == 'customer/booking-history.html':
+                page_name = 'หน้าประวัติการจอง'
+            elif page_name == 'customer/booking.html':
+                page_name = 'หน้าการจอง'
+            elif page_name == 'customer/home.html':
+                page_name = 'หน้าหลักลูกค้า'
+            elif page_name == 'customer/promotions.html':
+                page_name = 'หน้าโปรโมชั่น'
+            elif page_name == 'customer/guide.html':
+                page_name = 'หน้าแนะนำยาง'
+            elif page_name == 'customer/contact.html':
+                page_name = 'หน้าติดต่อ'
+            elif page_name == 'customer/tires_michelin.html':
+                page_name = 'หน้ายางมิชลิน'
+            elif page_name == 'customer/promotion_detail.html':
+                page_name = 'หน้ารายละเอียดโปรโมชั่น'
+            elif page_name == 'customer/tires.html':
+                page_name = 'หน้ายางทั้งหมด'
+            elif page_name == 'customer/tires_bfgoodrich.html':
+                page_name = 'หน้ายางบีเอฟกู๊ดริช'
+            elif page_name == 'customer/tires_maxxis.html':
+                page_name = 'หน้ายางแม็กซิส'
+            elif page_name == 'login.html':
+                page_name = 'หน้าเข้าสู่ระบบ'
+            elif page_name == 'register.html':
+                page_name = 'หน้าลงทะเบียน'
+
+            table_data.append([page_name, str(page['total_visits'])])
+
+        # สร้างตาราง
+        table = Table(table_data, colWidths=[4*inch, 2*inch])
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#166534')),  # green-800
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),  # หัวตารางอยู่กึ่งกลาง
+            ('FONTNAME', (0, 0), (-1, 0), 'NotoSansThai-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f0fdf4')),  # green-50
+            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#166534')),  # green-800
+            ('ALIGN', (0, 1), (0, -1), 'LEFT'),  # คอลัมน์ชื่อหน้าชิดซ้าย
+            ('ALIGN', (1, 1), (1, -1), 'CENTER'),  # คอลัมน์จำนวนอยู่กึ่งกลาง
+            ('FONTNAME', (0, 1), (-1, -1), 'NotoSansThai'),
+            ('FONTSIZE', (0, 1), (-1, -1), 10),
+            ('LEFTPADDING', (0, 0), (-1, -1), 10),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 10),
+            ('TOPPADDING', (0, 0), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+        ]))
+
+        elements.append(table)
+    else:
+        # ถ้าไม่มีข้อมูลในตารางหน้าเว็บ และไม่มีข้อมูลในส่วนอื่นๆ ด้วย
+        if not device_stats and not daily_visits:
+            no_data = Paragraph("ไม่พบข้อมูลการเข้าชมในช่วงวันที่ที่เลือก", normal_style)
+            elements.append(no_data)
+
+    # สร้าง PDF
+    doc.build(elements)
+    return buffer.getvalue()
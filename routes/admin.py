@@ -2,10 +2,27 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, g, current_app, send_file
 from database import get_cursor, get_db  # ฟังก์ชันสำหรับเชื่อมต่อฐานข้อมูล
 from utils import allowed_file  # ฟังก์ชันตรวจสอบไฟล์ที่อนุญาต
+from upload_store import save_upload, delete_upload  # บันทึก/ลบไฟล์อัปโหลดพร้อมอัปเดตดัชนี /uploads
 from decorators import login_required, admin_required  # decorators สำหรับตรวจสอบสิทธิ์
+from tire_catalog import invalidate_tire_catalog  # ล้าง catalog ยางในหน่วยความจำหลังแก้ไขข้อมูล
+from promotion_cache import invalidate_promotions  # แจ้งทุก worker ว่าโปรโมชันเปลี่ยน
+from tire_model_images import refresh_model_images, tire_model_id  # รูปตัวแทนของรุ่นยาง (tire_models.default_image)
+from tire_search import rank_tires  # จัดอันดับผลค้นหายางของหน้า admin/tires
+from pagination import KeysetQuery  # แบ่งหน้าแบบ keyset พร้อม cache จำนวนรายการ
+from booking_search import booking_search_condition, index_bookings  # ดัชนีค้นหาการจอง (ชื่อลูกค้า/ทะเบียนรถ)
+from customer_search import search_customers, customers_changed, CUSTOMERS_VERSION  # trigram index ค้นหาลูกค้า
+import monthly_stats  # สถิติรายเดือนสำหรับกราฟแดชบอร์ด
+from booking_details import load_booking_services  # ดึงรายละเอียดการจองเป็นชุด
+from booking_slots import lock_booking_slot, lock_customer_booking_slots, move_booking_slot, slot_key, slot_times  # ตัวนับคิวต่อรอบเวลา
+from booking_service import create_booking, update_booking, services_from_form, tires_from_form, bookings_changed, BOOKINGS_VERSION  # เขียนข้อมูลการจอง
+import report_pdfs  # ฟังก์ชันสร้าง PDF รายงาน (รันใน process pool)
+from report_jobs import register_report  # คิวสร้างรายงานเบื้องหลัง
+from booking_reports import load_booking_report, BOOKING_REPORT_VERSIONS  # ข้อมูลรายงานการจอง PDF (ใช้ร่วมกับ owner)
+from routes.reports import report_response
+from sql_profiler import profiler as sql_profiler  # สถิติ SQL ต่อ endpoint
 import os  # สำหรับจัดการไฟล์และโฟลเดอร์
 from werkzeug.utils import secure_filename  # สำหรับสร้างชื่อไฟล์ที่ปลอดภัย
-from datetime import datetime, timedelta  # สำหรับจัดการวันที่และเวลา
+from datetime import datetime  # สำหรับจัดการวันที่และเวลา
 import json  # สำหรับจัดการข้อมูล JSON
 import io  # สำหรับจัดการข้อมูลในหน่วยความจำ
 # Libraries สำหรับสร้าง PDF reports
@@ -58,106 +75,26 @@ def tire_list():
     }
     # --- ระบบค้นหาแบบพิเศษ ---
     if search:
-        # ใช้ search_term จาก request.args เพื่อให้ตรงกันทุกที่
-        search_term = request.args.get('search', '')
-        
-        # ค้นหาแบบ fuzzy search ในฟิลด์ที่เลือกตาม filter_by
-        if filter_by in ['brand', 'model', 'full_size']:
-            if filter_by == 'brand':
-                where = 'WHERE b.brand_name LIKE %s'
-                params = [f"%{search_term}%"]
-            elif filter_by == 'model':
-                where = 'WHERE m.model_name LIKE %s'
-                params = [f"%{search_term}%"]
-            elif filter_by == 'full_size':
-                where = 'WHERE t.full_size LIKE %s'
-                params = [f"%{search_term}%"]
-        else:
-            # ถ้าไม่ได้เลือก filter หรือเลือก filter อื่น ให้ค้นหาในทุกฟิลด์
-            where = "WHERE b.brand_name LIKE %s OR m.model_name LIKE %s OR t.full_size LIKE %s"
-            params = [f"%{search_term}%", f"%{search_term}%", f"%{search_term}%"]
-        
-        # 2. Get all results, then sort in Python: prefix match first, then contains
-        query = f'''
-            SELECT t.tire_id, t.full_size, t.price_each, t.price_set, t.product_date, t.high_speed_rating, m.model_name, b.brand_name,
-                   t.width, t.aspect_ratio, t.rim_diameter, 
-                   COALESCE(t.tire_image_url, 
-                     (SELECT t2.tire_image_url 
-                      FROM tires t2 
-                      JOIN tire_models m2 ON t2.model_id = m2.model_id 
-                      JOIN brands b2 ON m2.brand_id = b2.brand_id 
-                      WHERE b2.brand_name = b.brand_name 
-                        AND m2.model_name = m.model_name 
-                        AND t2.tire_image_url IS NOT NULL 
-                      LIMIT 1)) as tire_image_url
-            FROM tires t
-            JOIN tire_models m ON t.model_id = m.model_id
-            JOIN brands b ON m.brand_id = b.brand_id
-            {where}
-        '''
-        print(f"Debug - Query: {query}")
-        print(f"Debug - Params: {params}")
-        cursor.execute(query, params)
-        tires = cursor.fetchall()
-        print(f"Debug - Found {len(tires)} tires")
-        
-        def calculate_similarity(tire, search_term, filter_by):
-            """คำนวณความคล้ายคลึงระหว่างยางกับคำค้นหาในฟิลด์ที่เลือก"""
-            search_lower = search_term.lower()
-            
-            if filter_by == 'brand':
-                return calculate_field_similarity(tire['brand_name'] or '', search_lower)
-            elif filter_by == 'model':
-                return calculate_field_similarity(tire['model_name'] or '', search_lower)
-            elif filter_by == 'full_size':
-                return calculate_field_similarity(tire['full_size'] or '', search_lower)
-            else:
-                # คำนวณ similarity สำหรับทุกฟิลด์และคืนค่าสูงสุด
-                brand_score = calculate_field_similarity(tire['brand_name'] or '', search_lower)
-                model_score = calculate_field_similarity(tire['model_name'] or '', search_lower)
-                full_size_score = calculate_field_similarity(tire['full_size'] or '', search_lower)
-                return max(brand_score, model_score, full_size_score)
-        
-        def calculate_field_similarity(text, search_term):
-            """คำนวณความคล้ายคลึงระหว่างข้อความกับคำค้นหา"""
-            text_lower = text.lower()
-            
-            # 1. Exact match (คะแนนสูงสุด)
-            if text_lower == search_term:
-                return 100
-            
-            # 2. Starts with (คะแนนสูง)
-            if text_lower.startswith(search_term):
-                return 90
-            
-            # 3. Contains (คะแนนปานกลาง)
-            if search_term in text_lower:
-                return 70
-            
-            # 4. Partial word match (คะแนนต่ำ)
-            words = search_term.split()
-            text_words = text_lower.split()
-            matches = sum(1 for word in words if any(word in tw for tw in text_words))
-            if matches > 0:
-                return 50 + (matches * 10)
-            
-            # 5. Character similarity (คะแนนต่ำสุด)
-            common_chars = sum(1 for c in search_term if c in text_lower)
-            return min(30, common_chars * 5)
-        
-        # คำนวณ similarity score สำหรับแต่ละยาง
-        for tire in tires:
-            tire['similarity_score'] = calculate_similarity(tire, search_term, filter_by)
-        
-        # เรียงลำดับตาม similarity score จากสูงไปต่ำ
-        tires.sort(key=lambda t: (-t['similarity_score'], t['brand_name'] or '', t['model_name'] or ''))
-        
-        # ลบ similarity_score ออกก่อนส่งกลับ
-        for tire in tires:
-            del tire['similarity_score']
-        total = len(tires)
+        # จัดอันดับจาก index ในหน่วยความจำ (ผลลัพธ์ถูกเก็บไว้ชั่วคราว การเปลี่ยนหน้าจึงไม่ต้องจัดอันดับใหม่)
+        # แล้วดึงเฉพาะแถวของหน้าปัจจุบันจากฐานข้อมูล
+        ranked_ids = rank_tires(search, filter_by)
+        total = len(ranked_ids)
         total_pages = (total + per_page - 1) // per_page
-        tires = tires[offset:offset+per_page]
+        page_ids = ranked_ids[offset:offset+per_page]
+        tires = []
+        if page_ids:
+            placeholders = ', '.join(['%s'] * len(page_ids))
+            cursor.execute(f'''
+                SELECT t.tire_id, t.full_size, t.price_each, t.price_set, t.product_date, t.high_speed_rating, m.model_name, b.brand_name,
+                       t.width, t.aspect_ratio, t.rim_diameter, 
+                       COALESCE(t.tire_image_url, m.default_image) as tire_image_url
+                FROM tires t
+                JOIN tire_models m ON t.model_id = m.model_id
+                JOIN brands b ON m.brand_id = b.brand_id
+                WHERE t.tire_id IN ({placeholders})
+            ''', tuple(page_ids))
+            rows = {row['tire_id']: row for row in cursor.fetchall()}
+            tires = [rows[tire_id] for tire_id in page_ids if tire_id in rows]
     else:
         # Default logic (unchanged)
         if search:
@@ -185,15 +122,7 @@ def tire_list():
         query = f'''
             SELECT t.tire_id, t.full_size, t.price_each, t.price_set, t.product_date, t.high_speed_rating, m.model_name, b.brand_name,
                    t.width, t.aspect_ratio, t.rim_diameter, 
-                   COALESCE(t.tire_image_url, 
-                     (SELECT t2.tire_image_url 
-                      FROM tires t2 
-                      JOIN tire_models m2 ON t2.model_id = m2.model_id 
-                      JOIN brands b2 ON m2.brand_id = b2.brand_id 
-                      WHERE b2.brand_name = b.brand_name 
-                        AND m2.model_name = m.model_name 
-                        AND t2.tire_image_url IS NOT NULL 
-                      LIMIT 1)) as tire_image_url
+                   COALESCE(t.tire_image_url, m.default_image) as tire_image_url
             FROM tires t
             JOIN tire_models m ON t.model_id = m.model_id
             JOIN brands b ON m.brand_id = b.brand_id
@@ -353,9 +282,8 @@ def add_tire():
                 filename = secure_filename(file.filename)
                 # สร้างโฟลเดอร์ถ้ายังไม่มี
                 upload_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'tires')
-                os.makedirs(upload_folder, exist_ok=True)
                 # บันทึกไฟล์
-                file.save(os.path.join(upload_folder, filename))
+                save_upload(file, upload_folder, filename)
                 tire_image_url = filename
             
             query = """
@@ -363,7 +291,10 @@ def add_tire():
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             """
             cursor.execute(query, (model_id, width, aspect_ratio, construction, rim_diameter, load_index, speed_symbol, service_description, high_speed_rating, price_each, price_set, product_date, full_size, tire_image_url))
+            if tire_image_url:
+                refresh_model_images(cursor, [model_id])
             get_db().commit()
+            invalidate_tire_catalog()
             flash('เพิ่มยางสำเร็จ')
             return redirect(url_for('admin.tire_list'))
             
@@ -424,17 +355,19 @@ def edit_tire(tire_id):
     cursor = get_cursor()
     if request.method == 'POST':
         # --- ลบรูปภาพ ---
-        cursor.execute('SELECT tire_image_url FROM tires WHERE tire_id=%s', (tire_id,))
+        cursor.execute('SELECT tire_image_url, model_id FROM tires WHERE tire_id=%s', (tire_id,))
         row = cursor.fetchone()
         if request.form.get('delete_image') == '1':
             image_url = row['tire_image_url'] if row else None
             if image_url:
                 try:
-                    os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], 'tires', image_url))
+                    delete_upload(os.path.join(current_app.config['UPLOAD_FOLDER'], 'tires'), image_url)
                 except Exception:
                     pass
                 cursor.execute('UPDATE tires SET tire_image_url=NULL WHERE tire_id=%s', (tire_id,))
+                refresh_model_images(cursor, [row['model_id']])
                 get_db().commit()
+                invalidate_tire_catalog()
             return redirect(url_for('admin.edit_tire', tire_id=tire_id))
         
         try:
@@ -497,12 +430,10 @@ def edit_tire(tire_id):
                 
                 # สร้างโฟลเดอร์ถ้ายังไม่มี
                 upload_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'tires')
-                os.makedirs(upload_folder, exist_ok=True)
                 print(f"Debug - Upload folder: {upload_folder}")
                 
                 # บันทึกไฟล์
-                file_path = os.path.join(upload_folder, filename)
-                file.save(file_path)
+                file_path = save_upload(file, upload_folder, filename)
                 print(f"Debug - File saved to: {file_path}")
                 
                 # ตรวจสอบว่าไฟล์ถูกบันทึกจริงหรือไม่
@@ -565,7 +496,15 @@ def edit_tire(tire_id):
                 WHERE tire_image_url = 'Michelin ENERGY XM2 +_EXM2+.png'
             ''')
             
+            # รุ่นเดิมและรุ่นใหม่ของยาง รวมถึงรุ่นที่ยังใช้ชื่อไฟล์เก่าที่เพิ่งแก้ไข
+            cursor.execute('''
+                SELECT model_id FROM tire_models
+                WHERE default_image IN ('Michelin AGILIS 3.png', 'Michelin ENERGY XM2 +_EXM2+.png')
+            ''')
+            affected_models = [model_row['model_id'] for model_row in cursor.fetchall()]
+            refresh_model_images(cursor, affected_models + [row['model_id'] if row else None, model_id])
             get_db().commit()
+            invalidate_tire_catalog()
             flash('Tire updated successfully!')
             # --- คำนวณตำแหน่งแถวของยางที่เพิ่งแก้ไข ---
             per_page = 10
@@ -645,9 +584,12 @@ def edit_tire(tire_id):
 def delete_tire(tire_id):
     """ลบข้อมูลยาง"""
     cursor = get_cursor()
+    model_id = tire_model_id(cursor, tire_id)
     query = "DELETE FROM tires WHERE tire_id=%s"
     cursor.execute(query, (tire_id,))
+    refresh_model_images(cursor, [model_id])
     get_db().commit()
+    invalidate_tire_catalog()
     flash('Tire deleted successfully!')
     return redirect(url_for('admin.tire_list'))
 
@@ -660,49 +602,38 @@ def customer_list():
     filter_by = request.args.get('filter', 'first_name')
     page = int(request.args.get('page', 1))
     per_page = 10
-    offset = (page - 1) * per_page
-    
-    # สร้าง query สำหรับค้นหา
-    query = '''
-        SELECT c.*
-        FROM customers c
-        WHERE 1=1
-    '''
-    params = []
     
     if search:
-        if filter_by == 'first_name':
-            query += ' AND c.first_name LIKE %s'
-            params.append(f'%{search}%')
-        elif filter_by == 'last_name':
-            query += ' AND c.last_name LIKE %s'
-            params.append(f'%{search}%')
-        elif filter_by == 'email':
-            query += ' AND c.email LIKE %s'
-            params.append(f'%{search}%')
-        elif filter_by == 'phone':
-            query += ' AND c.phone LIKE %s'
-            params.append(f'%{search}%')
-    
-    # นับจำนวนทั้งหมด
-    count_query = f"SELECT COUNT(*) as total FROM ({query}) as subquery"
-    cursor.execute(count_query, params)
-    total = cursor.fetchone()['total']
-    total_pages = (total + per_page - 1) // per_page
-    
-    # เพิ่ม ORDER BY และ LIMIT
-    query += ' ORDER BY c.customer_id DESC LIMIT %s OFFSET %s'
-    params.extend([per_page, offset])
-    
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
+        # จัดอันดับจาก trigram index ในหน่วยความจำ แล้วดึงเฉพาะแถวของหน้าปัจจุบันจากฐานข้อมูล
+        ranked_ids = search_customers(search, filter_by)
+        total_pages = (len(ranked_ids) + per_page - 1) // per_page
+        page_ids = ranked_ids[(page - 1) * per_page:page * per_page]
+        rows = []
+        if page_ids:
+            placeholders = ', '.join(['%s'] * len(page_ids))
+            cursor.execute(f'SELECT c.* FROM customers c WHERE c.customer_id IN ({placeholders})', tuple(page_ids))
+            by_id = {row['customer_id']: row for row in cursor.fetchall()}
+            rows = [by_id[customer_id] for customer_id in page_ids if customer_id in by_id]
+        next_cursor = None
+    else:
+        # แบ่งหน้าแบบ keyset ตาม customer_id (จำนวนทั้งหมดและจุดเริ่มของแต่ละหน้ามาจาก cache)
+        result = KeysetQuery(
+            select='c.*',
+            from_clause='customers c',
+            keys=[('c.customer_id', 'DESC')],
+            per_page=per_page, versions=(CUSTOMERS_VERSION,),
+        ).fetch(cursor, page=page, after=request.args.get('cursor'))
+        rows = result.rows
+        total_pages = result.total_pages
+        next_cursor = result.next_cursor
     
     return render_template('admin/customer_list.html', 
                          rows=rows, 
                          search=search, 
                          filter_by=filter_by,
                          page=page, 
-                         total_pages=total_pages)
+                         total_pages=total_pages,
+                         next_cursor=next_cursor)
 
 @admin.route('/customers/add', methods=['GET', 'POST'])
 @admin_required
@@ -744,6 +675,7 @@ def add_customer():
             
             
             get_db().commit()
+            customers_changed([customer_id])
             flash('เพิ่มลูกค้าสำเร็จ')
             return redirect(url_for('admin.customer_list'))
             
@@ -799,10 +731,12 @@ def edit_customer(customer_id):
         email = request.form['email']
         cursor.execute('''UPDATE customers SET first_name=%s, last_name=%s, phone=%s, email=%s WHERE customer_id=%s''',
             (first_name, last_name, phone, email, customer_id))
+        index_bookings(cursor, customer_ids=[customer_id])
         # --- Vehicles: เพิ่ม/ลบ/แก้ไข ---
         print('DEBUG: Processing vehicles in edit mode...')
         
         get_db().commit()
+        customers_changed([customer_id])
         flash('อัปเดตข้อมูลลูกค้าสำเร็จ')
         return redirect(url_for('admin.customer_list'))
     
@@ -827,7 +761,9 @@ def delete_customer(customer_id):
         # ลบ service_tires ที่เกี่ยวข้องกับ bookings ของลูกค้านี้
         cursor.execute(f'DELETE FROM service_tires WHERE booking_id IN ({format_strings})', tuple(booking_ids))
         cursor.execute(f'DELETE FROM booking_items WHERE booking_id IN ({format_strings})', tuple(booking_ids))
-    # ลบ bookings ของลูกค้านี้
+    # คืนคิวของการจองที่ยังไม่ยกเลิก แล้วลบ bookings ของลูกค้านี้
+    for slot in lock_customer_booking_slots(cursor, customer_id):
+        move_booking_slot(cursor, slot, None)
     cursor.execute('DELETE FROM bookings WHERE customer_id=%s', (customer_id,))
     # ลบ service_record_items ที่เกี่ยวข้องกับ service_records ของรถลูกค้านี้
     cursor.execute('SELECT vehicle_id FROM vehicles WHERE customer_id=%s', (customer_id,))
@@ -857,9 +793,24 @@ def delete_customer(customer_id):
         cursor.execute('DELETE FROM users WHERE user_id=%s', (user_id,))
     
     get_db().commit()
+    customers_changed([customer_id])
+    bookings_changed()
     flash('ลบลูกค้าสำเร็จ')
     return redirect(url_for('admin.customer_list'))
 
+@admin.route('/sql-metrics')
+@admin_required
+def sql_metrics():
+    """สถิติ SQL ต่อ endpoint ของ worker นี้ (จำนวน statement, เวลา DB, N+1) ?reset=1 เพื่อล้างค่า"""
+    if request.args.get('reset') == '1':
+        sql_profiler.reset()
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'n_plus_one_threshold': sql_profiler.n_plus_one_threshold,
+        'endpoints': sql_profiler.snapshot(),
+    })
+
 @admin.route('/check-queue')
 @admin_required
 def check_queue():
@@ -881,47 +832,32 @@ def booking_list():
     status_filter = request.args.get('status', '').strip()
     page = int(request.args.get('page', 1))
     per_page = 10
-    offset = (page - 1) * per_page
     
-    # สร้าง query สำหรับนับจำนวนทั้งหมด
-    count_query = '''SELECT COUNT(*) as total
-                     FROM bookings b
-                     JOIN customers c ON b.customer_id = c.customer_id
-                     JOIN vehicles v ON b.vehicle_id = v.vehicle_id'''
-    count_params = []
     where_conditions = []
+    params = []
     
     if search:
-        where_conditions.append("(c.first_name LIKE %s OR c.last_name LIKE %s OR v.license_plate LIKE %s)")
-        search_param = f"%{search}%"
-        count_params.extend([search_param, search_param, search_param])
+        # ค้นชื่อลูกค้า/ทะเบียนรถจากตาราง booking_search_keys (index) แทน LIKE '%...%'
+        condition_sql, condition_params = booking_search_condition(search)
+        where_conditions.append(condition_sql)
+        params.extend(condition_params)
     
     if status_filter:
         where_conditions.append("b.status = %s")
-        count_params.append(status_filter)
-    
-    if where_conditions:
-        count_query += " WHERE " + " AND ".join(where_conditions)
+        params.append(status_filter)
     
-    cursor.execute(count_query, count_params)
-    total = cursor.fetchone()['total']
-    total_pages = (total + per_page - 1) // per_page
-    
-    # สร้าง query สำหรับดึงข้อมูลพร้อม pagination
-    query = '''SELECT b.booking_id, b.service_date, b.service_time, b.status, c.first_name, c.last_name, v.license_plate, v.license_province
-               FROM bookings b
+    # แบ่งหน้าแบบ keyset ตาม (booking_date, booking_id) ใหม่ไปเก่า
+    result = KeysetQuery(
+        select='b.booking_id, b.service_date, b.service_time, b.status, c.first_name, c.last_name, v.license_plate, v.license_province',
+        from_clause='''bookings b
                JOIN customers c ON b.customer_id = c.customer_id
-               JOIN vehicles v ON b.vehicle_id = v.vehicle_id'''
-    params = []
-    
-    if where_conditions:
-        query += " WHERE " + " AND ".join(where_conditions)
-    
-    query += " ORDER BY b.booking_date DESC LIMIT %s OFFSET %s"
-    params.extend([per_page, offset])
-    
-    cursor.execute(query, params)
-    bookings = cursor.fetchall()
+               JOIN vehicles v ON b.vehicle_id = v.vehicle_id''',
+        keys=[('b.booking_date', 'DESC'), ('b.booking_id', 'DESC')],
+        where=where_conditions, params=params, per_page=per_page,
+        versions=(BOOKINGS_VERSION, CUSTOMERS_VERSION),
+    ).fetch(cursor, page=page, after=request.args.get('cursor'))
+    bookings = result.rows
+    total_pages = result.total_pages
     
     # ดึงรายการบริการสำหรับทุก booking ในครั้งเดียว (แก้ปัญหา N+1 query)
     if bookings:
@@ -974,8 +910,12 @@ def update_booking_status(booking_id):
     new_status = data.get('status')
     
     if new_status:
+        before = lock_booking_slot(cursor, booking_id)
         cursor.execute('UPDATE bookings SET status = %s WHERE booking_id = %s', (new_status, booking_id))
+        if before:
+            move_booking_slot(cursor, before, dict(before, status=new_status))
         get_db().commit()
+        bookings_changed()
         return jsonify({'success': True})
     
     return jsonify({'success': False, 'error': 'Invalid status'}), 400
@@ -990,31 +930,13 @@ def add_booking():
             vehicle_id = request.form['vehicle_id']
             booking_date = request.form['booking_date']
             status = request.form['status']
-            cursor.execute('''INSERT INTO bookings (customer_id, vehicle_id, booking_date, status) VALUES (%s, %s, %s, %s)''',
-                (customer_id, vehicle_id, booking_date, status))
-            booking_id = cursor.lastrowid
-            # เพิ่ม booking_items และ booking_item_options
-            service_ids = request.form.getlist('service_id')
-            for sid in service_ids:
-                cursor.execute('''INSERT INTO booking_items (booking_id, service_id) VALUES (%s, %s)''', (booking_id, sid))
-                item_id = cursor.lastrowid
-                option_field = f'service_option_{sid}'
-                option_ids = request.form.getlist(option_field)
-                for option_id in option_ids:
-                    cursor.execute('''INSERT INTO booking_item_options (item_id, option_id) VALUES (%s, %s)''', (item_id, option_id))
-            # --- เพิ่มการบันทึกข้อมูลยางลง service_tires ---
-            tire_front_size = request.form.get('tire_front_size', '').strip()
-            tire_front_brand_id = request.form.get('tire_front_brand_id', '').strip()
-            tire_front_model_id = request.form.get('tire_front_model_id', '').strip()
-            tire_rear_size = request.form.get('tire_rear_size', '').strip()
-            tire_rear_brand_id = request.form.get('tire_rear_brand_id', '').strip()
-            tire_rear_model_id = request.form.get('tire_rear_model_id', '').strip()
-            tire_front_left = request.form.get('dot_front_left', '').strip()
-            tire_front_right = request.form.get('dot_front_right', '').strip()
-            tire_rear_left = request.form.get('dot_rear_left', '').strip()
-            tire_rear_right = request.form.get('dot_rear_right', '').strip()
-            
+            # บันทึกการจอง บริการ บริการย่อย และข้อมูลยางผ่าน booking_service (INSERT หลายแถว)
+            create_booking(cursor, customer_id, vehicle_id, booking_date,
+                           request.form.get('service_date') or None, request.form.get('service_time') or None,
+                           status, request.form.get('note', '').strip(),
+                           services_from_form(request.form), tires_from_form(request.form))
             get_db().commit()
+            bookings_changed()
             flash('เพิ่มการจองสำเร็จ')
             return redirect(url_for('admin.booking_list'))
         except Exception as e:
@@ -1062,6 +984,8 @@ def add_booking():
             
             return render_template('admin/booking_form.html', 
                                  booking=None,
+                                 slot_times=slot_times(),
+                                 selected_time=None,
                                  customers=customers,
                                  vehicles=vehicles,
                                  services=services,
@@ -1115,6 +1039,8 @@ def add_booking():
     
     return render_template('admin/booking_form.html', 
                          booking=None,
+                         slot_times=slot_times(),
+                         selected_time=None,
                          customers=customers,
                          vehicles=vehicles,
                          services=services,
@@ -1167,11 +1093,9 @@ def edit_booking(booking_id):
         if not service_time:
             service_time = '09:00'
         
-        cursor.execute('''
-            UPDATE bookings 
-            SET service_date = %s, service_time = %s, status = %s, note = %s 
-            WHERE booking_id = %s
-        ''', (service_date, service_time, status, note, booking_id))
+        # อัปเดตการจอง ย้ายคิว และแก้เฉพาะบริการ/บริการย่อย/ยางที่เปลี่ยน
+        update_booking(cursor, booking_id, service_date, service_time, status, note,
+                       services_from_form(request.form), tires_from_form(request.form))
         
         # อัปเดตข้อมูลรถในตาราง vehicles
         vehicle_id = booking['vehicle_id']
@@ -1205,124 +1129,13 @@ def edit_booking(booking_id):
             WHERE vehicle_id = %s
         ''', (license_plate, license_province, brand_name, model_name, 
               color, production_year, vehicle_type_id, vehicle_id))
+        index_bookings(cursor, vehicle_ids=[vehicle_id])
         
         print(f"Debug: Vehicle {vehicle_id} updated successfully")
         
-        # --- เพิ่มการบันทึกข้อมูลยางลง service_tires ---
-        # อัปเดต position ของข้อมูลยางที่มีอยู่แล้ว (ก่อนลบข้อมูล)
-        cursor.execute('SELECT * FROM service_tires WHERE booking_id = %s AND (position IS NULL OR position = \'\' OR position REGEXP \'^[0-9]+$\') ORDER BY id', (booking_id,))
-        existing_tires = cursor.fetchall()
-        if existing_tires:
-            positions = ['front_left', 'front_right', 'rear_left', 'rear_right']
-            for i, tire in enumerate(existing_tires):
-                if i < len(positions):
-                    cursor.execute('UPDATE service_tires SET position = %s WHERE id = %s', (positions[i], tire['id']))
-                    print(f"Updated tire ID {tire['id']} to position '{positions[i]}'")
-        
-        # ลบข้อมูลยางเก่าก่อน
-        cursor.execute('DELETE FROM service_tires WHERE booking_id = %s', (booking_id,))
-        
-        # รับข้อมูลยางจากฟอร์ม
-        tire_front_size = request.form.get('tire_front_size', '').strip()
-        tire_front_brand_id = request.form.get('tire_front_brand_id', '').strip()
-        tire_front_model_id = request.form.get('tire_front_model_id', '').strip()
-        tire_rear_size = request.form.get('tire_rear_size', '').strip()
-        tire_rear_brand_id = request.form.get('tire_rear_brand_id', '').strip()
-        tire_rear_model_id = request.form.get('tire_rear_model_id', '').strip()
-        tire_front_left = request.form.get('dot_front_left', '').strip()
-        tire_front_right = request.form.get('dot_front_right', '').strip()
-        tire_rear_left = request.form.get('dot_rear_left', '').strip()
-        tire_rear_right = request.form.get('dot_rear_right', '').strip()
-        
-        # ดึงข้อมูลยี่ห้อและรุ่นยางจาก ID
-        front_brand_name = ''
-        front_model_name = ''
-        rear_brand_name = ''
-        rear_model_name = ''
-        
-        if tire_front_brand_id:
-            cursor.execute('SELECT brand_name FROM brands WHERE brand_id = %s', (tire_front_brand_id,))
-            brand_result = cursor.fetchone()
-            if brand_result:
-                front_brand_name = brand_result['brand_name']
-        
-        if tire_front_model_id:
-            cursor.execute('SELECT model_name FROM tire_models WHERE model_id = %s', (tire_front_model_id,))
-            model_result = cursor.fetchone()
-            if model_result:
-                front_model_name = model_result['model_name']
-        
-        if tire_rear_brand_id:
-            cursor.execute('SELECT brand_name FROM brands WHERE brand_id = %s', (tire_rear_brand_id,))
-            brand_result = cursor.fetchone()
-            if brand_result:
-                rear_brand_name = brand_result['brand_name']
-        
-        if tire_rear_model_id:
-            cursor.execute('SELECT model_name FROM tire_models WHERE model_id = %s', (tire_rear_model_id,))
-            model_result = cursor.fetchone()
-            if model_result:
-                rear_model_name = model_result['model_name']
-        
-        # บันทึกข้อมูลยาง 4 แถว (front_left, front_right, rear_left, rear_right) ลงในตาราง service_tires
-        # Front Left
-        cursor.execute('''
-            INSERT INTO service_tires (booking_id, position, brand, model, size, dot) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', (booking_id, 'front_left', front_brand_name, front_model_name, tire_front_size, tire_front_left))
-        
-        # Front Right
-        cursor.execute('''
-            INSERT INTO service_tires (booking_id, position, brand, model, size, dot) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', (booking_id, 'front_right', front_brand_name, front_model_name, tire_front_size, tire_front_right))
-        
-        # Rear Left
-        cursor.execute('''
-            INSERT INTO service_tires (booking_id, position, brand, model, size, dot) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', (booking_id, 'rear_left', rear_brand_name, rear_model_name, tire_rear_size, tire_rear_left))
-        
-        # Rear Right
-        cursor.execute('''
-            INSERT INTO service_tires (booking_id, position, brand, model, size, dot) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', (booking_id, 'rear_right', rear_brand_name, rear_model_name, tire_rear_size, tire_rear_right))
-        
-        # ลบข้อมูลบริการเก่าก่อน
-        cursor.execute('DELETE FROM booking_item_options WHERE item_id IN (SELECT item_id FROM booking_items WHERE booking_id = %s)', (booking_id,))
-        cursor.execute('DELETE FROM booking_items WHERE booking_id = %s', (booking_id,))
-        get_db().commit()  # Commit การลบข้อมูลเก่า
-        
-        # บันทึกข้อมูลบริการที่เลือก
-        services = request.form.getlist('service_id')
-        print(f"Debug: Selected services: {services}")  # Debug print
-        
-        for service_id in services:
-            if service_id.strip():
-                # เพิ่มข้อมูลบริการ
-                cursor.execute('''
-                    INSERT INTO booking_items (booking_id, service_id, quantity) 
-                    VALUES (%s, %s, %s)
-                ''', (booking_id, service_id, 1))
-                
-                item_id = cursor.lastrowid
-                print(f"Debug: Inserted service {service_id} with item_id {item_id}")  # Debug print
-                
-                # เพิ่มข้อมูล options สำหรับบริการนี้
-                options = request.form.getlist(f'service_option_{service_id}')
-                print(f"Debug: Options for service {service_id}: {options}")  # Debug print
-                
-                for option_id in options:
-                    if option_id.strip():
-                        cursor.execute('''
-                            INSERT INTO booking_item_options (item_id, option_id) 
-                            VALUES (%s, %s)
-                        ''', (item_id, option_id))
-                        print(f"Debug: Inserted option {option_id} for item_id {item_id}")  # Debug print
-        
         try:
             get_db().commit()
+            bookings_changed()
             print(f"Debug: Successfully committed all changes for booking {booking_id}")
             flash('อัปเดตข้อมูลการจองสำเร็จ')
             return redirect(url_for('admin.booking_list'))
@@ -1488,6 +1301,8 @@ def edit_booking(booking_id):
     
     return render_template('admin/booking_form.html', 
                          booking=booking,
+                         slot_times=slot_times(),
+                         selected_time=slot_key(booking['service_time']),
                          vehicle_types=vehicle_types,
                          services=services,
                          service_groups=service_groups,
@@ -1506,9 +1321,11 @@ def edit_booking(booking_id):
 @admin_required
 def delete_booking(booking_id):
     cursor = get_cursor()
+    move_booking_slot(cursor, lock_booking_slot(cursor, booking_id), None)
     cursor.execute('DELETE FROM booking_items WHERE booking_id=%s', (booking_id,))
     cursor.execute('DELETE FROM bookings WHERE booking_id=%s', (booking_id,))
     get_db().commit()
+    bookings_changed()
     flash('ลบการจองสำเร็จ')
     return redirect(url_for('admin.booking_list'))
 
@@ -1548,14 +1365,10 @@ def customer_bookings(customer_id):
         ORDER BY booking_date DESC
     ''', (customer_id,))
     bookings = cursor.fetchall()
-    # ดึงบริการแต่ละ booking
+    # ดึงบริการของทุก booking ในชุดเดียว
+    services = load_booking_services(cursor, [b['booking_id'] for b in bookings])
     for b in bookings:
-        cursor.execute('''
-            SELECT s.service_name FROM booking_items bi
-            JOIN services s ON bi.service_id = s.service_id
-            WHERE bi.booking_id = %s
-        ''', (b['booking_id'],))
-        b['services'] = [row['service_name'] for row in cursor.fetchall()]
+        b['services'] = [item['service_name'] for item in services.get(b['booking_id'], [])]
     return render_template('admin/customer_bookings.html', bookings=bookings, customer_id=customer_id)
 
 @admin.route('/service-records')
@@ -1612,14 +1425,11 @@ def admin_profile():
                         filename = f"{session.get('admin_user_id')}_{timestamp}_{secure_filename(file.filename)}"
                         
                         # บันทึกไฟล์
-                        file_path = os.path.join(current_app.config['PROFILE_UPLOAD_FOLDER'], filename)
-                        file.save(file_path)
+                        save_upload(file, current_app.config['PROFILE_UPLOAD_FOLDER'], filename)
                         
                         # ลบไฟล์เก่าถ้ามี
                         if user.get('avatar_filename'):
-                            old_file_path = os.path.join(current_app.config['PROFILE_UPLOAD_FOLDER'], user['avatar_filename'])
-                            if os.path.exists(old_file_path):
-                                os.remove(old_file_path)
+                            delete_upload(current_app.config['PROFILE_UPLOAD_FOLDER'], user['avatar_filename'])
                         
                         # อัปเดตฐานข้อมูล
                         cursor.execute('UPDATE users SET avatar_filename = %s WHERE user_id = %s', 
@@ -1821,6 +1631,7 @@ def add_user():
                 cursor.execute('INSERT INTO users (username, password_hash, name, role_name) VALUES (%s, %s, %s, %s)', 
                              (username, password_hash, full_name, role))
                 user_id = cursor.lastrowid
+                changed_customer_ids = []
                 
                 # ถ้าเป็น customer ให้เพิ่มข้อมูลลงตาราง customers
                 if role == 'customer':
@@ -1833,8 +1644,10 @@ def add_user():
                         # เพิ่มข้อมูลใหม่ลงตาราง customers
                         cursor.execute('INSERT INTO customers (user_id, first_name, last_name, email) VALUES (%s, %s, %s, %s)', 
                                      (user_id, first_name, last_name, email))
+                        changed_customer_ids.append(cursor.lastrowid)
                 
                 get_db().commit()
+                customers_changed(changed_customer_ids)
                 flash('เพิ่มผู้ใช้สำเร็จ')
                 return redirect(url_for('admin.user_list'))
             except Exception as e:
@@ -1908,6 +1721,7 @@ def edit_user(user_id):
                     cursor.execute('UPDATE users SET username=%s, name=%s, role_name=%s WHERE user_id=%s', 
                                  (username, full_name, role, user_id))
                 
+                changed_customer_ids = []
                 # อัปเดตข้อมูล customer ถ้าเป็น customer
                 if role == 'customer':
                     cursor.execute('SELECT customer_id FROM customers WHERE user_id=%s', (user_id,))
@@ -1917,10 +1731,13 @@ def edit_user(user_id):
                         # อัปเดตข้อมูลที่มีอยู่
                         cursor.execute('UPDATE customers SET first_name=%s, last_name=%s, email=%s WHERE user_id=%s', 
                                      (first_name, last_name, email, user_id))
+                        index_bookings(cursor, customer_ids=[existing_customer['customer_id']])
+                        changed_customer_ids.append(existing_customer['customer_id'])
                     else:
                         # เพิ่มข้อมูลใหม่
                         cursor.execute('INSERT INTO customers (user_id, first_name, last_name, email) VALUES (%s, %s, %s, %s)', 
                                      (user_id, first_name, last_name, email))
+                        changed_customer_ids.append(cursor.lastrowid)
                 else:
                     # ถ้าเปลี่ยนจาก customer เป็น role อื่น ให้ลบข้อมูล customer และข้อมูลที่เกี่ยวข้อง
                     # ตรวจสอบว่ามีข้อมูล customer หรือไม่
@@ -1940,7 +1757,9 @@ def edit_user(user_id):
                             cursor.execute(f'DELETE FROM booking_item_options WHERE item_id IN (SELECT item_id FROM booking_items WHERE booking_id IN ({format_strings}))', tuple(booking_ids))
                             cursor.execute(f'DELETE FROM booking_items WHERE booking_id IN ({format_strings})', tuple(booking_ids))
                         
-                        # 2. ลบ bookings ของ customer นี้
+                        # 2. คืนคิวแล้วลบ bookings ของ customer นี้
+                        for slot in lock_customer_booking_slots(cursor, customer_id):
+                            move_booking_slot(cursor, slot, None)
                         cursor.execute('DELETE FROM bookings WHERE customer_id=%s', (customer_id,))
                         
                         # 3. ลบ service_record_items ที่เกี่ยวข้องกับ service_records ของรถ customer นี้
@@ -1960,8 +1779,11 @@ def edit_user(user_id):
                         
                         # 4. ลบข้อมูล customer
                         cursor.execute('DELETE FROM customers WHERE user_id=%s', (user_id,))
+                        changed_customer_ids.append(customer_id)
                 
                 get_db().commit()
+                customers_changed(changed_customer_ids)
+                bookings_changed()
                 flash('อัปเดตผู้ใช้สำเร็จ')
                 return redirect(url_for('admin.user_list'))
             except Exception as e:
@@ -1974,8 +1796,11 @@ def edit_user(user_id):
 @admin_required
 def delete_user(user_id):
     cursor = get_cursor()
+    cursor.execute('SELECT customer_id FROM customers WHERE user_id=%s', (user_id,))
+    customer_ids = [row['customer_id'] for row in cursor.fetchall()]
     cursor.execute('DELETE FROM users WHERE user_id=%s', (user_id,))
     get_db().commit()
+    customers_changed(customer_ids)
     return redirect(url_for('admin.user_list'))
 
 @admin.route('/dashboard')
@@ -2028,13 +1853,13 @@ def add_promotion():
             filename = secure_filename(file.filename)
             # สร้างโฟลเดอร์ promotions ถ้ายังไม่มี
             promotions_folder = current_app.config['PROMOTION_UPLOAD_FOLDER']
-            os.makedirs(promotions_folder, exist_ok=True)
-            file.save(os.path.join(promotions_folder, filename))
+            save_upload(file, promotions_folder, filename)
             image_url = filename
         try:
             cursor.execute('''INSERT INTO promotions (title, description, start_date, end_date, image_url) VALUES (%s, %s, %s, %s, %s)''',
                 (title, description, start_date, end_date, image_url))
             get_db().commit()
+            invalidate_promotions()
             flash('เพิ่มโปรโมชันเรียบร้อยแล้ว', 'success')
             return redirect(url_for('admin.promotion_list'))
         except Exception as e:
@@ -2057,11 +1882,12 @@ def edit_promotion(promotion_id):
             if image_url:
                 try:
                     promotions_folder = current_app.config['PROMOTION_UPLOAD_FOLDER']
-                    os.remove(os.path.join(promotions_folder, image_url))
+                    delete_upload(promotions_folder, image_url)
                 except Exception:
                     pass
                 cursor.execute('UPDATE promotions SET image_url=NULL WHERE promotion_id=%s', (promotion_id,))
                 get_db().commit()
+                invalidate_promotions()
             return redirect(url_for('admin.edit_promotion', promotion_id=promotion_id))
         title = request.form['title']
         description = request.form['description']
@@ -2073,13 +1899,13 @@ def edit_promotion(promotion_id):
             filename = secure_filename(file.filename)
             # สร้างโฟลเดอร์ promotions ถ้ายังไม่มี
             promotions_folder = current_app.config['PROMOTION_UPLOAD_FOLDER']
-            os.makedirs(promotions_folder, exist_ok=True)
-            file.save(os.path.join(promotions_folder, filename))
+            save_upload(file, promotions_folder, filename)
             image_url = filename
         try:
             cursor.execute('''UPDATE promotions SET title=%s, description=%s, start_date=%s, end_date=%s, image_url=%s WHERE promotion_id=%s''',
                 (title, description, start_date, end_date, image_url, promotion_id))
             get_db().commit()
+            invalidate_promotions()
             flash('บันทึกโปรโมชันเรียบร้อยแล้ว', 'success')
             return redirect(url_for('admin.promotion_list'))
         except Exception as e:
@@ -2099,12 +1925,13 @@ def delete_promotion(promotion_id):
     if row and row['image_url']:
         try:
             promotions_folder = current_app.config['PROMOTION_UPLOAD_FOLDER']
-            os.remove(os.path.join(promotions_folder, row['image_url']))
+            delete_upload(promotions_folder, row['image_url'])
             # ปกติ
         except Exception:
             pass
     cursor.execute('DELETE FROM promotions WHERE promotion_id=%s', (promotion_id,))
     get_db().commit()
+    invalidate_promotions()
     flash('ลบโปรโมชันเรียบร้อยแล้ว', 'success')
     return redirect(url_for('admin.promotion_list'))
 
@@ -2112,44 +1939,15 @@ def delete_promotion(promotion_id):
 @admin_required
 def dashboard_chart_data():
     try:
-        cursor = get_cursor()
         # กำหนดช่วง 12 เดือนล่าสุด
-        now = datetime.now()
-        months = []
-        for i in range(11, -1, -1):
-            d = now - timedelta(days=30*i)
-            months.append(d.strftime('%Y-%m'))
-        months = sorted(list(set(months)))
-        
-        # ดึงข้อมูลการจองรายเดือน
-        bookings_data = []
-        for month in months:
-            try:
-                cursor.execute('''
-                    SELECT COUNT(*) as count 
-                    FROM bookings 
-                    WHERE DATE_FORMAT(booking_date, '%Y-%m') = %s
-                ''', (month,))
-                result = cursor.fetchone()
-                bookings_data.append(result['count'] if result else 0)
-            except Exception as e:
-                print(f"Error getting bookings for {month}: {e}")
-                bookings_data.append(0)
+        month_list = monthly_stats.last_months(12)
+        months = [monthly_stats.month_key(year, month) for year, month in month_list]
         
-        # ดึงข้อมูลลูกค้าใหม่รายเดือน
-        customers_data = []
-        for month in months:
-            try:
-                cursor.execute('''
-                    SELECT COUNT(*) as count 
-                    FROM customers 
-                    WHERE DATE_FORMAT(NOW(), '%Y-%m') = %s
-                ''', (month,))
-                result = cursor.fetchone()
-                customers_data.append(result['count'] if result else 0)
-            except Exception as e:
-                print(f"Error getting customers for {month}: {e}")
-                customers_data.append(0)
+        # ดึงข้อมูลการจองและลูกค้าใหม่รายเดือน (query แบบช่วงเดียวต่อชุดข้อมูล เดือนที่ปิดแล้วมาจาก cache)
+        bookings_counts = monthly_stats.monthly_counts('bookings', month_list)
+        customers_counts = monthly_stats.monthly_counts('customers', month_list)
+        bookings_data = [bookings_counts.get(month, 0) for month in months]
+        customers_data = [customers_counts.get(month, 0) for month in months]
         
         # แปลงเดือนเป็นชื่อภาษาไทย
         thai_months = []
@@ -2209,9 +2007,7 @@ def upload_slider_image():
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
         slider_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'home_slider')
-        os.makedirs(slider_folder, exist_ok=True)
-        
-        file.save(os.path.join(slider_folder, filename))
+        save_upload(file, slider_folder, filename)
         flash('อัปโหลดรูปภาพสำเร็จ')
     else:
         flash('ไฟล์ไม่ถูกต้อง')
@@ -2222,10 +2018,8 @@ def upload_slider_image():
 @admin_required
 def delete_slider_image(filename):
     slider_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'home_slider')
-    file_path = os.path.join(slider_folder, filename)
     
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    if delete_upload(slider_folder, secure_filename(filename)):
         flash('ลบรูปภาพสำเร็จ')
     else:
         flash('ไม่พบไฟล์')
@@ -2369,510 +2163,26 @@ def booking_report():
         flash('เกิดข้อผิดพลาดในการโหลดรายงาน', 'error')
         return redirect(url_for('admin.admin_dashboard'))
 
+def _load_admin_booking_report(params):
+    """ดึงข้อมูลสำหรับรายงานการจอง PDF ของผู้ดูแลระบบ (รันในคิวรายงาน)"""
+    return load_booking_report(params, order_by='b.booking_date DESC')
+
+
+register_report('admin_booking_report', _load_admin_booking_report,
+                report_pdfs.render_admin_booking_report,
+                lambda params: f"admin_booking_report_{params.get('start_date')}_to_{params.get('end_date')}.pdf",
+                versions=BOOKING_REPORT_VERSIONS)
+
+
 @admin.route('/booking-report-pdf')
 @admin_required
 def booking_report_pdf():
-    """หน้ารายงานการจอง PDF สำหรับผู้ดูแลระบบ"""
+    """หน้ารายงานการจอง PDF สำหรับผู้ดูแลระบบ (สร้างในคิวรายงานเบื้องหลัง)"""
     try:
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        report_type = request.args.get('report_type', 'all')  # เพิ่มการรับ report_type
-        
-        cursor = get_cursor()
-        
-        # ดึงข้อมูลการจองตามช่วงวันที่ พร้อมบริการที่จอง หมายเหตุ และข้อมูลยาง
-        query = '''
-            SELECT b.*, 
-                   c.first_name, c.last_name, c.phone,
-                   v.brand_name, v.model_name, v.license_plate, v.license_province,
-                   GROUP_CONCAT(DISTINCT s.service_name ORDER BY s.service_name SEPARATOR ', ') AS service_names,
-                   GROUP_CONCAT(DISTINCT CONCAT(s.service_name, 
-                       CASE WHEN so.option_name IS NOT NULL 
-                            THEN CONCAT(' (', so.option_name, ')') 
-                            ELSE '' 
-                       END) ORDER BY s.service_name, so.option_name SEPARATOR ', ') AS service_details,
-                   b.note
-            FROM bookings b
-            JOIN customers c ON b.customer_id = c.customer_id
-            JOIN vehicles v ON b.vehicle_id = v.vehicle_id
-            LEFT JOIN booking_items bi ON bi.booking_id = b.booking_id
-            LEFT JOIN services s ON bi.service_id = s.service_id
-            LEFT JOIN booking_item_options bio ON bi.item_id = bio.item_id
-            LEFT JOIN service_options so ON bio.option_id = so.option_id
-        '''
-        params = []
-        
-        if start_date and end_date:
-            query += ' WHERE DATE(b.booking_date) BETWEEN %s AND %s'
-            params.extend([start_date, end_date])
-        
-        query += ' GROUP BY b.booking_id ORDER BY b.booking_date DESC'
-        cursor.execute(query, params)
-        bookings = cursor.fetchall()
-        
-        # แปลงข้อมูลให้เป็น JSON serializable และดึงข้อมูลยาง
-        bookings_data = []
-        processed_booking_ids = set()  # เก็บ booking_id ที่ประมวลผลแล้ว
-        
-        for booking in bookings:
-            booking_id = booking['booking_id']
-            
-            # ตรวจสอบว่า booking_id นี้ประมวลผลแล้วหรือยัง
-            if booking_id in processed_booking_ids:
-                continue  # ข้ามถ้าประมวลผลแล้ว
-            
-            processed_booking_ids.add(booking_id)
-            booking_id = booking['booking_id']
-            
-            # ดึงข้อมูลยางจากตาราง service_tires
-            tire_query = '''
-                SELECT position, brand, model, size, dot 
-                FROM service_tires 
-                WHERE booking_id = %s
-            '''
-            cursor.execute(tire_query, (booking_id,))
-            tire_data = cursor.fetchall()
-            
-            # จัดกลุ่มข้อมูลยางตาม position
-            tire_info = {
-                'front_left': None,
-                'front_right': None,
-                'rear_left': None,
-                'rear_right': None
-            }
-            
-            for tire in tire_data:
-                position = tire['position']
-                tire_info[position] = {
-                    'brand': tire['brand'],
-                    'model': tire['model'],
-                    'size': tire['size'],
-                    'dot': tire['dot']
-                }
-            
-            booking_dict = {
-                'booking_id': booking_id,
-                'booking_date': booking['booking_date'].strftime('%Y-%m-%d') if booking['booking_date'] else None,
-                'service_date': booking['service_date'].strftime('%Y-%m-%d') if booking['service_date'] else None,
-                'service_time': str(booking['service_time']) if booking['service_time'] else None,
-                'status': booking['status'],
-                'first_name': booking['first_name'],
-                'last_name': booking['last_name'],
-                'phone': booking['phone'],
-                'brand_name': booking['brand_name'],
-                'model_name': booking['model_name'],
-                'license_plate': booking['license_plate'],
-                'license_province': booking['license_province'],
-                'service_names': booking.get('service_names') if isinstance(booking, dict) else booking['service_names'],
-                'service_details': booking.get('service_details') if isinstance(booking, dict) else booking['service_details'],
-                'note': booking.get('note') if isinstance(booking, dict) else booking['note'],
-                'tire_info': tire_info
-            }
-            bookings_data.append(booking_dict)
-        
-        # สร้าง PDF ด้วย ReportLab
-        from reportlab.lib.pagesizes import A4
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.units import inch
-        from reportlab.pdfbase import pdfmetrics
-        from reportlab.pdfbase.ttfonts import TTFont
-        import io
-        import os
-        
-        # สร้าง buffer สำหรับ PDF
-        buffer = io.BytesIO()
-        
-        # ฟังก์ชันสำหรับเพิ่มเส้นขีดและเลขหน้า
-        def add_page_number(canvas, doc):
-            canvas.saveState()
-            # วาดเส้นขีดสีเขียว green-700
-            canvas.setStrokeColor(HexColor('#15803d'))  # green-700
-            canvas.setLineWidth(1.2)
-            
-            # เส้นวาดเหนือ margin (เช่น y=doc.bottomMargin-10)
-            y_line = doc.bottomMargin - 10
-            canvas.line(doc.leftMargin, y_line, A4[0] - doc.rightMargin, y_line)
-            
-            # วันที่และเวลาปัจจุบัน
-            canvas.setFont('Helvetica', 10)
-            current_time = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-            canvas.drawString(doc.leftMargin, y_line - 12, f"This report was created {current_time}")
-            
-            #เลขหน้า
-            page_num = canvas.getPageNumber()
-            canvas.drawRightString(A4[0] - doc.rightMargin, y_line - 12, f"หน้าที่ {page_num}")
-            
-            canvas.restoreState()
-        
-        # ตั้ง margin ให้มีพื้นที่ว่างรอบขอบกระดาษเพื่อความอ่านง่าย
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=A4,
-            leftMargin=36,   # 0.5 inch
-            rightMargin=36,  # 0.5 inch
-            topMargin=36,    # 0.5 inch
-            bottomMargin=36,  # 0.5 inch
-            onFirstPage=add_page_number,
-            onLaterPages=add_page_number
-        )
-        elements = []
-        
-        # ลงทะเบียนฟอนต์ภาษาไทย
-        font_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'fonts', 'Noto_Sans_Thai', 'static', 'NotoSansThai-Regular.ttf')
-        pdfmetrics.registerFont(TTFont('NotoSansThai', font_path))
-        
-        # ลงทะเบียนฟอนต์ภาษาไทย Bold
-        bold_font_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'fonts', 'Noto_Sans_Thai', 'static', 'NotoSansThai-Bold.ttf')
-        if os.path.exists(bold_font_path):
-            pdfmetrics.registerFont(TTFont('NotoSansThai-Bold', bold_font_path))
-        else:
-            # ถ้าไม่มี Bold font ให้ใช้ font ปกติ
-            pdfmetrics.registerFont(TTFont('NotoSansThai-Bold', font_path))
-        
-        # สร้างสไตล์
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontName='NotoSansThai',
-            fontSize=18,
-            spaceAfter=30,
-            alignment=1  # center
-        )
-        
-        # สร้างสไตล์สำหรับข้อความปกติ
-        normal_style = ParagraphStyle(
-            'ThaiNormal',
-            parent=styles['Normal'],
-            fontName='NotoSansThai',
-            fontSize=10,
-            leading=13,
-            wordWrap='CJK'
-        )
-        
-        # สร้างสไตล์สำหรับข้อความตัวหนา
-        bold_style = ParagraphStyle(
-            'ThaiBold',
-            parent=styles['Normal'],
-            fontName='NotoSansThai-Bold',
-            fontSize=10,
-            leading=13,
-            wordWrap='CJK'
-        )
-        
-        # สร้างสไตล์สำหรับลำดับ (จัดกึ่งกลาง)
-        center_style = ParagraphStyle(
-            'ThaiCenter',
-            parent=styles['Normal'],
-            fontName='NotoSansThai',
-            fontSize=10,
-            leading=13,
-            alignment=1,  # จัดกึ่งกลาง
-            wordWrap='CJK'
-        )
-        
-        # สร้างสไตล์สำหรับชื่อร้าน (กลางหน้ากระดาษ, สีเขียว, ตัวหนา)
-        shop_name_style = ParagraphStyle(
-            'ShopName',
-            parent=styles['Heading1'],
-            fontName='NotoSansThai-Bold',
-            fontSize=20,
-            textColor=HexColor('#14532d'),  # green-900
-            spaceAfter=15,
-            alignment=1,  # center
-            leading=24
-        )
-        
-        # สไตล์สำหรับหัวข้อหลัก
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontName='NotoSansThai-Bold',
-            fontSize=14,  # ลดขนาดลง
-            textColor=black,  # สีดำ
-            spaceAfter=15,  # ลดระยะห่าง
-            alignment=1,  # center
-            leading=18
-        )
-        
-        # สไตล์สำหรับ Selected Period (ตัวปกติ, ขนาดเล็กมาก, จัดกึ่งกลาง)
-        selected_period_style = ParagraphStyle(
-            'SelectedPeriod',
-            parent=styles['Heading1'],
-            fontName='Helvetica',  # ใช้ฟอนต์ภาษาอังกฤษ
-            fontSize=10,  # ขนาดเล็กมาก
-            textColor=black,  # สีดำ
-            spaceAfter=8,  # ลดระยะห่าง
-            alignment=1,  # center
-            leading=14
-        )
-        
-        # ชื่อร้านที่กลางหน้ากระดาษ
-        shop_name = Paragraph("TYRE PLUS BURIRAM SANGJAROENKARNYANG", shop_name_style)
-        elements.append(shop_name)
-        
-        # ข้อมูลช่วงวันที่ (ย้ายมาอยู่บนชื่อรายงาน)
-        if start_date and end_date:
-            # แปลงวันที่เป็นรูปแบบไทย (วว/ดด/ปปปป)
-            try:
-                start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
-                end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
-                thai_start_date = start_date_obj.strftime('%d/%m/%Y')
-                thai_end_date = end_date_obj.strftime('%d/%m/%Y')
-                date_text = f"Selected Period: {thai_start_date} to {thai_end_date}"
-            except:
-                date_text = f"Selected Period: {start_date} to {end_date}"
-            
-            # สร้าง Paragraph สำหรับวันที่ (ตัวปกติ, ขนาดเล็กมาก, จัดกึ่งกลาง)
-            date_paragraph = Paragraph(date_text, selected_period_style)
-            elements.append(date_paragraph)
-            elements.append(Spacer(1, 2))  # ลดระยะห่าง
-        
-        # หัวเรื่อง
-        title = Paragraph("รายงานการจองบริการ", title_style)
-        elements.append(title)
-        elements.append(Spacer(1, 3))  # ลดระยะห่างหลังหัวเรื่อง
-        
-        # สร้างตารางข้อมูล
-        if bookings_data:
-            # สร้างสไตล์สำหรับหัวตาราง (สีขาว, จัดกึ่งกลาง)
-            header_style = ParagraphStyle(
-                'TableHeader',
-                parent=styles['Normal'],
-                fontName='NotoSansThai-Bold',
-                fontSize=11,
-                textColor=white,  # สีขาว
-                leading=14,
-                alignment=1  # จัดกึ่งกลาง
-            )
-            
-            # หัวตาราง
-            table_data = [
-                [
-                    Paragraph('ลำดับ', header_style),
-                    Paragraph('ลูกค้า', header_style),
-                    Paragraph('รถยนต์', header_style),
-                    Paragraph('บริการที่จอง', header_style),
-                    Paragraph('หมายเหตุ', header_style),
-                    Paragraph('วันที่จอง', header_style),
-                    Paragraph('สถานะ', header_style)
-                ]
-            ]
-            
-            # ข้อมูลในตาราง
-            row_number = 1  # ตัวนับลำดับแยก
-            for booking in bookings_data:
-                # จัดรูปแบบชื่อลูกค้า - แยกชื่อและนามสกุล
-                first_name = booking['first_name'] or ''
-                last_name = booking['last_name'] or ''
-                full_name = f"{first_name} {last_name}".strip()
-                
-                # ถ้าชื่อยาวเกิน 15 ตัวอักษร ให้แยกบรรทัด
-                if len(full_name) > 15:
-                    customer_name = Paragraph(f"{first_name}<br/>{last_name}", normal_style)
-                else:
-                    customer_name = Paragraph(full_name, normal_style)
-                # จัดรูปแบบข้อมูลรถยนต์ - แยกยี่ห้อ รุ่น ทะเบียนรถ และจังหวัด
-                brand_name = booking['brand_name'] or ''
-                model_name = booking['model_name'] or ''
-                license_plate = booking['license_plate'] or ''
-                license_province = booking['license_province'] or ''
-                
-                vehicle_parts = []
-                if brand_name:
-                    vehicle_parts.append(f"ยี่ห้อ : {brand_name}")
-                if model_name:
-                    vehicle_parts.append(f"รุ่น : {model_name}")
-                if license_plate:
-                    vehicle_parts.append(f"ทะเบียน : {license_plate}")
-                if license_province:
-                    vehicle_parts.append(f"{license_province}")
-                
-                if vehicle_parts:
-                    vehicle_info = Paragraph("<br/>".join(vehicle_parts), normal_style)
-                else:
-                    vehicle_info = Paragraph('-', normal_style)
-                # แปลงวันที่เป็นรูปแบบไทย (วว/ดด/ปป)
-                if booking['booking_date']:
-                    try:
-                        # แปลงจาก YYYY-MM-DD เป็น DD/MM/YY
-                        date_obj = datetime.strptime(booking['booking_date'], '%Y-%m-%d')
-                        thai_date = date_obj.strftime('%d/%m/%y')
-                        booking_date = Paragraph(thai_date, center_style)
-                    except:
-                        booking_date = Paragraph(booking['booking_date'] or '-', center_style)
-                else:
-                    booking_date = Paragraph('-', center_style)
-                status = Paragraph(booking['status'], center_style)
-                
-                # ใช้ service_details ถ้ามี (รวมบริการย่อย) ไม่งั้นใช้ service_names
-                service_text = booking.get('service_details') or booking.get('service_names') or '-'
-                
-                # จัดรูปแบบการแสดงผลบริการและข้อมูลยาง
-                all_content = []
-                
-                # เพิ่มบริการหลักและบริการย่อย
-                if service_text and service_text != '-':
-                    # แยกบริการหลักและบริการย่อย
-                    services_list = service_text.split(', ')
-                    formatted_services = []
-                    
-                    for service in services_list:
-                        if '(' in service and ')' in service:
-                            # มีบริการย่อย
-                            main_service = service.split(' (')[0]
-                            sub_service = service.split(' (')[1].rstrip(')')
-                            formatted_services.append(f"๐ {main_service}")
-                            formatted_services.append(f"  - {sub_service}")
-                        else:
-                            # ไม่มีบริการย่อย
-                            formatted_services.append(f"๐ {service}")
-                    
-                    all_content.extend(formatted_services)
-                
-                # เพิ่มข้อมูลยางจาก tire_info
-                tire_info = booking.get('tire_info', {})
-                
-                # ตรวจสอบว่ามีข้อมูลยางหรือไม่
-                has_tire_data = any(tire_info.get(pos) for pos in ['front_left', 'front_right', 'rear_left', 'rear_right'])
-                
-                if has_tire_data:
-                    # ตรวจสอบยางด้านหน้า
-                    front_tires = []
-                    if tire_info.get('front_left'):
-                        front_tires.append(tire_info['front_left'])
-                    if tire_info.get('front_right'):
-                        front_tires.append(tire_info['front_right'])
-                    
-                    if front_tires:
-                        all_content.append("๐ ยางด้านหน้า")
-                        for i, tire in enumerate(front_tires, 1):
-                            if tire.get('size'):
-                                all_content.append(f"  - ขนาด: {tire['size']}")
-                            if tire.get('brand'):
-                                all_content.append(f"  - ยี่ห้อ: {tire['brand']}")
-                            if tire.get('model'):
-                                all_content.append(f"  - รุ่น: {tire['model']}")
-                    
-                    # ตรวจสอบยางด้านหลัง
-                    rear_tires = []
-                    if tire_info.get('rear_left'):
-                        rear_tires.append(tire_info['rear_left'])
-                    if tire_info.get('rear_right'):
-                        rear_tires.append(tire_info['rear_right'])
-                    
-                    if rear_tires:
-                        all_content.append("๐ ยางด้านหลัง")
-                        for i, tire in enumerate(rear_tires, 1):
-                            if tire.get('size'):
-                                all_content.append(f"  - ขนาด: {tire['size']}")
-                            if tire.get('brand'):
-                                all_content.append(f"  - ยี่ห้อ: {tire['brand']}")
-                            if tire.get('model'):
-                                all_content.append(f"  - รุ่น: {tire['model']}")
-                    
-                    # ตรวจสอบข้อมูล DOT
-                    dot_data = []
-                    for pos, tire in tire_info.items():
-                        if tire and tire.get('dot'):
-                            pos_name = {
-                                'front_left': 'หน้าซ้าย',
-                                'front_right': 'หน้าขวา',
-                                'rear_left': 'หลังซ้าย',
-                                'rear_right': 'หลังขวา'
-                            }.get(pos, pos)
-                            dot_data.append(f"  - {pos_name}: {tire['dot']}")
-                    
-                    if dot_data:
-                        all_content.append("๐ DOT ของยาง")
-                        all_content.extend(dot_data)
-                
-                if all_content:
-                    # สร้าง Paragraph แยกสำหรับบริการหลักและบริการย่อย
-                    services_list = []
-                    
-                    for content in all_content:
-                        if content.startswith('๐ '):
-                            # บริการหลัก - ใช้ bold_style
-                            services_list.append(Paragraph(content, bold_style))
-                        else:
-                            # บริการย่อย - ใช้ normal_style
-                            services_list.append(Paragraph(content, normal_style))
-                    
-                    services = services_list
-                else:
-                    services = Paragraph('-', normal_style)
-                
-                note_text = Paragraph((booking.get('note') or '-'), normal_style)
-                
-                table_data.append([
-                    Paragraph(str(row_number), center_style),
-                    customer_name,
-                    vehicle_info,
-                    services,
-                    note_text,
-                    booking_date,
-                    status
-                ])
-                
-                row_number += 1  # เพิ่มลำดับ
-            
-            # สร้างตาราง - ปรับความกว้างคอลัมน์ให้เหมาะสมกับขนาดกระดาษ
-            table = Table(
-                table_data,
-                colWidths=[35, 70, 100, 150, 60, 60, 70]  # เพิ่มความกว้างคอลัมน์สถานะจาก 50 เป็น 70
-            )
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), HexColor('#166534')),  # green-800
-                ('TEXTCOLOR', (0, 0), (-1, 0), white),
-                ('FONTNAME', (0, 0), (-1, 0), 'NotoSansThai-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 11),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('ALIGN', (0, 0), (-1, 0), 'CENTER'),  # จัดกึ่งกลางหัวตารางทั้งหมด
-                ('VALIGN', (0, 0), (-1, 0), 'MIDDLE'),  # จัดกึ่งกลางแนวตั้งหัวตาราง
-
-                ('BACKGROUND', (0, 1), (-1, -1), HexColor('#fefce8')),  # yellow-50
-                ('GRID', (0, 0), (-1, -1), 1, HexColor('#166534')),  # green-800
-                ('FONTNAME', (0, 1), (-1, -1), 'NotoSansThai'),
-                ('FONTSIZE', (0, 1), (-1, -1), 9),
-                ('VALIGN', (0, 1), (-1, -1), 'TOP'),
-
-                # จัดชิดซ้ายให้คอลัมน์ข้อความยาว
-                ('ALIGN', (1, 1), (4, -1), 'LEFT'),  # ลูกค้า, รถยนต์, บริการ, หมายเหตุ
-                ('ALIGN', (0, 1), (0, -1), 'CENTER'),  # ลำดับ
-                ('ALIGN', (5, 1), (5, -1), 'CENTER'),  # วันที่จอง
-                ('ALIGN', (6, 1), (6, -1), 'CENTER'),  # สถานะ
-
-                # Padding ให้พอดีอ่านง่าย - ลด padding เพื่อประหยัดพื้นที่
-                ('LEFTPADDING', (0, 0), (-1, -1), 4),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 4),
-                ('TOPPADDING', (0, 0), (-1, -1), 3),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
-            ]))
-            table.repeatRows = 1
-            
-            elements.append(table)
-        else:
-            no_data = Paragraph("ไม่พบข้อมูลการจองในช่วงวันที่ที่เลือก", normal_style)
-            no_data.leftIndent = 40
-            elements.append(no_data)
-        
-        elements.append(Spacer(1, 8))  # ลดระยะห่างก่อนข้อมูลเพิ่มเติม
-        
-        # สร้าง PDF
-        doc.build(elements)
-        buffer.seek(0)
-        
-        # ส่งกลับไฟล์ PDF
-        from flask import send_file
-        return send_file(
-            buffer,
-            as_attachment=True,
-            download_name=f'admin_booking_report_{start_date}_to_{end_date}.pdf',
-            mimetype='application/pdf'
-        )
-        
+        return report_response('admin_booking_report', {
+            'start_date': request.args.get('start_date'),
+            'end_date': request.args.get('end_date'),
+        })
     except Exception as e:
         print(f"Error in admin booking_report_pdf: {e}")
         return jsonify({
@@ -3331,6 +2641,7 @@ def add_brand():
             cursor.execute('INSERT INTO brands (brand_name) VALUES (%s)', (brand_name,))
             brand_id = cursor.lastrowid
             get_db().commit()
+            invalidate_tire_catalog()
             flash('เพิ่มยี่ห้อยางสำเร็จ', 'success')
             return redirect(url_for('admin.add_brand', success=1))
         except Exception as e:
@@ -3363,6 +2674,7 @@ def edit_brand(brand_id):
         try:
             cursor.execute('UPDATE brands SET brand_name = %s WHERE brand_id = %s', (brand_name, brand_id))
             get_db().commit()
+            invalidate_tire_catalog()
             flash('แก้ไขยี่ห้อยางสำเร็จ', 'success')
             return redirect(url_for('admin.edit_brand', brand_id=brand_id, success=1))
         except Exception as e:
@@ -3402,6 +2714,7 @@ def delete_brand(brand_id):
         
         cursor.execute('DELETE FROM brands WHERE brand_id = %s', (brand_id,))
         get_db().commit()
+        invalidate_tire_catalog()
         flash('ลบยี่ห้อยางสำเร็จ', 'success')
     except Exception as e:
         get_db().rollback()
@@ -3498,6 +2811,7 @@ def add_tire_model():
                          (model_name, brand_id, tire_category))
             model_id = cursor.lastrowid
             get_db().commit()
+            invalidate_tire_catalog()
             flash('เพิ่มรุ่นยางสำเร็จ', 'success')
             return redirect(url_for('admin.add_tire_model', success=1))
         except Exception as e:
@@ -3538,6 +2852,7 @@ def edit_tire_model(model_id):
             cursor.execute('UPDATE tire_models SET model_name = %s, brand_id = %s, tire_category = %s WHERE model_id = %s', 
                          (model_name, brand_id, tire_category, model_id))
             get_db().commit()
+            invalidate_tire_catalog()
             flash('แก้ไขรุ่นยางสำเร็จ', 'success')
             return redirect(url_for('admin.edit_tire_model', model_id=model_id, success=1))
         except Exception as e:
@@ -3575,6 +2890,7 @@ def delete_tire_model(model_id):
         
         cursor.execute('DELETE FROM tire_models WHERE model_id = %s', (model_id,))
         get_db().commit()
+        invalidate_tire_catalog()
         flash('ลบรุ่นยางสำเร็จ', 'success')
     except Exception as e:
         get_db().rollback()
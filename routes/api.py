@@ -2,14 +2,23 @@
 from flask import Blueprint, request, jsonify, session
 from database import get_cursor, get_db
 from utils import validate_pagination_params, validate_sort_params
-from datetime import datetime
-from utils import get_device_type
-import json
+from pagination import KeysetQuery
+from promotion_cache import active_promotions
+from utils import get_device_type, etag_json_response
+from page_view_recorder import record_page_view
+from address_gazetteer import get_gazetteer
+from tire_catalog import get_tire_catalog, CATALOG_VERSION
+from booking_service import bookings_changed, BOOKINGS_VERSION
+from customer_search import CUSTOMERS_VERSION
+from booking_slots import parse_service_date, parse_month, slot_schedule, slot_availability, slot_key, move_booking_slot, month_availability_payload
 from functools import wraps
 
 # สร้าง Blueprint สำหรับ API routes
 api = Blueprint('api', __name__)
 
+# อายุ cache ฝั่งเบราว์เซอร์ของต้นไม้ขนาดยาง (วินาที) หลังจากนั้นเบราว์เซอร์ถามซ้ำด้วย If-None-Match
+TIRE_SIZES_CLIENT_MAX_AGE = 300
+
 @api.route('/log-page-view', methods=['POST'])
 def log_page_view():
     """บันทึกการเข้าชมหน้าเว็บ"""
@@ -30,9 +39,6 @@ def log_page_view():
         if not page_id:
             return jsonify({'success': False, 'error': 'page_id is required'}), 400
         
-        # เชื่อมต่อฐานข้อมูล
-        cursor = get_cursor()
-        
         # ตรวจสอบ device_type จาก User-Agent header
         user_agent = request.headers.get('User-Agent', '')
         device_type = get_device_type(user_agent)
@@ -40,23 +46,10 @@ def log_page_view():
         print(f"Page ID: {page_id}")
         print(f"Device Type: {device_type}")
         
-        # บันทึกข้อมูลการเข้าชมลงในตาราง page_view_logs
-        cursor.execute('''
-            INSERT INTO page_view_logs (page_id, device_type, viewed_at)
-            VALUES (%s, %s, %s)
-        ''', (page_id, device_type, datetime.now()))
-        
-        # อัปเดตหรือเพิ่มข้อมูลสถิติการเข้าชมในตาราง page_views
-        cursor.execute('''
-            INSERT INTO page_views (page_id, views, last_viewed_at)
-            VALUES (%s, 1, %s)
-            ON DUPLICATE KEY UPDATE
-            views = views + 1,
-            last_viewed_at = %s
-        ''', (page_id, datetime.now(), datetime.now()))
-        
-        # บันทึกการเปลี่ยนแปลงลงฐานข้อมูล
-        cursor.connection.commit()
+        # บันทึกลงบัฟเฟอร์ แล้ว page_view_recorder จะเขียน page_views และ page_view_logs เป็นชุด
+        # page_id ที่ไม่ใช่ข้อความหรือยาวเกินคอลัมน์จะถูกปฏิเสธที่นี่ ไม่ให้เข้าไปทำให้ทั้งชุดเขียนไม่ได้
+        if not record_page_view(page_id, device_type=device_type):
+            return jsonify({'success': False, 'error': 'invalid page_id'}), 400
         
         print(f"Successfully logged page view for: {page_id}")
         
@@ -92,31 +85,14 @@ def api_log_page_view():
         if not page_id:
             return jsonify({'success': False, 'error': 'page_id is required'}), 400
         
-        # เชื่อมต่อฐานข้อมูล
-        cursor = get_cursor()
-        
         # ตรวจสอบ device_type จาก User-Agent header
         user_agent = request.headers.get('User-Agent', '')
         device_type = get_device_type(user_agent)
         
-        # บันทึกข้อมูลการเข้าชมลงในตาราง page_view_logs
-        cursor.execute('''
-            INSERT INTO page_view_logs (page_id, device_type, viewed_at)
-            VALUES (%s, %s, %s)
-        ''', (page_id, device_type, datetime.now()))
-        
-        # อัปเดตหรือเพิ่มข้อมูลสถิติการเข้าชมในตาราง page_views
-        cursor.execute('''
-            INSERT INTO page_views (page_id, views, last_viewed_at)
-            VALUES (%s, 1, %s)
-            ON DUPLICATE KEY UPDATE
-            views = views + 1,
-            last_viewed_at = %s
-        ''', (page_id, datetime.now(), datetime.now()))
-        
-        # บันทึกการเปลี่ยนแปลงลงฐานข้อมูล
-        from database import get_db
-        get_db().commit()
+        # บันทึกลงบัฟเฟอร์ แล้ว page_view_recorder จะเขียน page_views และ page_view_logs เป็นชุด
+        # page_id ที่ไม่ใช่ข้อความหรือยาวเกินคอลัมน์จะถูกปฏิเสธที่นี่ ไม่ให้เข้าไปทำให้ทั้งชุดเขียนไม่ได้
+        if not record_page_view(page_id, device_type=device_type):
+            return jsonify({'success': False, 'error': 'invalid page_id'}), 400
         
         return jsonify({
             'success': True,
@@ -208,64 +184,41 @@ def api_tires():
         aspect_ratio = request.args.get('aspect_ratio')
         rim_diameter = request.args.get('rim_diameter')
         
-        # สร้าง SQL query หลักสำหรับดึงข้อมูลยาง
-        base_query = """
-            SELECT t.tire_id, t.name, t.width, t.aspect_ratio, t.rim_diameter, 
-                   t.load_index, t.speed_rating, t.price, t.stock_quantity,
-                   t.image_filename, t.description, t.created_at,
-                   b.brand_name, b.brand_id
-            FROM tires t
-            JOIN brands b ON t.brand_id = b.brand_id
-            WHERE 1=1
-        """
-        
+        where = []
         params = []
         
         # เพิ่มเงื่อนไขการกรองตามพารามิเตอร์ที่ส่งมา
         if brand_id:
-            base_query += " AND t.brand_id = %s"
+            where.append("t.brand_id = %s")
             params.append(brand_id)
         
         if width:
-            base_query += " AND t.width = %s"
+            where.append("t.width = %s")
             params.append(width)
         
         if aspect_ratio:
-            base_query += " AND t.aspect_ratio = %s"
+            where.append("t.aspect_ratio = %s")
             params.append(aspect_ratio)
         
         if rim_diameter:
-            base_query += " AND t.rim_diameter = %s"
+            where.append("t.rim_diameter = %s")
             params.append(rim_diameter)
         
-        # นับจำนวนรายการทั้งหมดสำหรับ pagination
-        count_query = f"SELECT COUNT(*) as total FROM ({base_query}) as subquery"
-        cursor = get_cursor()
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['total']
-        
-        # คำนวณค่า offset และจำนวนหน้าทั้งหมด
-        offset = (page - 1) * per_page
-        total_pages = (total + per_page - 1) // per_page
-        
-        # เพิ่ม ORDER BY และ LIMIT สำหรับ pagination
-        base_query += " ORDER BY t.created_at DESC"
-        base_query += " LIMIT %s OFFSET %s"
-        params.extend([per_page, offset])
-        
-        # ดึงข้อมูลยางตามเงื่อนไขที่กำหนด
-        cursor.execute(base_query, params)
-        tires = cursor.fetchall()
+        # แบ่งหน้าแบบ keyset เรียงตาม created_at ใหม่ไปเก่า (?cursor= สำหรับหน้าถัดไป)
+        result = KeysetQuery(
+            select="""t.tire_id, t.name, t.width, t.aspect_ratio, t.rim_diameter, 
+                   t.load_index, t.speed_rating, t.price, t.stock_quantity,
+                   t.image_filename, t.description, t.created_at,
+                   b.brand_name, b.brand_id""",
+            from_clause="tires t JOIN brands b ON t.brand_id = b.brand_id",
+            keys=[('t.created_at', 'DESC'), ('t.tire_id', 'DESC')],
+            where=where, params=params, per_page=per_page, versions=(CATALOG_VERSION,),
+        ).fetch(get_cursor(), page=page, after=request.args.get('cursor'))
         
         return jsonify({
             'success': True,
-            'data': tires,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': total,
-                'total_pages': total_pages
-            }
+            'data': result.rows,
+            'pagination': result.as_dict()
         })
         
     except Exception as e:
@@ -276,27 +229,25 @@ def api_tires():
             'error': str(e)
         }), 500
 
+@api.route('/api/tires/sizes')
+def api_tire_sizes():
+    """API สำหรับดึงขนาดยางทั้งหมดแบบลำดับชั้น width → aspect → rim ในครั้งเดียว (จาก catalog ในหน่วยความจำ)"""
+    try:
+        return etag_json_response(get_tire_catalog().sizes.payload(), TIRE_SIZES_CLIENT_MAX_AGE)
+    except Exception as e:
+        print(f"Error in api_tire_sizes: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @api.route('/api/tires/widths')
 def api_tire_widths():
-    """API สำหรับดึงรายการ width ทั้งหมดที่มีในตาราง tires"""
+    """API สำหรับดึงรายการ width ทั้งหมดที่มีในตาราง tires (จาก catalog ในหน่วยความจำ)"""
     try:
-        # เชื่อมต่อฐานข้อมูล
-        cursor = get_cursor()
-        
-        # ดึง width ที่ไม่ซ้ำและเรียงลำดับแบบตัวเลข
-        cursor.execute("""
-            SELECT DISTINCT width
-            FROM tires 
-            WHERE width IS NOT NULL
-            ORDER BY width ASC
-        """)
-        
-        # แปลงผลลัพธ์เป็น list ของ width
-        widths = [row['width'] for row in cursor.fetchall()]
-        
         return jsonify({
             'success': True,
-            'items': widths
+            'items': get_tire_catalog().sizes.widths
         })
         
     except Exception as e:
@@ -309,7 +260,7 @@ def api_tire_widths():
 
 @api.route('/api/tires/aspects')
 def api_tire_aspects():
-    """API สำหรับดึงรายการ aspect_ratio ตาม width ที่เลือก"""
+    """API สำหรับดึงรายการ aspect_ratio ตาม width ที่เลือก (จาก catalog ในหน่วยความจำ)"""
     try:
         # รับพารามิเตอร์ width
         width = request.args.get('width')
@@ -319,23 +270,9 @@ def api_tire_aspects():
                 'error': 'Width parameter is required'
             }), 400
         
-        # เชื่อมต่อฐานข้อมูล
-        cursor = get_cursor()
-        
-        # ดึง aspect_ratio ที่ไม่ซ้ำสำหรับ width ที่เลือก
-        cursor.execute("""
-            SELECT DISTINCT aspect_ratio
-            FROM tires 
-            WHERE width = %s AND aspect_ratio IS NOT NULL
-            ORDER BY aspect_ratio ASC
-        """, (width,))
-        
-        # แปลงผลลัพธ์เป็น list ของ aspect_ratio
-        aspects = [row['aspect_ratio'] for row in cursor.fetchall()]
-        
         return jsonify({
             'success': True,
-            'items': aspects
+            'items': get_tire_catalog().sizes.aspects(width)
         })
         
     except Exception as e:
@@ -348,7 +285,7 @@ def api_tire_aspects():
 
 @api.route('/api/tires/rims')
 def api_tire_rims():
-    """API สำหรับดึงรายการ rim_diameter ตาม width และ aspect_ratio ที่เลือก"""
+    """API สำหรับดึงรายการ rim_diameter ตาม width และ aspect_ratio ที่เลือก (จาก catalog ในหน่วยความจำ)"""
     try:
         # รับพารามิเตอร์ width และ aspect
         width = request.args.get('width')
@@ -361,23 +298,9 @@ def api_tire_rims():
                 'error': 'Width and aspect parameters are required'
             }), 400
         
-        # เชื่อมต่อฐานข้อมูล
-        cursor = get_cursor()
-        
-        # ดึง rim_diameter ที่ไม่ซ้ำสำหรับ width และ aspect_ratio ที่เลือก
-        cursor.execute("""
-            SELECT DISTINCT rim_diameter
-            FROM tires 
-            WHERE width = %s AND aspect_ratio = %s AND rim_diameter IS NOT NULL
-            ORDER BY rim_diameter ASC
-        """, (width, aspect))
-        
-        # แปลงผลลัพธ์เป็น list ของ rim_diameter
-        rims = [row['rim_diameter'] for row in cursor.fetchall()]
-        
         return jsonify({
             'success': True,
-            'items': rims
+            'items': get_tire_catalog().sizes.rims(width, aspect)
         })
         
     except Exception as e:
@@ -454,56 +377,35 @@ def api_bookings():
         status_filter = request.args.get('status')
         customer_id = request.args.get('customer_id')
         
-        # สร้าง SQL query หลักสำหรับดึงข้อมูลการจอง
-        base_query = """
-            SELECT b.booking_id, b.booking_date, b.status,
-                   c.customer_id, c.first_name, c.last_name, c.phone,
-                   v.license_plate, v.license_province, v.brand_name, v.model_name
-            FROM bookings b
-            JOIN customers c ON b.customer_id = c.customer_id
-            JOIN vehicles v ON b.vehicle_id = v.vehicle_id
-            WHERE 1=1
-        """
-        
+        where = []
         params = []
         
         # เพิ่มเงื่อนไขการกรองตามพารามิเตอร์ที่ส่งมา
         if status_filter:
-            base_query += " AND b.status = %s"
+            where.append("b.status = %s")
             params.append(status_filter)
         
         if customer_id:
-            base_query += " AND b.customer_id = %s"
+            where.append("b.customer_id = %s")
             params.append(customer_id)
         
-        # นับจำนวนรายการทั้งหมดสำหรับ pagination
-        count_query = f"SELECT COUNT(*) as total FROM ({base_query}) as subquery"
-        cursor = get_cursor()
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['total']
-        
-        # คำนวณค่า offset และจำนวนหน้าทั้งหมด
-        offset = (page - 1) * per_page
-        total_pages = (total + per_page - 1) // per_page
-        
-        # เพิ่ม ORDER BY และ LIMIT สำหรับ pagination
-        base_query += " ORDER BY b.booking_date DESC"
-        base_query += " LIMIT %s OFFSET %s"
-        params.extend([per_page, offset])
-        
-        # ดึงข้อมูลการจองตามเงื่อนไขที่กำหนด
-        cursor.execute(base_query, params)
-        bookings = cursor.fetchall()
+        # แบ่งหน้าแบบ keyset เรียงตาม (booking_date, booking_id) ใหม่ไปเก่า (?cursor= สำหรับหน้าถัดไป)
+        result = KeysetQuery(
+            select="""b.booking_id, b.booking_date, b.status,
+                   c.customer_id, c.first_name, c.last_name, c.phone,
+                   v.license_plate, v.license_province, v.brand_name, v.model_name""",
+            from_clause="""bookings b
+            JOIN customers c ON b.customer_id = c.customer_id
+            JOIN vehicles v ON b.vehicle_id = v.vehicle_id""",
+            keys=[('b.booking_date', 'DESC'), ('b.booking_id', 'DESC')],
+            where=where, params=params, per_page=per_page,
+            versions=(BOOKINGS_VERSION, CUSTOMERS_VERSION),
+        ).fetch(get_cursor(), page=page, after=request.args.get('cursor'))
         
         return jsonify({
             'success': True,
-            'data': bookings,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': total,
-                'total_pages': total_pages
-            }
+            'data': result.rows,
+            'pagination': result.as_dict()
         })
         
     except Exception as e:
@@ -608,16 +510,8 @@ def api_booking_detail(booking_id):
 def api_promotions_active():
     """API สำหรับดึงโปรโมชั่นที่ใช้งานได้"""
     try:
-        cursor = get_cursor()
-        
-        cursor.execute("""
-            SELECT promotion_id, title, description, image_url,
-                   start_date, end_date
-            FROM promotions
-            WHERE start_date <= CURDATE() AND end_date >= CURDATE()
-            ORDER BY promotion_id DESC
-        """)
-        promotions = cursor.fetchall()
+        # โปรโมชันที่ใช้งานได้วันนี้จาก cache ที่ทุก worker ใช้ร่วมกัน
+        promotions = active_promotions(order='promotion_id')
         
         return jsonify({
             'success': True,
@@ -641,48 +535,22 @@ def api_staff():
             request.args.get('per_page')
         )
         
-        # สร้าง query
-        base_query = """
-            SELECT 
-                sp.staff_id, sp.first_name, sp.last_name,
+        # แบ่งหน้าแบบ keyset เรียงตามชื่อ-นามสกุล (staff_id ปิดท้ายให้ลำดับไม่ซ้ำ)
+        result = KeysetQuery(
+            select="""sp.staff_id, sp.first_name, sp.last_name,
                 sp.phone, sp.email, sp.created_at,
                 u.user_id, u.username, u.name, u.avatar_filename,
-                u.role_name
-            FROM staff_profiles sp
-            JOIN users u ON sp.user_id = u.user_id
-            WHERE 1=1
-        """
-        
-        params = []
-        
-        # นับจำนวนทั้งหมด
-        count_query = f"SELECT COUNT(*) as total FROM ({base_query}) as subquery"
-        cursor = get_cursor()
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['total']
-        
-        # คำนวณ pagination
-        offset = (page - 1) * per_page
-        total_pages = (total + per_page - 1) // per_page
-        
-        # เพิ่ม ORDER BY และ LIMIT
-        base_query += " ORDER BY sp.first_name, sp.last_name"
-        base_query += " LIMIT %s OFFSET %s"
-        params.extend([per_page, offset])
-        
-        # ดึงข้อมูล
-        cursor.execute(base_query, params)
-        staff = cursor.fetchall()
+                u.role_name""",
+            from_clause="staff_profiles sp JOIN users u ON sp.user_id = u.user_id",
+            keys=[("COALESCE(sp.first_name, '')", 'ASC'), ("COALESCE(sp.last_name, '')", 'ASC'),
+                  ('sp.staff_id', 'ASC')],
+            per_page=per_page,
+        ).fetch(get_cursor(), page=page, after=request.args.get('cursor'))
         
         return jsonify({
             'success': True,
-            'data': staff,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': total,
-                'total_pages': total_pages
-            }
+            'data': result.rows,
+            'pagination': result.as_dict()
         })
         
     except Exception as e:
@@ -754,24 +622,9 @@ def get_districts():
         if not province:
             return jsonify([])
         
-        # อ่านข้อมูลจาก JSON file
-        with open('static/data/api_province_with_amphure_tambon.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # กรองข้อมูลตามจังหวัด
-        districts = []
-        for province_data in data:
-            if province_data.get('name_th') == province:
-                amphures = province_data.get('amphure', [])
-                for amphure in amphures:
-                    amphure_name = amphure.get('name_th')
-                    if amphure_name and amphure_name not in districts:
-                        districts.append(amphure_name)
-                break
-        
-        # เรียงลำดับ
-        districts.sort()
-        return jsonify(districts)
+        # ข้อมูลที่อยู่ถูกอ่านจาก JSON file ครั้งเดียวต่อ process และเรียงไว้แล้ว
+        districts = get_gazetteer().get_districts(province)
+        return _address_response(districts)
         
     except Exception as e:
         print(f"Error in get_districts: {e}")
@@ -787,28 +640,8 @@ def get_subdistricts():
         if not province or not district:
             return jsonify([])
         
-        # อ่านข้อมูลจาก JSON file
-        with open('static/data/api_province_with_amphure_tambon.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # กรองข้อมูลตามจังหวัดและอำเภอ
-        subdistricts = []
-        for province_data in data:
-            if province_data.get('name_th') == province:
-                amphures = province_data.get('amphure', [])
-                for amphure in amphures:
-                    if amphure.get('name_th') == district:
-                        tambons = amphure.get('tambon', [])
-                        for tambon in tambons:
-                            tambon_name = tambon.get('name_th')
-                            if tambon_name and tambon_name not in subdistricts:
-                                subdistricts.append(tambon_name)
-                        break
-                break
-        
-        # เรียงลำดับ
-        subdistricts.sort()
-        return jsonify(subdistricts)
+        subdistricts = get_gazetteer().get_subdistricts(province, district)
+        return _address_response(subdistricts)
         
     except Exception as e:
         print(f"Error in get_subdistricts: {e}")
@@ -825,95 +658,70 @@ def get_zipcodes():
         if not province or not district or not subdistrict:
             return jsonify([])
         
-        # อ่านข้อมูลจาก JSON file
-        with open('static/data/api_province_with_amphure_tambon.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # กรองข้อมูลตามจังหวัด อำเภอ และตำบล
-        zipcodes = []
-        for province_data in data:
-            if province_data.get('name_th') == province:
-                amphures = province_data.get('amphure', [])
-                for amphure in amphures:
-                    if amphure.get('name_th') == district:
-                        tambons = amphure.get('tambon', [])
-                        for tambon in tambons:
-                            if tambon.get('name_th') == subdistrict:
-                                zipcode = tambon.get('zip_code')
-                                if zipcode and str(zipcode) not in zipcodes:
-                                    zipcodes.append(str(zipcode))
-                        break
-                break
-        
-        # เรียงลำดับ
-        zipcodes.sort()
-        return jsonify(zipcodes)
+        zipcodes = get_gazetteer().get_zipcodes(province, district, subdistrict)
+        return _address_response(zipcodes)
         
     except Exception as e:
         print(f"Error in get_zipcodes: {e}")
         return jsonify([]), 500
 
+@api.route('/api/address/autocomplete')
+def address_autocomplete():
+    """ค้นหาที่อยู่แบบขึ้นต้นด้วยคำที่พิมพ์ (level: province, district, subdistrict, zipcode)"""
+    try:
+        q = request.args.get('q', '').strip()
+        level = request.args.get('level', 'subdistrict').strip()
+        province = request.args.get('province', '').strip() or None
+        district = request.args.get('district', '').strip() or None
+        try:
+            limit = min(50, max(1, int(request.args.get('limit', 20))))
+        except ValueError:
+            limit = 20
+        
+        if not q:
+            return jsonify([])
+        
+        results = get_gazetteer().autocomplete(q, level=level, province=province, district=district, limit=limit)
+        return _address_response(results)
+        
+    except Exception as e:
+        print(f"Error in address_autocomplete: {e}")
+        return jsonify([]), 500
+
+def _address_response(data):
+    """ข้อมูลที่อยู่ไม่เปลี่ยนระหว่างการ deploy จึงให้ browser cache ได้"""
+    response = jsonify(data)
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    return response
+
 @api.route('/api/booking-availability')
 def get_booking_availability():
-    """ตรวจสอบความพร้อมของแต่ละชั่วโมง (จำกัด 3 คิวต่อชั่วโมง)"""
+    """ตรวจสอบความพร้อมของแต่ละรอบเวลา (จำนวนคิวต่อรอบตั้งค่าได้ใน config)"""
     try:
         service_date = request.args.get('service_date', '').strip()
         
         if not service_date:
             return jsonify({'success': False, 'error': 'service_date is required'}), 400
         
-        # ดึงข้อมูลจากฐานข้อมูลจริง
+        slot_date = parse_service_date(service_date)
+        if slot_date is None:
+            return jsonify({'success': False, 'error': 'service_date must be YYYY-MM-DD'}), 400
+        
+        # อ่านตัวนับคิวจาก booking_slots (1 แถวต่อรอบเวลา ไม่ต้องนับจาก bookings ทุกครั้ง)
         try:
             cursor = get_cursor()
-            
-            # ตรวจสอบจำนวนการจองในแต่ละชั่วโมง
-            cursor.execute('''
-                SELECT service_time, COUNT(*) as booking_count
-                FROM bookings 
-                WHERE service_date = %s AND status != 'ยกเลิก'
-                GROUP BY service_time
-            ''', (service_date,))
-            
-            booking_counts = {}
-            for row in cursor.fetchall():
-                # แปลง service_time เป็น string format
-                service_time = row['service_time']
-                if hasattr(service_time, 'total_seconds'):
-                    # ถ้าเป็น timedelta object
-                    total_seconds = int(service_time.total_seconds())
-                    hours = total_seconds // 3600
-                    minutes = (total_seconds % 3600) // 60
-                    time_str = f"{hours:02d}:{minutes:02d}"
-                elif hasattr(service_time, 'strftime'):
-                    # ถ้าเป็น time object
-                    time_str = service_time.strftime('%H:%M')
-                else:
-                    # ถ้าเป็น string หรือ format อื่น
-                    time_str = str(service_time)
-                    if ':' in time_str:
-                        # แปลง format ให้เป็น HH:MM
-                        parts = time_str.split(':')
-                        if len(parts) >= 2:
-                            time_str = f"{parts[0].zfill(2)}:{parts[1].zfill(2)}"
-                
-                booking_counts[time_str] = row['booking_count']
-                
+            availability = slot_availability(cursor, slot_date)
         except Exception as db_error:
             print(f"Database error: {db_error}")
-            # ถ้าฐานข้อมูลมีปัญหา ให้ใช้ข้อมูลว่าง
-            booking_counts = {}
-        
-        # สร้างรายการเวลาที่มีให้เลือก
-        available_times = ['09:00', '10:00', '11:00', '13:00', '14:00', '15:00']
-        availability = {}
-        
-        for time_slot in available_times:
-            current_count = booking_counts.get(time_slot, 0)
-            availability[time_slot] = {
-                'available': current_count < 3,
-                'current_bookings': current_count,
-                'max_bookings': 3,
-                'remaining': max(0, 3 - current_count)
+            # ถ้าฐานข้อมูลมีปัญหา ให้แสดงทุกรอบว่าง
+            availability = {
+                time_slot: {
+                    'available': capacity > 0,
+                    'current_bookings': 0,
+                    'max_bookings': capacity,
+                    'remaining': capacity
+                }
+                for time_slot, capacity in slot_schedule(slot_date).items()
             }
         
         return jsonify({
@@ -928,6 +736,18 @@ def get_booking_availability():
             'error': str(e)
         }), 500
 
+@api.route('/api/booking-availability/month')
+def get_month_availability():
+    """ความพร้อมของทุกรอบเวลาในทุกวันของเดือน (?month=YYYY-MM) สำหรับปฏิทินคิว"""
+    month = parse_month(request.args.get('month', ''))
+    if month is None:
+        return jsonify({'success': False, 'error': 'month must be YYYY-MM'}), 400
+    try:
+        return etag_json_response(month_availability_payload(*month), max_age=0)
+    except Exception as e:
+        print(f"Error in get_month_availability: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @api.route('/api/booking-customers')
 def get_booking_customers():
     """ดึงข้อมูลลูกค้าที่จองในแต่ละชั่วโมง"""
@@ -956,22 +776,16 @@ def get_booking_customers():
             
             bookings = cursor.fetchall()
             
-            # จัดกลุ่มข้อมูลตามเวลา
-            time_slots = ['09:00', '10:00', '11:00', '13:00', '14:00', '15:00']
+            # จัดกลุ่มข้อมูลตามรอบเวลาของวันนั้น
+            slot_date = parse_service_date(service_date)
+            time_slots = slot_schedule(slot_date) if slot_date else {}
             customers_by_time = {}
             
             for time_slot in time_slots:
                 customers_by_time[time_slot] = []
             
             for booking in bookings:
-                # แปลง service_time เป็น string format
-                if hasattr(booking['service_time'], 'total_seconds'):
-                    total_seconds = int(booking['service_time'].total_seconds())
-                    hours = total_seconds // 3600
-                    minutes = (total_seconds % 3600) // 60
-                    time_str = f"{hours:02d}:{minutes:02d}"
-                else:
-                    time_str = str(booking['service_time'])
+                time_str = slot_key(booking['service_time'])
                 
                 if time_str in customers_by_time:
                     customers_by_time[time_str].append({
@@ -1010,11 +824,12 @@ def cancel_booking(booking_id):
         customer_id = session['customer_id']
         cursor = get_cursor()
         
-        # ตรวจสอบว่าการจองนี้เป็นของลูกค้าที่เข้าสู่ระบบหรือไม่
+        # ตรวจสอบว่าการจองนี้เป็นของลูกค้าที่เข้าสู่ระบบหรือไม่ (ล็อกแถวไว้จนกว่าจะ commit)
         cursor.execute('''
-            SELECT booking_id, status 
+            SELECT booking_id, service_date, service_time, status 
             FROM bookings 
             WHERE booking_id = %s AND customer_id = %s
+            FOR UPDATE
         ''', (booking_id, customer_id))
         
         booking = cursor.fetchone()
@@ -1032,8 +847,11 @@ def cancel_booking(booking_id):
             SET status = 'ยกเลิก' 
             WHERE booking_id = %s
         ''', (booking_id,))
+        # คืนคิวของรอบเวลานี้
+        move_booking_slot(cursor, booking, dict(booking, status='ยกเลิก'))
         
         get_db().commit()
+        bookings_changed()
         
         return jsonify({'success': True, 'message': 'ยกเลิกการจองเรียบร้อยแล้ว'})
         
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
 from database import get_cursor, get_db
 from utils import verify_password, is_safe_url
+from customer_search import customers_changed
 from datetime import timedelta
 import secrets
 import smtplib
@@ -272,9 +273,11 @@ def register():
                 INSERT INTO customers (user_id, first_name, last_name, phone, email) 
                 VALUES (%s, %s, %s, %s, %s)
             ''', (user_id, first_name, last_name, phone, email))
+            customer_id = cursor.lastrowid
             
             # Commit transaction
             get_db().commit()
+            customers_changed([customer_id])
             
             # ถ้าเป็น AJAX request
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -1,7 +1,18 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, g, current_app, jsonify
 from database import get_cursor, get_db
-from utils import allowed_file, verify_password
+from utils import allowed_file, verify_password, etag_json_response
+from upload_store import save_upload, delete_upload
 from decorators import customer_login_required, customer_required
+from page_view_recorder import record_page_view
+from tire_catalog import get_tire_catalog
+from booking_details import load_booking_services
+from booking_slots import SlotFullError, slot_times
+from booking_service import car_brand_name, services_from_form, tires_from_form, create_booking, bookings_changed, BOOKINGS_VERSION
+from pagination import KeysetQuery
+from booking_search import index_bookings
+from customer_search import customers_changed
+from promotion_cache import active_promotions
+from vehicle_taxonomy import get_vehicle_taxonomy, CLIENT_MAX_AGE as VEHICLE_TAXONOMY_CLIENT_MAX_AGE
 import os
 from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
@@ -13,23 +24,8 @@ customer = Blueprint('customer', __name__)
 def home():
     """หน้าแรกสำหรับลูกค้า"""
     try:
-        cursor = get_cursor()
-        
-        # ดึงข้อมูลโปรโมชันที่ใช้งานได้ (มีวันที่ปัจจุบันอยู่ในช่วงโปรโมชัน)
-        cursor.execute("""
-            SELECT promotion_id, title, description, image_url,
-                   start_date, end_date
-            FROM promotions
-            WHERE start_date <= CURDATE() AND end_date >= CURDATE()
-            ORDER BY start_date DESC
-        """)
-        promotions = cursor.fetchall()
-        print(f"Found {len(promotions)} active promotions: {promotions}")
-        
-        # Debug: ดูโปรโมชันทั้งหมด
-        cursor.execute("SELECT promotion_id, title, image_url, start_date, end_date FROM promotions ORDER BY start_date DESC")
-        all_promotions = cursor.fetchall()
-        print(f"All promotions in database: {all_promotions}")
+        # โปรโมชันที่ใช้งานได้วันนี้จาก cache (โหลดใหม่เมื่อถึงวันเริ่ม/สิ้นสุดโปรโมชัน หรือแอดมินแก้ไข)
+        promotions = active_promotions()
         
         return render_customer_template('customer/home.html', promotions=promotions)
         
@@ -39,31 +35,10 @@ def home():
 
 @customer.route('/api/tire-sizes')
 def get_tire_sizes():
-    """API สำหรับดึงข้อมูล tire sizes จากฐานข้อมูล"""
+    """API สำหรับดึงข้อมูล tire sizes ที่มีอยู่จริง (จาก catalog ในหน่วยความจำ)"""
     try:
-        cursor = get_cursor()
-        
-        # ดึงข้อมูล tire sizes ที่มีอยู่จริงในฐานข้อมูล
-        cursor.execute("""
-            SELECT DISTINCT width, aspect_ratio, rim_diameter
-            FROM tires
-            WHERE width IS NOT NULL AND aspect_ratio IS NOT NULL AND rim_diameter IS NOT NULL
-            ORDER BY width ASC, aspect_ratio ASC, rim_diameter ASC
-        """)
-        
-        tire_sizes = cursor.fetchall()
-        
-        # จัดกลุ่มข้อมูลตาม width, aspect_ratio, rim_diameter
-        combinations = []
-        for tire in tire_sizes:
-            combinations.append({
-                'width': int(tire['width']),
-                'aspect': int(tire['aspect_ratio']),
-                'rim': int(tire['rim_diameter'])
-            })
-        
         return jsonify({
-            'combinations': combinations
+            'combinations': get_tire_catalog().sizes.combinations()
         })
         
     except Exception as e:
@@ -72,56 +47,18 @@ def get_tire_sizes():
 
 @customer.route('/api/car-brands')
 def get_car_brands():
-    """API สำหรับดึงข้อมูลยี่ห้อรถจากฐานข้อมูล"""
+    """API สำหรับดึงข้อมูลยี่ห้อรถที่มีการแมทซ์ในตาราง tire_model_vehicle_targets (จาก taxonomy ในหน่วยความจำ)"""
     try:
-        cursor = get_cursor()
-        
-        # ดึงข้อมูลยี่ห้อรถที่มีการแมทซ์ในตาราง tire_model_vehicle_targets
-        cursor.execute("""
-            SELECT DISTINCT cb.car_brand_id, cb.car_brand_name
-            FROM car_brands cb
-            JOIN car_models cm ON cb.car_brand_id = cm.car_brand_id
-            JOIN car_model_years cmy ON cm.car_model_id = cmy.car_model_id
-            JOIN tire_model_vehicle_targets tvt ON cmy.car_model_year_id = tvt.car_model_year_id
-            ORDER BY cb.car_brand_name ASC
-        """)
-        
-        brands = cursor.fetchall()
-        print(f"Found {len(brands)} matched car brands: {brands}")
-        
-        return jsonify({
-            'brands': [{'id': brand['car_brand_id'], 'name': brand['car_brand_name']} for brand in brands]
-        })
-        
+        return etag_json_response(get_vehicle_taxonomy().brands_payload(), VEHICLE_TAXONOMY_CLIENT_MAX_AGE)
     except Exception as e:
         print(f"Error fetching car brands: {e}")
         return jsonify({'brands': []})
 
 @customer.route('/api/car-models/<int:brand_id>')
 def get_car_models(brand_id):
-    """API สำหรับดึงข้อมูลรุ่นรถตามยี่ห้อ"""
+    """API สำหรับดึงข้อมูลรุ่นรถตามยี่ห้อ (จาก taxonomy ในหน่วยความจำ)"""
     try:
-        print(f"API called: /api/car-models/{brand_id}")
-        cursor = get_cursor()
-        
-        # ดึงข้อมูลรุ่นรถจากตาราง car_models โดยตรง
-        cursor.execute("""
-            SELECT car_model_id, car_model_name
-            FROM car_models
-            WHERE car_brand_id = %s
-            ORDER BY car_model_name ASC
-        """, (brand_id,))
-        
-        models = cursor.fetchall()
-        print(f"Found {len(models)} car models for brand {brand_id}: {models}")
-        
-        result = {
-            'models': [{'id': model['car_model_id'], 'name': model['car_model_name']} for model in models]
-        }
-        print(f"Returning result: {result}")
-        
-        return jsonify(result)
-        
+        return etag_json_response(get_vehicle_taxonomy().models_payload(brand_id), VEHICLE_TAXONOMY_CLIENT_MAX_AGE)
     except Exception as e:
         print(f"Error fetching car models: {e}")
         # Fallback data สำหรับรุ่นรถ
@@ -155,29 +92,9 @@ def get_car_models(brand_id):
 
 @customer.route('/api/car-years/<int:model_id>')
 def get_car_years(model_id):
-    """API สำหรับดึงข้อมูลปีที่ผลิตตามรุ่นรถ"""
+    """API สำหรับดึงข้อมูลปีที่ผลิตที่มียางรองรับตามรุ่นรถ (จาก taxonomy ในหน่วยความจำ)"""
     try:
-        cursor = get_cursor()
-        
-        # ดึงข้อมูลปีที่ผลิตที่มีการแมทซ์ในตาราง tire_model_vehicle_targets
-        cursor.execute("""
-            SELECT DISTINCT cmy.production_year
-            FROM car_model_years cmy
-            JOIN tire_model_vehicle_targets tvt ON cmy.car_model_year_id = tvt.car_model_year_id
-            WHERE cmy.car_model_id = %s
-            ORDER BY cmy.production_year DESC
-        """, (model_id,))
-        
-        years = cursor.fetchall()
-        print(f"Found {len(years)} matched years for model {model_id}: {years}")
-        
-        # ส่งกลับเฉพาะปี
-        year_list = [year['production_year'] for year in years]
-        
-        return jsonify({
-            'years': year_list
-        })
-        
+        return etag_json_response(get_vehicle_taxonomy().years_payload(model_id), VEHICLE_TAXONOMY_CLIENT_MAX_AGE)
     except Exception as e:
         print(f"Error fetching car years: {e}")
         return jsonify({'years': []})
@@ -199,153 +116,65 @@ def tires():
     try:
         cursor = get_cursor()
         
-        # Commit เพื่อให้แน่ใจว่าข้อมูลล่าสุดถูกดึงมา
-        get_db().commit()
-        
-        # สร้าง query พื้นฐาน
-        base_query = """
-            SELECT t.*, b.brand_name, b.brand_id, m.model_name
-            FROM tires t
-            JOIN tire_models m ON t.model_id = m.model_id
-            JOIN brands b ON m.brand_id = b.brand_id
-            WHERE 1=1
-        """
-        
-        params = []
+        # ข้อมูลยางทั้งหมดอยู่ใน catalog index ในหน่วยความจำ (สร้างใหม่เมื่อแอดมินแก้ไขยาง)
+        catalog = get_tire_catalog()
         
-        # เพิ่มเงื่อนไขการกรอง
-        if width:
-            base_query += " AND t.width = %s"
-            params.append(width)
-        
-        if aspect_ratio:
-            base_query += " AND t.aspect_ratio = %s"
-            params.append(aspect_ratio)
-        
-        if rim_diameter:
-            base_query += " AND t.rim_diameter = %s"
-            params.append(rim_diameter)
-        
-        if brand_id:
-            base_query += " AND b.brand_id = %s"
-            params.append(brand_id)
-        
-        # เพิ่มเงื่อนไขการค้นหาแบบ general search
-        if search_query:
-            base_query += """ AND (
-                t.full_size LIKE %s OR 
-                CAST(t.width AS CHAR) LIKE %s OR 
-                CAST(t.aspect_ratio AS CHAR) LIKE %s OR 
-                CAST(t.rim_diameter AS CHAR) LIKE %s OR
-                t.load_index LIKE %s OR
-                t.speed_symbol LIKE %s OR
-                b.brand_name LIKE %s OR
-                m.model_name LIKE %s OR
-                t.service_description LIKE %s OR
-                t.notes LIKE %s OR
-                CONCAT(CAST(t.width AS CHAR), '/', CAST(t.aspect_ratio AS CHAR), 'R', CAST(t.rim_diameter AS CHAR)) LIKE %s OR
-                CONCAT(b.brand_name, ' ', m.model_name) LIKE %s OR
-                CONCAT(b.brand_name, ' ', t.full_size) LIKE %s
-            )"""
-            search_pattern = f"%{search_query}%"
-            params.extend([search_pattern] * 13)
+        filters = dict(width=width, aspect_ratio=aspect_ratio, rim_diameter=rim_diameter,
+                       brand_id=brand_id, search_query=search_query)
         
         # เพิ่มเงื่อนไขการค้นหาจากหน้า recommend
         if usage_type_id or car_brand_id or car_model_id or car_year_id:
-            base_query += """ AND t.model_id IN (
-                SELECT DISTINCT tm.model_id 
-                FROM tire_models tm
-                JOIN tire_model_vehicle_targets tvt ON tm.model_id = tvt.model_id
-                WHERE 1=1
+            model_query = """
+                SELECT DISTINCT tvt.model_id
+                FROM tire_model_vehicle_targets tvt
             """
-            
-            if usage_type_id:
-                base_query += " AND tvt.usage_type_id = %s"
-                params.append(usage_type_id)
+            model_params = []
+            conditions = []
             
             # ค้นหาตามลำดับ: car_brands → car_models → car_model_years → tire_model_vehicle_targets
-            if car_brand_id and car_model_id and car_year_id:
-                # ค้นหาตามยี่ห้อ รุ่น และปีที่ผลิต
-                base_query += """ AND tvt.car_model_year_id IN (
-                    SELECT cmy.car_model_year_id 
-                    FROM car_model_years cmy
-                    JOIN car_models cm ON cmy.car_model_id = cm.car_model_id
-                    JOIN car_brands cb ON cm.car_brand_id = cb.car_brand_id
-                    WHERE cb.car_brand_id = %s 
-                    AND cm.car_model_id = %s 
-                    AND cmy.production_year = %s
-                )"""
-                params.extend([car_brand_id, car_model_id, car_year_id])
-            elif car_brand_id and car_model_id:
-                # ค้นหาตามยี่ห้อและรุ่น
-                base_query += """ AND tvt.car_model_year_id IN (
-                    SELECT cmy.car_model_year_id 
-                    FROM car_model_years cmy
-                    JOIN car_models cm ON cmy.car_model_id = cm.car_model_id
-                    JOIN car_brands cb ON cm.car_brand_id = cb.car_brand_id
-                    WHERE cb.car_brand_id = %s 
-                    AND cm.car_model_id = %s
-                )"""
-                params.extend([car_brand_id, car_model_id])
-            elif car_brand_id:
-                # ค้นหาตามยี่ห้อเท่านั้น
-                base_query += """ AND tvt.car_model_year_id IN (
-                    SELECT cmy.car_model_year_id 
-                    FROM car_model_years cmy
+            if car_brand_id:
+                model_query += """
+                    JOIN car_model_years cmy ON tvt.car_model_year_id = cmy.car_model_year_id
                     JOIN car_models cm ON cmy.car_model_id = cm.car_model_id
-                    JOIN car_brands cb ON cm.car_brand_id = cb.car_brand_id
-                    WHERE cb.car_brand_id = %s
-                )"""
-                params.append(car_brand_id)
+                """
+                conditions.append("cm.car_brand_id = %s")
+                model_params.append(car_brand_id)
+                if car_model_id:
+                    # ค้นหาตามยี่ห้อและรุ่น
+                    conditions.append("cm.car_model_id = %s")
+                    model_params.append(car_model_id)
+                    if car_year_id:
+                        # ค้นหาตามยี่ห้อ รุ่น และปีที่ผลิต
+                        conditions.append("cmy.production_year = %s")
+                        model_params.append(car_year_id)
             
-            base_query += ")"
+            if usage_type_id:
+                conditions.append("tvt.usage_type_id = %s")
+                model_params.append(usage_type_id)
             
-            # เพิ่ม ORDER BY
-            base_query += " ORDER BY t.full_size ASC, t.price_each ASC, t.price_set ASC"
+            if conditions:
+                model_query += " WHERE " + " AND ".join(conditions)
             
-            # Execute query หลัก
-            print(f"Car search query: {base_query}")
-            print(f"Car search params: {params}")
-            cursor.execute(base_query, params)
-            tires = cursor.fetchall()
+            cursor.execute(model_query, model_params)
+            model_ids = {row['model_id'] for row in cursor.fetchall()}
+            tires = catalog.search(model_ids=model_ids, **filters)
             print(f"Found {len(tires)} tires for car search")
             
             # ถ้าไม่พบผลลัพธ์ ให้ลองค้นหาตามลักษณะการใช้งานเท่านั้น
             if not tires and usage_type_id:
-                # ลองค้นหาตามลักษณะการใช้งานเท่านั้น
-                fallback_query = """
-                    SELECT t.*, b.brand_name, b.brand_id, m.model_name
-                    FROM tires t
-                    JOIN tire_models m ON t.model_id = m.model_id
-                    JOIN brands b ON m.brand_id = b.brand_id
-                    JOIN tire_model_vehicle_targets tvt ON m.model_id = tvt.model_id
-                    WHERE tvt.usage_type_id = %s
-                    ORDER BY t.full_size ASC, t.price_each ASC, t.price_set ASC
-                """
-                cursor.execute(fallback_query, (usage_type_id,))
-                tires = cursor.fetchall()
+                cursor.execute("""
+                    SELECT DISTINCT model_id
+                    FROM tire_model_vehicle_targets
+                    WHERE usage_type_id = %s
+                """, (usage_type_id,))
+                usage_model_ids = {row['model_id'] for row in cursor.fetchall()}
+                tires = catalog.search(model_ids=usage_model_ids)
                 
                 # ถ้ายังไม่พบ ให้แสดงยางทั่วไปทั้งหมด
                 if not tires:
-                    general_query = """
-                        SELECT t.*, b.brand_name, b.brand_id, m.model_name
-                        FROM tires t
-                        JOIN tire_models m ON t.model_id = m.model_id
-                        JOIN brands b ON m.brand_id = b.brand_id
-                        ORDER BY t.full_size ASC, t.price_each ASC, t.price_set ASC
-                        LIMIT 20
-                    """
-                    cursor.execute(general_query)
-                    tires = cursor.fetchall()
+                    tires = catalog.search(limit=20)
         else:
-            # เพิ่ม ORDER BY สำหรับการค้นหาทั่วไป
-            base_query += " ORDER BY t.full_size ASC, t.price_each ASC, t.price_set ASC"
-            
-            # Execute query ทั่วไป
-            print(f"General search query: {base_query}")
-            print(f"General search params: {params}")
-            cursor.execute(base_query, params)
-            tires = cursor.fetchall()
+            tires = catalog.search(**filters)
             print(f"Found {len(tires)} tires for general search")
         
         # สร้างข้อความแสดงเงื่อนไขการค้นหา
@@ -354,20 +183,9 @@ def tires():
         # ถ้าไม่พบผลลัพธ์จากการค้นหาขนาดยาง ให้แสดงยางทั่วไป
         if not tires and (width or aspect_ratio or rim_diameter):
             print(f"No tires found for search criteria: width={width}, aspect_ratio={aspect_ratio}, rim_diameter={rim_diameter}")
-            print(f"Query: {base_query}")
-            print(f"Params: {params}")
             
             # แสดงยางทั่วไปทั้งหมด
-            general_query = """
-                SELECT t.*, b.brand_name, b.brand_id, m.model_name
-                FROM tires t
-                JOIN tire_models m ON t.model_id = m.model_id
-                JOIN brands b ON m.brand_id = b.brand_id
-                ORDER BY t.full_size ASC, t.price_each ASC, t.price_set ASC
-                LIMIT 20
-            """
-            cursor.execute(general_query)
-            tires = cursor.fetchall()
+            tires = catalog.search(limit=20)
             print(f"Found {len(tires)} general tires")
             
             # เพิ่มข้อความแจ้งเตือนว่าพบยางทั่วไป
@@ -586,13 +404,8 @@ def booking():
                 if existing_vehicle:
                     vehicle_id = existing_vehicle['vehicle_id']
                 else:
-                    # ดึงชื่อยี่ห้อรถจาก brand_id
-                    brand_name = ''
-                    if brand_id:
-                        cursor.execute('SELECT car_brand_name FROM car_brands WHERE car_brand_id = %s', (brand_id,))
-                        brand_result = cursor.fetchone()
-                        if brand_result:
-                            brand_name = brand_result['car_brand_name']
+                    # ชื่อยี่ห้อรถจาก brand_id (อ่านจากข้อมูลที่แคชไว้ ไม่ต้อง query)
+                    brand_name = car_brand_name(brand_id)
                     
                     # สร้างรถใหม่
                     cursor.execute('''
@@ -606,101 +419,23 @@ def booking():
             if not vehicle_id:
                 vehicle_id = 1
             
-            # บันทึกข้อมูลการจอง
-            cursor.execute('''
-                INSERT INTO bookings (customer_id, vehicle_id, booking_date, service_date, service_time, status, note) 
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ''', (customer_id, vehicle_id, current_datetime, preferred_date, preferred_time, 'รอดำเนินการ', notes))
-            
-            booking_id = cursor.lastrowid
-            
-            # บันทึกข้อมูลบริการที่เลือก
-            service_ids = request.form.getlist('service_id')
-            for service_id in service_ids:
-                cursor.execute('''
-                    INSERT INTO booking_items (booking_id, service_id, quantity) 
-                    VALUES (%s, %s, %s)
-                ''', (booking_id, service_id, 1))
-                
-                # บันทึกตัวเลือกของบริการ
-                option_ids = request.form.getlist(f'service_option_{service_id}')
-                for option_id in option_ids:
-                    cursor.execute('''
-                        INSERT INTO booking_item_options (item_id, option_id) 
-                        VALUES (LAST_INSERT_ID(), %s)
-                    ''', (option_id,))
+            # เตรียมบริการและข้อมูลยาง (ชื่อยี่ห้อ/รุ่นยางอ่านจากแคช) ก่อนล็อกคิว
+            services = services_from_form(request.form)
+            tires = tires_from_form(request.form)
             
-            # บันทึกข้อมูลยาง
-            tire_front_size = request.form.get('tire_front_size', '').strip()
-            tire_front_brand_id = request.form.get('tire_front_brand_id', '').strip()
-            tire_front_model_id = request.form.get('tire_front_model_id', '').strip()
-            tire_rear_size = request.form.get('tire_rear_size', '').strip()
-            tire_rear_brand_id = request.form.get('tire_rear_brand_id', '').strip()
-            tire_rear_model_id = request.form.get('tire_rear_model_id', '').strip()
-            tire_front_left = request.form.get('dot_front_left', '').strip()
-            tire_front_right = request.form.get('dot_front_right', '').strip()
-            tire_rear_left = request.form.get('dot_rear_left', '').strip()
-            tire_rear_right = request.form.get('dot_rear_right', '').strip()
-            
-            # ดึงข้อมูลยี่ห้อและรุ่นยางจาก ID
-            front_brand_name = ''
-            front_model_name = ''
-            rear_brand_name = ''
-            rear_model_name = ''
-            
-            if tire_front_brand_id:
-                cursor.execute('SELECT brand_name FROM brands WHERE brand_id = %s', (tire_front_brand_id,))
-                brand_result = cursor.fetchone()
-                if brand_result:
-                    front_brand_name = brand_result['brand_name']
-            
-            if tire_front_model_id:
-                cursor.execute('SELECT model_name FROM tire_models WHERE model_id = %s', (tire_front_model_id,))
-                model_result = cursor.fetchone()
-                if model_result:
-                    front_model_name = model_result['model_name']
-            
-            if tire_rear_brand_id:
-                cursor.execute('SELECT brand_name FROM brands WHERE brand_id = %s', (tire_rear_brand_id,))
-                brand_result = cursor.fetchone()
-                if brand_result:
-                    rear_brand_name = brand_result['brand_name']
-            
-            if tire_rear_model_id:
-                cursor.execute('SELECT model_name FROM tire_models WHERE model_id = %s', (tire_rear_model_id,))
-                model_result = cursor.fetchone()
-                if model_result:
-                    rear_model_name = model_result['model_name']
-            
-            # บันทึกข้อมูลยาง 4 แถว (front_left, front_right, rear_left, rear_right) ลงในตาราง service_tires
-            # Front Left
-            cursor.execute('''
-                INSERT INTO service_tires (booking_id, position, brand, model, size, dot) 
-                VALUES (%s, %s, %s, %s, %s, %s)
-            ''', (booking_id, 'front_left', front_brand_name, front_model_name, tire_front_size, tire_front_left))
-            
-            # Front Right
-            cursor.execute('''
-                INSERT INTO service_tires (booking_id, position, brand, model, size, dot) 
-                VALUES (%s, %s, %s, %s, %s, %s)
-            ''', (booking_id, 'front_right', front_brand_name, front_model_name, tire_front_size, tire_front_right))
-            
-            # Rear Left
-            cursor.execute('''
-                INSERT INTO service_tires (booking_id, position, brand, model, size, dot) 
-                VALUES (%s, %s, %s, %s, %s, %s)
-            ''', (booking_id, 'rear_left', rear_brand_name, rear_model_name, tire_rear_size, tire_rear_left))
-            
-            # Rear Right
-            cursor.execute('''
-                INSERT INTO service_tires (booking_id, position, brand, model, size, dot) 
-                VALUES (%s, %s, %s, %s, %s, %s)
-            ''', (booking_id, 'rear_right', rear_brand_name, rear_model_name, tire_rear_size, tire_rear_right))
+            # จองคิวในรอบเวลา (ล็อกตัวนับของรอบนี้จนกว่าจะ commit) แล้วบันทึกการจอง บริการ และยาง
+            create_booking(cursor, customer_id, vehicle_id, current_datetime, preferred_date, preferred_time,
+                           'รอดำเนินการ', notes, services, tires, enforce_capacity=True)
             
             get_db().commit()
+            bookings_changed()
             flash('จองบริการสำเร็จแล้ว', 'success')
             return redirect(url_for('customer.home'))
             
+        except SlotFullError as e:
+            get_db().rollback()
+            flash(str(e), 'error')
+            return redirect(url_for('customer.booking'))
         except Exception as e:
             print(f"Error in booking: {e}")
             flash('เกิดข้อผิดพลาดในการจองบริการ', 'error')
@@ -958,6 +693,7 @@ def booking():
                                       customer_data=customer_data,
                                       vehicle_data=vehicle_data,
                                       customer_vehicles=customer_vehicles,
+                                      slot_times=slot_times(),
                                       user_name=session.get('customer_name', ''))
         
     except Exception as e:
@@ -1000,6 +736,7 @@ def booking():
                                       customer_data=None,
                                       vehicle_data=None,
                                       customer_vehicles=[],
+                                      slot_times=slot_times(),
                                       user_name=session.get('customer_name', ''))
 
 @customer.route('/recommend', methods=['GET', 'POST'])
@@ -1114,18 +851,8 @@ def recommend():
 def promotions():
     """หน้าโปรโมชั่น"""
     try:
-        cursor = get_cursor()
-        
-        # ดึงข้อมูลโปรโมชันที่ใช้งานได้ (มีวันที่ปัจจุบันอยู่ในช่วงโปรโมชัน)
-        cursor.execute("""
-            SELECT promotion_id, title, description, image_url,
-                   start_date, end_date
-            FROM promotions
-            WHERE start_date <= CURDATE() AND end_date >= CURDATE()
-            ORDER BY start_date DESC
-        """)
-        promotions = cursor.fetchall()
-        print(f"Promotions page - Found {len(promotions)} active promotions: {promotions}")
+        # โปรโมชันที่ใช้งานได้วันนี้จาก cache
+        promotions = active_promotions()
         
         return render_customer_template('customer/promotions.html', promotions=promotions)
         
@@ -1182,53 +909,44 @@ def booking_history():
         status_filter = request.args.get('status', '')
         date_filter = request.args.get('date_filter', '')
         per_page = 10
-        offset = (page - 1) * per_page
-        
-        # สร้าง query พื้นฐาน
-        base_query = """
-            SELECT b.booking_id, b.booking_date, b.service_date, b.service_time, b.status, b.note,
-                   v.license_plate, v.license_province, v.brand_name, v.model_name
-            FROM bookings b
-            JOIN vehicles v ON b.vehicle_id = v.vehicle_id
-            WHERE b.customer_id = %s
-        """
+        
+        # เงื่อนไขพื้นฐาน
+        where = ["b.customer_id = %s"]
         params = [customer_id]
         
         # เพิ่มเงื่อนไขการกรอง
         if status_filter:
-            base_query += " AND b.status = %s"
+            where.append("b.status = %s")
             params.append(status_filter)
         
         if date_filter:
             if date_filter == '7':
-                base_query += " AND b.booking_date >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)"
+                where.append("b.booking_date >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)")
             elif date_filter == '30':
-                base_query += " AND b.booking_date >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)"
+                where.append("b.booking_date >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)")
             elif date_filter == '90':
-                base_query += " AND b.booking_date >= DATE_SUB(CURDATE(), INTERVAL 90 DAY)"
-        
-        # นับจำนวนทั้งหมด
-        count_query = f"SELECT COUNT(*) as total FROM ({base_query}) as subquery"
-        cursor.execute(count_query, params)
-        total_bookings = cursor.fetchone()['total']
-        total_pages = (total_bookings + per_page - 1) // per_page
-        
-        # ดึงข้อมูลการจอง
-        query = base_query + " ORDER BY b.booking_date DESC LIMIT %s OFFSET %s"
-        params.extend([per_page, offset])
-        cursor.execute(query, params)
-        bookings = cursor.fetchall()
-        
-        # ดึงข้อมูลบริการสำหรับแต่ละการจอง
+                where.append("b.booking_date >= DATE_SUB(CURDATE(), INTERVAL 90 DAY)")
+        
+        # ดึงข้อมูลการจองแบบ keyset ตาม (booking_date, booking_id) ใหม่ไปเก่า
+        result = KeysetQuery(
+            select="""b.booking_id, b.booking_date, b.service_date, b.service_time, b.status, b.note,
+                   v.license_plate, v.license_province, v.brand_name, v.model_name""",
+            from_clause="bookings b JOIN vehicles v ON b.vehicle_id = v.vehicle_id",
+            keys=[('b.booking_date', 'DESC'), ('b.booking_id', 'DESC')],
+            where=where, params=params, per_page=per_page, versions=(BOOKINGS_VERSION,),
+        ).fetch(cursor, page=page, after=request.args.get('cursor'))
+        bookings = result.rows
+        total_bookings = result.total
+        total_pages = result.total_pages
+        
+        # ดึงข้อมูลบริการของทุกการจองในหน้านี้ด้วย query เดียว แล้วเรียงตามหมวดหมู่และชื่อบริการ
+        services = load_booking_services(cursor, [booking['booking_id'] for booking in bookings])
         for booking in bookings:
-            cursor.execute("""
-                SELECT s.service_name, s.category
-                FROM booking_items bi
-                JOIN services s ON bi.service_id = s.service_id
-                WHERE bi.booking_id = %s
-                ORDER BY s.category, s.service_name
-            """, (booking['booking_id'],))
-            booking['services'] = cursor.fetchall()
+            booking['services'] = sorted(
+                ({'service_name': item['service_name'], 'category': item['category']}
+                 for item in services.get(booking['booking_id'], [])),
+                key=lambda service: (service['category'] is not None, service['category'] or '',
+                                     service['service_name'] or ''))
         
         return render_customer_template('customer/booking_history.html',
                              bookings=bookings,
@@ -1277,6 +995,7 @@ def profile():
                 SET first_name = %s, last_name = %s, phone = %s 
                 WHERE customer_id = %s
             ''', (first_name, last_name, phone, session.get('customer_id')))
+            index_bookings(cursor, customer_ids=[session.get('customer_id')])
             
             # อัปเดต name ในตาราง users ด้วย
             cursor.execute('''
@@ -1289,6 +1008,7 @@ def profile():
             session['customer_name'] = name
             
             get_db().commit()
+            customers_changed([session.get('customer_id')])
             flash('อัปเดตข้อมูลเรียบร้อยแล้ว', 'success')
             return redirect(url_for('customer.profile'))
             
@@ -1346,8 +1066,7 @@ def edit_profile():
                         filename = f"{customer_id}_{timestamp}_{secure_filename(file.filename)}"
                         
                         # บันทึกไฟล์
-                        file_path = os.path.join(current_app.config['PROFILE_UPLOAD_FOLDER'], filename)
-                        file.save(file_path)
+                        save_upload(file, current_app.config['PROFILE_UPLOAD_FOLDER'], filename)
                         avatar_filename = filename
                         
                         # ลบไฟล์เก่าถ้ามี
@@ -1355,9 +1074,7 @@ def edit_profile():
                         cursor.execute('SELECT avatar_filename FROM users WHERE user_id = (SELECT user_id FROM customers WHERE customer_id = %s)', (customer_id,))
                         user_data = cursor.fetchone()
                         if user_data and user_data.get('avatar_filename'):
-                            old_file_path = os.path.join(current_app.config['PROFILE_UPLOAD_FOLDER'], user_data['avatar_filename'])
-                            if os.path.exists(old_file_path):
-                                os.remove(old_file_path)
+                            delete_upload(current_app.config['PROFILE_UPLOAD_FOLDER'], user_data['avatar_filename'])
                     else:
                         flash('นามสกุลไฟล์ไม่ถูกต้อง กรุณาใช้ไฟล์ JPG, PNG เท่านั้น', 'error')
                         return redirect(url_for('customer.edit_profile'))
@@ -1369,6 +1086,7 @@ def edit_profile():
                 SET first_name = %s, last_name = %s, phone = %s, email = %s 
                 WHERE customer_id = %s
             ''', (first_name, last_name, phone, email, customer_id))
+            index_bookings(cursor, customer_ids=[customer_id])
             
             if avatar_filename:
                 cursor.execute('''
@@ -1382,6 +1100,8 @@ def edit_profile():
             if avatar_filename:
                 session['customer_avatar'] = avatar_filename
             
+            get_db().commit()
+            customers_changed([customer_id])
             flash('อัปเดตข้อมูลเรียบร้อยแล้ว', 'success')
             return redirect(url_for('customer.profile'))
             
@@ -1546,15 +1266,9 @@ def update_avatar():
                 
                 # สร้างโฟลเดอร์ถ้ายังไม่มี
                 upload_folder = current_app.config['PROFILE_UPLOAD_FOLDER']
-                os.makedirs(upload_folder, exist_ok=True)
                 
                 # บันทึกไฟล์
-                file_path = os.path.join(upload_folder, filename)
-                print(f"Attempting to save file to: {file_path}")
-                print(f"Upload folder exists: {os.path.exists(upload_folder)}")
-                print(f"Upload folder: {upload_folder}")
-                
-                file.save(file_path)
+                file_path = save_upload(file, upload_folder, filename)
                 
                 # ตรวจสอบว่าไฟล์ถูกบันทึกจริง
                 if not os.path.exists(file_path):
@@ -1569,9 +1283,7 @@ def update_avatar():
                 cursor.execute('SELECT avatar_filename FROM users WHERE user_id = (SELECT user_id FROM customers WHERE customer_id = %s)', (customer_id,))
                 user_data = cursor.fetchone()
                 if user_data and user_data.get('avatar_filename'):
-                    old_file_path = os.path.join(current_app.config['PROFILE_UPLOAD_FOLDER'], user_data['avatar_filename'])
-                    if os.path.exists(old_file_path):
-                        os.remove(old_file_path)
+                    delete_upload(current_app.config['PROFILE_UPLOAD_FOLDER'], user_data['avatar_filename'])
                 
                 # อัปเดตฐานข้อมูล
                 cursor.execute('''
@@ -1644,24 +1356,9 @@ def render_customer_template(template_name: str, **context):
     return render_template(template_name, **context)
 # ฟังก์ชันสำหรับบันทึกการเข้าชมหน้าเว็บ
 def log_page_view(page_id: str):
-    """บันทึกการเข้าชมหน้าเว็บ"""
+    """บันทึกการเข้าชมหน้าเว็บ (บัฟเฟอร์ไว้แล้วเขียนลงฐานข้อมูลเป็นชุดโดย page_view_recorder)"""
     try:
-        # สร้างตาราง page_views ถ้ายังไม่มี
-        ensure_page_views_table()
-        
-        cursor = get_cursor()
-        
-        # อัปเดตหรือเพิ่มข้อมูลใน page_views
-        cursor.execute("""
-            INSERT INTO page_views (page_id, views, last_viewed_at)
-            VALUES (%s, 1, %s)
-            ON DUPLICATE KEY UPDATE 
-            views = views + 1,
-            last_viewed_at = %s
-        """, (page_id, datetime.now(), datetime.now()))
-        
-        get_db().commit()
-        
+        record_page_view(page_id)
     except Exception as e:
         print(f"Error logging page view: {e}")
 
@@ -1683,19 +1380,3 @@ def get_device_type(user_agent):
         return 'tablet'
     else:
         return 'desktop'
-
-# ฟังก์ชันสำหรับสร้างตาราง page_views
-def ensure_page_views_table():
-    """สร้างตาราง page_views ถ้ายังไม่มี"""
-    try:
-        cursor = get_cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS page_views (
-                page_id VARCHAR(100) NOT NULL PRIMARY KEY,
-                views INT DEFAULT 0,
-                last_viewed_at DATETIME DEFAULT NULL
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        """)
-        get_db().commit()
-    except Exception as e:
-        print(f"Error ensuring page_views table: {e}")
\ No newline at end of file
@@ -0,0 +1,33 @@
+import hmac
+from flask import Blueprint, Response, request, session, current_app, abort
+from metrics import metrics_text
+
+monitoring = Blueprint('monitoring', __name__)
+
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+
+def _scrape_allowed():
+    """อนุญาต scrape เมื่อส่ง METRICS_TOKEN ถูกต้อง, เป็นแอดมินที่ล็อกอินอยู่
+    หรือไม่ได้ตั้ง token และเรียกจากเครื่องเดียวกัน"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        supplied = request.headers.get('Authorization', '')
+        if supplied.startswith('Bearer '):
+            supplied = supplied[len('Bearer '):]
+        else:
+            supplied = request.args.get('token', '')
+        if supplied and hmac.compare_digest(supplied, token):
+            return True
+    if session.get('role') == 'admin' and session.get('admin_user_id'):
+        return True
+    return not token and request.remote_addr in LOCAL_ADDRESSES
+
+
+@monitoring.route('/metrics')
+def metrics():
+    """สถิติของทุก gunicorn worker ในรูปแบบ Prometheus text exposition"""
+    if not _scrape_allowed():
+        abort(404)
+    return Response(metrics_text(), content_type='text/plain; version=0.0.4; charset=utf-8',
+                    headers={'Cache-Control': 'no-store'})
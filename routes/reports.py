@@ -0,0 +1,116 @@
+from functools import wraps
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, current_app, send_file
+from report_jobs import queue, submit_report, DONE, ERROR
+
+reports = Blueprint('reports', __name__, url_prefix='/reports')
+
+
+def _requester():
+    """ผู้ส่งงานรายงานในรูป 'role:user_id' (เฉพาะแอดมินและเจ้าของกิจการ)"""
+    role = session.get('role')
+    if role == 'admin' and session.get('admin_user_id'):
+        return f"admin:{session['admin_user_id']}"
+    if role == 'owner' and session.get('owner_user_id'):
+        return f"owner:{session['owner_user_id']}"
+    return None
+
+
+def report_access_required(f):
+    """Decorator สำหรับหน้ารายงาน อนุญาตเฉพาะแอดมินและเจ้าของกิจการ"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not _requester():
+            flash('คุณไม่มีสิทธิ์เข้าถึงส่วนนี้ กรุณาเข้าสู่ระบบ', 'error')
+            return redirect(url_for('auth.login', next=request.path))
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def _get_own_job(job_id):
+    job = queue.get_job(job_id)
+    if not job or job.get('requested_by') != _requester():
+        return None
+    return job
+
+
+def _send_report(job):
+    path = queue.result_path(job)
+    if not path:
+        return None
+    return send_file(path, as_attachment=True, download_name=job['filename'], mimetype='application/pdf')
+
+
+def report_response(kind, params):
+    """ส่งงานรายงานเข้าคิวแล้วรอสั้นๆ
+
+    ถ้าเสร็จทันเวลา (หรือมีในแคช) จะส่งไฟล์ PDF กลับเลย ไม่อย่างนั้นพาไปหน้าสถานะงาน
+    """
+    job_id = submit_report(kind, params, requested_by=_requester())
+    job = queue.wait(job_id, current_app.config.get('REPORT_SYNC_WAIT', 5))
+    if job and job['status'] == DONE:
+        response = _send_report(job)
+        if response is not None:
+            return response
+    return redirect(url_for('reports.job_status', job_id=job_id))
+
+
+@reports.route('/jobs', methods=['POST'])
+@report_access_required
+def submit_job():
+    """ส่งงานสร้างรายงาน (JSON: {"kind": ..., "params": {...}}) คืนค่า job_id"""
+    data = request.get_json(silent=True) or request.form
+    kind = data.get('kind')
+    params = data.get('params') or {}
+    if not isinstance(params, dict):
+        return jsonify({'success': False, 'error': 'params ต้องเป็น object'}), 400
+    if kind == 'admin_booking_report' and session.get('role') != 'admin':
+        return jsonify({'success': False, 'error': 'ไม่มีสิทธิ์'}), 403
+    if kind in ('owner_bookings_report', 'page_views_report') and session.get('role') != 'owner':
+        return jsonify({'success': False, 'error': 'ไม่มีสิทธิ์'}), 403
+    try:
+        job_id = submit_report(kind, params, requested_by=_requester())
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': url_for('reports.job_status', job_id=job_id),
+    }), 202
+
+
+@reports.route('/jobs/<job_id>')
+@report_access_required
+def job_status(job_id):
+    """สถานะงานรายงาน (JSON สำหรับ polling หรือหน้า HTML ที่รีเฟรชตัวเอง)"""
+    job = _get_own_job(job_id)
+    if not job:
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({'success': False, 'error': 'ไม่พบงานรายงาน'}), 404
+        flash('ไม่พบงานรายงาน หรือรายงานหมดอายุแล้ว', 'error')
+        return redirect(url_for('admin.booking_report' if session.get('role') == 'admin' else 'owner.dashboard'))
+
+    download_url = url_for('reports.download', job_id=job_id) if job['status'] == DONE else None
+    if request.accept_mimetypes.best == 'application/json' or request.args.get('format') == 'json':
+        return jsonify({
+            'success': job['status'] != ERROR,
+            'job_id': job_id,
+            'status': job['status'],
+            'cached': job.get('cached', False),
+            'error': job.get('error'),
+            'download_url': download_url,
+        })
+
+    layout = 'layout.html' if session.get('role') == 'admin' else 'owner/layout.html'
+    return render_template('report_job.html', job=job, layout=layout, download_url=download_url)
+
+
+@reports.route('/jobs/<job_id>/download')
+@report_access_required
+def download(job_id):
+    """ดาวน์โหลดไฟล์ PDF ของงานที่เสร็จแล้ว"""
+    job = _get_own_job(job_id)
+    response = _send_report(job) if job else None
+    if response is None:
+        flash('รายงานยังไม่พร้อม กรุณารอสักครู่', 'error')
+        return redirect(url_for('reports.job_status', job_id=job_id))
+    return response
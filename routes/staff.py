@@ -2,8 +2,14 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_wtf.csrf import CSRFError
 from database import get_cursor, get_db
 from utils import allowed_file
+from upload_store import save_upload, delete_upload
 from decorators import login_required, staff_required
-import os
+from booking_details import load_booking_services, service_summary
+from booking_slots import lock_booking_slot, move_booking_slot, slot_key, slot_times
+from booking_service import create_booking, update_booking, services_from_form, tires_from_form, bookings_changed, BOOKINGS_VERSION
+from pagination import KeysetQuery
+from customer_search import CUSTOMERS_VERSION
+from booking_search import booking_search_condition
 import json
 from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
@@ -71,86 +77,14 @@ def add_booking():
         vehicle_id = request.form['vehicle_id']
         booking_date = request.form['booking_date']
         status = request.form['status']
-        cursor.execute('''INSERT INTO bookings (customer_id, vehicle_id, booking_date, status) VALUES (%s, %s, %s, %s)''',
-            (customer_id, vehicle_id, booking_date, status))
-        booking_id = cursor.lastrowid
-        # เพิ่ม booking_items และ booking_item_options
-        service_ids = request.form.getlist('service_id')
-        for sid in service_ids:
-            cursor.execute('''INSERT INTO booking_items (booking_id, service_id) VALUES (%s, %s)''', (booking_id, sid))
-            item_id = cursor.lastrowid
-            option_field = f'service_option_{sid}'
-            option_ids = request.form.getlist(option_field)
-            for option_id in option_ids:
-                cursor.execute('''INSERT INTO booking_item_options (item_id, option_id) VALUES (%s, %s)''', (item_id, option_id))
-        # --- เพิ่มการบันทึกข้อมูลยางลง service_tires ---
-        tire_front_size = request.form.get('tire_front_size', '').strip()
-        tire_front_brand_id = request.form.get('tire_front_brand_id', '').strip()
-        tire_front_model_id = request.form.get('tire_front_model_id', '').strip()
-        tire_rear_size = request.form.get('tire_rear_size', '').strip()
-        tire_rear_brand_id = request.form.get('tire_rear_brand_id', '').strip()
-        tire_rear_model_id = request.form.get('tire_rear_model_id', '').strip()
-        tire_front_left = request.form.get('dot_front_left', '').strip()
-        tire_front_right = request.form.get('dot_front_right', '').strip()
-        tire_rear_left = request.form.get('dot_rear_left', '').strip()
-        tire_rear_right = request.form.get('dot_rear_right', '').strip()
-        
-        # ดึงข้อมูลยี่ห้อและรุ่นยางจาก ID
-        front_brand_name = ''
-        front_model_name = ''
-        rear_brand_name = ''
-        rear_model_name = ''
-        
-        if tire_front_brand_id:
-            cursor.execute('SELECT brand_name FROM brands WHERE brand_id = %s', (tire_front_brand_id,))
-            brand_result = cursor.fetchone()
-            if brand_result:
-                front_brand_name = brand_result['brand_name']
-        
-        if tire_front_model_id:
-            cursor.execute('SELECT model_name FROM tire_models WHERE model_id = %s', (tire_front_model_id,))
-            model_result = cursor.fetchone()
-            if model_result:
-                front_model_name = model_result['model_name']
-        
-        if tire_rear_brand_id:
-            cursor.execute('SELECT brand_name FROM brands WHERE brand_id = %s', (tire_rear_brand_id,))
-            brand_result = cursor.fetchone()
-            if brand_result:
-                rear_brand_name = brand_result['brand_name']
-        
-        if tire_rear_model_id:
-            cursor.execute('SELECT model_name FROM tire_models WHERE model_id = %s', (tire_rear_model_id,))
-            model_result = cursor.fetchone()
-            if model_result:
-                rear_model_name = model_result['model_name']
-        
-        # บันทึกข้อมูลยาง 4 แถว (front_left, front_right, rear_left, rear_right) ลงในตาราง service_tires
-        # Front Left
-        cursor.execute('''
-            INSERT INTO service_tires (booking_id, position, brand, model, size, dot) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', (booking_id, 'front_left', front_brand_name, front_model_name, tire_front_size, tire_front_left))
-        
-        # Front Right
-        cursor.execute('''
-            INSERT INTO service_tires (booking_id, position, brand, model, size, dot) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', (booking_id, 'front_right', front_brand_name, front_model_name, tire_front_size, tire_front_right))
-        
-        # Rear Left
-        cursor.execute('''
-            INSERT INTO service_tires (booking_id, position, brand, model, size, dot) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', (booking_id, 'rear_left', rear_brand_name, rear_model_name, tire_rear_size, tire_rear_left))
-        
-        # Rear Right
-        cursor.execute('''
-            INSERT INTO service_tires (booking_id, position, brand, model, size, dot) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', (booking_id, 'rear_right', rear_brand_name, rear_model_name, tire_rear_size, tire_rear_right))
+        # บันทึกการจอง บริการ บริการย่อย และข้อมูลยางผ่าน booking_service (INSERT หลายแถว)
+        create_booking(cursor, customer_id, vehicle_id, booking_date,
+                       request.form.get('service_date') or None, request.form.get('service_time') or None,
+                       status, request.form.get('note', '').strip(),
+                       services_from_form(request.form), tires_from_form(request.form))
         
         get_db().commit()
+        bookings_changed()
         flash('เพิ่มการจองสำเร็จ')
         return redirect(url_for('staff.bookings'))
     
@@ -211,6 +145,8 @@ def add_booking():
     
     return render_template('staff/booking_form.html', 
                          booking=None,
+                         slot_times=slot_times(),
+                         selected_time=None,
                          customers=customers,
                          vehicles=vehicles,
                          services=services,
@@ -238,65 +174,39 @@ def bookings():
         status_filter = request.args.get('status', '').strip()
         page = int(request.args.get('page', 1))
         per_page = 10
-        offset = (page - 1) * per_page
         
-        # สร้าง query สำหรับการจองปัจจุบัน - แสดงการจองทั้งหมด
-        query = '''SELECT b.booking_id, b.booking_date, b.service_date, b.service_time, b.status, c.first_name, c.last_name, v.license_plate, v.license_province
-                   FROM bookings b
-                   JOIN customers c ON b.customer_id = c.customer_id
-                   JOIN vehicles v ON b.vehicle_id = v.vehicle_id'''
         page_title = "ข้อมูลการจอง"
         
         params = []
         where_conditions = []
         
         if search:
-            where_conditions.append('(c.first_name LIKE %s OR c.last_name LIKE %s OR v.license_plate LIKE %s)')
-            like = f"%{search}%"
-            params.extend([like, like, like])
+            # ค้นชื่อลูกค้า/ทะเบียนรถจากตาราง booking_search_keys (index) แทน LIKE '%...%'
+            condition_sql, condition_params = booking_search_condition(search)
+            where_conditions.append(condition_sql)
+            params.extend(condition_params)
         
         if status_filter:
             where_conditions.append('b.status = %s')
             params.append(status_filter)
         
-        if where_conditions:
-            query += ' WHERE ' + ' AND '.join(where_conditions)
-        
-        # สร้าง query สำหรับนับจำนวนทั้งหมด
-        count_query = '''SELECT COUNT(*) as total
-                         FROM bookings b
-                         JOIN customers c ON b.customer_id = c.customer_id
-                         JOIN vehicles v ON b.vehicle_id = v.vehicle_id'''
-        count_params = []
-        
-        if where_conditions:
-            count_query += ' WHERE ' + ' AND '.join(where_conditions)
-        
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['total']
-        total_pages = (total + per_page - 1) // per_page
-        
-        query += ' ORDER BY b.booking_date DESC LIMIT %s OFFSET %s'
-        params.extend([per_page, offset])
-        
-        # ดึงข้อมูลการจอง
-        cursor.execute(query, params)
-        bookings = cursor.fetchall()
-        
-        # ดึงข้อมูลบริการสำหรับแต่ละการจอง
+        # ดึงข้อมูลการจองแบบ keyset ตาม (booking_date, booking_id) ใหม่ไปเก่า
+        result = KeysetQuery(
+            select='b.booking_id, b.booking_date, b.service_date, b.service_time, b.status, c.first_name, c.last_name, v.license_plate, v.license_province',
+            from_clause='''bookings b
+                   JOIN customers c ON b.customer_id = c.customer_id
+                   JOIN vehicles v ON b.vehicle_id = v.vehicle_id''',
+            keys=[('b.booking_date', 'DESC'), ('b.booking_id', 'DESC')],
+            where=where_conditions, params=params, per_page=per_page,
+            versions=(BOOKINGS_VERSION, CUSTOMERS_VERSION),
+        ).fetch(cursor, page=page, after=request.args.get('cursor'))
+        bookings = result.rows
+        total_pages = result.total_pages
+        
+        # ดึงข้อมูลบริการของทุกการจองในชุดเดียว (query แบบ IN (...) แทนการ query ทีละการจอง)
+        services = load_booking_services(cursor, [booking['booking_id'] for booking in bookings])
         for booking in bookings:
-            cursor.execute('''
-                SELECT bi.item_id, bi.service_id, bi.quantity, 
-                       s.service_name, s.category,
-                       GROUP_CONCAT(so.option_name SEPARATOR ', ') as options
-                FROM booking_items bi
-                JOIN services s ON bi.service_id = s.service_id
-                LEFT JOIN booking_item_options bio ON bi.item_id = bio.item_id
-                LEFT JOIN service_options so ON bio.option_id = so.option_id
-                WHERE bi.booking_id = %s
-                GROUP BY bi.item_id, bi.service_id, bi.quantity, s.service_name, s.category
-            ''', (booking['booking_id'],))
-            booking['services'] = cursor.fetchall()
+            booking['services'] = [service_summary(item) for item in services.get(booking['booking_id'], [])]
             
             # สร้าง service_options สำหรับ dropdown
             booking['service_options'] = {}
@@ -353,9 +263,10 @@ def booking_history():
         where_conditions = []
         
         if search:
-            where_conditions.append('(c.first_name LIKE %s OR c.last_name LIKE %s OR v.license_plate LIKE %s)')
-            like = f"%{search}%"
-            params.extend([like, like, like])
+            # ค้นชื่อลูกค้า/ทะเบียนรถจากตาราง booking_search_keys (index) แทน LIKE '%...%'
+            condition_sql, condition_params = booking_search_condition(search)
+            where_conditions.append(condition_sql)
+            params.extend(condition_params)
         
         if status_filter:
             where_conditions.append('b.status = %s')
@@ -378,20 +289,10 @@ def booking_history():
         cursor.execute(query, params)
         bookings = cursor.fetchall()
         
-        # ดึงข้อมูลบริการสำหรับแต่ละการจอง
+        # ดึงข้อมูลบริการของทุกการจองในชุดเดียว (query แบบ IN (...) แทนการ query ทีละการจอง)
+        services = load_booking_services(cursor, [booking['booking_id'] for booking in bookings])
         for booking in bookings:
-            cursor.execute('''
-                SELECT bi.item_id, bi.service_id, bi.quantity, 
-                       s.service_name, s.category,
-                       GROUP_CONCAT(so.option_name SEPARATOR ', ') as options
-                FROM booking_items bi
-                JOIN services s ON bi.service_id = s.service_id
-                LEFT JOIN booking_item_options bio ON bi.item_id = bio.item_id
-                LEFT JOIN service_options so ON bio.option_id = so.option_id
-                WHERE bi.booking_id = %s
-                GROUP BY bi.item_id, bi.service_id, bi.quantity, s.service_name, s.category
-            ''', (booking['booking_id'],))
-            booking['services'] = cursor.fetchall()
+            booking['services'] = [service_summary(item) for item in services.get(booking['booking_id'], [])]
             
             # สร้าง service_options สำหรับ dropdown
             booking['service_options'] = {}
@@ -447,8 +348,7 @@ def profile():
                         filename = f"{user_id}_{timestamp}_{secure_filename(file.filename)}"
                         
                         # บันทึกไฟล์
-                        file_path = os.path.join(current_app.config['PROFILE_UPLOAD_FOLDER'], filename)
-                        file.save(file_path)
+                        save_upload(file, current_app.config['PROFILE_UPLOAD_FOLDER'], filename)
                         avatar_filename = filename
                         
                         # ลบไฟล์เก่าถ้ามี
@@ -456,9 +356,7 @@ def profile():
                         cursor.execute('SELECT avatar_filename FROM users WHERE user_id = %s', (user_id,))
                         user_data = cursor.fetchone()
                         if user_data and user_data.get('avatar_filename'):
-                            old_file_path = os.path.join(current_app.config['PROFILE_UPLOAD_FOLDER'], user_data['avatar_filename'])
-                            if os.path.exists(old_file_path):
-                                os.remove(old_file_path)
+                            delete_upload(current_app.config['PROFILE_UPLOAD_FOLDER'], user_data['avatar_filename'])
                     else:
                         flash('นามสกุลไฟล์ไม่ถูกต้อง กรุณาใช้ไฟล์ JPG, PNG เท่านั้น', 'error')
                         return redirect(url_for('staff.profile'))
@@ -570,137 +468,13 @@ def edit_booking(booking_id):
         if not service_time:
             service_time = '09:00'
         
-        cursor.execute('''
-            UPDATE bookings 
-            SET service_date = %s, service_time = %s, status = %s, note = %s 
-            WHERE booking_id = %s
-        ''', (service_date, service_time, status, note, booking_id))
-        
-        # --- เพิ่มการบันทึกข้อมูลยางลง service_tires ---
-        # อัปเดต position ของข้อมูลยางที่มีอยู่แล้ว (ก่อนลบข้อมูล)
-        cursor.execute('SELECT * FROM service_tires WHERE booking_id = %s AND (position IS NULL OR position = \'\' OR position REGEXP \'^[0-9]+$\') ORDER BY id', (booking_id,))
-        existing_tires = cursor.fetchall()
-        if existing_tires:
-            positions = ['front_left', 'front_right', 'rear_left', 'rear_right']
-            for i, tire in enumerate(existing_tires):
-                if i < len(positions):
-                    cursor.execute('UPDATE service_tires SET position = %s WHERE id = %s', (positions[i], tire['id']))
-                    print(f"Updated tire ID {tire['id']} to position '{positions[i]}'")
-        
-        # ลบข้อมูลยางเก่าก่อน
-        cursor.execute('DELETE FROM service_tires WHERE booking_id = %s', (booking_id,))
-        
-        # รับข้อมูลยางจากฟอร์ม
-        tire_front_size = request.form.get('tire_front_size', '').strip()
-        tire_front_brand_id = request.form.get('tire_front_brand_id', '').strip()
-        tire_front_model_id = request.form.get('tire_front_model_id', '').strip()
-        tire_rear_size = request.form.get('tire_rear_size', '').strip()
-        tire_rear_brand_id = request.form.get('tire_rear_brand_id', '').strip()
-        tire_rear_model_id = request.form.get('tire_rear_model_id', '').strip()
-        tire_front_left = request.form.get('dot_front_left', '').strip()
-        tire_front_right = request.form.get('dot_front_right', '').strip()
-        tire_rear_left = request.form.get('dot_rear_left', '').strip()
-        tire_rear_right = request.form.get('dot_rear_right', '').strip()
-        
-        # Debug: แสดงข้อมูลยางที่ส่งมา
-        print(f"Debug: Front brand_id: {tire_front_brand_id}, model_id: {tire_front_model_id}")
-        print(f"Debug: Rear brand_id: {tire_rear_brand_id}, model_id: {tire_rear_model_id}")
-        
-        # ดึงข้อมูลยี่ห้อและรุ่นยางจาก ID
-        front_brand_name = ''
-        front_model_name = ''
-        rear_brand_name = ''
-        rear_model_name = ''
-        
-        if tire_front_brand_id:
-            cursor.execute('SELECT brand_name FROM brands WHERE brand_id = %s', (tire_front_brand_id,))
-            brand_result = cursor.fetchone()
-            if brand_result:
-                front_brand_name = brand_result['brand_name']
-        
-        if tire_front_model_id:
-            cursor.execute('SELECT model_name FROM tire_models WHERE model_id = %s', (tire_front_model_id,))
-            model_result = cursor.fetchone()
-            if model_result:
-                front_model_name = model_result['model_name']
-                print(f"Debug: Found front model: {front_model_name}")
-            else:
-                print(f"Debug: No front model found for ID: {tire_front_model_id}")
-        
-        if tire_rear_brand_id:
-            cursor.execute('SELECT brand_name FROM brands WHERE brand_id = %s', (tire_rear_brand_id,))
-            brand_result = cursor.fetchone()
-            if brand_result:
-                rear_brand_name = brand_result['brand_name']
-        
-        if tire_rear_model_id:
-            cursor.execute('SELECT model_name FROM tire_models WHERE model_id = %s', (tire_rear_model_id,))
-            model_result = cursor.fetchone()
-            if model_result:
-                rear_model_name = model_result['model_name']
-                print(f"Debug: Found rear model: {rear_model_name}")
-            else:
-                print(f"Debug: No rear model found for ID: {tire_rear_model_id}")
-        
-        # บันทึกข้อมูลยาง 4 แถว (front_left, front_right, rear_left, rear_right) ลงในตาราง service_tires
-        # Front Left
-        cursor.execute('''
-            INSERT INTO service_tires (booking_id, position, brand, model, size, dot) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', (booking_id, 'front_left', front_brand_name, front_model_name, tire_front_size, tire_front_left))
-        
-        # Front Right
-        cursor.execute('''
-            INSERT INTO service_tires (booking_id, position, brand, model, size, dot) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', (booking_id, 'front_right', front_brand_name, front_model_name, tire_front_size, tire_front_right))
-        
-        # Rear Left
-        cursor.execute('''
-            INSERT INTO service_tires (booking_id, position, brand, model, size, dot) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', (booking_id, 'rear_left', rear_brand_name, rear_model_name, tire_rear_size, tire_rear_left))
-        
-        # Rear Right
-        cursor.execute('''
-            INSERT INTO service_tires (booking_id, position, brand, model, size, dot) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', (booking_id, 'rear_right', rear_brand_name, rear_model_name, tire_rear_size, tire_rear_right))
-        
-        # ลบข้อมูลบริการเก่าก่อน
-        cursor.execute('DELETE FROM booking_item_options WHERE item_id IN (SELECT item_id FROM booking_items WHERE booking_id = %s)', (booking_id,))
-        cursor.execute('DELETE FROM booking_items WHERE booking_id = %s', (booking_id,))
-        get_db().commit()  # Commit การลบข้อมูลเก่า
-        
-        # บันทึกข้อมูลบริการที่เลือก
-        services = request.form.getlist('service_id')
-        print(f"Debug: Selected services: {services}")  # Debug print
-        
-        for service_id in services:
-            if service_id.strip():
-                # เพิ่มข้อมูลบริการ
-                cursor.execute('''
-                    INSERT INTO booking_items (booking_id, service_id, quantity) 
-                    VALUES (%s, %s, %s)
-                ''', (booking_id, service_id, 1))
-                
-                item_id = cursor.lastrowid
-                print(f"Debug: Inserted service {service_id} with item_id {item_id}")  # Debug print
-                
-                # เพิ่มข้อมูล options สำหรับบริการนี้
-                options = request.form.getlist(f'service_option_{service_id}')
-                print(f"Debug: Options for service {service_id}: {options}")  # Debug print
-                
-                for option_id in options:
-                    if option_id.strip():
-                        cursor.execute('''
-                            INSERT INTO booking_item_options (item_id, option_id) 
-                            VALUES (%s, %s)
-                        ''', (item_id, option_id))
-                        print(f"Debug: Inserted option {option_id} for item_id {item_id}")  # Debug print
+        # อัปเดตการจอง ย้ายคิว และแก้เฉพาะบริการ/บริการย่อย/ยางที่เปลี่ยน
+        update_booking(cursor, booking_id, service_date, service_time, status, note,
+                       services_from_form(request.form), tires_from_form(request.form))
         
         try:
             get_db().commit()
+            bookings_changed()
             print(f"Debug: Successfully committed all changes for booking {booking_id}")
             flash('อัปเดตข้อมูลการจองสำเร็จ')
             return redirect(url_for('staff.bookings'))
@@ -866,6 +640,8 @@ def edit_booking(booking_id):
     
     return render_template('staff/booking_form.html', 
                          booking=booking,
+                         slot_times=slot_times(),
+                         selected_time=slot_key(booking['service_time']),
                          vehicle_types=vehicle_types,
                          services=services,
                          service_groups=service_groups,
@@ -893,8 +669,12 @@ def update_booking_status(booking_id):
             return jsonify({'success': False, 'error': 'ไม่พบสถานะใหม่'}), 400
         
         cursor = get_cursor()
+        before = lock_booking_slot(cursor, booking_id)
         cursor.execute('UPDATE bookings SET status = %s WHERE booking_id = %s', (new_status, booking_id))
+        if before:
+            move_booking_slot(cursor, before, dict(before, status=new_status))
         get_db().commit()
+        bookings_changed()
         
         return jsonify({'success': True})
         
@@ -909,13 +689,15 @@ def delete_booking(booking_id):
     try:
         cursor = get_cursor()
         
-        # ลบข้อมูลที่เกี่ยวข้อง
+        # คืนคิวแล้วลบข้อมูลที่เกี่ยวข้อง
+        move_booking_slot(cursor, lock_booking_slot(cursor, booking_id), None)
         cursor.execute('DELETE FROM booking_item_options WHERE item_id IN (SELECT item_id FROM booking_items WHERE booking_id = %s)', (booking_id,))
         cursor.execute('DELETE FROM booking_items WHERE booking_id = %s', (booking_id,))
         cursor.execute('DELETE FROM service_tires WHERE booking_id = %s', (booking_id,))
         cursor.execute('DELETE FROM bookings WHERE booking_id = %s', (booking_id,))
         
         get_db().commit()
+        bookings_changed()
         
         return jsonify({'success': True})
         
@@ -954,20 +736,10 @@ def check_queue_detail():
         ''', (date,))
         bookings = cursor.fetchall()
         
-        # ดึงข้อมูลบริการสำหรับแต่ละการจอง
+        # ดึงข้อมูลบริการของทุกการจองในชุดเดียว (query แบบ IN (...) แทนการ query ทีละการจอง)
+        services = load_booking_services(cursor, [booking['booking_id'] for booking in bookings])
         for booking in bookings:
-            cursor.execute('''
-                SELECT bi.item_id, bi.service_id, bi.quantity, 
-                       s.service_name, s.category,
-                       GROUP_CONCAT(so.option_name SEPARATOR ', ') as options
-                FROM booking_items bi
-                JOIN services s ON bi.service_id = s.service_id
-                LEFT JOIN booking_item_options bio ON bi.item_id = bio.item_id
-                LEFT JOIN service_options so ON bio.option_id = so.option_id
-                WHERE bi.booking_id = %s
-                GROUP BY bi.item_id, bi.service_id, bi.quantity, s.service_name, s.category
-            ''', (booking['booking_id'],))
-            booking['services'] = cursor.fetchall()
+            booking['services'] = [service_summary(item) for item in services.get(booking['booking_id'], [])]
         
         return render_template('staff/check_queue_detail.html', 
                              date=date, 
@@ -0,0 +1,244 @@
+import re
+import time
+import threading
+import logging
+from collections import deque, Counter
+
+from flask import g, request, has_request_context
+
+logger = logging.getLogger(__name__)
+
+# ค่าเริ่มต้น (override ได้ผ่าน app.config)
+DEFAULT_N_PLUS_ONE_THRESHOLD = 5
+DEFAULT_WINDOW = 200
+
+# ขอบบนของ bucket histogram: จำนวน statement ต่อ request และเวลา DB รวม (ms)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+DB_TIME_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(sql):
+    """รูปแบบของ statement สำหรับจับ query ซ้ำ (ตัด literal, รวม IN (...) และช่องว่าง)"""
+    shape = _STRING_LITERAL.sub('?', str(sql))
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _PLACEHOLDER_LIST.sub('(?)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+class RequestProfile:
+    """สถิติ SQL ของ request เดียว"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.count = 0
+        self.db_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_sql = None
+        self.shapes = Counter()
+
+    def record(self, sql, elapsed):
+        self.count += 1
+        self.db_time += elapsed
+        if elapsed > self.slowest_time:
+            self.slowest_time = elapsed
+            self.slowest_sql = sql
+        self.shapes[statement_shape(sql)] += 1
+
+    def repeated_shapes(self, threshold):
+        """statement ที่รูปแบบเดียวกันถูกรันตั้งแต่ threshold ครั้งขึ้นไป (สัญญาณของ N+1)"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+class ProfiledCursor:
+    """ห่อ cursor ของ mysql-connector เพื่อจับเวลาทุก execute/executemany ของ request ปัจจุบัน"""
+
+    def __init__(self, cursor, profile):
+        self._cursor = cursor
+        self._profile = profile
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+        return False
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            self._profile.record(operation, time.perf_counter() - start)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            self._profile.record(operation, time.perf_counter() - start)
+
+
+def _bucket(value, bounds):
+    for bound in bounds:
+        if value <= bound:
+            return bound
+    return '+Inf'
+
+
+class EndpointStats:
+    """สถิติย้อนหลังของ endpoint เดียว (เก็บ window ล่าสุดในหน่วยความจำของ process)"""
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.requests = 0
+        self.n_plus_one = Counter()
+
+    def add(self, profile, request_time, repeated):
+        self.requests += 1
+        self.samples.append((profile.count, profile.db_time, request_time))
+        for shape, _ in repeated:
+            self.n_plus_one[shape] += 1
+
+    def summary(self):
+        samples = list(self.samples)
+        counts = sorted(sample[0] for sample in samples)
+        db_times = sorted(sample[1] * 1000 for sample in samples)
+        request_times = sorted(sample[2] * 1000 for sample in samples)
+
+        def percentile(values, p):
+            if not values:
+                return 0
+            return round(values[min(len(values) - 1, int(len(values) * p))], 2)
+
+        count_histogram = Counter(_bucket(value, QUERY_COUNT_BUCKETS) for value in counts)
+        time_histogram = Counter(_bucket(value, DB_TIME_BUCKETS) for value in db_times)
+        return {
+            'requests': self.requests,
+            'window': len(samples),
+            'queries': {
+                'avg': round(sum(counts) / len(counts), 2) if counts else 0,
+                'p50': percentile(counts, 0.5),
+                'p95': percentile(counts, 0.95),
+                'max': counts[-1] if counts else 0,
+                'histogram': {str(bound): count_histogram.get(bound, 0)
+                              for bound in QUERY_COUNT_BUCKETS + ('+Inf',)},
+            },
+            'db_time_ms': {
+                'p50': percentile(db_times, 0.5),
+                'p95': percentile(db_times, 0.95),
+                'max': round(db_times[-1], 2) if db_times else 0,
+                'histogram': {str(bound): time_histogram.get(bound, 0)
+                              for bound in DB_TIME_BUCKETS + ('+Inf',)},
+            },
+            'request_time_ms': {
+                'p50': percentile(request_times, 0.5),
+                'p95': percentile(request_times, 0.95),
+            },
+            'n_plus_one': [{'shape': shape, 'requests': count} for shape, count in self.n_plus_one.most_common(10)],
+        }
+
+
+class SqlProfiler:
+    """ตัววัด SQL ต่อ request: จำนวน statement, เวลา DB รวม, statement ที่ช้าที่สุด และ N+1
+
+    สถิติต่อ endpoint เก็บแยกใน process ของแต่ละ gunicorn worker
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.header = False
+        self.n_plus_one_threshold = DEFAULT_N_PLUS_ONE_THRESHOLD
+        self.window = DEFAULT_WINDOW
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def configure(self, enabled=None, header=None, n_plus_one_threshold=None, window=None):
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if header is not None:
+            self.header = bool(header)
+        if n_plus_one_threshold:
+            self.n_plus_one_threshold = int(n_plus_one_threshold)
+        if window:
+            self.window = int(window)
+
+    def wrap(self, cursor):
+        """คืน cursor ที่ถูกจับเวลา (หรือ cursor เดิมถ้าไม่ได้อยู่ใน request หรือปิดการวัดไว้)"""
+        if cursor is None or not self.enabled or not has_request_context():
+            return cursor
+        profile = g.get('sql_profile')
+        if profile is None:
+            profile = g.sql_profile = RequestProfile()
+        return ProfiledCursor(cursor, profile)
+
+    def start(self):
+        """เริ่มจับเวลา request (before_request)"""
+        if self.enabled:
+            g.sql_profile = RequestProfile()
+
+    def finish(self, response):
+        """บันทึกสถิติของ request ลง endpoint และใส่ header X-SQL-Profile ถ้าเปิดไว้"""
+        profile = g.pop('sql_profile', None)
+        if profile is None or profile.count == 0:
+            # request ที่ไม่ได้ใช้ฐานข้อมูล (เช่นไฟล์ static) ไม่ต้องเก็บสถิติ
+            return response
+        request_time = time.perf_counter() - profile.started_at
+        repeated = profile.repeated_shapes(self.n_plus_one_threshold)
+        endpoint = request.endpoint or 'unknown'
+        with self._lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                stats = self._stats[endpoint] = EndpointStats(self.window)
+            stats.add(profile, request_time, repeated)
+
+        if repeated:
+            shape, count = repeated[0]
+            logger.warning(f"Possible N+1 in {endpoint}: {count}x {shape[:200]}")
+        if self.header:
+            value = f"count={profile.count}; db={profile.db_time * 1000:.1f}ms; " \
+                    f"slowest={profile.slowest_time * 1000:.1f}ms"
+            if repeated:
+                value += f"; n_plus_one={repeated[0][1]}x"
+            response.headers['X-SQL-Profile'] = value
+        return response
+
+    def snapshot(self):
+        """สถิติของทุก endpoint ใน process นี้ เรียงตาม p95 ของจำนวน statement"""
+        with self._lock:
+            items = list(self._stats.items())
+        summaries = {endpoint: stats.summary() for endpoint, stats in items}
+        return dict(sorted(summaries.items(), key=lambda item: item[1]['queries']['p95'], reverse=True))
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+
+profiler = SqlProfiler()
+
+
+def init_app(app):
+    """ตั้งค่าตัววัดจาก app.config และลงทะเบียน after_request"""
+    profiler.configure(
+        enabled=app.config.get('SQL_PROFILE_ENABLED', True),
+        header=app.config.get('SQL_PROFILE_HEADER', app.config.get('DEBUG', False)),
+        n_plus_one_threshold=app.config.get('SQL_N_PLUS_ONE_THRESHOLD'),
+        window=app.config.get('SQL_PROFILE_WINDOW'),
+    )
+    app.before_request(profiler.start)
+    app.after_request(profiler.finish)
+
+
+def profile_cursor(cursor):
+    return profiler.wrap(cursor)
@@ -70,29 +70,46 @@ function initTireSizeSelector() {
         }
     });
 
+    // ต้นไม้ขนาดยาง width → aspect → rim โหลดครั้งเดียวจาก /api/tires/sizes แล้วเลือกต่อในเบราว์เซอร์
+    let sizeTreePromise = null;
+
+    function loadSizeTree() {
+        if (!sizeTreePromise) {
+            sizeTreePromise = fetch('/api/tires/sizes')
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(`HTTP error! status: ${response.status}`);
+                    }
+                    return response.json();
+                })
+                .then(data => {
+                    if (!data.success) {
+                        throw new Error(data.error || 'API error');
+                    }
+                    return data;
+                })
+                .catch(error => {
+                    // ให้ลองโหลดใหม่ได้ในครั้งถัดไป
+                    sizeTreePromise = null;
+                    throw error;
+                });
+        }
+        return sizeTreePromise;
+    }
+
+    function sortedNumbers(values) {
+        return values.map(Number).sort((a, b) => a - b);
+    }
+
     // ฟังก์ชันโหลดรายการ width
     async function loadWidths() {
         try {
             console.log('Loading widths...');
             setLoadingState(widthSelect, 'กำลังโหลด...');
             
-            const response = await fetch('/api/tires/widths');
-            console.log('Response status:', response.status);
-            
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            
-            const data = await response.json();
-            console.log('Widths data:', data);
-            
-            if (data.success) {
-                console.log('Widths loaded successfully:', data.items);
-                populateSelect(widthSelect, data.items, 'เลือกความกว้าง');
-            } else {
-                console.error('API error:', data.error);
-                setErrorState(widthSelect, 'เกิดข้อผิดพลาด ลองใหม่');
-            }
+            const data = await loadSizeTree();
+            console.log('Widths loaded successfully:', data.widths);
+            populateSelect(widthSelect, data.widths, 'เลือกความกว้าง');
         } catch (error) {
             console.error('Error loading widths:', error);
             setErrorState(widthSelect, 'เกิดข้อผิดพลาด ลองใหม่');
@@ -106,18 +123,11 @@ function initTireSizeSelector() {
             setLoadingState(aspectSelect, 'กำลังโหลด...');
             aspectSelect.disabled = false;
             
-            const response = await fetch(`/api/tires/aspects?width=${width}`);
-            const data = await response.json();
-            
-            if (data.success) {
-                console.log('Aspects loaded successfully:', data.items);
-                populateSelect(aspectSelect, data.items, 'เลือกแก้มยาง');
-                aspectSelect.disabled = false;
-            } else {
-                console.error('API error:', data.error);
-                setErrorState(aspectSelect, 'เกิดข้อผิดพลาด ลองใหม่');
-                aspectSelect.disabled = true;
-            }
+            const data = await loadSizeTree();
+            const aspects = sortedNumbers(Object.keys(data.tree[width] || {}));
+            console.log('Aspects loaded successfully:', aspects);
+            populateSelect(aspectSelect, aspects, 'เลือกแก้มยาง');
+            aspectSelect.disabled = false;
         } catch (error) {
             console.error('Error loading aspects:', error);
             setErrorState(aspectSelect, 'เกิดข้อผิดพลาด ลองใหม่');
@@ -132,18 +142,11 @@ function initTireSizeSelector() {
             setLoadingState(rimSelect, 'กำลังโหลด...');
             rimSelect.disabled = false;
             
-            const response = await fetch(`/api/tires/rims?width=${width}&aspect=${aspect}`);
-            const data = await response.json();
-            
-            if (data.success) {
-                console.log('Rims loaded successfully:', data.items);
-                populateSelect(rimSelect, data.items, 'เลือกขนาดกระทะล้อ');
-                rimSelect.disabled = false;
-            } else {
-                console.error('API error:', data.error);
-                setErrorState(rimSelect, 'เกิดข้อผิดพลาด ลองใหม่');
-                rimSelect.disabled = true;
-            }
+            const data = await loadSizeTree();
+            const rims = ((data.tree[width] || {})[aspect]) || [];
+            console.log('Rims loaded successfully:', rims);
+            populateSelect(rimSelect, rims, 'เลือกขนาดกระทะล้อ');
+            rimSelect.disabled = false;
         } catch (error) {
             console.error('Error loading rims:', error);
             setErrorState(rimSelect, 'เกิดข้อผิดพลาด ลองใหม่');
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import threading
+import time
+import logging
+from collections import OrderedDict
+from datetime import date
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from cache_versions import get_version
+from tire_catalog import CATALOG_VERSION
+from promotion_cache import PROMOTIONS_VERSION
+
+logger = logging.getLogger(__name__)
+
+# ค่าเริ่มต้น (override ได้ผ่าน app.config)
+DEFAULT_BYTECODE_DIR = os.path.join(tempfile.gettempdir(), 'tireweb_jinja_bytecode')
+DEFAULT_FRAGMENT_TTL = 300
+DEFAULT_FRAGMENT_CACHE_SIZE = 256
+# version stamp ที่อยู่ใน key ของทุก fragment: ข้อมูลยางหรือโปรโมชันเปลี่ยน fragment เดิมจะไม่ถูกใช้อีก
+FRAGMENT_VERSIONS = (CATALOG_VERSION, PROMOTIONS_VERSION)
+# template ที่คอมไพล์ไว้ตั้งแต่ตอนโหลดแอป (gunicorn --preload: worker ที่ fork ใหม่ได้ template ที่คอมไพล์แล้วไปด้วย)
+PRELOAD_PREFIXES = ('customer/',)
+
+
+class FragmentCache:
+    """HTML ของ fragment ที่ render แล้วต่อ process (LRU + TTL)
+
+    key ของแต่ละ fragment = key ที่ template ระบุ + version stamp ใน FRAGMENT_VERSIONS + วันที่ปัจจุบัน
+    (โปรโมชันที่แสดงขึ้นกับวันที่) ทุก worker จึงเลิกใช้ fragment เก่าพร้อมกันเมื่อข้อมูลเปลี่ยน
+    """
+
+    def __init__(self):
+        self.default_ttl = DEFAULT_FRAGMENT_TTL
+        self.max_entries = DEFAULT_FRAGMENT_CACHE_SIZE
+        self.enabled = True
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, default_ttl=None, max_entries=None, enabled=None):
+        if default_ttl is not None:
+            self.default_ttl = float(default_ttl)
+        if max_entries is not None:
+            self.max_entries = int(max_entries)
+        if enabled is not None:
+            self.enabled = bool(enabled)
+
+    def _full_key(self, key):
+        return (repr(key), tuple(get_version(name) for name in FRAGMENT_VERSIONS), date.today())
+
+    def get_or_render(self, key, ttl, render):
+        """HTML ของ fragment จาก cache หรือ render ใหม่ด้วย render()"""
+        if not self.enabled:
+            return render()
+        full_key = self._full_key(key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None and now < entry[0]:
+                self._entries.move_to_end(full_key)
+                return entry[1]
+        body = Markup(render())
+        with self._lock:
+            self._entries[full_key] = (now + (self.default_ttl if ttl is None else float(ttl)), body)
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+fragments = FragmentCache()
+
+
+class FragmentCacheExtension(Extension):
+    """แท็ก {% cache key, ttl %}...{% endcache %} สำหรับเก็บ HTML ส่วนที่ไม่ขึ้นกับผู้ใช้
+
+    key เป็นนิพจน์ใดก็ได้ (เช่น tuple ที่รวมพารามิเตอร์ของหน้า) ttl เป็นวินาที ไม่ระบุใช้ค่าเริ่มต้น
+    ห้ามใส่ข้อมูลเฉพาะผู้ใช้ (ชื่อ, session, CSRF token) ไว้ใน fragment
+    """
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render_fragment', args), [], [], body).set_lineno(lineno)
+
+    def _render_fragment(self, key, ttl, caller):
+        return fragments.get_or_render(key, ttl, caller)
+
+
+def init_app(app):
+    """ติดตั้ง bytecode cache ที่ทุก worker ใช้ร่วมกันและแท็ก {% cache %} ให้ Jinja ของแอป"""
+    fragments.configure(
+        default_ttl=app.config.get('TEMPLATE_FRAGMENT_CACHE_TTL'),
+        max_entries=app.config.get('TEMPLATE_FRAGMENT_CACHE_SIZE'),
+        enabled=app.config.get('TEMPLATE_FRAGMENT_CACHE_ENABLED', True),
+    )
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    directory = app.config.get('TEMPLATE_BYTECODE_CACHE_DIR') or DEFAULT_BYTECODE_DIR
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # bytecode ถูกเก็บตาม checksum ของ source จึงไม่ใช้ของเก่าเมื่อแก้ template
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory, '%s.jinja.cache')
+    except OSError as e:
+        logger.warning(f"Template bytecode cache disabled ({directory}): {e}")
+
+
+def preload_templates(app, prefixes=PRELOAD_PREFIXES):
+    """คอมไพล์ template ล่วงหน้า (เรียกหลังลงทะเบียน filter ทั้งหมดแล้ว)"""
+    loaded = 0
+    for name in app.jinja_env.list_templates():
+        if not name.startswith(prefixes):
+            continue
+        try:
+            app.jinja_env.get_template(name)
+            loaded += 1
+        except Exception as e:
+            logger.warning(f"Error preloading template {name}: {e}")
+    logger.info(f"Preloaded {loaded} templates")
+    return loaded
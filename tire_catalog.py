@@ -0,0 +1,262 @@
+import re
+import threading
+import time
+import logging
+from array import array
+
+from database import get_cursor
+from cache_versions import get_version, bump_version
+from utils import encode_json_payload
+
+logger = logging.getLogger(__name__)
+
+# ชื่อ version stamp ของข้อมูลยาง (tires / tire_models / brands)
+CATALOG_VERSION = 'tire_catalog'
+# สร้าง index ใหม่อย่างน้อยทุกกี่วินาที เผื่อมีการแก้ฐานข้อมูลโดยตรงนอกแอป
+CATALOG_MAX_AGE = 600
+
+_TOKEN_SPLIT = re.compile(r'\s+')
+
+
+def _sort_text(value):
+    return (value or '').lower()
+
+
+def _sort_number(value):
+    # MySQL เรียง NULL ไว้ก่อนเมื่อ ORDER BY ... ASC
+    return (0, 0) if value is None else (1, value)
+
+
+def _to_int(value):
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+class SizeCascade:
+    """ขนาดยางที่มีจริงแบบลำดับชั้น ความกว้าง → แก้มยาง → ขอบล้อ (เรียงจากน้อยไปมาก)"""
+
+    def __init__(self, rows):
+        tree = {}
+        for row in rows:
+            width, aspect, rim = row.get('width'), row.get('aspect_ratio'), row.get('rim_diameter')
+            if width is None or aspect is None or rim is None:
+                continue
+            tree.setdefault(width, {}).setdefault(aspect, set()).add(rim)
+        self.tree = {
+            width: {aspect: sorted(rims) for aspect, rims in sorted(aspects.items())}
+            for width, aspects in sorted(tree.items())
+        }
+        self.widths = list(self.tree)
+        self._payload = None
+
+    def aspects(self, width):
+        return list(self.tree.get(_to_int(width), {}))
+
+    def rims(self, width, aspect):
+        return list(self.tree.get(_to_int(width), {}).get(_to_int(aspect), []))
+
+    def combinations(self):
+        return [{'width': width, 'aspect': aspect, 'rim': rim}
+                for width, aspects in self.tree.items()
+                for aspect, rims in aspects.items()
+                for rim in rims]
+
+    def payload(self):
+        """(body, etag) ของต้นไม้ทั้งหมดสำหรับ endpoint รวม (encode ครั้งเดียวต่อ catalog)"""
+        if self._payload is None:
+            self._payload = encode_json_payload({
+                'success': True,
+                'widths': self.widths,
+                'tree': {str(width): {str(aspect): rims for aspect, rims in aspects.items()}
+                         for width, aspects in self.tree.items()},
+            })
+        return self._payload
+
+
+class TireCatalog:
+    """ข้อมูลยางทั้งหมดในหน่วยความจำ พร้อม index สำหรับกรองและค้นหา
+
+    แถวถูกเรียงตาม full_size, price_each, price_set ตั้งแต่ตอนสร้าง
+    ตำแหน่งแถวจึงเป็นลำดับผลลัพธ์ที่ถูกต้องเสมอ
+    """
+
+    def __init__(self, rows, version, brand_names=None, model_names=None):
+        self.version = version
+        self.built_at = time.monotonic()
+        # ชื่อยี่ห้อ/รุ่นยางทั้งหมด (รวมที่ยังไม่มียาง) สำหรับแปลง id จากฟอร์มเป็นชื่อโดยไม่ต้อง query
+        self.brand_names = brand_names or {}
+        self.model_names = model_names or {}
+        self.rows = sorted(rows, key=lambda r: (
+            _sort_text(r.get('full_size')),
+            _sort_number(r.get('price_each')),
+            _sort_number(r.get('price_set')),
+        ))
+        self.by_width = {}
+        self.by_aspect_ratio = {}
+        self.by_rim_diameter = {}
+        self.by_brand = {}
+        self.by_model = {}
+        self.postings = {}
+        self._haystacks = []
+        self._token_cache = {}
+        self.sizes = SizeCascade(self.rows)
+
+        for pos, row in enumerate(self.rows):
+            self._add_to_index(self.by_width, row.get('width'), pos)
+            self._add_to_index(self.by_aspect_ratio, row.get('aspect_ratio'), pos)
+            self._add_to_index(self.by_rim_diameter, row.get('rim_diameter'), pos)
+            self._add_to_index(self.by_brand, row.get('brand_id'), pos)
+            self._add_to_index(self.by_model, row.get('model_id'), pos)
+
+            fields = self._search_fields(row)
+            self._haystacks.append(fields)
+            for text in fields:
+                for token in _TOKEN_SPLIT.split(text):
+                    if token:
+                        self.postings.setdefault(token, set()).add(pos)
+
+    @staticmethod
+    def _add_to_index(index, value, pos):
+        if value is None:
+            return
+        index.setdefault(value, array('I')).append(pos)
+
+    @staticmethod
+    def _search_fields(row):
+        """ข้อความที่ใช้ค้นหา (ตรงกับเงื่อนไข LIKE เดิมของหน้า /tires)"""
+        width = '' if row.get('width') is None else str(row['width'])
+        aspect = '' if row.get('aspect_ratio') is None else str(row['aspect_ratio'])
+        rim = '' if row.get('rim_diameter') is None else str(row['rim_diameter'])
+        brand = row.get('brand_name') or ''
+        model = row.get('model_name') or ''
+        full_size = row.get('full_size') or ''
+        fields = (
+            full_size, width, aspect, rim,
+            row.get('load_index') or '',
+            row.get('speed_symbol') or '',
+            brand, model,
+            row.get('service_description') or '',
+            row.get('notes') or '',
+            f"{width}/{aspect}R{rim}",
+            f"{brand} {model}",
+            f"{brand} {full_size}",
+        )
+        return tuple(str(field).lower() for field in fields)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _token_candidates(self, query_token):
+        """แถวที่มี token ใดๆ ซึ่งมี query_token เป็นส่วนหนึ่ง"""
+        cached = self._token_cache.get(query_token)
+        if cached is not None:
+            return cached
+        matched = set()
+        for token, positions in self.postings.items():
+            if query_token in token:
+                matched |= positions
+        if len(self._token_cache) < 1024:
+            self._token_cache[query_token] = matched
+        return matched
+
+    def _text_matches(self, query):
+        query = query.strip().lower()
+        if not query:
+            return None
+        candidates = None
+        for token in _TOKEN_SPLIT.split(query):
+            if not token:
+                continue
+            positions = self._token_candidates(token)
+            candidates = positions if candidates is None else candidates & positions
+            if not candidates:
+                return set()
+        # ยืนยันว่าทั้งวลีอยู่ในฟิลด์ใดฟิลด์หนึ่ง (เทียบเท่า LIKE '%...%')
+        return {pos for pos in candidates if any(query in field for field in self._haystacks[pos])}
+
+    def search(self, width=None, aspect_ratio=None, rim_diameter=None, brand_id=None,
+               search_query=None, model_ids=None, limit=None):
+        """กรอง/ค้นหายาง คืนค่า list ของ dict (สำเนา) เรียงตาม full_size, ราคา"""
+        selected = None
+        for index, value in ((self.by_width, width),
+                             (self.by_aspect_ratio, aspect_ratio),
+                             (self.by_rim_diameter, rim_diameter),
+                             (self.by_brand, brand_id)):
+            if not value:
+                continue
+            positions = set(index.get(_to_int(value), ()))
+            selected = positions if selected is None else selected & positions
+            if not selected:
+                return []
+
+        if model_ids is not None:
+            positions = set()
+            for model_id in model_ids:
+                positions.update(self.by_model.get(model_id, ()))
+            selected = positions if selected is None else selected & positions
+            if not selected:
+                return []
+
+        if search_query:
+            positions = self._text_matches(search_query)
+            if positions is not None:
+                selected = positions if selected is None else selected & positions
+                if not selected:
+                    return []
+
+        if selected is None:
+            ordered = range(len(self.rows))
+        else:
+            ordered = sorted(selected)
+        if limit is not None:
+            ordered = list(ordered)[:limit]
+        return [dict(self.rows[pos]) for pos in ordered]
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def _load_catalog(version):
+    cursor = get_cursor()
+    cursor.execute("""
+        SELECT t.*, b.brand_name, b.brand_id, m.model_name
+        FROM tires t
+        JOIN tire_models m ON t.model_id = m.model_id
+        JOIN brands b ON m.brand_id = b.brand_id
+    """)
+    rows = cursor.fetchall()
+    cursor.execute("SELECT brand_id, brand_name FROM brands")
+    brand_names = {row['brand_id']: row['brand_name'] for row in cursor.fetchall()}
+    cursor.execute("SELECT model_id, model_name FROM tire_models")
+    model_names = {row['model_id']: row['model_name'] for row in cursor.fetchall()}
+    cursor.close()
+    catalog = TireCatalog(rows, version, brand_names, model_names)
+    logger.info(f"Tire catalog index built: {len(catalog)} tires")
+    return catalog
+
+
+def get_tire_catalog():
+    """คืนค่า catalog ยางของ process นี้ สร้างใหม่เมื่อ version stamp เปลี่ยนหรือเก่าเกินไป"""
+    global _catalog
+    version = get_version(CATALOG_VERSION)
+    catalog = _catalog
+    if catalog is not None and catalog.version == version and \
+            time.monotonic() - catalog.built_at < CATALOG_MAX_AGE:
+        return catalog
+    with _catalog_lock:
+        catalog = _catalog
+        if catalog is None or catalog.version != version or \
+                time.monotonic() - catalog.built_at >= CATALOG_MAX_AGE:
+            catalog = _load_catalog(version)
+            _catalog = catalog
+    return catalog
+
+
+def invalidate_tire_catalog():
+    """แจ้งทุก worker ว่าข้อมูลยางเปลี่ยน (เรียกหลัง commit การเพิ่ม/แก้ไข/ลบยาง รุ่น หรือยี่ห้อ)"""
+    global _catalog
+    _catalog = None
+    bump_version(CATALOG_VERSION)
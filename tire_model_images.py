@@ -0,0 +1,67 @@
+import logging
+
+from database import get_cursor, get_db
+
+logger = logging.getLogger(__name__)
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def refresh_model_images(cursor, model_ids=None):
+    """คำนวณรูปตัวแทนของรุ่นยาง (tire_models.default_image) ใหม่ (ผู้เรียกต้อง commit เอง)
+
+    รูปตัวแทนคือรูปของยางเส้นแรก (tire_id น้อยสุด) ในรุ่นที่มีรูป ใช้แทนรูปของยางที่ไม่มีรูปในหน้ารายการ
+    model_ids=None คำนวณใหม่ทุกรุ่น
+    """
+    where = ''
+    params = ()
+    if model_ids is not None:
+        model_ids = sorted({int(model_id) for model_id in model_ids if model_id not in (None, '')})
+        if not model_ids:
+            return
+        where = f'WHERE m.model_id IN ({_placeholders(model_ids)})'
+        params = tuple(model_ids)
+    cursor.execute(f'''
+        UPDATE tire_models m
+        SET m.default_image = (
+            SELECT t.tire_image_url
+            FROM tires t
+            WHERE t.model_id = m.model_id AND t.tire_image_url IS NOT NULL
+            ORDER BY t.tire_id
+            LIMIT 1
+        )
+        {where}
+    ''', params)
+
+
+def tire_model_id(cursor, tire_id):
+    """model_id ของยาง (None ถ้าไม่พบ)"""
+    cursor.execute('SELECT model_id FROM tires WHERE tire_id = %s', (tire_id,))
+    row = cursor.fetchone()
+    return row['model_id'] if row else None
+
+
+def ensure_model_image_column():
+    """เพิ่มคอลัมน์ tire_models.default_image ถ้ายังไม่มี และเติมรูปตัวแทนของทุกรุ่นเมื่อเพิ่มครั้งแรก"""
+    try:
+        cursor = get_cursor()
+        if not cursor:
+            logger.error("Cannot create cursor for tire_models.default_image")
+            return False
+        cursor.execute('''
+            SELECT COUNT(*) AS column_count
+            FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = 'tire_models' AND column_name = 'default_image'
+        ''')
+        if cursor.fetchone()['column_count'] == 0:
+            cursor.execute('ALTER TABLE tire_models ADD COLUMN default_image VARCHAR(255) NULL')
+            refresh_model_images(cursor)
+            get_db().commit()
+            logger.info("คอลัมน์ tire_models.default_image พร้อมใช้งาน (เติมรูปตัวแทนแล้ว)")
+        cursor.close()
+        return True
+    except Exception as e:
+        logger.error(f"Error creating tire_models.default_image: {e}")
+        return False
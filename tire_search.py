@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import OrderedDict
+
+from tire_catalog import get_tire_catalog
+
+# ฟิลด์ที่หน้า admin/tires ค้นหาได้ (filter → key ในแถวของ catalog)
+SEARCH_FIELDS = {
+    'brand': 'brand_name',
+    'model': 'model_name',
+    'full_size': 'full_size',
+}
+# เก็บลำดับผลค้นหาไว้กี่วินาที (ให้การเปลี่ยนหน้าไม่ต้องจัดอันดับใหม่) และกี่คำค้น
+RANKING_TTL = 60
+RANKING_CACHE_SIZE = 128
+
+
+class _FieldIndex:
+    """ค่าที่ไม่ซ้ำของฟิลด์เดียว (ตัวพิมพ์เล็ก) → ตำแหน่งแถว พร้อม prefix map และคำในแต่ละค่า"""
+
+    def __init__(self, rows, key):
+        self.values = {}
+        for pos, row in enumerate(rows):
+            self.values.setdefault((row.get(key) or '').lower(), []).append(pos)
+        self.prefixes = {}
+        for value in self.values:
+            for end in range(1, len(value) + 1):
+                self.prefixes.setdefault(value[:end], set()).add(value)
+        self.words = {value: value.split() for value in self.values}
+        self.chars = {value: set(value) for value in self.values}
+
+    def containing(self, term):
+        """ค่าที่มี term อยู่ (เทียบเท่า LIKE '%term%') ตรวจต่อค่าที่ไม่ซ้ำ ไม่ใช่ต่อแถว"""
+        return [value for value in self.values if term in value]
+
+    def similarity(self, value, term):
+        """คะแนนความคล้ายของค่ากับคำค้น (เกณฑ์เดียวกับการจัดอันดับเดิมของหน้า admin/tires)"""
+        if value == term:
+            return 100
+        if value in self.prefixes.get(term, ()):
+            return 90
+        if term in value:
+            return 70
+        text_words = self.words[value]
+        matches = sum(1 for word in term.split() if any(word in text_word for text_word in text_words))
+        if matches > 0:
+            return 50 + (matches * 10)
+        chars = self.chars[value]
+        return min(30, sum(1 for c in term if c in chars) * 5)
+
+
+class TireSearchIndex:
+    """index สำหรับจัดอันดับผลค้นหายางของหน้า admin/tires สร้างจาก catalog ในหน่วยความจำครั้งเดียว
+
+    - filter brand/model/full_size: แถวที่ฟิลด์นั้นมีคำค้น คะแนน ตรงทั้งคำ 100 / ขึ้นต้น 90 / มีอยู่ 70
+    - filter อื่น: แถวที่ฟิลด์ใดฟิลด์หนึ่งมีคำค้น คะแนนสูงสุดของทั้งสามฟิลด์
+    เรียงตามคะแนน, ยี่ห้อ, รุ่น แล้ว tire_id เพื่อให้ลำดับคงที่ระหว่างเปลี่ยนหน้า
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        rows = catalog.rows
+        self.tire_ids = [row['tire_id'] for row in rows]
+        self.fields = {name: _FieldIndex(rows, key) for name, key in SEARCH_FIELDS.items()}
+        self.row_values = {name: [(row.get(key) or '').lower() for row in rows]
+                           for name, key in SEARCH_FIELDS.items()}
+        self.tiebreak = [((row.get('brand_name') or ''), (row.get('model_name') or ''), row['tire_id'])
+                         for row in rows]
+        self._rankings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _rank(self, term, filter_by):
+        names = [filter_by] if filter_by in self.fields else list(self.fields)
+        scores = {}
+        memo = {}
+        for name in names:
+            field = self.fields[name]
+            for value in field.containing(term):
+                for pos in field.values[value]:
+                    scores[pos] = None
+        for pos in scores:
+            best = 0
+            for name in names:
+                value = self.row_values[name][pos]
+                score = memo.get((name, value))
+                if score is None:
+                    score = memo[(name, value)] = self.fields[name].similarity(value, term)
+                best = max(best, score)
+            scores[pos] = best
+        ordered = sorted(scores, key=lambda pos: (-scores[pos], self.tiebreak[pos]))
+        return [self.tire_ids[pos] for pos in ordered]
+
+    def ranked_ids(self, term, filter_by):
+        """tire_id ที่ตรงกับคำค้นเรียงตามอันดับ (เก็บไว้ RANKING_TTL วินาที)"""
+        term = term.strip().lower()
+        if not term:
+            return []
+        key = (term, filter_by if filter_by in self.fields else None)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._rankings.get(key)
+            if cached is not None and now - cached[0] < RANKING_TTL:
+                self._rankings.move_to_end(key)
+                return cached[1]
+        ranked = self._rank(*key)
+        with self._lock:
+            self._rankings[key] = (now, ranked)
+            self._rankings.move_to_end(key)
+            while len(self._rankings) > RANKING_CACHE_SIZE:
+                self._rankings.popitem(last=False)
+        return ranked
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_tire_search_index():
+    """index ค้นหาของ catalog ปัจจุบัน สร้างใหม่เมื่อ catalog ถูกสร้างใหม่ (ผลค้นหาเก่าจึงหมดไปด้วย)"""
+    global _index
+    catalog = get_tire_catalog()
+    index = _index
+    if index is not None and index.catalog is catalog:
+        return index
+    with _index_lock:
+        if _index is None or _index.catalog is not catalog:
+            _index = TireSearchIndex(catalog)
+        return _index
+
+
+def rank_tires(term, filter_by):
+    return get_tire_search_index().ranked_ids(term, filter_by)
@@ -0,0 +1,213 @@
+import os
+import mimetypes
+import threading
+import logging
+
+from flask import send_file, abort
+
+from image_derivatives import pipeline as derivatives, DERIVED_DIR
+
+logger = logging.getLogger(__name__)
+
+# อายุ cache ฝั่งเบราว์เซอร์ของไฟล์อัปโหลด (วินาที) ค่าเริ่มต้น override ได้ผ่าน app.config
+DEFAULT_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+
+def upload_roots(app):
+    """โฟลเดอร์ที่ /uploads/<filename> ค้นหา เรียงตามลำดับความสำคัญ (เหมือนลำดับเดิมของ uploaded_file)"""
+    static_uploads = os.path.join(app.static_folder, 'uploads')
+    return [
+        app.config['PROFILE_UPLOAD_FOLDER'],
+        app.config['TIRE_UPLOAD_FOLDER'],
+        app.config['PROMOTION_UPLOAD_FOLDER'],
+        app.config['SLIDER_UPLOAD_FOLDER'],
+        app.config['LOGO_UPLOAD_FOLDER'],
+        # static/uploads สำหรับไฟล์เก่า
+        static_uploads,
+        os.path.join(static_uploads, 'promotions'),
+        os.path.join(static_uploads, 'tires'),
+        os.path.join(static_uploads, 'profiles'),
+        os.path.join(static_uploads, 'logos'),
+    ]
+
+
+class UploadStore:
+    """ดัชนี filename → (ลำดับโฟลเดอร์, path จริง, mimetype) ในหน่วยความจำของ process
+
+    สร้างครั้งเดียวตอนเริ่มแอป และอัปเดตเมื่อบันทึก/ลบไฟล์ผ่าน save_upload/delete_upload
+    ไฟล์ที่ worker อื่นเพิ่งบันทึกจะหาไม่เจอในดัชนี จึงค้นโฟลเดอร์แบบเดิมแล้วเพิ่มเข้าดัชนี
+    ส่วนไฟล์ที่ worker อื่นลบไปแล้วจะถูกเอาออกเมื่อเปิดไฟล์ไม่สำเร็จ
+    """
+
+    def __init__(self):
+        self.roots = []
+        self.allowed_extensions = set()
+        self.cache_max_age = DEFAULT_CACHE_MAX_AGE
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def configure(self, roots, allowed_extensions, cache_max_age=None):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.allowed_extensions = {ext.lower() for ext in allowed_extensions}
+        if cache_max_age is not None:
+            self.cache_max_age = int(cache_max_age)
+
+    def _allowed(self, filename):
+        return '.' in filename and filename.rsplit('.', 1)[1].lower() in self.allowed_extensions
+
+    def _keys(self, path):
+        """[(ลำดับโฟลเดอร์, ชื่อที่ใช้ใน URL), ...] ของไฟล์ path ในทุกโฟลเดอร์ที่ครอบไฟล์นั้น"""
+        path = os.path.abspath(path)
+        keys = []
+        for priority, root in enumerate(self.roots):
+            if path.startswith(root + os.sep):
+                keys.append((priority, os.path.relpath(path, root).replace(os.sep, '/')))
+        return keys
+
+    def _entry(self, priority, path):
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        return priority, os.path.abspath(path), mimetype
+
+    def build(self):
+        """สแกนทุกโฟลเดอร์แล้วสร้างดัชนีใหม่ (โฟลเดอร์ที่มาก่อนชนะเมื่อชื่อซ้ำ)"""
+        index = {}
+        for priority, root in enumerate(self.roots):
+            if not os.path.isdir(root):
+                continue
+            for folder, dirs, files in os.walk(root):
+                # ไม่ใส่รูปย่อ (.derived) ลงดัชนี
+                dirs[:] = [name for name in dirs if name != DERIVED_DIR]
+                for name in files:
+                    if not self._allowed(name):
+                        continue
+                    path = os.path.join(folder, name)
+                    key = os.path.relpath(path, root).replace(os.sep, '/')
+                    if key not in index:
+                        index[key] = self._entry(priority, path)
+        with self._lock:
+            self._index = index
+        logger.info(f"Upload index built: {len(index)} files")
+
+    def add(self, path):
+        """เพิ่มไฟล์ที่เพิ่งบันทึกเข้าดัชนี"""
+        with self._lock:
+            for priority, key in self._keys(path):
+                current = self._index.get(key)
+                if current is None or current[0] >= priority:
+                    self._index[key] = self._entry(priority, path)
+
+    def remove(self, path):
+        """เอาไฟล์ที่ถูกลบออกจากดัชนี"""
+        path = os.path.abspath(path)
+        with self._lock:
+            for _, key in self._keys(path):
+                current = self._index.get(key)
+                if current is not None and current[1] == path:
+                    del self._index[key]
+
+    def _probe(self, filename):
+        """ค้นหาไฟล์ในโฟลเดอร์ทีละโฟลเดอร์ (ใช้เมื่อไม่พบในดัชนี)"""
+        for priority, root in enumerate(self.roots):
+            path = os.path.abspath(os.path.join(root, filename))
+            if not path.startswith(root + os.sep):
+                continue
+            if os.path.isfile(path):
+                entry = self._entry(priority, path)
+                with self._lock:
+                    self._index[filename] = entry
+                return entry
+        return None
+
+    def resolve(self, filename):
+        """(path, mimetype) ของไฟล์ หรือ None ถ้าไม่พบหรือไม่ใช่ไฟล์รูปภาพ"""
+        if not self._allowed(filename):
+            return None
+        entry = self._index.get(filename) or self._probe(filename)
+        if entry is None:
+            return None
+        return entry[1], entry[2]
+
+    def forget(self, filename):
+        with self._lock:
+            self._index.pop(filename, None)
+
+    def _send_derivative(self, path, mimetype, width, webp):
+        """ส่งรูปย่อที่ใกล้กับความกว้าง width ที่สุด หรือ None ถ้าไฟล์นี้ย่อไม่ได้
+
+        ระหว่างที่รูปย่อยังสร้างไม่เสร็จ (ส่งงานสร้างให้แล้ว) ส่งไฟล์เดิมแบบ no-cache
+        เพื่อไม่ให้เบราว์เซอร์/proxy เก็บไฟล์ขนาดเต็มไว้ที่ URL ของรูปย่อ
+        """
+        selected = derivatives.select(path, width, webp)
+        if selected is None:
+            return None
+        derivative, derivative_mimetype = selected
+        try:
+            response = send_file(derivative, mimetype=derivative_mimetype, conditional=True, etag=True,
+                                 max_age=self.cache_max_age)
+        except FileNotFoundError:
+            derivatives.enqueue(path)
+            response = send_file(path, mimetype=mimetype, conditional=True, etag=True, max_age=0)
+        response.vary.add('Accept')
+        return response
+
+    def send(self, filename, width=None, webp=False):
+        """ส่งไฟล์พร้อม mimetype ที่ถูกต้อง, ETag/Last-Modified, 304 และ Cache-Control
+
+        ถ้าระบุ width จะส่งรูปย่อขนาดมาตรฐานที่ใกล้ที่สุด (WebP ถ้า webp=True)
+        และส่งไฟล์เดิมแบบ no-cache ระหว่างที่รูปย่อยังสร้างไม่เสร็จ
+        """
+        resolved = self.resolve(filename)
+        if resolved is None:
+            abort(404)
+        path, mimetype = resolved
+        try:
+            if width:
+                response = self._send_derivative(path, mimetype, width, webp)
+                if response is not None:
+                    return response
+            return send_file(path, mimetype=mimetype, conditional=True, etag=True,
+                             max_age=self.cache_max_age)
+        except FileNotFoundError:
+            # ไฟล์ถูกลบโดย worker อื่น ลองค้นใหม่อีกครั้ง (อาจมีไฟล์ชื่อเดียวกันในโฟลเดอร์อื่น)
+            self.forget(filename)
+            resolved = self.resolve(filename)
+            if resolved is None:
+                abort(404)
+            path, mimetype = resolved
+            return send_file(path, mimetype=mimetype, conditional=True, etag=True,
+                             max_age=self.cache_max_age)
+
+
+store = UploadStore()
+
+
+def init_app(app):
+    """ตั้งค่าโฟลเดอร์จาก app.config และสร้างดัชนีไฟล์อัปโหลด"""
+    store.configure(upload_roots(app), app.config['ALLOWED_EXTENSIONS'],
+                    app.config.get('UPLOAD_CACHE_MAX_AGE'))
+    store.build()
+
+
+def save_upload(file, upload_folder, filename):
+    """บันทึกไฟล์อัปโหลดลงโฟลเดอร์ (สร้างโฟลเดอร์ถ้ายังไม่มี) และเพิ่มเข้าดัชนี คืนค่า path"""
+    os.makedirs(upload_folder, exist_ok=True)
+    file_path = os.path.join(upload_folder, filename)
+    file.save(file_path)
+    store.add(file_path)
+    # ไฟล์ชื่อเดิมถูกเขียนทับได้ ลบรูปย่อเก่าก่อนสร้างใหม่ใน process pool
+    derivatives.discard(file_path)
+    derivatives.enqueue(file_path)
+    return file_path
+
+
+def delete_upload(upload_folder, filename):
+    """ลบไฟล์อัปโหลดและเอาออกจากดัชนี คืนค่า True ถ้าลบสำเร็จ"""
+    file_path = os.path.join(upload_folder, filename)
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        return False
+    finally:
+        store.remove(file_path)
+        derivatives.discard(file_path)
+    return True
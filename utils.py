@@ -1,6 +1,7 @@
 import os
 import re
 import json
+import hashlib
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 from urllib.parse import urlparse, urljoin
@@ -105,14 +106,9 @@ def get_brand_name(brand_id):
 def safe_file_save(file, upload_folder, filename):
     """บันทึกไฟล์อย่างปลอดภัยพร้อม error handling"""
     try:
-        # สร้างโฟลเดอร์ถ้ายังไม่มี
-        os.makedirs(upload_folder, exist_ok=True)
-        
-        # สร้าง path สำหรับไฟล์
-        file_path = os.path.join(upload_folder, filename)
-        
-        # บันทึกไฟล์
-        file.save(file_path)
+        # บันทึกไฟล์ (สร้างโฟลเดอร์ถ้ายังไม่มี) และเพิ่มเข้าดัชนีของ /uploads
+        from upload_store import save_upload
+        file_path = save_upload(file, upload_folder, filename)
         
         # ตรวจสอบว่าไฟล์ถูกบันทึกจริง
         if os.path.exists(file_path):
@@ -167,3 +163,18 @@ def make_json_serializable(data):
         # สำหรับ object อื่นๆ เช่น Decimal, datetime, etc.
         return str(data)
 
+
+def encode_json_payload(data):
+    """แปลงข้อมูลเป็น (body JSON, strong ETag) สำหรับข้อมูลที่สร้างครั้งเดียวแล้วส่งซ้ำหลายครั้ง"""
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return body, hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+def etag_json_response(payload, max_age=60):
+    """ส่ง JSON ที่ encode ไว้แล้วพร้อม ETag และ Cache-Control (ตอบ 304 เมื่อเบราว์เซอร์มีข้อมูลล่าสุดแล้ว)"""
+    body, etag = payload
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.must_revalidate = True
+    return response.make_conditional(request)
@@ -0,0 +1,124 @@
+import threading
+import time
+import logging
+
+from database import get_cursor
+from cache_versions import get_version, bump_version
+from utils import encode_json_payload
+
+logger = logging.getLogger(__name__)
+
+# ชื่อ version stamp ของข้อมูลยี่ห้อ/รุ่น/ปีรถ และ tire_model_vehicle_targets
+TAXONOMY_VERSION = 'vehicle_taxonomy'
+# สร้างใหม่อย่างน้อยทุกกี่วินาที เพราะตาราง targets ถูกแก้ไขโดยตรงในฐานข้อมูล ไม่ผ่านแอป
+TAXONOMY_MAX_AGE = 600
+# อายุ cache ฝั่งเบราว์เซอร์ (วินาที) หลังจากนั้นเบราว์เซอร์ต้องถามซ้ำด้วย If-None-Match
+CLIENT_MAX_AGE = 60
+
+
+class VehicleTaxonomy:
+    """ต้นไม้ยี่ห้อ → รุ่น → ปีรถ ในหน่วยความจำ พร้อม payload JSON และ ETag ของแต่ละระดับ
+
+    - brands: เฉพาะยี่ห้อที่มีปีรถผูกกับยางใน tire_model_vehicle_targets
+    - models: รุ่นทั้งหมดของยี่ห้อ (เหมือน API เดิม)
+    - years: เฉพาะปีที่มียางรองรับ เรียงจากใหม่ไปเก่า
+    """
+
+    def __init__(self, brands, models, years, version, brand_names=None):
+        self.version = version
+        self.built_at = time.monotonic()
+        # ชื่อยี่ห้อรถทั้งหมด (รวมยี่ห้อที่ยังไม่มียางรองรับ) ใช้แปลง id จากฟอร์มจองเป็นชื่อ
+        self.brand_names = brand_names or {}
+        self.brands = [{'id': row['car_brand_id'], 'name': row['car_brand_name']} for row in brands]
+        self.models = {}
+        for row in models:
+            self.models.setdefault(row['car_brand_id'], []).append(
+                {'id': row['car_model_id'], 'name': row['car_model_name']})
+        self.years = {}
+        for row in years:
+            self.years.setdefault(row['car_model_id'], []).append(row['production_year'])
+        self._payloads = {}
+        self._lock = threading.Lock()
+
+    def _payload(self, key, data):
+        """(body, etag) ของข้อมูลแต่ละระดับ สร้างครั้งเดียวแล้วใช้ซ้ำจนกว่า taxonomy จะถูกสร้างใหม่"""
+        payload = self._payloads.get(key)
+        if payload is None:
+            payload = encode_json_payload(data)
+            with self._lock:
+                self._payloads[key] = payload
+        return payload
+
+    def brands_payload(self):
+        return self._payload('brands', {'brands': self.brands})
+
+    def models_payload(self, brand_id):
+        if brand_id not in self.models:
+            # ไม่เก็บ payload ของ id ที่ไม่มีอยู่จริง เพื่อไม่ให้ cache โตตาม URL ที่ส่งเข้ามา
+            return encode_json_payload({'models': []})
+        return self._payload(('models', brand_id), {'models': self.models[brand_id]})
+
+    def years_payload(self, model_id):
+        if model_id not in self.years:
+            return encode_json_payload({'years': []})
+        return self._payload(('years', model_id), {'years': self.years[model_id]})
+
+
+_taxonomy = None
+_taxonomy_lock = threading.Lock()
+
+
+def _load_taxonomy(version):
+    cursor = get_cursor()
+    cursor.execute("""
+        SELECT DISTINCT cb.car_brand_id, cb.car_brand_name
+        FROM car_brands cb
+        JOIN car_models cm ON cb.car_brand_id = cm.car_brand_id
+        JOIN car_model_years cmy ON cm.car_model_id = cmy.car_model_id
+        JOIN tire_model_vehicle_targets tvt ON cmy.car_model_year_id = tvt.car_model_year_id
+        ORDER BY cb.car_brand_name ASC
+    """)
+    brands = cursor.fetchall()
+    cursor.execute("""
+        SELECT car_brand_id, car_model_id, car_model_name
+        FROM car_models
+        ORDER BY car_model_name ASC
+    """)
+    models = cursor.fetchall()
+    cursor.execute("""
+        SELECT DISTINCT cmy.car_model_id, cmy.production_year
+        FROM car_model_years cmy
+        JOIN tire_model_vehicle_targets tvt ON cmy.car_model_year_id = tvt.car_model_year_id
+        ORDER BY cmy.production_year DESC
+    """)
+    years = cursor.fetchall()
+    cursor.execute("SELECT car_brand_id, car_brand_name FROM car_brands")
+    brand_names = {row['car_brand_id']: row['car_brand_name'] for row in cursor.fetchall()}
+    cursor.close()
+    taxonomy = VehicleTaxonomy(brands, models, years, version, brand_names)
+    logger.info(f"Vehicle taxonomy built: {len(taxonomy.brands)} brands, {len(models)} models")
+    return taxonomy
+
+
+def get_vehicle_taxonomy():
+    """คืนค่า taxonomy ของ process นี้ สร้างใหม่เมื่อ version stamp เปลี่ยนหรือเก่าเกินไป"""
+    global _taxonomy
+    version = get_version(TAXONOMY_VERSION)
+    taxonomy = _taxonomy
+    if taxonomy is not None and taxonomy.version == version and \
+            time.monotonic() - taxonomy.built_at < TAXONOMY_MAX_AGE:
+        return taxonomy
+    with _taxonomy_lock:
+        taxonomy = _taxonomy
+        if taxonomy is None or taxonomy.version != version or \
+                time.monotonic() - taxonomy.built_at >= TAXONOMY_MAX_AGE:
+            taxonomy = _load_taxonomy(version)
+            _taxonomy = taxonomy
+    return taxonomy
+
+
+def invalidate_vehicle_taxonomy():
+    """แจ้งทุก worker ว่าข้อมูลรถหรือ tire_model_vehicle_targets เปลี่ยน"""
+    global _taxonomy
+    _taxonomy = None
+    bump_version(TAXONOMY_VERSION)